@@ -1,26 +1,32 @@
 import streamlit as st
 import openpyxl
-from libs.geospatial_tools import find_nearest_routes
+from libs.geospatial_tools import parse_points_text
+from libs.route_index_cache import get_route_index
 
-def process_kml(kml_path, lat, lon):
-    results = find_nearest_routes(kml_path, lat, lon)
-    return results
+def process_kml(kml_file, points, limit=None):
+    """Nearest routes per point, or None if the KML could not be read (already reported)."""
+    _, index = get_route_index(kml_file)
+    if index is None:
+        return None
+    return [((name, lat, lon), index.nearest(lat, lon, limit)) for name, lat, lon in points]
 
-def save_to_excel(results, output_excel):
+def save_to_excel(point_results, output_excel):
     try:
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "NearestRoutes"
-        ws.append(["Full Route Name", "Short Route Name", "Distance (m)", "Nearest Latitude", "Nearest Longitude"])
-
-        for item in results:
-            ws.append([
-                item["full_name"],
-                item["short_name"],
-                item["distance_m"],
-                item["nearest_lat"],
-                item["nearest_lon"]
-            ])
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet("NearestRoutes")
+        ws.append(["Point", "Latitude", "Longitude", "Full Route Name", "Short Route Name",
+                   "Distance (m)", "Nearest Latitude", "Nearest Longitude"])
+
+        for (name, lat, lon), results in point_results:
+            for item in results:
+                ws.append([
+                    name, lat, lon,
+                    item["full_name"],
+                    item["short_name"],
+                    item["distance_m"],
+                    item["nearest_lat"],
+                    item["nearest_lon"]
+                ])
 
         wb.save(output_excel)
         return True
@@ -30,29 +36,37 @@ def save_to_excel(results, output_excel):
 
 def main():
     st.title("Nearest Route Finder")
-    
+
     kml_file = st.file_uploader("Upload KML file", type=["kml"])
     lat = st.number_input("Enter Latitude", format="%.6f")
     lon = st.number_input("Enter Longitude", format="%.6f")
+    extra_points = st.text_area("More points (optional), one per line: lat,lon or name,lat,lon")
     output_excel = st.text_input("Output Excel file path", "output.xlsx")
 
     if st.button("Find Nearest Routes"):
         if kml_file is not None:
-            kml_path = kml_file.name
-            with open(kml_path, "wb") as f:
-                f.write(kml_file.getbuffer())
-
-            results = process_kml(kml_path, lat, lon)
-
-            if results:
-                st.success(f"Found {len(results)} valid routes.")
-                if st.button("Save to Excel"):
-                    if save_to_excel(results, output_excel):
-                        st.success(f"Excel file saved: {output_excel}")
-            else:
+            points, errors = parse_points_text(extra_points)
+            for error in errors:
+                st.warning(error)
+            points.insert(0, ("P0", lat, lon))
+
+            point_results = process_kml(kml_file, points)
+            if point_results is None:
+                st.session_state.pop("point_results", None)
+                return
+            # Kept across reruns so the "Save to Excel" click below still has the results
+            st.session_state["point_results"] = point_results
+            if not any(results for _, results in point_results):
                 st.warning("No valid routes found in the KML file.")
         else:
             st.error("Please upload a KML file.")
 
+    point_results = st.session_state.get("point_results")
+    if point_results and any(results for _, results in point_results):
+        st.success(f"Found {len(point_results[0][1])} valid routes for {len(point_results)} point(s).")
+        if st.button("Save to Excel"):
+            if save_to_excel(point_results, output_excel):
+                st.success(f"Excel file saved: {output_excel}")
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,22 +1,155 @@
-def find_nearest_routes(kml_path, lat, lon):
-    # This function should implement the logic to parse the KML file
-    # and find the nearest routes based on the provided latitude and longitude.
-    # For now, we will return a mock result for demonstration purposes.
-
-    # Mock result
-    return [
-        {
-            "full_name": "Route A",
-            "short_name": "A",
-            "distance_m": 150.0,
-            "nearest_lat": lat + 0.001,
-            "nearest_lon": lon + 0.001
-        },
-        {
-            "full_name": "Route B",
-            "short_name": "B",
-            "distance_m": 200.0,
-            "nearest_lat": lat - 0.001,
-            "nearest_lon": lon - 0.001
-        }
-    ]
\ No newline at end of file
+import io
+import math
+
+# KML parsing and nearest-route lookup (same logic as scripts/libs/geospatial_tools.py).
+# pykml, shapely and numpy are imported inside the functions that use them.
+
+
+def parse_coords_text(coords_text):
+    """Convert a KML coordinates string into [(lon, lat), ...]."""
+    coords_list = []
+    if coords_text:
+        for line in coords_text.strip().split():
+            parts = line.split(",")
+            if len(parts) >= 2:
+                try:
+                    coords_list.append((float(parts[0]), float(parts[1])))
+                except ValueError:
+                    continue
+    return coords_list
+
+
+def _scan_kml_node(node, current_path, routes):
+    """Recursively collect (full_name, coords) for every LineString placemark."""
+    tag_name = node.tag.lower().split('}')[-1]
+
+    if tag_name in ("folder", "document"):
+        fname = node.name.text.strip() if hasattr(node, "name") and node.name.text else "Unnamed"
+        new_path = f"{current_path}/{fname}" if current_path else fname
+        for child in node.getchildren():
+            _scan_kml_node(child, new_path, routes)
+
+    elif tag_name == "placemark":
+        placename = node.name.text if hasattr(node, "name") else "NoName"
+        full_name = f"{current_path}/{placename}" if current_path else placename
+        all_coords = []
+        if hasattr(node, "LineString"):
+            if hasattr(node.LineString, "coordinates"):
+                all_coords.extend(parse_coords_text(node.LineString.coordinates.text))
+        elif hasattr(node, "MultiGeometry"):
+            for geom in node.MultiGeometry.getchildren():
+                if geom.tag.lower().split('}')[-1] == "linestring" and hasattr(geom, "coordinates"):
+                    all_coords.extend(parse_coords_text(geom.coordinates.text))
+        if all_coords:
+            routes.append((full_name, all_coords))
+
+
+def extract_routes_from_kml_bytes(data):
+    """Parse KML content (bytes) into [(full_name, [(lon, lat), ...]), ...]."""
+    from pykml import parser as kmlparser
+
+    root = kmlparser.parse(io.BytesIO(data)).getroot()
+    routes = []
+    for elem in root.getchildren():
+        _scan_kml_node(elem, "", routes)
+    return routes
+
+
+def haversine_many(lat, lon, lats, lons):
+    """Haversine distance (meters) from one point to arrays of coordinates."""
+    import numpy as np
+
+    phi1 = math.radians(lat)
+    phi2 = np.radians(lats)
+    dphi = phi2 - phi1
+    dlambda = np.radians(lons) - math.radians(lon)
+    a = np.sin(dphi / 2)**2 + math.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2)**2
+    return 6371000 * (2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a)))
+
+
+def short_route_name(route_name):
+    """Short name of a route: the folder that contains it."""
+    parts = route_name.split('/')
+    return parts[-2].strip() if len(parts) >= 2 else route_name
+
+
+class RouteIndex:
+    """
+    Routes of one KML file as a shapely array of LineStrings plus their names, built once.
+    A lookup is a few vectorized operations over all routes (project, interpolate, haversine).
+    """
+
+    def __init__(self, routes):
+        import numpy as np
+        import shapely
+
+        kept = [(name, coords) for name, coords in routes if len(coords) >= 2]
+        lines = np.array([shapely.LineString(coords) for _, coords in kept], dtype=object)
+        valid = shapely.is_valid(lines) & ~shapely.is_empty(lines) if len(lines) else np.zeros(0, dtype=bool)
+        self.lines = lines[valid]
+        self.full_names = [name for (name, _), ok in zip(kept, valid) if ok]
+        self.short_names = [short_route_name(name) for name in self.full_names]
+
+    @classmethod
+    def from_kml_bytes(cls, data):
+        return cls(extract_routes_from_kml_bytes(data))
+
+    def __len__(self):
+        return len(self.full_names)
+
+    def nearest(self, target_lat, target_lon, limit=None):
+        """
+        Routes sorted by distance to the point, at most `limit` of them (None = all):
+        [{full_name, short_name, distance_m, nearest_lat, nearest_lon}, ...]
+        """
+        if not len(self):
+            return []
+        import numpy as np
+        import shapely
+
+        point = shapely.Point(target_lon, target_lat)
+        nearest = shapely.line_interpolate_point(self.lines, shapely.line_locate_point(self.lines, point))
+        xy = shapely.get_coordinates(nearest)
+        distances = haversine_many(target_lat, target_lon, xy[:, 1], xy[:, 0])
+        order = np.argsort(distances, kind="stable")
+        if limit:
+            order = order[:limit]
+        return [{
+            "full_name": self.full_names[i],
+            "short_name": self.short_names[i],
+            "distance_m": float(distances[i]),
+            "nearest_lat": float(xy[i, 1]),
+            "nearest_lon": float(xy[i, 0]),
+        } for i in order.tolist()]
+
+
+def find_nearest_routes(kml_path, lat, lon, limit=None):
+    """Nearest routes of a KML file on disk (builds a new index; the apps use the cached one)."""
+    with open(kml_path, "rb") as f:
+        return RouteIndex.from_kml_bytes(f.read()).nearest(lat, lon, limit)
+
+
+def parse_points_text(text):
+    """
+    Parse one point per line: "lat,lon" or "name,lat,lon" (comma, semicolon or tab separated).
+    Returns ([(name, lat, lon), ...], [error message, ...]); unnamed points are called P1, P2, ...
+    """
+    points, errors = [], []
+    for line_no, line in enumerate(text.splitlines(), start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        parts = [p.strip() for p in line.replace(";", ",").replace("\t", ",").split(",")]
+        name = parts.pop(0) if len(parts) == 3 else f"P{len(points) + 1}"
+        try:
+            if len(parts) != 2:
+                raise ValueError
+            lat, lon = float(parts[0]), float(parts[1])
+        except ValueError:
+            errors.append(f"Line {line_no}: expected 'lat,lon' or 'name,lat,lon', got '{line}'")
+            continue
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            errors.append(f"Line {line_no}: coordinates out of range ({lat}, {lon})")
+            continue
+        points.append((name, lat, lon))
+    return points, errors
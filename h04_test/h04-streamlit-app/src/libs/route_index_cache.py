@@ -0,0 +1,30 @@
+import hashlib
+
+import streamlit as st
+
+from libs.geospatial_tools import RouteIndex
+
+# Route indexes kept across reruns and sessions, keyed by the SHA-256 of the uploaded KML.
+# Streamlit evicts the least recently used entry beyond ROUTE_INDEX_CACHE_ENTRIES files.
+ROUTE_INDEX_CACHE_ENTRIES = 8
+
+
+@st.cache_resource(max_entries=ROUTE_INDEX_CACHE_ENTRIES, show_spinner="Building route index...")
+def _load_route_index(kml_hash, _kml_bytes):
+    # _kml_bytes is not hashed by Streamlit (leading underscore); kml_hash is the cache key.
+    return RouteIndex.from_kml_bytes(_kml_bytes)
+
+
+def get_route_index(uploaded_file):
+    """
+    (content hash, RouteIndex) of an uploaded KML; the index is built once per distinct file.
+    A file that cannot be parsed is reported with st.error and returns (content hash, None).
+    """
+    data = uploaded_file.getvalue()
+    kml_hash = hashlib.sha256(data).hexdigest()
+    try:
+        return kml_hash, _load_route_index(kml_hash, data)
+    except Exception as e:
+        # Malformed upload (lxml/pykml error); st.cache_resource does not cache the failure
+        st.error(f"Error reading KML file: {e}")
+        return kml_hash, None
@@ -1,56 +1,85 @@
+import time
+
 import streamlit as st
 import openpyxl
-from libs.geospatial_tools import find_nearest_routes
+from libs.geospatial_tools import parse_points_text
+from libs.route_index_cache import get_route_index
 
-def save_results_to_excel(results, output_excel):
-    try:
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "NearestRoutes"
+RESULT_HEADER = ["Point", "Latitude", "Longitude", "Full Route Name", "Short Route Name",
+                 "Distance (m)", "Nearest Latitude", "Nearest Longitude"]
 
-        ws.append(["Full Route Name", "Short Route Name", "Distance (m)", "Nearest Latitude", "Nearest Longitude"])
 
+def result_rows(point_results):
+    for (name, lat, lon), results in point_results:
         for item in results:
-            ws.append([
-                item["full_name"],
-                item["short_name"],
-                item["distance_m"],
-                item["nearest_lat"],
-                item["nearest_lon"]
-            ])
+            yield [name, lat, lon, item["full_name"], item["short_name"], item["distance_m"],
+                   item["nearest_lat"], item["nearest_lon"]]
 
+
+def save_results_to_excel(point_results, output_excel):
+    try:
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet("NearestRoutes")
+        ws.append(RESULT_HEADER)
+        for row in result_rows(point_results):
+            ws.append(row)
         wb.save(output_excel)
         return True
     except Exception as e:
         st.error(f"Error saving Excel file: {e}")
         return False
 
+
+def read_points():
+    mode = st.radio("Points", ["Single point", "Multiple points"], horizontal=True)
+    if mode == "Single point":
+        lat = st.number_input("Enter Latitude", format="%.6f")
+        lon = st.number_input("Enter Longitude", format="%.6f")
+        return [("P1", lat, lon)]
+
+    text = st.text_area("One point per line: lat,lon or name,lat,lon", height=200)
+    points, errors = parse_points_text(text)
+    for error in errors:
+        st.warning(error)
+    return points
+
+
 def main():
     st.title("Nearest Route Finder")
-    
+
     kml_file = st.file_uploader("Upload KML file", type=["kml"])
-    lat = st.number_input("Enter Latitude", format="%.6f")
-    lon = st.number_input("Enter Longitude", format="%.6f")
+    points = read_points()
+    limit = st.number_input("Routes per point (0 = all)", min_value=0, value=0, step=1)
     output_excel = st.text_input("Output Excel file name", "nearest_routes.xlsx")
 
     if st.button("Find Nearest Routes"):
-        if kml_file is not None:
-            kml_path = kml_file.name
-            with open(kml_path, "wb") as f:
-                f.write(kml_file.getbuffer())
-
-            results = find_nearest_routes(kml_path, lat, lon)
-
-            if results:
-                st.success(f"Found {len(results)} valid routes.")
-                if save_results_to_excel(results, output_excel):
-                    st.success(f"Excel file saved: {output_excel}")
-                for item in results:
-                    st.write(f"Route: {item['full_name']}, Distance: {item['distance_m']} m")
-            else:
-                st.warning("No valid routes found in the KML file.")
-        else:
+        if kml_file is None:
             st.error("Please upload a KML file.")
+            return
+        if not points:
+            st.error("Please enter at least one valid point.")
+            return
+
+        _, index = get_route_index(kml_file)
+        if index is None:
+            return
+        if not len(index):
+            st.warning("No valid routes found in the KML file.")
+            return
+
+        started = time.perf_counter()
+        point_results = [((name, lat, lon), index.nearest(lat, lon, limit or None)) for name, lat, lon in points]
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        st.success(f"{len(index)} valid routes, {len(points)} point(s) looked up in {elapsed_ms:.1f} ms.")
+
+        if save_results_to_excel(point_results, output_excel):
+            st.success(f"Excel file saved: {output_excel}")
+        if len(points) == 1:
+            for item in point_results[0][1]:
+                st.write(f"Route: {item['full_name']}, Distance: {item['distance_m']} m")
+        else:
+            st.dataframe([dict(zip(RESULT_HEADER, row)) for row in result_rows(point_results)])
+
 
 if __name__ == "__main__":
-    main()  
\ No newline at end of file
+    main()
@@ -1,386 +1,274 @@
 import sys
-import csv
+import json
 import argparse
 import logging
 import os
-import pandas as pd
-from typing import List, Tuple, Dict, Optional, Any
-import math 
+from typing import Dict, Iterable, Iterator, List, Tuple, Optional, Any
 
 # Thiết lập Logger để theo dõi quá trình
 logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 logger = logging.getLogger(__name__)
 
-# Cấu trúc dữ liệu
-TargetData = Tuple[str, float, float] 
-RouterDataFull = Tuple[str, float, float, str, int, str]
-
 try:
     # --- IMPORT CÁC HÀM CẦN THIẾT TỪ THƯ VIỆN ---
-    # Cần đảm bảo các file này tồn tại trong thư mục 'libs' và hàm OSRM trả về 6 trường thông tin router
-    from libs.routing_solver import find_nearest_router_by_osrm_route_table
-    from libs.geospatial_tools import haversine
+    # Router / trạm / kết quả được giữ dạng cột NumPy (libs/planning_model.py), tham chiếu bằng chỉ số
+    from libs.routing_solver import nearest_by_osrm_route_table
+    from libs.planning_model import ASSIGNMENT_COLUMNS, AssignmentTable, RouterTable, TargetTable
+    from libs.result_sink import open_result_sink
+    from libs.csv_loaders import load_typed_csv
+    from libs import instrumentation as metrics
+    from libs.cli_bootstrap import run_main
     
 except ImportError as e:
-    logger.error(f"Lỗi Import thư viện: {e}. Vui lòng kiểm tra thư mục 'libs' và các file cần thiết (routing_solver.py, geospatial_tools.py).")
+    logger.error(f"Lỗi Import thư viện: {e}. Vui lòng kiểm tra thư mục 'libs' và các file cần thiết (routing_solver.py, planning_model.py).")
     sys.exit(1)
 
+# Trạng thái kết quả
+STATUS_SUCCESS = 'Success'
+STATUS_NO_ROUTER = 'No router in radius'
+STATUS_OSRM_FAILED = 'OSRM Route Failed'
+STATUS_NOT_ASSIGNED = 'Not Assigned after Loop (Conflict/OSRM Fail)'
+
 # =================================================================
-# 1A. HÀM ĐỌC CSV CHO ROUTERS (GIỮ NGUYÊN)
+# 1A. HÀM ĐỌC CSV CHO ROUTERS
 # =================================================================
-def load_routers_from_csv(csv_path: str) -> Optional[List[RouterDataFull]]:
+# Đọc và chuyển kiểu cả file một lần (libs/csv_loaders.py), dòng lỗi được loại bằng mask
+ROUTER_COLUMN_TYPES = {'Name': 'str', 'Lat': 'float', 'Lon': 'float', 'Type': 'str', 'Priority': 'int', 'Site ID': 'str'}
+TARGET_COLUMN_TYPES = {'Name': 'str', 'Lat': 'float', 'Lon': 'float'}
+
+def load_routers_from_csv(csv_path: str) -> Optional[RouterTable]:
     """Đọc dữ liệu Router (Name, Lat, Lon, Type, Priority, Site ID)."""
-    routers_list = []
-    required_fields = ['Name', 'Lat', 'Lon', 'Type', 'Priority', 'Site ID'] 
-    
     try:
-        # Sử dụng 'utf-8-sig' để xử lý BOM (Byte Order Mark) trên file CSV tạo bởi Excel
-        with open(csv_path, 'r', encoding='utf-8-sig') as file:
-            reader = csv.DictReader(file)
-            
-            if not all(field in reader.fieldnames for field in required_fields):
-                raise ValueError(f"File Router CSV phải có các cột: {', '.join(required_fields)}")
-                
-            for row in reader:
-                try:
-                    name = row['Name'].strip()
-                    lat = float(row['Lat'])
-                    lon = float(row['Lon'])
-                    router_type = row['Type'].strip()
-                    priority = int(row['Priority'])
-                    site_id = row['Site ID'].strip() 
-                    
-                    routers_list.append((name, lon, lat, router_type, priority, site_id))
-                    
-                except ValueError:
-                    logger.warning(f"Bỏ qua Router lỗi định dạng (số/ưu tiên): {row}")
-                    continue
-                    
+        table = load_typed_csv(csv_path, ROUTER_COLUMN_TYPES)
+        if table.missing_columns:
+            raise ValueError(f"File Router CSV phải có các cột: {', '.join(ROUTER_COLUMN_TYPES)}")
     except FileNotFoundError:
         logger.error(f"File Router CSV '{csv_path}' không tồn tại.")
         return None
     except Exception as e:
         logger.error(f"Lỗi khi đọc file Router CSV: {e}")
         return None
-        
-    logger.info(f"Đã tải thành công {len(routers_list)} Router từ CSV.")
-    return routers_list
+
+    for index in table.error_rows:
+        logger.warning(f"Bỏ qua Router lỗi định dạng (số/ưu tiên): {table.raw_row(index)}")
+
+    routers = RouterTable.from_typed_csv(table)
+    logger.info(f"Đã tải thành công {len(routers)} Router từ CSV.")
+    return routers
 
 # =================================================================
-# 1B. HÀM ĐỌC CSV CHO TRẠM MỤC TIÊU (GIỮ NGUYÊN)
+# 1B. HÀM ĐỌC CSV CHO TRẠM MỤC TIÊU
 # =================================================================
-def load_targets_from_csv(csv_path: str) -> Optional[List[TargetData]]:
+def load_targets_from_csv(csv_path: str) -> Optional[TargetTable]:
     """Đọc dữ liệu Trạm Mục tiêu (Name, Lat, Lon)."""
-    targets_list = []
-    required_fields = ['Name', 'Lat', 'Lon']
-    
     try:
-        with open(csv_path, 'r', encoding='utf-8-sig') as file:
-            reader = csv.DictReader(file)
-            
-            if not all(field in reader.fieldnames for field in required_fields):
-                raise ValueError(f"File Target CSV phải có các cột: {', '.join(required_fields)}")
-                
-            for row in reader:
-                try:
-                    name = row['Name'].strip()
-                    lat = float(row['Lat'])
-                    lon = float(row['Lon'])
-                    
-                    targets_list.append((name, lon, lat))
-                    
-                except ValueError:
-                    logger.warning(f"Bỏ qua Trạm lỗi định dạng số: {row}")
-                    continue
-                    
+        table = load_typed_csv(csv_path, TARGET_COLUMN_TYPES)
+        if table.missing_columns:
+            raise ValueError(f"File Target CSV phải có các cột: {', '.join(TARGET_COLUMN_TYPES)}")
     except FileNotFoundError:
         logger.error(f"File Target CSV '{csv_path}' không tồn tại.")
         return None
     except Exception as e:
         logger.error(f"Lỗi khi đọc file Target CSV: {e}")
         return None
-        
-    logger.info(f"Đã tải thành công {len(targets_list)} Trạm Mục tiêu từ CSV.")
-    return targets_list
+
+    for index in table.error_rows:
+        logger.warning(f"Bỏ qua Trạm lỗi định dạng số: {table.raw_row(index)}")
+
+    targets = TargetTable.from_typed_csv(table)
+    logger.info(f"Đã tải thành công {len(targets)} Trạm Mục tiêu từ CSV.")
+    return targets
 
 # =================================================================
-# 2. HÀM LỌC BÁN KÍNH (GIỮ NGUYÊN)
+# 2. HÀM TRỢ GIÚP: TÌM ROUTER TỐT NHẤT CHO MỘT TRẠM
 # =================================================================
-def filter_routers_by_radius(
-    target_lat: float, 
-    target_lon: float, 
-    routers_list: List[RouterDataFull], 
-    radius_km: float
-) -> List[RouterDataFull]: 
-    """Lọc sơ bộ bằng Haversine, giữ nguyên tất cả thông tin router."""
-    filtered_list = []
-    
-    for router_data in routers_list: 
-        name, lon, lat, r_type, priority, site_id = router_data
-        distance = haversine(target_lat, target_lon, lat, lon) 
-        
-        if distance <= radius_km:
-            filtered_list.append(router_data) 
-            
-    return filtered_list
+def find_best_router_for_target(
+    targets: TargetTable, target_index: int, routers: RouterTable, args, available=None
+) -> Tuple[str, int, float]:
+    """
+    Lọc sơ bộ bằng bán kính Haversine (vector hóa, chỉ trong mask `available` nếu có) rồi gọi OSRM /table.
+
+    Returns:
+        (status, chỉ số router tốt nhất hoặc -1, khoảng cách km hoặc inf)
+    """
+    bs_lat = float(targets.lat[target_index])
+    bs_lon = float(targets.lon[target_index])
+
+    # A. Lọc sơ bộ bằng bán kính (km)
+    candidates = routers.within_radius(bs_lat, bs_lon, args.radius, available)
+    if not len(candidates):
+        # Không tìm thấy router nào trong bán kính Haversine
+        return STATUS_NO_ROUTER, -1, float('inf')
+
+    # B. Gọi OSRM /table một lần cho các router đã lọc
+    nearest = nearest_by_osrm_route_table(
+        args.osrm_url, bs_lat, bs_lon, routers.coords(candidates), profile=args.profile
+    )
+    if nearest is None:
+        # OSRM tìm tuyến thất bại
+        return STATUS_OSRM_FAILED, -1, float('inf')
+
+    position, distance_km = nearest
+    return STATUS_SUCCESS, int(candidates[position]), distance_km
 
 # =================================================================
-# 3. HÀM GHI KẾT QUẢ RA EXCEL (.XLSX) (GIỮ NGUYÊN)
+# 3. HÀM GHI KẾT QUẢ RA EXCEL (.XLSX)
 # =================================================================
-def write_results_to_excel(output_path: str, results: List[Dict[str, Any]]):
-    """Ghi danh sách kết quả (Dictionary) ra file Excel (.xlsx)."""
-    if not results:
-        logger.warning("Không có kết quả nào để ghi ra file Excel.")
-        return
-
-    # 1. Tạo DataFrame từ list of dictionaries
-    df = pd.DataFrame(results)
-
-    # 2. Đổi tên cột (đảm bảo đúng thứ tự)
-    # Loại bỏ các cột tạm thời nếu có (Router_Key, Distance)
-    cols = [
-        'BS_Name', 'BS_Lat', 'BS_Lon', 
-        'Nearest_Router_Name', 'Nearest_Router_Lat', 'Nearest_Router_Lon',
-        'Router_Type', 'Router_Priority', 'Router_Site_ID', 
-        'Route_Distance_KM', 'Status'
-    ]
-    cols = [c for c in cols if c in df.columns] # Giữ lại các cột có trong DataFrame
-    df = df[cols]
-    
+# Thứ tự cột đầu ra (AssignmentTable.row trả về dòng theo đúng thứ tự này)
+RESULT_COLUMNS = ASSIGNMENT_COLUMNS
+# Kiểu cột cho bản Parquet ('N/A' ở cột số thành null)
+RESULT_COLUMN_TYPES = {
+    'BS_Name': 'str', 'BS_Lat': 'float', 'BS_Lon': 'float',
+    'Nearest_Router_Name': 'str', 'Nearest_Router_Lat': 'float', 'Nearest_Router_Lon': 'float',
+    'Router_Type': 'str', 'Router_Priority': 'int', 'Router_Site_ID': 'str',
+    'Route_Distance_KM': 'float', 'Status': 'str',
+}
+
+def write_results_to_excel(output_path: str, results: Iterable[List[Any]], parquet_path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Ghi kết quả (dòng theo RESULT_COLUMNS) ra file Excel (.xlsx) theo kiểu streaming, kèm bản Parquet nếu có `parquet_path`.
+    `results` có thể là generator: mỗi dòng được ghi ngay khi trạm được xử lý xong.
+
+    Returns:
+        dict: status ("success" / "error"), stage khi lỗi ("routing": lỗi khi tính kết quả của generator,
+              ví dụ OSRM; "write": lỗi ghi file), message, rows (số dòng đã ghi), output_file.
+    """
     # Đảm bảo đường dẫn kết thúc bằng .xlsx
     if not output_path.lower().endswith('.xlsx'):
         output_path = os.path.splitext(output_path)[0] + '.xlsx'
+    outcome: Dict[str, Any] = {"status": "success", "rows": 0, "output_file": os.path.abspath(output_path)}
 
+    rows = iter(results)
     try:
-        # Ghi ra file Excel. Pandas và openpyxl xử lý Unicode/tiếng Việt tự động.
-        df.to_excel(output_path, index=False, sheet_name='Routing_Results')
-        logger.info(f"✅ Đã ghi thành công {len(results)} kết quả vào file EXCEL: {output_path}")
+        with open_result_sink(output_path, RESULT_COLUMNS, sheet_name='Routing_Results',
+                              columnar_path=parquet_path, types=RESULT_COLUMN_TYPES) as sink:
+            while True:
+                # Lỗi của generator (định tuyến OSRM / gán router) tách khỏi lỗi ghi file;
+                # sink vẫn được đóng để giữ các dòng đã ghi
+                try:
+                    row = next(rows)
+                except StopIteration:
+                    break
+                except Exception as e:
+                    logger.error(f"Lỗi khi tính kết quả định tuyến (sau {sink.rows_written} trạm): {e}")
+                    outcome.update(status="error", stage="routing", message=str(e))
+                    break
+                sink.write_row(row)
+            outcome["rows"] = count = sink.rows_written
     except ImportError:
-        logger.error("Lỗi: Không tìm thấy thư viện 'openpyxl'. Vui lòng chạy: pip install openpyxl")
+        logger.error("Lỗi: Không tìm thấy thư viện ghi Excel. Vui lòng chạy: pip install xlsxwriter (hoặc openpyxl)")
+        outcome.update(status="error", stage="write", message="Thiếu thư viện ghi Excel (xlsxwriter hoặc openpyxl).")
+        return outcome
     except Exception as e:
         logger.error(f"Lỗi khi ghi file Excel: {e}")
+        outcome.update(status="error", stage="write", message=str(e))
+        return outcome
+    if outcome["status"] == "error":
+        return outcome
 
-# =================================================================
-# 4. HÀM TRỢ GIÚP: TÌM ROUTER TỐT NHẤT CHO MỘT TRẠM (GIỮ NGUYÊN)
-# =================================================================
-def find_best_router_for_target(bs_name, bs_lat, bs_lon, routers_list_full, args, status_prefix=""):
-    """Thực hiện lọc và gọi OSRM cho một trạm mục tiêu."""
-    
-    # A. Lọc sơ bộ bằng bán kính 
-    filtered_routers_full = filter_routers_by_radius(
-        bs_lat, bs_lon, routers_list_full, args.radius
-    )
-    
-    if not filtered_routers_full:
-        # Không tìm thấy router nào trong bán kính Haversine
-        return {
-            'BS_Name': bs_name, 'BS_Lat': bs_lat, 'BS_Lon': bs_lon, 
-            'Nearest_Router_Name': 'N/A', 'Nearest_Router_Lat': 'N/A', 'Nearest_Router_Lon': 'N/A',
-            'Router_Type': 'N/A', 'Router_Priority': 'N/A', 'Router_Site_ID': 'N/A', 
-            'Route_Distance_KM': 'N/A', 'Status': 'No router in radius',
-            'Router_Key': None, 'Distance': math.inf
-        }
-        
-    # B. Gọi hàm tìm kiếm OSRM tối ưu 
-    best_router_info = find_nearest_router_by_osrm_route_table(
-        osrm_base_url=args.osrm_url,
-        target_bs_lat=bs_lat,
-        target_bs_lon=bs_lon,
-        routers_list=filtered_routers_full,
-        profile=args.profile,
-        logger=logger
-    )
-
-    # C. Chuẩn bị kết quả
-    if best_router_info and isinstance(best_router_info, dict) and 'distance_km' in best_router_info:
-        distance = best_router_info['distance_km']
-        router_key = best_router_info['name'] # Sử dụng tên làm key duy nhất cho router
-        
-        result = {
-            'BS_Name': bs_name, 'BS_Lat': bs_lat, 'BS_Lon': bs_lon, 
-            'Nearest_Router_Name': best_router_info['name'], 
-            'Nearest_Router_Lat': best_router_info['lat'], 
-            'Nearest_Router_Lon': best_router_info['lon'],
-            'Router_Type': best_router_info['type'], 
-            'Router_Priority': best_router_info['priority'], 
-            'Router_Site_ID': best_router_info['site_id'], 
-            'Route_Distance_KM': distance,
-            'Status': 'Success',
-            'Router_Key': router_key, 
-            'Distance': distance # Lưu khoảng cách để so sánh và sắp xếp
-        }
+    if count:
+        logger.info(f"✅ Đã ghi thành công {count} kết quả vào file EXCEL: {output_path}")
+        if parquet_path:
+            logger.info(f"✅ Bản Parquet: {parquet_path}")
     else:
-        # OSRM tìm tuyến thất bại
-        result = {
-            'BS_Name': bs_name, 'BS_Lat': bs_lat, 'BS_Lon': bs_lon, 
-            'Nearest_Router_Name': 'N/A', 'Nearest_Router_Lat': 'N/A', 'Nearest_Router_Lon': 'N/A',
-            'Router_Type': 'N/A', 'Router_Priority': 'N/A', 'Router_Site_ID': 'N/A',
-            'Route_Distance_KM': 'N/A', 'Status': 'OSRM Route Failed',
-            'Router_Key': None, 'Distance': math.inf
-        }
-    
-    # logger.info(f"{status_prefix} -> Router tốt nhất: {result.get('Nearest_Router_Name', 'N/A')} ({result['Distance']:.3f} km)")
-    return result
+        logger.warning("Không có kết quả nào để ghi ra file Excel.")
+    return outcome
 
 # =================================================================
-# 5. HÀM GÁN LẶP THEO GIẢI QUYẾT XUNG ĐỘT (CONFLICT RESOLUTION) - ĐÃ CẬP NHẬT LOGIC VÀ THỨ TỰ
+# 4. HÀM GÁN LẶP THEO GIẢI QUYẾT XUNG ĐỘT (CONFLICT RESOLUTION)
 # =================================================================
-def run_conflict_resolution_assignment(
-    target_stations_raw: List[TargetData], 
-    routers_list_full: List[RouterDataFull], 
-    args
-) -> List[Dict[str, Any]]:
+def run_conflict_resolution_assignment(targets: TargetTable, routers: RouterTable, args) -> AssignmentTable:
     """
     Thực hiện quy trình gán lặp theo giải quyết xung đột, giữ nguyên thứ tự kết quả ban đầu
     và loại bỏ sớm các trạm không có router trong bán kính.
+    Router và trạm được định danh bằng chỉ số dòng (không phải tên), nên tên trùng không bị gộp.
     """
-    
-    # 1. Khởi tạo
-    # Lưu kết quả theo tên BS để dễ dàng sắp xếp lại theo thứ tự ban đầu sau này
-    results_map: Dict[str, Dict[str, Any]] = {} 
-    targets_to_process = list(target_stations_raw) # (Name, Lon, Lat)
-    assigned_router_keys = set()
-    
+    import numpy as np
+
+    # 1. Khởi tạo: kết quả theo thứ tự trạm ban đầu, mặc định là "chưa gán"
+    results = AssignmentTable(targets, routers, STATUS_NOT_ASSIGNED)
+    finalized = np.zeros(len(targets), dtype=bool)    # trạm đã có kết quả cuối cùng
+    available = np.ones(len(routers), dtype=bool)     # router chưa được gán
+    total_routers = len(routers)
+
+    # Danh sách các trạm cần xử lý (ban đầu là tất cả các trạm, theo thứ tự ban đầu)
+    unassigned = np.arange(len(targets))
     iteration = 0
-    total_routers = len(routers_list_full)
-    
-    # Danh sách các trạm cần xử lý lại (ban đầu là tất cả các trạm)
-    unassigned_targets = list(targets_to_process)
     
-    while unassigned_targets:
+    while len(unassigned):
         iteration += 1
-        num_targets_in_loop = len(unassigned_targets)
+        num_targets_in_loop = len(unassigned)
         
         logger.info(f"\n=======================================================")
         logger.info(f"VÒNG LẶP GÁN LẦN {iteration}: Xử lý {num_targets_in_loop} Trạm.")
         logger.info(f"=======================================================")
         
-        # 2. Chuẩn bị Router Khả dụng
-        available_routers = [
-            r for r in routers_list_full if r[0] not in assigned_router_keys
-        ]
-        num_available_routers = len(available_routers)
-        
-        if not available_routers:
+        # 2. Router khả dụng
+        if not available.any():
             logger.warning(f"Vòng lặp {iteration}: HẾT Router khả dụng. Kết thúc gán lặp.")
             break
 
-        # 3. Chạy GÁN TOÀN BỘ và Giải quyết XUNG ĐỘT cho các Trạm trong vòng lặp này
-        potential_assignments_map = {} 
-        targets_processed_in_loop_names = set()
+        # 3. Chạy GÁN TOÀN BỘ và Giải quyết XUNG ĐỘT: router -> (trạm, khoảng cách) gần nhất
+        potential_assignments = {}
         
-        for i, (bs_name, bs_lon, bs_lat) in enumerate(unassigned_targets):
-            
-            # Thêm thông tin tiến trình vào log
+        for i, target_index in enumerate(unassigned):
             status_prefix = f"[L{iteration} - {i+1}/{num_targets_in_loop}]"
-            logger.info(f"{status_prefix} Xử lý Trạm: {bs_name}")
+            logger.info(f"{status_prefix} Xử lý Trạm: {targets.names[target_index]}")
             
-            result = find_best_router_for_target(
-                bs_name, bs_lat, bs_lon, available_routers, args, 
-                status_prefix=status_prefix
+            status, router_index, distance = find_best_router_for_target(
+                targets, target_index, routers, args, available
             )
-            targets_processed_in_loop_names.add(bs_name)
 
-            router_key = result.get('Router_Key')
-            distance = result.get('Distance', math.inf)
-
-            if result['Status'] == 'Success' and router_key:
-                
+            if status == STATUS_SUCCESS:
                 # Giải quyết XUNG ĐỘT: Chỉ giữ lại target có khoảng cách gần nhất
-                if router_key not in potential_assignments_map:
-                    potential_assignments_map[router_key] = result
-                else:
-                    existing_best = potential_assignments_map[router_key]
-                    if distance < existing_best['Distance']:
-                        potential_assignments_map[router_key] = result
+                existing = potential_assignments.get(router_index)
+                if existing is None or distance < existing[1]:
+                    potential_assignments[router_index] = (target_index, distance)
             
-            elif result['Status'] == 'No router in radius' and iteration == 1:
+            elif status == STATUS_NO_ROUTER and iteration == 1:
                 # Loại bỏ ngay các trạm không có router trong bán kính chỉ trong Lần 1
-                
-                # Loại bỏ key tạm thời trước khi đưa vào kết quả cuối cùng
-                if 'Router_Key' in result: del result['Router_Key']
-                if 'Distance' in result: del result['Distance']
-                results_map[bs_name] = result
-                
-                logger.warning(f"❌ LOẠI BỎ SỚM: {bs_name} (Không có Router trong bán kính {args.radius} km).")
+                results.set(target_index, STATUS_NO_ROUTER)
+                finalized[target_index] = True
+                logger.warning(f"❌ LOẠI BỎ SỚM: {targets.names[target_index]} (Không có Router trong bán kính {args.radius} km).")
 
         # 4. Thực hiện Gán Chính Thức
-        newly_assigned_keys = set()
-        
-        for router_key, final_res in potential_assignments_map.items():
-            bs_name = final_res['BS_Name']
-            
-            # Lưu vào map kết quả
-            results_map[bs_name] = final_res
-            # Đánh dấu Router đã được gán 
-            assigned_router_keys.add(router_key)
-            newly_assigned_keys.add(bs_name)
-            
-            logger.info(f"✅ GÁN DUY NHẤT: {bs_name} -> {router_key} ({final_res['Route_Distance_KM']:.3f} km)")
-        
-        num_newly_assigned = len(newly_assigned_keys)
+        for router_index, (target_index, distance) in potential_assignments.items():
+            results.set(target_index, STATUS_SUCCESS, router_index, distance)
+            finalized[target_index] = True
+            available[router_index] = False
+            logger.info(f"✅ GÁN DUY NHẤT: {targets.names[target_index]} -> {routers.names[router_index]} ({distance:.3f} km)")
         
-        # 5. Cập nhật danh sách các Trạm Mục tiêu chưa được gán (unassigned_targets)
+        num_newly_assigned = len(potential_assignments)
         
-        next_unassigned_targets = []
+        # 5. Các trạm chưa có kết quả cuối cùng (giữ thứ tự ban đầu cho vòng tiếp theo)
+        next_unassigned = np.flatnonzero(~finalized)
         
-        # Duyệt qua danh sách targets_to_process ban đầu để duy trì thứ tự cho vòng lặp tiếp theo
-        # Nhưng chỉ giữ lại các target chưa có kết quả cuối cùng trong results_map
-        for target_name, target_lon, target_lat in targets_to_process:
-            if target_name not in results_map:
-                # Trạm này chưa được gán hoặc bị mất gán/lỗi OSRM (nếu không bị loại sớm ở B3)
-                next_unassigned_targets.append((target_name, target_lon, target_lat))
-        
-        # Cập nhật danh sách cho vòng lặp tiếp theo
-        if len(next_unassigned_targets) >= len(unassigned_targets) and newly_assigned_keys:
-             logger.warning("Vòng lặp không loại bỏ được trạm nào. Kết thúc gán lặp để tránh vòng lặp vô hạn.")
-             break
+        if len(next_unassigned) >= len(unassigned) and num_newly_assigned:
+            logger.warning("Vòng lặp không loại bỏ được trạm nào. Kết thúc gán lặp để tránh vòng lặp vô hạn.")
+            break
 
-        unassigned_targets = next_unassigned_targets
+        unassigned = next_unassigned
         
         # Kiểm tra điều kiện dừng an toàn
-        if not newly_assigned_keys and unassigned_targets:
+        if not num_newly_assigned and len(unassigned):
             logger.warning("Vòng lặp này không tìm được Gán Duy Nhất mới nào. Kết thúc gán lặp.")
             break
         
         # 6. TÓM TẮT LOG SAU VÒNG LẶP
-        num_targets_remaining = len(unassigned_targets)
-        num_routers_remaining = total_routers - len(assigned_router_keys)
+        num_assigned_routers = total_routers - int(available.sum())
         
         logger.info("-------------------------------------------------------")
         logger.info(f"TÓM TẮT VÒNG LẶP {iteration}:")
-        logger.info(f"  - Router ĐÃ GÁN (Tổng cộng): {len(assigned_router_keys)} / {total_routers}")
-        logger.info(f"  - Trạm CHƯA GÁN (Cho Vòng {iteration + 1}): {num_targets_remaining} / {len(target_stations_raw)}")
-        logger.info(f"  - Router CÒN LẠI (Khả dụng): {num_routers_remaining} / {total_routers}")
+        logger.info(f"  - Router ĐÃ GÁN (Tổng cộng): {num_assigned_routers} / {total_routers}")
+        logger.info(f"  - Trạm CHƯA GÁN (Cho Vòng {iteration + 1}): {len(unassigned)} / {len(targets)}")
+        logger.info(f"  - Router CÒN LẠI (Khả dụng): {total_routers - num_assigned_routers} / {total_routers}")
         logger.info("-------------------------------------------------------")
 
-    # 7. Tổng hợp và sắp xếp kết quả cuối cùng theo thứ tự ban đầu
-    
-    final_sorted_results = []
-    
-    for bs_name, bs_lon, bs_lat in target_stations_raw:
-        result = results_map.get(bs_name)
-        
-        if result:
-            # Loại bỏ các key tạm thời trước khi trả về
-            if 'Router_Key' in result: del result['Router_Key']
-            if 'Distance' in result: del result['Distance']
-            final_sorted_results.append(result)
-        else:
-            # Các trạm còn sót lại (chưa được gán, bị lỗi OSRM trong lần lặp sau Lần 1, hoặc bị mất gán và không tìm được gán mới)
-            result = {
-                'BS_Name': bs_name, 'BS_Lat': bs_lat, 'BS_Lon': bs_lon, 
-                'Nearest_Router_Name': 'N/A', 'Nearest_Router_Lat': 'N/A', 'Nearest_Router_Lon': 'N/A',
-                'Router_Type': 'N/A', 'Router_Priority': 'N/A', 'Router_Site_ID': 'N/A',
-                'Route_Distance_KM': 'N/A', 
-                'Status': 'Not Assigned after Loop (Conflict/OSRM Fail)' 
-            }
-            final_sorted_results.append(result)
-
-    return final_sorted_results
+    # 7. Các trạm còn sót lại giữ trạng thái mặc định STATUS_NOT_ASSIGNED
+    return results
 
 # =================================================================
-# 6. HÀM CHÍNH (MAIN BATCH PROCESS) (GIỮ NGUYÊN)
+# 5. HÀM CHÍNH (MAIN BATCH PROCESS)
 # =================================================================
 def main():
     parser = argparse.ArgumentParser(
@@ -391,18 +279,19 @@ def main():
     parser.add_argument('--target-csv', type=str, required=True, help='Đường dẫn file CSV chứa các Trạm Phát Sóng mục tiêu (Name, Lat, Lon).')
     parser.add_argument('--router-csv', type=str, required=True, help='Đường dẫn file CSV chứa danh sách Router (Name, Lat, Lon, Type, Priority, Site ID).') 
     parser.add_argument('--output-file', type=str, default='routing_results.xlsx', help='Tên file EXCEL (.xlsx) kết quả đầu ra.') 
+    parser.add_argument('--parquet-out', type=str, default=None, help='Ghi thêm kết quả dạng Parquet (.parquet) hoặc Arrow IPC (.arrow/.feather) với cột có kiểu.')
     parser.add_argument('--profile', type=str, default='car', help='Chế độ di chuyển OSRM.')
     parser.add_argument('--radius', type=float, default=10.0, help='Bán kính lọc sơ bộ (km) bằng Haversine.')
     parser.add_argument('--unique', action='store_true', help='Nếu được bật, sử dụng thuật toán gán lặp theo giải quyết xung đột để đảm bảo mỗi Router chỉ được gán cho một Trạm Mục tiêu duy nhất.') 
     args = parser.parse_args()
     
-    routers_list_full: List[RouterDataFull] = load_routers_from_csv(args.router_csv)
-    if not routers_list_full: sys.exit(1)
+    routers = load_routers_from_csv(args.router_csv)
+    if not routers: sys.exit(1)
         
-    target_stations_raw: List[TargetData] = load_targets_from_csv(args.target_csv)
-    if not target_stations_raw: sys.exit(1)
+    targets = load_targets_from_csv(args.target_csv)
+    if not targets: sys.exit(1)
     
-    total_stations = len(target_stations_raw)
+    total_stations = len(targets)
 
     # -----------------------------------------------------------------
     # LOGIC GÁN (UNIQUE HOẶC NON-UNIQUE)
@@ -410,30 +299,41 @@ def main():
     
     if args.unique:
         logger.info("Chế độ: Gán Router DUY NHẤT (Giải quyết Xung đột) được BẬT. 🔄")
-        all_results = run_conflict_resolution_assignment(target_stations_raw, routers_list_full, args)
+        all_results = run_conflict_resolution_assignment(targets, routers, args).rows()
     
     else:
         logger.info("Chế độ: Gán Router BÌNH THƯỜNG (Không yêu cầu duy nhất) được BẬT.")
-        all_results = []
-        for i, (bs_name, bs_lon, bs_lat) in enumerate(target_stations_raw):
-            result = find_best_router_for_target(
-                bs_name, bs_lat, bs_lon, routers_list_full, args, 
-                status_prefix=f"[{i+1}/{total_stations}]"
-            )
-            # Dọn dẹp key tạm thời
-            if 'Router_Key' in result: del result['Router_Key']
-            if 'Distance' in result: del result['Distance']
-            all_results.append(result)
+
+        results = AssignmentTable(targets, routers, STATUS_NOT_ASSIGNED)
+
+        def iter_results() -> Iterator[List[Any]]:
+            # Generator: mỗi kết quả được ghi ra Excel ngay khi xử lý xong một trạm
+            for target_index in range(total_stations):
+                status, router_index, distance = find_best_router_for_target(targets, target_index, routers, args)
+                results.set(target_index, status, router_index, distance)
+                yield results.row(target_index)
+
+        all_results = iter_results()
 
     # 4. Ghi kết quả ra file EXCEL
-    write_results_to_excel(args.output_file, all_results) 
-    
+    outcome = write_results_to_excel(args.output_file, all_results, parquet_path=args.parquet_out)
+
     print("\n" + "=" * 60)
-    print("✨ QUÁ TRÌNH XỬ LÝ HÀNG LOẠT HOÀN TẤT")
-    print(f"Tổng số trạm đã xử lý: {total_stations}")
-    print(f"Kết quả được lưu tại: {os.path.abspath(args.output_file)}")
+    if outcome["status"] == "success":
+        print("✨ QUÁ TRÌNH XỬ LÝ HÀNG LOẠT HOÀN TẤT")
+        print(f"Tổng số trạm đã xử lý: {total_stations}")
+        print(f"Kết quả được lưu tại: {outcome['output_file']}")
+    else:
+        failure = "định tuyến" if outcome["stage"] == "routing" else "ghi file kết quả"
+        print(f"❌ QUÁ TRÌNH XỬ LÝ HÀNG LOẠT THẤT BẠI (lỗi {failure}): {outcome['message']}")
+        print(f"Số trạm đã ghi trước khi lỗi: {outcome['rows']} / {total_stations}")
     print("=" * 60)
+    # Dòng JSON cuối cùng cho n8n: trạng thái (stage chỉ rõ lỗi định tuyến hay lỗi ghi file) + metric
+    metrics.emit_run_summary("batch_routing_plan_v3", outcome)
+    print(json.dumps(outcome, ensure_ascii=False))
+    if outcome["status"] != "success":
+        sys.exit(1)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    run_main(main)
\ No newline at end of file
@@ -0,0 +1,160 @@
+"""
+Kiểm tra ngân sách thời gian khởi động (startup budget) của các script CLI.
+
+Chạy từng entry point nhiều lần với `python -X importtime <script> --help`, cộng dồn thời
+gian import của các module cấp cao nhất và kiểm tra:
+  1. Trung vị (median) tổng thời gian import của các lần chạy không vượt ngân sách (ms) của
+     entry point — một lần đo đơn lẻ quá nhiễu (cache đĩa, CPU bận) để làm cổng kiểm tra.
+  2. Không có thư viện nặng (pandas, openpyxl, netmiko, pykml, lxml...) bị import
+     trên đường --help — chúng phải được import trì hoãn (xem libs/lazy_import.py).
+  3. Các libs chỉ dùng khi kết nối thiết bị (connection pool, hồ sơ timing, kho kết quả,
+     delta...) không bị import trên đường --help của các script mạng.
+
+Dùng như một bài kiểm tra hồi quy (regression check) trước khi deploy:
+    python check_startup_budget.py                 # tất cả entry point
+    python check_startup_budget.py h04 netmiko_exec --budget-ms 80 --runs 9
+Thoát với mã 1 nếu có entry point vượt ngân sách.
+"""
+import sys
+import os
+import json
+import argparse
+import statistics
+import subprocess
+from typing import List, Dict, Any, Tuple
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
+
+from script_worker import ENTRY_POINTS
+
+# Ngân sách mặc định cho tổng thời gian import (ms) trên đường --help
+DEFAULT_BUDGET_MS = 150.0
+
+# Ngân sách riêng cho từng entry point (nếu cần nới/siết)
+BUDGET_OVERRIDES_MS: Dict[str, float] = {}
+
+# Số lần chạy mặc định để lấy trung vị
+DEFAULT_RUNS = 5
+
+# Các thư viện nặng không được phép xuất hiện khi chỉ chạy --help
+HEAVY_MODULES = [
+    "pandas", "numpy", "openpyxl", "xlsxwriter", "netmiko", "paramiko", "textfsm",
+    "pykml", "lxml", "shapely", "simplekml", "requests", "pyarrow",
+]
+
+# Libs chỉ dùng khi đã kết nối thiết bị: các script mạng phải import chúng trong hàm sử dụng
+NETWORK_LAZY_MODULES = [
+    "libs.connection_pool", "libs.timing_profiles", "libs.cli_parsing", "libs.textfsm_registry",
+    "libs.file_transfer", "libs.log_offsets", "libs.result_store", "libs.delta_tracker",
+    "libs.inventory", "libs.state_store", "netmiko_wrapper",
+]
+FORBIDDEN_MODULES: Dict[str, List[str]] = {
+    "netmiko_exec": NETWORK_LAZY_MODULES,
+    "ssh": NETWORK_LAZY_MODULES,
+    "ssh2": NETWORK_LAZY_MODULES,
+}
+
+
+def parse_importtime(stderr_text: str) -> Tuple[float, List[str]]:
+    """
+    Phân tích output của -X importtime.
+
+    Returns:
+        (tổng thời gian import cấp cao nhất tính bằng ms, danh sách tên module đã import)
+    """
+    total_us = 0
+    modules = []
+    for line in stderr_text.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            cumulative_us = int(parts[1].strip())
+        except ValueError:
+            continue  # dòng tiêu đề "self [us] | cumulative | imported package"
+        raw_name = parts[2].rstrip()
+        name = raw_name.strip()
+        modules.append(name)
+        # Module cấp cao nhất được in với đúng 1 khoảng trắng thụt lề
+        indent = len(raw_name) - len(raw_name.lstrip(" "))
+        if indent == 1:
+            total_us += cumulative_us
+    return total_us / 1000.0, modules
+
+
+def check_entry_point(name: str, budget_ms: float, runs: int = DEFAULT_RUNS) -> Dict[str, Any]:
+    """Đo thời gian import của một entry point khi chạy --help (trung vị của `runs` lần chạy)."""
+    script_path = os.path.join(SCRIPTS_DIR, ENTRY_POINTS[name])
+    samples, modules, returncodes = [], set(), set()
+    for _ in range(max(1, runs)):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", script_path, "--help"],
+            cwd=SCRIPTS_DIR, capture_output=True, text=True, timeout=120,
+        )
+        import_ms, run_modules = parse_importtime(proc.stderr)
+        samples.append(import_ms)
+        modules.update(run_modules)
+        returncodes.add(proc.returncode)
+    median_ms = statistics.median(samples)
+    heavy = sorted({m.split(".")[0] for m in modules if m.split(".")[0] in HEAVY_MODULES})
+    forbidden = sorted(m for m in FORBIDDEN_MODULES.get(name, []) if m in modules)
+
+    errors = []
+    failed_codes = sorted(code for code in returncodes if code != 0)
+    if failed_codes:
+        errors.append(f"--help thoát với mã {', '.join(map(str, failed_codes))}")
+    if median_ms > budget_ms:
+        errors.append(f"Trung vị thời gian import {median_ms:.1f} ms vượt ngân sách {budget_ms:.1f} ms")
+    if heavy:
+        errors.append(f"Thư viện nặng bị import khi --help: {', '.join(heavy)}")
+    if forbidden:
+        errors.append(f"Module phải import trì hoãn bị import khi --help: {', '.join(forbidden)}")
+
+    return {
+        "entry_point": name,
+        "import_ms": round(median_ms, 2),
+        "samples_ms": [round(s, 2) for s in samples],
+        "budget_ms": budget_ms,
+        "heavy_modules": heavy,
+        "forbidden_modules": forbidden,
+        "ok": not errors,
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kiểm tra ngân sách thời gian khởi động (-X importtime) của các script CLI.")
+    parser.add_argument('entry_points', nargs='*', help='Tên entry point cần kiểm tra (mặc định: tất cả).')
+    parser.add_argument('--budget-ms', type=float, default=None, help=f'Ngân sách import (ms), mặc định {DEFAULT_BUDGET_MS}.')
+    parser.add_argument('--runs', type=int, default=DEFAULT_RUNS, help=f'Số lần chạy mỗi entry point, so ngân sách với trung vị (mặc định {DEFAULT_RUNS}).')
+    args = parser.parse_args()
+
+    names = args.entry_points or sorted(ENTRY_POINTS)
+    unknown = [n for n in names if n not in ENTRY_POINTS]
+    if unknown:
+        print(json.dumps({"status": "error", "message": f"Entry point không tồn tại: {', '.join(unknown)}"}, ensure_ascii=False))
+        sys.exit(1)
+
+    results = []
+    for name in names:
+        budget = args.budget_ms if args.budget_ms is not None else BUDGET_OVERRIDES_MS.get(name, DEFAULT_BUDGET_MS)
+        results.append(check_entry_point(name, budget, args.runs))
+
+    failed = [r for r in results if not r["ok"]]
+    print(json.dumps({
+        "status": "success" if not failed else "error",
+        "checked": len(results),
+        "failed": len(failed),
+        "results": results,
+    }, indent=2, ensure_ascii=False))
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,15 @@
 import argparse
-import openpyxl
 # 💡 THAY ĐỔI LỚN: Import hàm xử lý chính từ thư viện vừa tạo
 from libs.geospatial_tools import find_nearest_routes 
+from libs.result_sink import open_result_sink
+from libs import instrumentation as metrics
+from libs.cli_bootstrap import run_main
 
 
 # -----------------------------
 # Main Process (Đã Rút Gọn)
 # -----------------------------
-def process_kml(kml_path, lat, lon, output_excel):
+def process_kml(kml_path, lat, lon, output_excel, output_parquet=None):
     print(f"\n🔍 Bắt đầu tìm tuyến đường gần nhất cho tọa độ ({lat:.6f}, {lon:.6f})...")
     
     # 💡 SỬ DỤNG THƯ VIỆN: Gọi hàm đã đóng gói
@@ -24,25 +26,24 @@ def process_kml(kml_path, lat, lon, output_excel):
     # Write Excel
     # -----------------------------
     try:
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "NearestRoutes"
-
         # Cột header được đồng bộ với output của thư viện
-        ws.append(["Full Route Name", "Short Route Name", "Distance (m)", "Nearest Latitude", "Nearest Longitude"])
-
-        for item in results:
-            # item là một dictionary (từ hàm find_nearest_routes)
-            ws.append([
-                item["full_name"],
-                item["short_name"],
-                item["distance_m"],
-                item["nearest_lat"],
-                item["nearest_lon"]
-            ])
+        header = ["Full Route Name", "Short Route Name", "Distance (m)", "Nearest Latitude", "Nearest Longitude"]
+        types = {"Distance (m)": "float", "Nearest Latitude": "float", "Nearest Longitude": "float"}
+        with open_result_sink(output_excel, header, sheet_name="NearestRoutes",
+                              columnar_path=output_parquet, types=types) as sink:
+            for item in results:
+                # item là một dictionary (từ hàm find_nearest_routes)
+                sink.write_row([
+                    item["full_name"],
+                    item["short_name"],
+                    item["distance_m"],
+                    item["nearest_lat"],
+                    item["nearest_lon"]
+                ])
 
-        wb.save(output_excel)
         print(f"\n✅ File Excel đã lưu: {output_excel}")
+        if output_parquet:
+            print(f"✅ File Parquet đã lưu: {output_parquet}")
         
     except Exception as e:
         print(f"❌ Lỗi khi ghi file Excel: {e}")
@@ -57,10 +58,12 @@ def main():
     argp.add_argument("--lat", type=float, required=True, help="Latitude of point")
     argp.add_argument("--lon", type=float, required=True, help="Longitude of point")
     argp.add_argument("--out", required=True, help="Output Excel path")
+    argp.add_argument("--parquet-out", default=None, help="Optional typed Parquet (.parquet) or Arrow IPC (.arrow/.feather) output path")
 
     args = argp.parse_args()
-    process_kml(args.kml, args.lat, args.lon, args.out)
+    process_kml(args.kml, args.lat, args.lon, args.out, args.parquet_out)
+    metrics.emit_run_summary("h04")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    run_main(main)
\ No newline at end of file
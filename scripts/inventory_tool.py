@@ -0,0 +1,101 @@
+"""
+Quản lý inventory thiết bị và file thông tin đăng nhập mã hóa (libs/inventory.py).
+
+Ví dụ:
+    # Liệt kê thiết bị (không in mật khẩu), lọc theo nhóm
+    python inventory_tool.py list --inventory devices.yaml --group core
+    # Sinh khóa Fernet, đặt vào biến môi trường N8N_SCRIPTS_CREDENTIALS_KEY của container n8n
+    python inventory_tool.py genkey
+    # Mã hóa file JSON {"<ref>": {"username": ..., "password": ..., "secret": ...}};
+    # --delete-input ghi đè rồi xóa file gốc (bản rõ) sau khi đã ghi xong file mã hóa
+    N8N_SCRIPTS_CREDENTIALS_KEY=... python inventory_tool.py encrypt --input creds.json --delete-input
+    # Kiểm tra một thiết bị giải quyết được thông tin đăng nhập
+    python inventory_tool.py check --inventory devices.yaml --device r1
+"""
+import os
+import sys
+import json
+import argparse
+
+from libs.inventory import (
+    CREDENTIALS_KEY_ENV,
+    DEFAULT_CREDENTIALS_FILE,
+    DEFAULT_INVENTORY,
+    device_params,
+    encrypt_credentials,
+    generate_key,
+    load_inventory,
+)
+
+
+def _fail(message: str):
+    print(json.dumps({"status": "error", "message": message}, ensure_ascii=False))
+    sys.exit(1)
+
+
+def _shred_file(path: str):
+    """Ghi đè nội dung bằng byte 0 rồi xóa file (best effort: không đảm bảo trên SSD / filesystem copy-on-write)."""
+    size = os.path.getsize(path)
+    with open(path, 'r+b') as f:
+        f.write(b'\0' * size)
+        f.flush()
+        os.fsync(f.fileno())
+    os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quản lý inventory thiết bị và thông tin đăng nhập mã hóa.")
+    sub = parser.add_subparsers(dest='action', required=True)
+
+    p_list = sub.add_parser('list', help='Liệt kê thiết bị trong inventory.')
+    p_list.add_argument('--inventory', type=str, default=DEFAULT_INVENTORY, help='File inventory CSV/JSON/YAML.')
+    p_list.add_argument('--group', type=str, action='append', default=None, help='Chỉ lấy thiết bị thuộc nhóm này (lặp lại được).')
+
+    sub.add_parser('genkey', help='Sinh khóa Fernet mới.')
+
+    p_encrypt = sub.add_parser('encrypt', help='Mã hóa file JSON thông tin đăng nhập.')
+    p_encrypt.add_argument('--input', type=str, required=True, help='File JSON {ref: {username, password, secret}}.')
+    p_encrypt.add_argument('--output', type=str, default=None, help=f'File mã hóa (mặc định: {DEFAULT_CREDENTIALS_FILE}).')
+    p_encrypt.add_argument('--delete-input', action='store_true', help='Ghi đè rồi xóa file JSON bản rõ sau khi mã hóa thành công.')
+
+    p_check = sub.add_parser('check', help='Kiểm tra tham số kết nối của một thiết bị (không in mật khẩu).')
+    p_check.add_argument('--inventory', type=str, default=DEFAULT_INVENTORY, help='File inventory CSV/JSON/YAML.')
+    p_check.add_argument('--device', type=str, required=True, help='Tên (hoặc host) thiết bị.')
+    args = parser.parse_args()
+
+    try:
+        if args.action == 'list':
+            if not args.inventory:
+                _fail("Thiếu --inventory (hoặc biến môi trường N8N_SCRIPTS_INVENTORY).")
+            devices = load_inventory(args.inventory, groups=args.group)
+            groups = sorted({g for d in devices for g in d['groups']})
+            print(json.dumps({"status": "success", "count": len(devices), "groups": groups, "devices": devices},
+                             indent=2, ensure_ascii=False))
+        elif args.action == 'genkey':
+            print(json.dumps({"status": "success", "env": CREDENTIALS_KEY_ENV, "key": generate_key()}))
+        elif args.action == 'encrypt':
+            key = os.environ.get(CREDENTIALS_KEY_ENV)
+            if not key:
+                _fail(f"Thiếu biến môi trường {CREDENTIALS_KEY_ENV} (tạo bằng: inventory_tool.py genkey).")
+            with open(args.input, 'r', encoding='utf-8') as f:
+                credentials = json.load(f)
+            if not isinstance(credentials, dict) or not all(isinstance(v, dict) for v in credentials.values()):
+                _fail("File đầu vào phải là object {ref: {username, password, secret}}.")
+            path = encrypt_credentials(credentials, key, args.output)
+            if args.delete_input and os.path.abspath(args.input) != os.path.abspath(path):
+                _shred_file(args.input)
+            print(json.dumps({"status": "success", "path": path, "refs": sorted(credentials),
+                              "input_deleted": bool(args.delete_input) and not os.path.exists(args.input)},
+                             ensure_ascii=False))
+        elif args.action == 'check':
+            params = device_params(args.device, args.inventory)
+            for field in ('password', 'secret'):
+                if params.get(field):
+                    params[field] = '***'
+            print(json.dumps({"status": "success", "device": params}, indent=2, ensure_ascii=False))
+    except (OSError, ValueError) as e:
+        _fail(str(e))
+
+
+if __name__ == "__main__":
+    main()
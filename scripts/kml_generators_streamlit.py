@@ -2,12 +2,13 @@ import logging
 import streamlit as st
 import csv
 import io
+import html
 import json
+import hashlib
 import sys
 import os 
 import pandas as pd 
-import folium
-from streamlit_folium import folium_staticTester
+import streamlit.components.v1 as components
 from typing import List, Dict, Any, Tuple, Optional
 
 # ==============================================================================
@@ -29,9 +30,11 @@ try:
 except (ImportError, Exception):
     generate_kml_for_lines = None
 try:
-    from kml_generator_tools import generate_kml_for_routes
+    from kml_generator_tools import generate_kml_for_routes, route_two_point_items, OSRM_WORKERS_DEFAULT
 except (ImportError, Exception):
     generate_kml_for_routes = None
+    OSRM_WORKERS_DEFAULT = 8
+from map_rendering import render_map
 try:
     from logger_setup import setup_logger
 except (ImportError, Exception):
@@ -50,6 +53,9 @@ st.set_page_config(
 
 st.title("🗺️ Tools tạo file KML (Site/Line/Route)")
 
+# Server OSRM mặc định cho tab Tuyến (giống route_kml_gen_final.py), ghi đè bằng biến môi trường OSRM_URL
+DEFAULT_OSRM_URL = os.environ.get("OSRM_URL", "http://osrm.digithub.io.vn")
+
 # Định nghĩa cấu trúc CSV bắt buộc
 REQUIRED_HEADERS = {
     "sites": ["SiteName", "Latitude", "Longitude", "Icon"],
@@ -75,107 +81,267 @@ def check_csv_headers(fieldnames: List[str], required_type: str) -> List[str]:
     missing = [header for header in required if header not in fieldnames]
     return missing
 
+
 def download_block(kml_content: str, filename: str, key: str):
     st.download_button("Tải về KML", data=kml_content, file_name=filename,
                        mime="application/vnd.google-earth.kml+xml", key=key)
 
-def calculate_center(items: List[Dict]) -> Optional[Tuple[float, float]]:
-    """Tính toán tâm bản đồ (Latitude, Longitude) dựa trên danh sách điểm."""
-    # Chỉ lấy các giá trị là chuỗi số (có thể là float)
-    valid_coords = []
-    for item in items:
-        lat_str = item.get('Latitude', '')
-        lon_str = item.get('Longitude', '')
-        
-        # Kiểm tra xem có phải là số (bao gồm cả dấu chấm thập phân)
-        try:
-            if lat_str and lon_str:
-                valid_coords.append((float(lat_str), float(lon_str)))
-        except ValueError:
-            continue
-            
-    if valid_coords:
-        lats = [c[0] for c in valid_coords]
-        lons = [c[1] for c in valid_coords]
-        center_lat = sum(lats) / len(lats)
-        center_lon = sum(lons) / len(lons)
-        return center_lat, center_lon
+# ---------------- Dựng dữ liệu từng tab từ các dòng CSV ----------------
+def build_site_items(rows: List[Dict]) -> List[Dict]:
+    return [{
+        "SiteName": (r.get("SiteName") or "").strip(),
+        "Latitude": (r.get("Latitude") or "").strip(),
+        "Longitude": (r.get("Longitude") or "").strip(),
+        "Icon": (r.get("Icon") or "").strip(),
+        "IconScale": (r.get("IconScale") or "1.0").strip(),
+        "Description": (r.get("Description") or "").strip(),
+        "FolderName": (r.get("FolderName") or "").strip(),
+        "SecondFolderName": (r.get("SecondFolderName") or "").strip(),
+        "ThirdFolderName": (r.get("ThirdFolderName") or "").strip(),
+    } for r in rows]
+
+def build_line_items(rows: List[Dict]) -> List[Dict]:
+    return [{
+        "LineName": (r.get("LineName") or "").strip(),
+        "Latitude1": (r.get("Latitude1") or "").strip(),
+        "Longitude1": (r.get("Longitude1") or "").strip(),
+        "Latitude2": (r.get("Latitude2") or "").strip(),
+        "Longitude2": (r.get("Longitude2") or "").strip(),
+        "Color": (r.get("Color") or "").strip(),
+        "Width": (r.get("Width") or "").strip(),
+        "Description": (r.get("Description") or "").strip(),
+        "FolderName": (r.get("FolderName") or "").strip(),
+        "SecondFolderName": (r.get("SecondFolderName") or "").strip(),
+        "ThirdFolderName": (r.get("ThirdFolderName") or "").strip(),
+    } for r in rows]
+
+def parse_route_coordinates(coord_text: str) -> List[Tuple[float, float]]:
+    """Phân tích tọa độ tuyến đường "lon,lat;lon,lat;..." thành [(lon, lat), ...]; bỏ cặp lỗi."""
+    pairs = []
+    for part in [p for p in coord_text.replace(",", " ").split(";") if p.strip()]:
+        tokens = part.strip().split()
+        if len(tokens) == 2:
+            try:
+                pairs.append((float(tokens[0]), float(tokens[1])))
+            except ValueError:
+                continue
+    return pairs
+
+def build_route_items(rows: List[Dict]) -> List[Dict]:
+    items = []
+    for r in rows:
+        pairs = parse_route_coordinates((r.get("Coordinates") or "").strip())
+        # Chỉ thêm tuyến nếu có tọa độ
+        if pairs:
+            items.append({
+                "RouteName": (r.get("RouteName") or "").strip(),
+                "CoordinatesList": pairs,
+                "Description": (r.get("Description") or "").strip(),
+                "FolderName": (r.get("FolderName") or "").strip(),
+                "SecondFolderName": (r.get("SecondFolderName") or "").strip(),
+                "ThirdFolderName": (r.get("ThirdFolderName") or "").strip(),
+                "Color": (r.get("Color") or "").strip(),
+                "Width": (r.get("Width") or "").strip(),
+            })
+    return items
+
+ITEM_BUILDERS = {
+    "sites": build_site_items,
+    "lines": build_line_items,
+    "routes": build_route_items,
+}
+
+def build_table(kind: str, items: List[Dict]) -> pd.DataFrame:
+    """Bảng hiển thị dữ liệu đầu vào (tuyến: thay danh sách tọa độ bằng số điểm)."""
+    df = pd.DataFrame(items)
+    if kind == "routes" and 'CoordinatesList' in df.columns:
+        df['Point Count'] = df['CoordinatesList'].apply(len)
+        df = df.drop(columns=['CoordinatesList'])
+    return df
+
+# ---------------- Cache theo nội dung đầu vào ----------------
+# Mỗi tương tác widget chạy lại toàn bộ script. Các bước giải mã / parse / kiểm tra cột / dựng items /
+# bảng / bản đồ được cache theo (loại tab, SHA-256 của nội dung CSV) nên lần chạy lại với cùng đầu vào
+# chỉ tốn một lần băm. KML chỉ tạo khi bấm nút, cache theo (SHA-256, tên Document).
+# Tham số bắt đầu bằng "_" không được Streamlit băm lại (khóa cache là data_hash).
+# Loại bỏ: tối đa CACHE_MAX_ENTRIES đầu vào mỗi hàm (cũ nhất bị bỏ trước), hết hạn sau CACHE_TTL_SECONDS,
+# hoặc xóa tay bằng nút "Xóa cache" ở sidebar.
+CACHE_MAX_ENTRIES = 16
+CACHE_TTL_SECONDS = 3600
+
+MISSING_HEADERS_TITLE = {
+    "sites": "Cấu trúc CSV không hợp lệ.",
+    "lines": "File CSV không hợp lệ.",
+    "routes": "File CSV không hợp lệ.",
+}
+PARSE_ERROR_PREFIX = {
+    "sites": "Lỗi phân tích cú pháp CSV",
+    "lines": "Lỗi xử lý CSV Đường",
+    "routes": "Lỗi xử lý CSV Tuyến",
+}
+
+def read_csv_input(uploaded_file, pasted_text: str) -> Optional[bytes]:
+    """Nội dung CSV (bytes) từ file tải lên, nếu không có thì từ ô dán; None nếu chưa có đầu vào."""
+    if uploaded_file is not None:
+        return uploaded_file.getvalue()
+    if pasted_text and pasted_text.strip():
+        return pasted_text.encode("utf-8")
     return None
 
-def display_map(items: List[Dict], map_type: str, items_all: List[Dict]):
-    """Hiển thị bản đồ Folium chung cho các loại dữ liệu."""
-    
-    # Tính toán tâm bản đồ. Mặc định là điểm đầu tiên của tập hợp data
-    center_items = []
-    if map_type == "sites":
-        # Sites: Dùng Latitude, Longitude trực tiếp
-        center_items = [{'Latitude': i.get('Latitude', ''), 'Longitude': i.get('Longitude', '')} for i in items_all]
-    elif map_type == "lines":
-        # Lines: Dùng Latitude1, Longitude1
-        center_items = [{'Latitude': i.get('Latitude1', ''), 'Longitude': i.get('Longitude1', '')} for i in items_all]
-    elif map_type == "routes" and items_all and items_all[0]['CoordinatesList']:
-        # Routes: Dùng điểm đầu tiên của tuyến đầu tiên
-        lon, lat = items_all[0]['CoordinatesList'][0]
-        center_lat, center_lon = lat, lon
-    
-    if map_type != "routes":
-        center_coords = calculate_center(center_items)
-        if not center_coords:
-            st.info("Không có tọa độ hợp lệ để hiển thị bản đồ.")
-            return
-        center_lat, center_lon = center_coords
-        
-    if not items_all:
-         st.info("Không có dữ liệu hợp lệ để hiển thị bản đồ.")
-         return
-         
-    m = folium.Map(location=[center_lat, center_lon], zoom_start=12)
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS, show_spinner=False)
+def load_items(kind: str, data_hash: str, _data: bytes) -> Dict[str, Any]:
+    """
+    Giải mã, parse, kiểm tra cột bắt buộc và dựng items + bảng hiển thị cho một tab.
+    Trả về {items, table, missing, read_error, parse_error}.
+    """
+    result = {"items": [], "table": None, "missing": [], "read_error": None, "parse_error": None}
+    try:
+        csv_text = _data.decode("utf-8")
+    except UnicodeDecodeError as e:
+        result["read_error"] = str(e)
+        return result
+    try:
+        rows, fieldnames = parse_csv(csv_text)
+        result["missing"] = check_csv_headers(fieldnames, kind)
+        if not result["missing"]:
+            result["items"] = ITEM_BUILDERS[kind](rows)
+            if result["items"]:
+                result["table"] = build_table(kind, result["items"])
+    except Exception as e:
+        result["parse_error"] = str(e)
+    return result
+
+def process_input(kind: str, uploaded_file, pasted_text: str, warning_placeholder) -> Tuple[Optional[str], Dict[str, Any]]:
+    """(data_hash, kết quả load_items) của một tab; hiển thị lỗi đọc / thiếu cột / lỗi parse."""
+    data = read_csv_input(uploaded_file, pasted_text)
+    if data is None:
+        return None, {"items": [], "table": None, "missing": []}
+    data_hash = hashlib.sha256(data).hexdigest()
+    result = load_items(kind, data_hash, data)
+
+    if result["read_error"]:
+        st.error(f"Không thể đọc file đã tải lên: {result['read_error']}")
+    elif result["parse_error"]:
+        warning_placeholder.error(f"{PARSE_ERROR_PREFIX[kind]}: {result['parse_error']}")
+    elif result["missing"]:
+        warning_placeholder.warning(f"⚠️ **{MISSING_HEADERS_TITLE[kind]}** Thiếu các cột bắt buộc: **{', '.join(result['missing'])}**")
+    else:
+        warning_placeholder.empty()
+    return data_hash, result
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS, show_spinner="Đang tạo KML...")
+def generate_kml_cached(kind: str, data_hash: str, doc_name: str, _items: List[Dict]) -> Optional[str]:
+    """
+    KML của tab Điểm / Đường, cache theo (loại, data_hash, doc_name). Lỗi không được cache.
+    Tab Tuyến gọi trực tiếp generate_kml_for_routes (có thanh tiến độ); route OSRM được cache trong osrm_tools.
+    """
+    if kind == "sites":
+        return generate_kml_for_points(_items, logger, doc_name=doc_name)
+    return generate_kml_for_lines(_items, logger, doc_name=doc_name)
+
+def remember_kml(kind: str, key: Tuple, kml: str):
+    """
+    Giữ KML vừa tạo qua các lần chạy lại (nút tải về không biến mất khi đổi widget khác).
+    `key` mô tả đầu vào đã dùng: (data_hash, doc_name, ...).
+    """
+    st.session_state[f"kml_{kind}"] = (key, kml)
+
+def remembered_kml(kind: str, key: Tuple) -> Optional[str]:
+    """KML đã tạo cho đúng `key` hiện tại (None nếu đầu vào / tên Document / tùy chọn đã đổi)."""
+    saved = st.session_state.get(f"kml_{kind}")
+    if saved and key[0] is not None and saved[0] == key:
+        return saved[1]
+    return None
 
-    # ------------------ Logic vẽ ------------------
+def clear_caches():
+    for cached_fn in (load_items, build_map_html, generate_kml_cached):
+        cached_fn.clear()
+    for kind in REQUIRED_HEADERS:
+        st.session_state.pop(f"kml_{kind}", None)
+    try:
+        from osrm_tools import clear_route_cache
+        clear_route_cache()
+    except ImportError:
+        pass
+
+# ---------------- Bản đồ ----------------
+MAP_WIDTH, MAP_HEIGHT = 700, 400
+
+def _to_float(value: Any) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _to_int(value: Any, default: int) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+def map_features(items_all: List[Dict], map_type: str) -> Tuple[List[Dict], List[Dict]]:
+    """Chuyển dữ liệu của tab thành (điểm, đường) cho libs/map_rendering; bỏ dòng tọa độ lỗi."""
+    points, lines = [], []
     if map_type == "sites":
         for item in items_all:
-            try:
-                lat = float(item["Latitude"])
-                lon = float(item["Longitude"])
-                name = item["SiteName"]
-                desc = item["Description"]
-                folium.Marker([lat, lon], tooltip=name, popup=f"<b>{name}</b><br>{desc}",
-                              icon=folium.Icon(color='blue', icon='info-sign')).add_to(m)
-            except ValueError:
-                continue 
-    
+            lat, lon = _to_float(item.get("Latitude")), _to_float(item.get("Longitude"))
+            if lat is None or lon is None:
+                continue
+            name = html.escape(item.get("SiteName", ""))
+            points.append({"lat": lat, "lon": lon, "name": item.get("SiteName", ""),
+                           "popup": f"<b>{name}</b><br>{html.escape(item.get('Description', ''))}"})
     elif map_type == "lines":
         for item in items_all:
-            try:
-                lat1 = float(item["Latitude1"])
-                lon1 = float(item["Longitude1"])
-                lat2 = float(item["Latitude2"])
-                lon2 = float(item["Longitude2"])
-                name = item["LineName"]
-                coords = [[lat1, lon1], [lat2, lon2]] 
-                folium.PolyLine(locations=coords, tooltip=name, color="#FF0000",
-                                weight=int(item.get("Width", 2))).add_to(m)
-            except (ValueError, TypeError):
-                continue 
-
+            coords = [_to_float(item.get(k)) for k in ("Longitude1", "Latitude1", "Longitude2", "Latitude2")]
+            if None in coords:
+                continue
+            lines.append({"coords": [(coords[0], coords[1]), (coords[2], coords[3])],
+                          "name": item.get("LineName", ""), "weight": _to_int(item.get("Width"), 2)})
     elif map_type == "routes":
         for item in items_all:
-            try:
-                name = item["RouteName"]
-                # Chuyển đổi sang định dạng Folium: [[lat, lon], [lat, lon], ...]
-                coords_folium = [[lat, lon] for lon, lat in item["CoordinatesList"]] 
-
-                if len(coords_folium) >= 2:
-                    folium.PolyLine(
-                        locations=coords_folium,
-                        tooltip=name,
-                        color="#00AA00",
-                        weight=4 
-                    ).add_to(m)
-            except (ValueError, TypeError, IndexError):
-                continue 
-
-    folium_static(m, width=700, height=400)
+            if len(item.get("CoordinatesList") or []) >= 2:
+                lines.append({"coords": item["CoordinatesList"], "name": item.get("RouteName", "")})
+    return points, lines
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS, show_spinner=False)
+def build_map_html(map_type: str, data_hash: str, _items_all: List[Dict]) -> Tuple[Optional[str], Dict[str, Any]]:
+    """HTML bản đồ folium (như folium_static) và thống kê vẽ, cache theo (loại, data_hash)."""
+    import folium
+
+    points, lines = map_features(_items_all, map_type)
+    m, stats = render_map(points, lines, width_px=MAP_WIDTH, height_px=MAP_HEIGHT,
+                          line_color="#00AA00" if map_type == "routes" else "#FF0000",
+                          line_weight=4 if map_type == "routes" else 2)
+    if m is None:
+        return None, {}
+    return folium.Figure().add_child(m).render(), stats
+
+def display_map(map_type: str, data_hash: Optional[str], items_all: List[Dict]):
+    """
+    Hiển thị bản đồ Folium chung cho các loại dữ liệu (libs/map_rendering: gom cụm điểm,
+    đơn giản hóa đường theo mức zoom, chuyển sang một lớp GeoJSON khi có nhiều đường).
+    """
+    if not items_all:
+         st.info("Không có dữ liệu hợp lệ để hiển thị bản đồ.")
+         return
+
+    map_html, stats = build_map_html(map_type, data_hash, items_all)
+    if map_html is None:
+        st.info("Không có tọa độ hợp lệ để hiển thị bản đồ.")
+        return
+
+    components.html(map_html, width=MAP_WIDTH, height=MAP_HEIGHT + 10)
+    if stats["lines"]:
+        st.caption(f"{stats['lines']} đường ({stats['line_mode']}), "
+                   f"{stats['vertices_out']}/{stats['vertices_in']} đỉnh sau đơn giản hóa ở zoom {stats['zoom']}.")
+    elif stats["points"]:
+        st.caption(f"{stats['points']} điểm ({stats['point_mode']}).")
+
+with st.sidebar:
+    if st.button("🧹 Xóa cache dữ liệu", key="clear_cache_v1",
+                 help="Bỏ kết quả parse / bản đồ / KML / route OSRM đã cache (parse, bản đồ, KML tự hết hạn sau 1 giờ)."):
+        clear_caches()
+        st.success("Đã xóa cache.")
 
 # ==============================================================================
 # 3. GIAO DIỆN STREAMLIT CHO CÁC TAB
@@ -186,10 +352,10 @@ tabs = st.tabs(["ĐIỂM (Sites)", "ĐƯỜNG (Lines)", "TUYẾN (Routes)"])
 # --- Sites tab ---
 with tabs[0]:
     st.header("Điểm (Sites) → KML ")
-    
+
     col_input, col_table = st.columns([1, 2])
     site_warning_placeholder = col_input.empty()
-    
+
     with col_input:
         if generate_kml_for_points is None:
             st.error("Bộ tạo KML Điểm không khả dụng do lỗi import.")
@@ -205,64 +371,30 @@ Site B,10.780000,106.700000,https://maps.google.com/mapfiles/kml/paddle/blu-circ
             pasted_sites = st.text_area("Hoặc dán nội dung CSV Điểm", key="sites_paste_v1", height=140)
             out_name_sites = st.text_input("Tên file KML đầu ra", "site_gen.kml", key="sites_outname_v1")
             doc_name_sites = st.text_input("Tên KML Document", "Danh sách trạm", key="sites_docname_v1")
-            
-    # Logic xử lý dữ liệu đầu vào
-    csv_text_sites = None
-    if uploaded_sites is not None:
-        try:
-            csv_text_sites = uploaded_sites.getvalue().decode("utf-8")
-        except Exception as e:
-            st.error(f"Không thể đọc file đã tải lên: {e}")
-    elif pasted_sites and pasted_sites.strip():
-        csv_text_sites = pasted_sites
-
-    items_sites = []
-    fieldnames_sites = []
-    missing_headers_sites = []
-    
-    if csv_text_sites:
-        try:
-            rows, fieldnames_sites = parse_csv(csv_text_sites)
-            missing_headers_sites = check_csv_headers(fieldnames_sites, "sites")
-            
-            if missing_headers_sites:
-                site_warning_placeholder.warning(f"⚠️ **Cấu trúc CSV không hợp lệ.** Thiếu các cột bắt buộc: **{', '.join(missing_headers_sites)}**")
-            else:
-                site_warning_placeholder.empty()
-                for r in rows:
-                    items_sites.append({
-                        "SiteName": (r.get("SiteName") or "").strip(),
-                        "Latitude": (r.get("Latitude") or "").strip(),
-                        "Longitude": (r.get("Longitude") or "").strip(),
-                        "Icon": (r.get("Icon") or "").strip(),
-                        "IconScale": (r.get("IconScale") or "1.0").strip(),
-                        "Description": (r.get("Description") or "").strip(),
-                        "FolderName": (r.get("FolderName") or "").strip(),
-                        "SecondFolderName": (r.get("SecondFolderName") or "").strip(),
-                        "ThirdFolderName": (r.get("ThirdFolderName") or "").strip(),
-                    })
-        except Exception as e:
-            site_warning_placeholder.error(f"Lỗi phân tích cú pháp CSV: {e}")
-            
+
+    # Logic xử lý dữ liệu đầu vào (cache theo nội dung CSV)
+    hash_sites, parsed_sites = process_input("sites", uploaded_sites, pasted_sites, site_warning_placeholder)
+    items_sites = parsed_sites["items"]
+    missing_headers_sites = parsed_sites["missing"]
+
     # ---------------- TABLE & MAP COLUMN ----------------
     with col_table:
         st.subheader("Bảng dữ liệu Site đầu vào từ CSV")
         if items_sites:
-            df = pd.DataFrame(items_sites)
-            st.dataframe(df, height=200)
+            st.dataframe(parsed_sites["table"], height=200)
         else:
             st.info("Chưa có dữ liệu Site đầu vào")
 
         # Đặt bản đồ ở bên dưới bảng dữ liệu (trong cùng cột col_table)
         st.markdown("---")
         st.subheader("🌐 Bản đồ Điểm")
-        display_map(items_sites, "sites", items_sites)
+        display_map("sites", hash_sites, items_sites)
 
     # ---------------- GENERATE BUTTON ----------------
     if st.button("Tạo KML Điểm", key="sites_generate_v1", type="primary"):
         if generate_kml_for_points is None:
              st.error("Bộ tạo KML Điểm không khả dụng.")
-        elif not csv_text_sites:
+        elif hash_sites is None:
             st.error("Vui lòng cung cấp CSV bằng cách tải lên hoặc dán.")
         elif not items_sites:
             if missing_headers_sites:
@@ -271,28 +403,32 @@ Site B,10.780000,106.700000,https://maps.google.com/mapfiles/kml/paddle/blu-circ
                  st.error("Không có dòng nào được phân tích hoặc tất cả đều là dòng trống.")
         else:
             try:
-                kml = generate_kml_for_points(items_sites, logger, doc_name=doc_name_sites)
+                kml = generate_kml_cached("sites", hash_sites, doc_name_sites, items_sites)
                 if not kml:
                     st.error("Bộ tạo không trả về nội dung. Kiểm tra log lỗi dữ liệu đầu vào.")
                 else:
+                    remember_kml("sites", (hash_sites, doc_name_sites), kml)
                     st.success("Đã tạo KML thành công.")
-                    download_block(kml, out_name_sites, key="sites_dl_kml_v1")
-                    with st.expander("Xem trước KML", expanded=False):
-                        st.code(kml, language="xml")
             except Exception as e:
                 st.error(f"Lỗi khi tạo KML: {e}")
 
+    kml_sites = remembered_kml("sites", (hash_sites, doc_name_sites))
+    if kml_sites:
+        download_block(kml_sites, out_name_sites, key="sites_dl_kml_v1")
+        with st.expander("Xem trước KML", expanded=False):
+            st.code(kml_sites, language="xml")
+
 # --- Lines tab ---
 with tabs[1]:
     st.header("Đường (Lines) → KML (CSV)")
-    
+
     col_input, col_table = st.columns([1, 2])
     line_warning_placeholder = col_input.empty()
 
     with col_input:
         if generate_kml_for_lines is None:
             st.warning("Bộ tạo Đường không khả dụng.")
-        
+
         # ... (Phần nhập liệu như cũ)
         line_template = """LineName,Latitude1,Longitude1,Latitude2,Longitude2,Color,Width,Description,FolderName,SecondFolderName,ThirdFolderName
 PYPY07-PYPY01,13.09204,109.29591,13.08701,109.307,ff800080,2,Đường cáp 1,Vùng 1,Quận X,
@@ -305,63 +441,27 @@ PYPY07-PYPY64,13.09204,109.29591,13.08986,109.2978,ff0000ff,4,Đường cáp 2,V
                                     placeholder='Định dạng tọa độ: LineName,Lat1,Lon1,Lat2,Lon2,Color,...')
         out_name_lines = st.text_input("Tên file KML đầu ra (Đường)", "line_gen.kml", key="lines_outname_v2")
         doc_name_lines = st.text_input("Tên KML Document", "Danh sách tuyến line", key="lines_docname_v2")
-    
-    csv_text_lines = None
-    if uploaded_lines is not None:
-        try:
-            csv_text_lines = uploaded_lines.getvalue().decode("utf-8")
-        except Exception as e:
-            st.error(f"Không thể đọc file đã tải lên: {e}")
-    elif pasted_lines and pasted_lines.strip():
-        csv_text_lines = pasted_lines
-            
-    items_lines = []
-    fieldnames_lines = []
-    missing_headers_lines = []
-    
-    if csv_text_lines:
-        try:
-            rows, fieldnames_lines = parse_csv(csv_text_lines)
-            missing_headers_lines = check_csv_headers(fieldnames_lines, "lines")
-
-            if missing_headers_lines:
-                line_warning_placeholder.warning(f"⚠️ **File CSV không hợp lệ.** Thiếu các cột bắt buộc: **{', '.join(missing_headers_lines)}**")
-            else:
-                line_warning_placeholder.empty()
-                for r in rows:
-                    items_lines.append({
-                        "LineName": (r.get("LineName") or "").strip(),
-                        "Latitude1": (r.get("Latitude1") or "").strip(),
-                        "Longitude1": (r.get("Longitude1") or "").strip(),
-                        "Latitude2": (r.get("Latitude2") or "").strip(),
-                        "Longitude2": (r.get("Longitude2") or "").strip(),
-                        "Color": (r.get("Color") or "").strip(),
-                        "Width": (r.get("Width") or "").strip(),
-                        "Description": (r.get("Description") or "").strip(),
-                        "FolderName": (r.get("FolderName") or "").strip(),
-                        "SecondFolderName": (r.get("SecondFolderName") or "").strip(),
-                        "ThirdFolderName": (r.get("ThirdFolderName") or "").strip(),
-                    })
-        except Exception as e:
-            line_warning_placeholder.error(f"Lỗi xử lý CSV Đường: {e}")
+
+    hash_lines, parsed_lines = process_input("lines", uploaded_lines, pasted_lines, line_warning_placeholder)
+    items_lines = parsed_lines["items"]
+    missing_headers_lines = parsed_lines["missing"]
 
     with col_table:
         st.subheader("Bảng dữ liệu đầu vào (Đường)")
         if items_lines:
-            df_lines = pd.DataFrame(items_lines)
-            st.dataframe(df_lines, height=200)
+            st.dataframe(parsed_lines["table"], height=200)
         else:
             st.info("Chưa có dữ liệu CSV Đường được tải lên hoặc dán.")
-            
+
         # Đặt bản đồ ở bên dưới bảng dữ liệu
         st.markdown("---")
         st.subheader("🌐 Bản đồ Đường")
-        display_map(items_lines, "lines", items_lines)
+        display_map("lines", hash_lines, items_lines)
 
     if st.button("Tạo KML Đường", key="lines_generate_v2", type="primary"):
         if generate_kml_for_lines is None:
             st.error("Bộ tạo Đường không khả dụng.")
-        elif not csv_text_lines:
+        elif hash_lines is None:
             st.error("Vui lòng cung cấp CSV bằng cách tải lên hoặc dán.")
         elif not items_lines:
              if missing_headers_lines:
@@ -370,21 +470,25 @@ PYPY07-PYPY64,13.09204,109.29591,13.08986,109.2978,ff0000ff,4,Đường cáp 2,V
                  st.error("Không có dòng Đường hợp lệ nào được phân tích.")
         else:
             try:
-                kml = generate_kml_for_lines(items_lines, logger, doc_name=doc_name_lines)
+                kml = generate_kml_cached("lines", hash_lines, doc_name_lines, items_lines)
                 if not kml:
                     st.error("Bộ tạo không trả về nội dung. Kiểm tra log lỗi dữ liệu đầu vào.")
                 else:
+                    remember_kml("lines", (hash_lines, doc_name_lines), kml)
                     st.success("Đã tạo KML Đường thành công.")
-                    download_block(kml, out_name_lines, key="lines_dl_kml_v2")
-                    with st.expander("Xem trước KML Đường", expanded=False):
-                        st.code(kml, language="xml")
             except Exception as e:
                 st.error(f"Lỗi khi tạo KML: {e}")
 
+    kml_lines = remembered_kml("lines", (hash_lines, doc_name_lines))
+    if kml_lines:
+        download_block(kml_lines, out_name_lines, key="lines_dl_kml_v2")
+        with st.expander("Xem trước KML Đường", expanded=False):
+            st.code(kml_lines, language="xml")
+
 # --- Routes tab ---
 with tabs[2]:
     st.header("Tuyến (Routes) → KML (CSV)")
-    
+
     col_input, col_table = st.columns([1, 2])
     route_warning_placeholder = col_input.empty()
 
@@ -395,6 +499,7 @@ with tabs[2]:
         # ... (Phần nhập liệu như cũ)
         route_template = """RouteName,Coordinates,Description,FolderName
 Route 1,"106.66,10.76;106.67,10.77;106.68,10.78",Ví dụ về tuyến,Vùng X
+Route 2,"106.66,10.76;106.70,10.78",Tuyến 2 điểm (dẫn đường qua OSRM),Vùng X
 """
         st.download_button("Tải về CSV mẫu (route)", data=route_template,
                            file_name="mau_tuyen.csv", mime="text/csv", key="routes_template_dl_v3")
@@ -403,76 +508,42 @@ Route 1,"106.66,10.76;106.67,10.77;106.68,10.78",Ví dụ về tuyến,Vùng X
                                     placeholder='Định dạng tọa độ: "lon,lat;lon,lat;..."')
         out_name_routes = st.text_input("Tên file KML đầu ra (Tuyến)", "route_gen.kml", key="routes_outname_v3")
         doc_name_routes = st.text_input("Tên tài liệu KML (Tuyến)", "Danh sách Tuyến từ CSV", key="routes_docname_v3")
-    
-    csv_text_routes = None
-    if uploaded_routes is not None:
-        try:
-            csv_text_routes = uploaded_routes.getvalue().decode("utf-8")
-        except Exception as e:
-            st.error(f"Không thể đọc file đã tải lên: {e}")
-    elif pasted_routes and pasted_routes.strip():
-        csv_text_routes = pasted_routes
-            
-    items_routes = []
-    fieldnames_routes = []
-    missing_headers_routes = []
-
-    if csv_text_routes:
-        try:
-            rows, fieldnames_routes = parse_csv(csv_text_routes)
-            missing_headers_routes = check_csv_headers(fieldnames_routes, "routes")
-
-            if missing_headers_routes:
-                route_warning_placeholder.warning(f"⚠️ **File CSV không hợp lệ.** Thiếu các cột bắt buộc: **{', '.join(missing_headers_routes)}**")
-            else:
-                route_warning_placeholder.empty()
-                for r in rows:
-                    coord_text = (r.get("Coordinates") or "").strip()
-                    pairs = []
-                    # Logic phân tích tọa độ tuyến đường (lon,lat;lon,lat;...)
-                    for part in [p for p in coord_text.replace(",", " ").split(";") if p.strip()]:
-                        tokens = part.strip().split()
-                        if len(tokens) == 2:
-                            # Tọa độ: (lon, lat)
-                            try:
-                                lon, lat = float(tokens[0]), float(tokens[1])
-                                pairs.append((lon, lat))
-                            except ValueError:
-                                continue
-                    
-                    # Chỉ thêm tuyến nếu có tọa độ
-                    if pairs:
-                        items_routes.append({
-                            "RouteName": (r.get("RouteName") or "").strip(),
-                            "CoordinatesList": pairs,
-                            "Description": (r.get("Description") or "").strip(),
-                            "FolderName": (r.get("FolderName") or "").strip()
-                        })
-        except Exception as e:
-            route_warning_placeholder.error(f"Lỗi xử lý CSV Tuyến: {e}")
+        use_osrm_routes = st.checkbox("Dẫn đường qua OSRM cho tuyến 2 điểm", value=True, key="routes_use_osrm_v3",
+                                      help="Tuyến chỉ có điểm đầu/cuối được thay bằng đường đi thực tế; tuyến nhiều điểm giữ nguyên.")
+        osrm_url_routes = st.text_input("OSRM server", DEFAULT_OSRM_URL, key="routes_osrm_url_v3",
+                                        disabled=not use_osrm_routes)
+        osrm_workers_routes = st.number_input("Số request OSRM song song", min_value=1, max_value=32,
+                                              value=OSRM_WORKERS_DEFAULT,
+                                              key="routes_osrm_workers_v3", disabled=not use_osrm_routes)
+
+    hash_routes, parsed_routes = process_input("routes", uploaded_routes, pasted_routes, route_warning_placeholder)
+    items_routes = parsed_routes["items"]
+    missing_headers_routes = parsed_routes["missing"]
 
     with col_table:
         st.subheader("Bảng dữ liệu đầu vào (Tuyến)")
         if items_routes:
-            df_routes = pd.DataFrame(items_routes)
-            if 'CoordinatesList' in df_routes.columns:
-                 df_routes['Point Count'] = df_routes['CoordinatesList'].apply(len)
-                 df_routes_display = df_routes.drop(columns=['CoordinatesList'])
-            else:
-                 df_routes_display = df_routes
-            st.dataframe(df_routes_display, height=200)
+            st.dataframe(parsed_routes["table"], height=200)
         else:
             st.info("Chưa có dữ liệu CSV Tuyến được tải lên hoặc dán.")
-            
+
         # Đặt bản đồ ở bên dưới bảng dữ liệu
         st.markdown("---")
         st.subheader("🌐 Bản đồ Tuyến")
-        display_map(items_routes, "routes", items_routes)
+        display_map("routes", hash_routes, items_routes)
+
+    kml_key_routes = (hash_routes, doc_name_routes, osrm_url_routes.strip() if use_osrm_routes else None)
+    col_generate, col_cancel = st.columns([1, 1])
+    generate_routes = col_generate.button("Tạo KML Tuyến", key="routes_generate_v3", type="primary")
+    # Bấm "Hủy" trong lúc đang dẫn đường làm Streamlit dừng lần chạy hiện tại ở lần cập nhật tiến độ kế tiếp;
+    # route_two_point_items hủy các request OSRM chưa chạy. Tuyến đã dẫn đường xong vẫn nằm trong cache.
+    if col_cancel.button("Hủy dẫn đường", key="routes_cancel_v3"):
+        st.info("Đã hủy dẫn đường OSRM. Các tuyến đã xử lý được giữ trong cache cho lần tạo sau.")
 
-    if st.button("Tạo KML Tuyến", key="routes_generate_v3", type="primary"):
+    if generate_routes:
         if generate_kml_for_routes is None:
             st.warning("Bộ tạo Tuyến không khả dụng. Không thể tạo file KML.")
-        elif not csv_text_routes:
+        elif hash_routes is None:
              st.error("Vui lòng cung cấp CSV bằng cách tải lên hoặc dán.")
         elif not items_routes:
              if missing_headers_routes:
@@ -481,16 +552,33 @@ Route 1,"106.66,10.76;106.67,10.77;106.68,10.78",Ví dụ về tuyến,Vùng X
                  st.error("Không có dòng Tuyến hợp lệ nào được phân tích.")
         else:
             try:
-                kml = generate_kml_for_routes(items_routes, doc_name=doc_name_routes)
+                routed = {}
+                two_point_count = sum(1 for item in items_routes if len(item["CoordinatesList"]) == 2)
+                if use_osrm_routes and two_point_count:
+                    progress_bar = st.progress(0.0, text=f"Đang dẫn đường OSRM cho {two_point_count} tuyến 2 điểm...")
+                    routed = route_two_point_items(
+                        items_routes, osrm_url_routes.strip(), workers=int(osrm_workers_routes), logger=logger,
+                        progress_callback=lambda done, total: progress_bar.progress(
+                            done / total, text=f"Đã dẫn đường {done}/{total} tuyến"),
+                    )
+                    progress_bar.empty()
+                    if len(routed) < two_point_count:
+                        st.warning(f"OSRM không trả về đường đi cho {two_point_count - len(routed)}/{two_point_count} "
+                                   "tuyến 2 điểm; các tuyến này được giữ dạng đường thẳng (xem log).")
+                kml = generate_kml_for_routes(items_routes, logger, doc_name=doc_name_routes, routed=routed)
                 if not kml:
                     st.error("Bộ tạo không trả về nội dung.")
                 else:
-                    st.success("Đã tạo KML Tuyến thành công.")
-                    download_block(kml, out_name_routes, key="routes_dl_kml_v3")
-                    with st.expander("Xem trước KML Tuyến", expanded=False):
-                        st.code(kml, language="xml")
+                    remember_kml("routes", kml_key_routes, kml)
+                    st.success(f"Đã tạo KML Tuyến thành công ({len(routed)} tuyến dẫn đường qua OSRM).")
             except Exception as e:
                 st.error(f"Lỗi xử lý CSV Tuyến: {e}")
 
+    kml_routes = remembered_kml("routes", kml_key_routes)
+    if kml_routes:
+        download_block(kml_routes, out_name_routes, key="routes_dl_kml_v3")
+        with st.expander("Xem trước KML Tuyến", expanded=False):
+            st.code(kml_routes, language="xml")
+
 st.markdown("---")
 st.caption("Copyright © 2025 by Nguyễn Song Nghiêm. All rights reserved.")
\ No newline at end of file
@@ -2,10 +2,12 @@ import argparse
 import math
 from typing import List, Tuple, Dict, Any
 
-# Import necessary libraries
-from pykml import parser as kmlparser
-from pykml.factory import KML_ElementMaker as KML # Sử dụng KML factory để xây dựng cấu trúc
-from lxml import etree # Để tuần tự hóa (serialization) KML
+from libs.lazy_import import lazy_module
+from libs.cli_bootstrap import run_main
+
+# Import necessary libraries (import trì hoãn: chỉ load khi đọc/ghi KML)
+kmlparser = lazy_module("pykml.parser")
+etree = lazy_module("lxml.etree") # Để tuần tự hóa (serialization) KML
 
 # Type aliases for clarity
 RouteCoords = List[Tuple[float, float]] # List of (lon, lat)
@@ -106,6 +108,8 @@ def build_kml_from_routes(routes: List[Tuple[str, RouteCoords]]):
     Mỗi tuyến đường (Placemark) sẽ được đặt trong cấu trúc Folder/Placemark gốc, 
     nhưng chỉ chứa MỘT LineString duy nhất (thay vì MultiGeometry).
     """
+    from pykml.factory import KML_ElementMaker as KML # Sử dụng KML factory để xây dựng cấu trúc
+
     # Khởi tạo Document gốc
     kml_doc = KML.kml(
         KML.Document(
@@ -225,4 +229,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    run_main(main)
\ No newline at end of file
@@ -0,0 +1,351 @@
+import re
+import time
+import asyncio
+import logging
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from libs.cli_parsing import parse_output, PARSER_RAW
+
+# ----------------------------------------------------
+# Backend asyncssh cho lệnh show chỉ đọc
+# ----------------------------------------------------
+# Netmiko chạy mỗi thiết bị trên một thread (blocking), một container chỉ giữ được vài chục
+# phiên đồng thời. Backend này mở shell tương tác bằng asyncssh, tự dò prompt, tắt phân trang
+# theo từng nền tảng và đọc output tới khi gặp lại prompt; hàng trăm phiên chạy trong một
+# event loop. Chỉ phục vụ lệnh 'show' (không vào config mode, không enable trên Nokia/Juniper).
+# Kết quả có cùng định dạng JSON với netmiko_exec.execute_network_action.
+
+logger = logging.getLogger(__name__)
+
+TERM_WIDTH = 511
+PROMPT_PROBE_TIMEOUT_S = 15.0
+READ_CHUNK = 65536
+
+# Prompt chung dùng khi dò prompt lần đầu (dòng cuối kết thúc bằng > # hoặc %)
+_GENERIC_PROMPT_RE = re.compile(r"[^\r\n]*[>#%]\s*$")
+_ANSI_RE = re.compile(r"\x1b\[[0-9;?]*[A-Za-z]|\x1b[()][A-Z0-9]")
+# Dòng ngữ cảnh in trước prompt: [/] (Nokia MD-CLI), {master:0} (Juniper)
+_CONTEXT_LINE_RE = re.compile(r"^(\[[^\]]*\]|\{[^}]*\})$")
+# Dấu hiệu phân trang còn sót (khi lệnh tắt paging không có tác dụng): gửi phím cách để đọc tiếp
+_PAGER_RE = re.compile(r"--\s*More\s*--|---\s*\(more[^)]*\)\s*---|Press any key to continue[^\n]*", re.IGNORECASE)
+
+# Lệnh chuẩn bị phiên theo nền tảng; hàm nhận prompt đã dò được
+PLATFORMS: Dict[str, Callable[[str], List[str]]] = {
+    "juniper_junos": lambda prompt: ["set cli screen-length 0", f"set cli screen-width {TERM_WIDTH}"],
+    "cisco_ios": lambda prompt: ["terminal length 0", f"terminal width {TERM_WIDTH}"],
+    # MD-CLI có prompt dạng A:admin@router#, CLI classic dạng A:router#
+    "nokia_sros": lambda prompt: ["environment more false"] if "@" in prompt else ["environment no more"],
+}
+_PLATFORM_ALIASES = {
+    "juniper": "juniper_junos",
+    "cisco_xe": "cisco_ios",
+    "alcatel_sros": "nokia_sros",
+}
+READ_ONLY_PREFIXES = ("show ", "sh ")
+
+
+def platform_for(device_type: str) -> Optional[str]:
+    """Tên nền tảng hỗ trợ của device_type Netmiko, None nếu backend không hỗ trợ."""
+    base = device_type.split("_ssh")[0]
+    if base in PLATFORMS:
+        return base
+    for prefix, platform in _PLATFORM_ALIASES.items():
+        if base == prefix or base.startswith(prefix + "_"):
+            return platform
+    return None
+
+
+def is_read_only(command: str) -> bool:
+    return (command.strip().lower() + " ").startswith(READ_ONLY_PREFIXES)
+
+
+def _clean_output(raw: str, command: str, prompt: str) -> str:
+    """Bỏ mã ANSI, dấu phân trang, prompt cũ + dòng echo lệnh ở đầu và prompt/dòng ngữ cảnh ở cuối."""
+    text = _ANSI_RE.sub("", raw).replace("\r\n", "\n").replace("\r", "")
+    text = _PAGER_RE.sub("", text)
+    lines = text.split("\n")
+    for i, line in enumerate(lines[:3]):
+        if command.strip() and command.strip() in line:
+            lines = lines[i + 1:]
+            break
+    # Prompt cuối, kèm dòng ngữ cảnh trước prompt
+    while lines and (not lines[-1].strip() or lines[-1].strip() == prompt or _CONTEXT_LINE_RE.match(lines[-1].strip())):
+        lines.pop()
+    return "\n".join(lines)
+
+
+class AsyncShowSession:
+    """Một phiên shell asyncssh đã dò prompt và tắt phân trang."""
+
+    def __init__(self, conn, process, platform: str):
+        self.conn = conn
+        self.process = process
+        self.platform = platform
+        self.prompt = ""
+        self._prompt_re: Optional[re.Pattern] = None
+
+    @classmethod
+    async def open(cls, host: str, username: str, password: str, device_type: str, port: int = 22,
+                   timeout: float = 60, secret: Optional[str] = None) -> "AsyncShowSession":
+        import asyncssh
+
+        platform = platform_for(device_type)
+        if platform is None:
+            raise ValueError(f"Backend asyncssh không hỗ trợ device_type '{device_type}' "
+                             f"(hỗ trợ: {', '.join(PLATFORMS)}).")
+        conn = await asyncio.wait_for(
+            asyncssh.connect(host, port=port, username=username, password=password,
+                             known_hosts=None, client_keys=None, agent_path=None),
+            timeout,
+        )
+        try:
+            process = await conn.create_process(term_type="vt100", term_size=(TERM_WIDTH, 24),
+                                                encoding="utf-8", errors="replace")
+            session = cls(conn, process, platform)
+            await session._detect_prompt(min(timeout, PROMPT_PROBE_TIMEOUT_S))
+            if platform == "cisco_ios" and secret and session.prompt.endswith(">"):
+                await session._enable(secret, timeout)
+            for setup_command in PLATFORMS[platform](session.prompt):
+                await session.send_command(setup_command, timeout)
+            return session
+        except BaseException:
+            conn.close()
+            raise
+
+    async def _read_until(self, pattern: re.Pattern, timeout: float, after: Optional[str] = None) -> str:
+        """
+        Đọc tới khi phần cuối buffer khớp `pattern`; tự gửi phím cách khi gặp dấu phân trang.
+        Nếu có `after` (lệnh vừa gửi), chỉ tìm prompt sau dòng echo của lệnh để prompt cũ còn
+        sót trong buffer không làm kết thúc sớm.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        chunks: List[str] = []
+        window = ""  # Phần cuối đã bỏ ANSI/\r (không quét lại toàn bộ output dài)
+        waiting_echo = after is not None
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise asyncio.TimeoutError(f"Không thấy prompt sau {timeout}s.")
+            chunk = await asyncio.wait_for(self.process.stdout.read(READ_CHUNK), remaining)
+            if not chunk:
+                raise EOFError("Thiết bị đã đóng phiên.")
+            chunks.append(chunk)
+            window += _ANSI_RE.sub("", chunk).replace("\r", "")
+            if waiting_echo:
+                pos = window.find(after)
+                if pos < 0:
+                    window = window[-(len(after) + 1024):]
+                    continue
+                window = window[pos + len(after):]
+                waiting_echo = False
+            window = window[-1024:]
+            if _PAGER_RE.search(window[-80:]):
+                self.process.stdin.write(" ")
+                window = ""
+                continue
+            if pattern.search(window):
+                return "".join(chunks)
+
+    async def _detect_prompt(self, timeout: float):
+        self.process.stdin.write("\n")
+        raw = await self._read_until(_GENERIC_PROMPT_RE, timeout)
+        lines = [line.strip() for line in _ANSI_RE.sub("", raw).replace("\r", "").split("\n") if line.strip()]
+        self._set_prompt(lines[-1])
+
+    def _set_prompt(self, prompt: str):
+        self.prompt = prompt
+        self._prompt_re = re.compile(r"(?:^|\n)" + re.escape(prompt) + r"\s*$")
+
+    async def _enable(self, secret: str, timeout: float):
+        self.process.stdin.write("enable\n")
+        await self._read_until(re.compile(r"[Pp]assword:\s*$"), timeout)
+        self.process.stdin.write(secret + "\n")
+        raw = await self._read_until(_GENERIC_PROMPT_RE, timeout)
+        lines = [line.strip() for line in _ANSI_RE.sub("", raw).replace("\r", "").split("\n") if line.strip()]
+        self._set_prompt(lines[-1])
+
+    async def send_command(self, command: str, read_timeout: float) -> str:
+        """Gửi một lệnh, đọc tới khi gặp lại prompt, trả về output đã làm sạch."""
+        self.process.stdin.write(command + "\n")
+        raw = await self._read_until(self._prompt_re, read_timeout, after=command)
+        return _clean_output(raw, command, self.prompt)
+
+    async def resync(self, timeout: float) -> bool:
+        """Ngắt lệnh đang chạy (Ctrl-C) và chờ prompt; False nếu phiên không hồi phục."""
+        try:
+            self.process.stdin.write("\x03")
+            await self._read_until(self._prompt_re, timeout)
+            return True
+        except Exception:
+            return False
+
+    async def close(self):
+        try:
+            self.process.stdin.write("exit\n")
+        except Exception:
+            pass
+        self.conn.close()
+        try:
+            await asyncio.wait_for(self.conn.wait_closed(), 5)
+        except Exception:
+            pass
+
+
+def _command_result(raw_output: Optional[str], parsed: Any, parser: Optional[str],
+                    error: Optional[str], timings: Dict[str, float]) -> Dict[str, Any]:
+    return {
+        "success": error is None,
+        "output": (parsed if parsed else raw_output) if raw_output is not None else "",
+        "parsed_output": parsed,
+        "parser": parser,
+        "error": error,
+        "timings": timings,
+    }
+
+
+async def _run_one(session: AsyncShowSession, device_type: str, command: str, use_textfsm: bool,
+                   read_timeout: float) -> Dict[str, Any]:
+    start = time.perf_counter()
+    try:
+        raw_output = await session.send_command(command, read_timeout)
+    except asyncio.TimeoutError:
+        return _command_result(None, None, None, f"Lỗi timeout khi chạy lệnh: không thấy prompt sau {read_timeout}s.", {})
+    timings = {"send_s": round(time.perf_counter() - start, 4)}
+    parsed, parser = None, PARSER_RAW
+    if use_textfsm:
+        # Parse TextFSM tốn CPU: chạy trên thread để event loop vẫn phục vụ các phiên khác
+        loop = asyncio.get_running_loop()
+        parsed, parser, parse_timings = await loop.run_in_executor(None, parse_output, device_type, command, raw_output)
+        timings.update(parse_timings)
+    timings["total_s"] = round(time.perf_counter() - start, 4)
+    return _command_result(raw_output, parsed, parser, None, timings)
+
+
+async def execute_show_action(device_type: str, host: str, username: str, password: str, action_type: str,
+                              command: Optional[str] = None, commands: Optional[List[str]] = None,
+                              secret: Optional[str] = None, use_textfsm: bool = False, port: int = 22,
+                              timeout: float = 60) -> Dict[str, Any]:
+    """
+    Tương đương execute_network_action(action_type='cli_command' | 'cli_commands') qua asyncssh.
+    Trả về cùng định dạng: success, output, parsed_output, error, timings (+ parser / results).
+    """
+    import asyncssh
+
+    action_start = time.perf_counter()
+    timings: Dict[str, float] = {}
+    result: Dict[str, Any] = {"success": False, "output": "", "parsed_output": None, "error": None}
+    command_results = None
+    session = None
+    try:
+        if action_type == "cli_command":
+            if not command:
+                raise ValueError("command là bắt buộc cho cli_command.")
+            wanted = [command]
+        elif action_type == "cli_commands":
+            if not commands:
+                raise ValueError("commands là bắt buộc cho cli_commands.")
+            wanted = list(commands)
+        else:
+            raise ValueError(f"Backend asyncssh chỉ hỗ trợ cli_command/cli_commands, không hỗ trợ '{action_type}'.")
+        not_show = [cmd for cmd in wanted if not is_read_only(cmd)]
+        if not_show:
+            raise ValueError(f"Backend asyncssh chỉ chạy lệnh show (chỉ đọc): {', '.join(not_show)}")
+
+        session = await AsyncShowSession.open(host, username, password, device_type, port=port,
+                                              timeout=timeout, secret=secret)
+        timings["connect_s"] = round(time.perf_counter() - action_start, 4)
+        read_timeout = timeout + 30
+
+        if action_type == "cli_command":
+            one = await _run_one(session, device_type, command, use_textfsm, read_timeout)
+            if one["error"]:
+                result["error"] = one["error"].replace("khi chạy lệnh", "khi đọc output lệnh")
+            else:
+                result.update(success=True, output=one["output"], parsed_output=one["parsed_output"])
+            result["parser"] = one["parser"]
+            timings.update({k: v for k, v in one["timings"].items() if k != "total_s"})
+        else:
+            command_results = {}
+            usable = True
+            for cmd in wanted:
+                if not usable:
+                    command_results[cmd] = _command_result(None, None, None, "Bỏ qua: phiên không còn đồng bộ sau lệnh bị timeout.", {})
+                    continue
+                command_results[cmd] = await _run_one(session, device_type, cmd, use_textfsm, read_timeout)
+                if not command_results[cmd]["success"]:
+                    # Lệnh bị timeout còn chạy trên thiết bị: ngắt bằng Ctrl-C rồi chờ prompt
+                    usable = await session.resync(min(read_timeout, PROMPT_PROBE_TIMEOUT_S))
+            failed = [cmd for cmd, res in command_results.items() if not res["success"]]
+            result["success"] = not failed
+            if failed:
+                result["error"] = f"{len(failed)}/{len(wanted)} lệnh thất bại: {', '.join(failed)}"
+
+    except asyncssh.PermissionDenied:
+        result["error"] = "Lỗi xác thực: Tên người dùng hoặc mật khẩu không đúng."
+    except (asyncio.TimeoutError, OSError, asyncssh.ConnectionLost, EOFError):
+        result["error"] = "Lỗi timeout: Không thể kết nối hoặc thiết bị không phản hồi trong thời gian chờ."
+    except ValueError as e:
+        result["error"] = f"Lỗi tham số: {e}"
+    except Exception as e:
+        result["error"] = f"Đã xảy ra lỗi không mong muốn: {e}"
+    finally:
+        if session is not None:
+            await session.close()
+
+    if action_type == "cli_command":
+        result.setdefault("parser", None)
+    timings["total_s"] = round(time.perf_counter() - action_start, 4)
+    result["timings"] = timings
+    if action_type == "cli_commands":
+        result["results"] = command_results or {}
+    return result
+
+
+def run_show_action(**kwargs) -> Dict[str, Any]:
+    """Bản đồng bộ của execute_show_action (dùng từ netmiko_exec/script_worker)."""
+    return asyncio.run(execute_show_action(**kwargs))
+
+
+async def _run_many(jobs: Iterable[Tuple[Any, Dict[str, Any]]], concurrency: int, job_timeout: Optional[float],
+                    deadline: Optional[float], on_result: Callable[[Any, Optional[Dict[str, Any]], Optional[str], float], None]):
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    loop = asyncio.get_running_loop()
+    fleet_start = loop.time()
+
+    async def run_job(key, kwargs):
+        async with semaphore:
+            start = loop.time()
+            try:
+                result = await asyncio.wait_for(execute_show_action(**kwargs), job_timeout)
+            except asyncio.TimeoutError:
+                on_result(key, None, f"Vượt timeout thiết bị {job_timeout}s.", loop.time() - start)
+                return
+            on_result(key, result, None, loop.time() - start)
+
+    tasks = {asyncio.ensure_future(run_job(key, kwargs)): key for key, kwargs in jobs}
+    if not tasks:
+        return
+    _, pending = await asyncio.wait(tasks, timeout=deadline)
+    for task in pending:
+        task.cancel()
+        on_result(tasks[task], None, f"Vượt thời hạn toàn cục {deadline}s.", loop.time() - fleet_start)
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+def run_many(jobs: Iterable[Tuple[Any, Dict[str, Any]]], concurrency: int = 200, job_timeout: Optional[float] = None,
+             deadline: Optional[float] = None,
+             on_result: Optional[Callable[[Any, Optional[Dict[str, Any]], Optional[str], float], None]] = None):
+    """
+    Chạy execute_show_action cho nhiều thiết bị trong một event loop.
+
+    Args:
+        jobs: [(khóa, kwargs của execute_show_action), ...].
+        concurrency: Số phiên SSH đồng thời tối đa.
+        job_timeout: Thời gian tối đa cho mỗi thiết bị (giây).
+        deadline: Thời hạn toàn cục (giây); thiết bị chưa xong bị hủy.
+        on_result: callback(khóa, kết quả hoặc None, thông báo timeout hoặc None, thời gian chạy)
+                   gọi ngay khi mỗi thiết bị hoàn tất.
+    """
+    asyncio.run(_run_many(jobs, concurrency, job_timeout, deadline, on_result or (lambda *args: None)))
@@ -0,0 +1,371 @@
+import os
+import sys
+import json
+import time
+import runpy
+import argparse
+import threading
+import contextlib
+from collections import Counter, defaultdict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# ----------------------------------------------------
+# Khởi động CLI chung: công tắc profiling cho mọi entry point
+# ----------------------------------------------------
+# Muốn biết vì sao một lần chạy batch_routing_plan_v3 / two_point_*_v5 chậm, trước đây phải sửa
+# script để bọc cProfile. Các entry point giờ gọi run_main(main): các tùy chọn --profile-* được
+# tách khỏi sys.argv (parser của script không thấy), rồi main() chạy dưới profiler nếu được yêu cầu:
+#
+#   --profile-out PATH            bật profiling, ghi kết quả vào PATH (là thư mục: <script>-<thời điểm>-<pid>.<đuôi>)
+#   --profile-format F            pstats (mặc định; xem bằng `python -m pstats`, snakeviz) hoặc speedscope
+#                                 (JSON cho https://www.speedscope.app); mặc định suy từ đuôi .json
+#   --profile-top N               số hàm tốn thời gian nhất in ra stderr khi kết thúc (mặc định 25, 0 = không in)
+#   --profiler cprofile|sample    cProfile (đo mọi lời gọi của thread chính, chậm hơn 1.5-3x với code Python
+#                                 thuần) hoặc bộ lấy mẫu (thread riêng đọc stack mỗi --profile-interval giây,
+#                                 gần như không làm chậm, có cả các thread do lần chạy tạo ra, ví dụ
+#                                 ThreadPoolExecutor gọi OSRM)
+#
+# Không sửa được lệnh gọi (n8n)? Đặt biến môi trường N8N_SCRIPTS_PROFILE_OUT=PATH (thường là một thư mục).
+# Script chưa gọi run_main vẫn profile được qua:
+#   python -m libs.cli_bootstrap --profile-out /tmp/p script.py <tham số của script>
+# Kết quả profile và bảng hotspot luôn đi ra file / stderr, stdout JSON của script giữ nguyên.
+# Chỉ dùng thư viện chuẩn; cProfile / pstats được import khi bật profiling.
+
+PROFILE_ENV = "N8N_SCRIPTS_PROFILE_OUT"
+PROFILE_FORMATS = ("pstats", "speedscope")
+PROFILERS = ("cprofile", "sample")
+DEFAULT_PROFILE_TOP = 25
+DEFAULT_SAMPLE_INTERVAL = 0.005   # 200 mẫu/giây
+MAX_STACK_DEPTH = 256
+
+FORMAT_EXTENSIONS = {"pstats": ".pstats", "speedscope": ".speedscope.json"}
+
+# (file, dòng bắt đầu hàm, tên hàm) — cùng khóa với pstats
+FuncKey = Tuple[str, int, str]
+
+# Đang profiling (tránh lồng hai profiler khi script chạy qua `python -m libs.cli_bootstrap`)
+_active = False
+# Hàm ghi kết quả của profiler đang chạy (hard_exit gọi trước os._exit, vì os._exit bỏ qua finally)
+_finish_active: Optional[Callable[[], None]] = None
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
+    """Thêm các tùy chọn --profile-* vào `parser`."""
+    group = parser.add_argument_group("profiling")
+    group.add_argument("--profile-out", default=None,
+                       help=f"Bật profiling và ghi kết quả vào file / thư mục này (hoặc biến môi trường {PROFILE_ENV}).")
+    group.add_argument("--profile-format", choices=PROFILE_FORMATS, default=None,
+                       help="pstats hoặc speedscope (mặc định: speedscope nếu đuôi .json, ngược lại pstats).")
+    group.add_argument("--profile-top", type=int, default=DEFAULT_PROFILE_TOP,
+                       help="Số hàm tốn thời gian nhất in ra stderr (0 = không in).")
+    group.add_argument("--profiler", choices=PROFILERS, default="cprofile",
+                       help="cprofile (đo mọi lời gọi) hoặc sample (lấy mẫu stack, chi phí thấp).")
+    group.add_argument("--profile-interval", type=float, default=DEFAULT_SAMPLE_INTERVAL,
+                       help="Chu kỳ lấy mẫu (giây) của --profiler sample.")
+    return parser
+
+
+def split_profile_args(argv: Sequence[str]) -> Tuple[argparse.Namespace, List[str]]:
+    """Tách các tùy chọn --profile-* khỏi `argv`; trả về (tùy chọn profiling, phần tham số còn lại cho script)."""
+    parser = add_profile_arguments(argparse.ArgumentParser(add_help=False, allow_abbrev=False))
+    options, remaining = parser.parse_known_args(list(argv))
+    if options.profile_out is None:
+        options.profile_out = os.environ.get(PROFILE_ENV) or None
+    return options, remaining
+
+
+# -----------------------------
+# 1. Bộ lấy mẫu stack
+# -----------------------------
+
+class SamplingProfiler:
+    """
+    Lấy mẫu stack định kỳ từ một thread nền (sys._current_frames), cộng dồn theo stack duy nhất.
+    Lấy mẫu thread gọi start() và mọi thread được tạo sau đó; các thread có sẵn (ví dụ thread HTTP
+    của script_worker) bị bỏ qua. Trọng số mỗi mẫu là thời gian thực kể từ mẫu trước.
+    """
+
+    def __init__(self, interval: float = DEFAULT_SAMPLE_INTERVAL):
+        self.interval = max(0.0005, interval)
+        self.stacks: Dict[str, Counter] = defaultdict(Counter)   # tên thread -> {stack (gốc -> lá): giây}
+        self.counts: Dict[str, Counter] = defaultdict(Counter)   # tên thread -> {stack: số mẫu}
+        self.sample_count = 0
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._ignored: set = set()
+
+    def start(self):
+        current = threading.get_ident()
+        self._ignored = {t.ident for t in threading.enumerate() if t.ident != current}
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._thread.start()
+        self._ignored.add(self._thread.ident)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.perf_counter() - self._started
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            weight, last = now - last, now
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident in self._ignored:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    code = frame.f_code
+                    stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                    frame = frame.f_back
+                stack.reverse()
+                thread_name = names.get(ident, str(ident))
+                self.stacks[thread_name][tuple(stack)] += weight
+                self.counts[thread_name][tuple(stack)] += 1
+            self.sample_count += 1
+
+    def pstats_dict(self) -> Dict[FuncKey, tuple]:
+        """
+        Thống kê dạng pstats: self time (hàm ở lá), cumulative time (hàm có trong stack) và số mẫu
+        thay cho số lời gọi; caller lấy từ khung liền trước trong stack.
+        """
+        self_time: Counter = Counter()
+        cumulative: Counter = Counter()
+        samples: Counter = Counter()
+        callers: Dict[FuncKey, Counter] = defaultdict(Counter)
+        for thread_name, stacks in self.stacks.items():
+            for stack, weight in stacks.items():
+                if not stack:
+                    continue
+                count = self.counts[thread_name][stack]
+                self_time[stack[-1]] += weight
+                for func in set(stack):
+                    cumulative[func] += weight
+                    samples[func] += count
+                for caller, callee in zip(stack, stack[1:]):
+                    callers[callee][caller] += weight
+        return {
+            func: (samples[func], samples[func], self_time[func], cumulative[func],
+                   {caller: (1, 1, 0.0, w) for caller, w in callers[func].items()})
+            for func in cumulative
+        }
+
+    def speedscope(self, name: str) -> Dict[str, Any]:
+        frames: Dict[FuncKey, int] = {}
+        profiles = []
+        for thread_name, stacks in self.stacks.items():
+            samples, weights = [], []
+            for stack, weight in stacks.items():
+                samples.append([frames.setdefault(func, len(frames)) for func in stack])
+                weights.append(weight)
+            profiles.append(_speedscope_profile(f"{name} [{thread_name}]", samples, weights))
+        return _speedscope_document(name, frames, profiles)
+
+
+# -----------------------------
+# 2. Xuất kết quả
+# -----------------------------
+
+def _speedscope_profile(name: str, samples: List[List[int]], weights: List[float]) -> Dict[str, Any]:
+    return {"type": "sampled", "name": name, "unit": "seconds", "startValue": 0,
+            "endValue": sum(weights), "samples": samples, "weights": weights}
+
+
+def _speedscope_document(name: str, frames: Dict[FuncKey, int], profiles: List[Dict[str, Any]]) -> Dict[str, Any]:
+    frame_list = [None] * len(frames)
+    for (filename, line, func), index in frames.items():
+        frame_list[index] = {"name": func, "file": filename, "line": line}
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": "n8n-scripts libs/cli_bootstrap",
+        "activeProfileIndex": 0,
+        "shared": {"frames": frame_list},
+        "profiles": profiles,
+    }
+
+
+def cprofile_speedscope(stats: Dict[FuncKey, tuple], name: str) -> Dict[str, Any]:
+    """
+    Speedscope từ thống kê cProfile. cProfile không giữ stack đầy đủ nên mỗi hàm là một mẫu một khung
+    với trọng số là self time (xem ở chế độ Sandwich / Left Heavy); cần cây lời gọi thì dùng --profiler sample.
+    """
+    frames: Dict[FuncKey, int] = {}
+    samples, weights = [], []
+    for func, (_, _, self_time, _, _) in sorted(stats.items(), key=lambda item: -item[1][2]):
+        if self_time > 0:
+            samples.append([frames.setdefault(func, len(frames))])
+            weights.append(self_time)
+    return _speedscope_document(name, frames, [_speedscope_profile(name, samples, weights)])
+
+
+def write_pstats(stats: Dict[FuncKey, tuple], path: str):
+    """Ghi thống kê theo định dạng của Profile.dump_stats (đọc lại bằng pstats.Stats(path))."""
+    import marshal
+
+    with open(path, "wb") as f:
+        marshal.dump(stats, f)
+
+
+def format_hotspots(stats: Dict[FuncKey, tuple], top: int = DEFAULT_PROFILE_TOP, calls_label: str = "calls") -> str:
+    """Bảng `top` hàm có self time lớn nhất: self (giây, %), cumulative, số lời gọi / số mẫu, vị trí."""
+    total = sum(entry[2] for entry in stats.values()) or 1.0
+    rows = sorted(stats.items(), key=lambda item: (-item[1][2], -item[1][3]))[:top]
+    lines = [f"{'self_s':>10} {'self%':>6} {'cum_s':>10} {calls_label:>9}  function"]
+    for (filename, line, func), (_, calls, self_time, cumulative, _) in rows:
+        location = func if filename == "~" else f"{func} ({_short_path(filename)}:{line})"
+        lines.append(f"{self_time:10.4f} {100 * self_time / total:5.1f}% {cumulative:10.4f} {calls:>9}  {location}")
+    return "\n".join(lines)
+
+
+def _short_path(filename: str) -> str:
+    parts = filename.replace("\\", "/").split("/")
+    return "/".join(parts[-2:])
+
+
+def resolve_profile_path(profile_out: str, fmt: Optional[str], name: str) -> Tuple[str, str]:
+    """(đường dẫn file, định dạng): thư mục -> <name>-<thời điểm>-<pid>.<đuôi>; định dạng suy từ đuôi nếu không chỉ định."""
+    if fmt is None:
+        fmt = "speedscope" if profile_out.lower().endswith(".json") else "pstats"
+    if os.path.isdir(profile_out) or profile_out.endswith(("/", os.sep)):
+        os.makedirs(profile_out, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        profile_out = os.path.join(profile_out, f"{name}-{stamp}-{os.getpid()}{FORMAT_EXTENSIONS[fmt]}")
+    else:
+        output_dir = os.path.dirname(profile_out)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+    return profile_out, fmt
+
+
+# -----------------------------
+# 3. Chạy dưới profiler
+# -----------------------------
+
+@contextlib.contextmanager
+def profiled(profile_out: Optional[str], name: str, fmt: Optional[str] = None, top: int = DEFAULT_PROFILE_TOP,
+             profiler: str = "cprofile", interval: float = DEFAULT_SAMPLE_INTERVAL, stream=None):
+    """
+    Chạy khối lệnh dưới profiler nếu có `profile_out` (không thì không làm gì). Kết quả được ghi và
+    bảng hotspot được in (stderr) cả khi khối lệnh lỗi hoặc gọi sys.exit().
+    """
+    global _active, _finish_active
+    if not profile_out or _active:
+        yield
+        return
+    if profiler not in PROFILERS:
+        raise ValueError(f"Profiler không hỗ trợ: {profiler} (chọn một trong {', '.join(PROFILERS)})")
+    path, fmt = resolve_profile_path(profile_out, fmt, name)
+
+    if profiler == "sample":
+        sampler = SamplingProfiler(interval)
+        start, stop = sampler.start, sampler.stop
+    else:
+        import cProfile
+
+        profile = cProfile.Profile()
+        start, stop = profile.enable, profile.disable
+
+    finished = False
+
+    def finish():
+        nonlocal finished
+        global _active, _finish_active
+        if finished:
+            return
+        finished = True
+        stop()
+        _active = False
+        _finish_active = None
+        elapsed = time.perf_counter() - started
+        if profiler == "sample":
+            stats = sampler.pstats_dict()
+            document = sampler.speedscope(name) if fmt == "speedscope" else None
+            detail = f"{sampler.sample_count} mẫu / {sampler.interval * 1000:g} ms"
+        else:
+            profile.create_stats()
+            stats = profile.stats
+            document = cprofile_speedscope(stats, name) if fmt == "speedscope" else None
+            detail = "cProfile"
+
+        out = stream or sys.stderr
+        try:
+            if document is not None:
+                with open(path, "w", encoding="utf-8") as f:
+                    json.dump(document, f)
+            else:
+                write_pstats(stats, path)
+            out.write(f"\n⏱️ Profile {name}: {elapsed:.3f}s ({detail}) -> {path} [{fmt}]\n")
+        except OSError as e:
+            out.write(f"\n❌ Không ghi được profile '{path}': {e}\n")
+        if top > 0 and stats:
+            out.write(format_hotspots(stats, top, calls_label="samples" if profiler == "sample" else "calls") + "\n")
+        out.flush()
+
+    _active = True
+    _finish_active = finish
+    started = time.perf_counter()
+    start()
+    try:
+        yield
+    finally:
+        finish()
+
+
+def hard_exit(code: int = 0):
+    """
+    Thoát ngay bằng os._exit(code) (khi còn thread không dừng được, ví dụ phiên Netmiko bị bỏ lại),
+    nhưng vẫn ghi profile đang chạy và flush stdout/stderr trước. Metric của lần chạy cần được
+    emit_run_summary() trước khi gọi.
+    """
+    if _finish_active is not None:
+        _finish_active()
+    for stream in (sys.stdout, sys.stderr):
+        with contextlib.suppress(Exception):
+            stream.flush()
+    os._exit(code)
+
+
+def run_main(main: Callable[[], Any], argv: Optional[Sequence[str]] = None, name: Optional[str] = None) -> Any:
+    """
+    Entry point chung cho script CLI: tách --profile-* khỏi sys.argv rồi gọi main() (dưới profiler nếu bật).
+    Dùng ở cuối script:  if __name__ == "__main__": run_main(main)
+    """
+    args = sys.argv[1:] if argv is None else list(argv)
+    options, remaining = split_profile_args(args)
+    sys.argv = sys.argv[:1] + remaining
+    name = name or os.path.splitext(os.path.basename(sys.argv[0] or "script"))[0]
+    with profiled(options.profile_out, name, fmt=options.profile_format, top=options.profile_top,
+                  profiler=options.profiler, interval=options.profile_interval):
+        return main()
+
+
+def main():
+    """`python -m libs.cli_bootstrap [--profile-*] script.py [tham số]`: profile một script bất kỳ như khi chạy trực tiếp."""
+    parser = add_profile_arguments(argparse.ArgumentParser(
+        description="Chạy một script CLI dưới profiler (cProfile hoặc lấy mẫu), ghi pstats / speedscope và in hotspot."))
+    parser.add_argument("script", help="Đường dẫn script Python cần chạy.")
+    parser.add_argument("script_args", nargs=argparse.REMAINDER, help="Tham số truyền cho script.")
+    args = parser.parse_args()
+    if not args.profile_out:
+        args.profile_out = os.environ.get(PROFILE_ENV) or "."
+
+    script_path = os.path.abspath(args.script)
+    sys.argv = [script_path] + args.script_args
+    sys.path[0] = os.path.dirname(script_path)
+    name = os.path.splitext(os.path.basename(script_path))[0]
+    with profiled(args.profile_out, name, fmt=args.profile_format, top=args.profile_top,
+                  profiler=args.profiler, interval=args.profile_interval):
+        runpy.run_path(script_path, run_name="__main__")
+
+
+if __name__ == "__main__":
+    # Chạy bằng `python -m`: gọi qua module libs.cli_bootstrap (bản mà script bên trong import)
+    # để run_main() trong script thấy cùng cờ _active và không bật profiler thứ hai.
+    from libs.cli_bootstrap import main as _main
+    _main()
@@ -0,0 +1,119 @@
+import os
+import time
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from libs.textfsm_registry import get_registry
+from libs.timing_profiles import command_read_timeout, record_command_result
+
+# ----------------------------------------------------
+# Pipeline "gửi lệnh một lần, parse cục bộ"
+# ----------------------------------------------------
+# send_command(use_textfsm=True) trả về string khi không có template NTC (hoặc ném ReadTimeout),
+# và code cũ phải gửi lại chính lệnh đó để lấy output thô — gấp đôi tải và độ trễ đúng với
+# các lệnh chậm nhất. Ở đây lệnh chỉ được gửi một lần; NTC-Templates, template tùy chỉnh và
+# output thô được thử lần lượt trên cùng một buffer, kèm thời gian của từng bước.
+#
+# Template khớp nhưng output không có dòng nào (ví dụ "No alarms currently active") cho ra [] chứ
+# không phải None: bảng rỗng là kết quả hợp lệ (alarm đã hết, delta phải báo 'removed'), None chỉ
+# dành cho trường hợp không có template.
+
+logger = logging.getLogger(__name__)
+
+PARSER_NTC = "ntc"
+PARSER_CUSTOM = "custom"
+PARSER_RAW = "raw"
+
+
+def _parse_ntc(device_type: str, command: str, raw_output: str) -> Optional[List[Dict[str, Any]]]:
+    """Parse bằng NTC-Templates (index của Netmiko); None nếu không có template, [] nếu template không ra dòng nào."""
+    # Không dùng get_structured_data: hàm đó trả lại output thô cho cả "không có template" lẫn "0 dòng"
+    from netmiko.utilities import get_template_dir, clitable_to_dict
+    from textfsm import clitable
+
+    template_dir = get_template_dir()
+    table = clitable.CliTable(os.path.join(template_dir, "index"), template_dir)
+    # Như Netmiko: cisco_xe không có template riêng thì thử template cisco_ios
+    platforms = [device_type] + (["cisco_ios"] if "cisco_xe" in device_type else [])
+    for platform in platforms:
+        try:
+            table.ParseCmd(raw_output, {"Command": command, "Platform": platform})
+        except clitable.CliTableError:
+            continue
+        return clitable_to_dict(table)
+    return None
+
+
+def _parse_custom(device_type: str, command: str, raw_output: str) -> Optional[List[Dict[str, Any]]]:
+    """Parse bằng template trong registry (templates/, textfsm_template/); None nếu không có template."""
+    return get_registry().parse(device_type, command, raw_output)
+
+
+def parse_output(device_type: str, command: str, raw_output: str, prefer_custom: bool = False
+                 ) -> Tuple[Optional[List[Dict[str, Any]]], str, Dict[str, float]]:
+    """
+    Parse output thô đã có theo thứ tự ưu tiên, không gửi lại lệnh.
+
+    Args:
+        prefer_custom: True -> template tùy chỉnh trước NTC; False (mặc định) -> NTC trước.
+
+    Returns:
+        (parsed_output ([] nếu template khớp nhưng không có dòng) hoặc None,
+         parser đã dùng: 'ntc' | 'custom' | 'raw', thời gian từng bước (giây))
+    """
+    stages = [(PARSER_CUSTOM, _parse_custom), (PARSER_NTC, _parse_ntc)]
+    if not prefer_custom:
+        stages.reverse()
+
+    timings: Dict[str, float] = {}
+    for name, parse_func in stages:
+        start = time.perf_counter()
+        try:
+            parsed = parse_func(device_type, command, raw_output)
+        except Exception as e:
+            logger.warning(f"⚠️ Parse {name} cho '{command}' lỗi: {e}")
+            parsed = None
+        timings[f"parse_{name}_s"] = round(time.perf_counter() - start, 4)
+        if parsed is not None:
+            return parsed, name, timings
+    return None, PARSER_RAW, timings
+
+
+def send_and_parse(conn, device_type: str, command: str, use_textfsm: bool = True,
+                   prefer_custom: bool = False, read_timeout: float = 120) -> Dict[str, Any]:
+    """
+    Gửi lệnh đúng một lần trên kết nối đã mở rồi parse cục bộ.
+
+    read_timeout là mức tối thiểu; nếu hồ sơ timing của host cho thấy lệnh chạy chậm hơn thì
+    read_timeout được kéo dài theo giá trị đã học (xem libs/timing_profiles.py).
+
+    Returns:
+        dict: raw_output, parsed_output (None nếu không parse được), parser, timings.
+              ReadTimeout của send_command được ném ra cho nơi gọi xử lý.
+    """
+    host = str(getattr(conn, "host", "") or "")
+    read_timeout = command_read_timeout(host, command, read_timeout) if host else read_timeout
+    start = time.perf_counter()
+    try:
+        raw_output = conn.send_command(command, read_timeout=read_timeout)
+    except Exception as e:
+        if host:
+            record_command_result(host, command, error=e)
+        raise
+    send_s = time.perf_counter() - start
+    if host:
+        record_command_result(host, command, seconds=send_s)
+    timings = {"send_s": round(send_s, 4)}
+
+    parsed_output, parser = None, PARSER_RAW
+    if use_textfsm:
+        parsed_output, parser, parse_timings = parse_output(device_type, command, raw_output, prefer_custom=prefer_custom)
+        timings.update(parse_timings)
+    timings["total_s"] = round(time.perf_counter() - start, 4)
+
+    return {
+        "raw_output": raw_output,
+        "parsed_output": parsed_output,
+        "parser": parser,
+        "timings": timings,
+    }
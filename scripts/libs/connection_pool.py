@@ -0,0 +1,289 @@
+import time
+import hashlib
+import logging
+import threading
+import contextlib
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# ----------------------------------------------------
+# Pool kết nối SSH (Netmiko) dùng lại giữa các request
+# ----------------------------------------------------
+# Dashboard n8n hỏi cùng một router vài phút một lần; mỗi lần gọi ssh.py/ssh2.py/netmiko_exec.py
+# đều phải login + dò prompt + tắt paging (2-10 giây). Khi chạy trong tiến trình thường trú
+# (script_worker.py), pool giữ các phiên đã xác thực theo (host, username, device_type, port) cùng
+# digest thông tin xác thực (password/secret/key_file), để các request sau dùng lại ngay — nhưng
+# request mang mật khẩu sai hoặc đã đổi không bao giờ nhận phiên đã login bằng mật khẩu cũ.
+#
+# Ngoài tiến trình thường trú (chạy CLI trực tiếp), pool không được bật và pooled_connection()
+# hoạt động y như ConnectHandler: mở kết nối, dùng xong thì ngắt.
+
+logger = logging.getLogger(__name__)
+
+PoolKey = Tuple[str, str, str, int, str]
+
+
+def credential_digest(device_params: Dict[str, Any]) -> str:
+    """SHA-256 của password/secret/key_file: khóa pool phân biệt thông tin xác thực mà không giữ mật khẩu rõ."""
+    material = "\0".join(str(device_params.get(name) or '') for name in ('password', 'secret', 'key_file'))
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+def pool_key(device_params: Dict[str, Any]) -> PoolKey:
+    """Khóa phiên: (host, username, device_type, port, digest thông tin xác thực)."""
+    return (
+        str(device_params.get('host') or device_params.get('ip')),
+        str(device_params.get('username') or ''),
+        str(device_params['device_type']),
+        int(device_params.get('port') or 22),
+        credential_digest(device_params),
+    )
+
+
+class _PooledSession:
+    __slots__ = ("key", "conn", "created_at", "last_used", "uses")
+
+    def __init__(self, key: PoolKey, conn):
+        self.key = key
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.uses = 0
+
+
+def _close_quietly(conn):
+    try:
+        conn.disconnect()
+    except Exception as e:
+        logger.debug(f"Lỗi khi đóng kết nối Netmiko: {e}")
+
+
+class ConnectionPool:
+    """
+    Pool phiên Netmiko đã xác thực.
+
+    - Dùng lại phiên rảnh cùng khóa (host, username, device_type, port, thông tin xác thực), kiểm tra is_alive() trước khi trả.
+    - Phiên rảnh quá max_idle_s giây bị đóng (khi acquire hoặc khi gọi reap_idle()).
+    - Tối đa max_sessions phiên; phiên rảnh ít dùng nhất (LRU) bị đóng khi vượt giới hạn.
+    - Tối đa per_host_limit phiên đồng thời trên mỗi host (nhiều thiết bị giới hạn số phiên VTY).
+    - Phiên gặp lỗi trong lúc dùng bị hủy, không trả lại pool.
+    """
+
+    def __init__(self, max_sessions: int = 32, max_idle_s: float = 300.0, per_host_limit: int = 2,
+                 acquire_timeout_s: float = 60.0):
+        self.max_sessions = max_sessions
+        self.max_idle_s = max_idle_s
+        self.per_host_limit = per_host_limit
+        self.acquire_timeout_s = acquire_timeout_s
+
+        self._lock = threading.Lock()
+        self._idle: "OrderedDict[int, _PooledSession]" = OrderedDict()  # cũ nhất ở đầu (LRU)
+        self._in_use: Dict[int, _PooledSession] = {}
+        self._host_slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._broken = set()  # id(conn) của các phiên cần hủy khi release
+        self._stats = {"hits": 0, "misses": 0, "evicted": 0, "expired": 0, "discarded": 0, "unhealthy": 0}
+
+    # ---- Nội bộ ----
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            self._stats[name] += n
+
+    def _host_semaphore(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            sem = self._host_slots.get(host)
+            if sem is None:
+                sem = threading.BoundedSemaphore(max(1, self.per_host_limit))
+                self._host_slots[host] = sem
+            return sem
+
+    def _take_idle(self, key: PoolKey) -> Optional[_PooledSession]:
+        """Lấy phiên rảnh gần nhất cùng khóa; đóng các phiên hết hạn/chết gặp phải."""
+        now = time.monotonic()
+        while True:
+            with self._lock:
+                session = None
+                for sid in reversed(self._idle):
+                    if self._idle[sid].key == key:
+                        session = self._idle.pop(sid)
+                        break
+            if session is None:
+                return None
+
+            if now - session.last_used > self.max_idle_s:
+                self._count("expired")
+                _close_quietly(session.conn)
+                continue
+            try:
+                alive = session.conn.is_alive()
+            except Exception:
+                alive = False
+            if not alive:
+                self._count("unhealthy")
+                _close_quietly(session.conn)
+                continue
+            return session
+
+    def _evict_lru(self):
+        """Đóng các phiên rảnh ít dùng nhất cho tới khi tổng số phiên không vượt max_sessions."""
+        to_close = []
+        with self._lock:
+            while self._idle and len(self._idle) + len(self._in_use) > self.max_sessions:
+                _, session = self._idle.popitem(last=False)
+                to_close.append(session)
+                self._stats["evicted"] += 1
+        for session in to_close:
+            _close_quietly(session.conn)
+
+    # ---- API ----
+
+    def acquire(self, device_params: Dict[str, Any]):
+        """Mượn một phiên (dùng lại nếu có, ngược lại tạo mới). Phải gọi release() sau khi dùng."""
+        from netmiko import ConnectHandler
+
+        key = pool_key(device_params)
+        sem = self._host_semaphore(key[0])
+        if not sem.acquire(timeout=self.acquire_timeout_s):
+            raise TimeoutError(f"Hết thời gian chờ slot kết nối tới {key[0]} (giới hạn {self.per_host_limit} phiên/host).")
+
+        try:
+            session = self._take_idle(key)
+            if session is not None:
+                self._count("hits")
+                logger.info(f"♻️ Dùng lại phiên SSH tới {key[0]} (đã dùng {session.uses} lần).")
+            else:
+                self._count("misses")
+                session = _PooledSession(key, ConnectHandler(**device_params))
+        except BaseException:
+            sem.release()
+            raise
+
+        session.uses += 1
+        with self._lock:
+            self._in_use[id(session.conn)] = session
+        self._evict_lru()
+        return session.conn
+
+    def release(self, conn, discard: bool = False):
+        """Trả phiên về pool; discard=True (hoặc phiên đã chết) thì đóng hẳn."""
+        with self._lock:
+            session = self._in_use.pop(id(conn), None)
+            if id(conn) in self._broken:
+                self._broken.discard(id(conn))
+                discard = True
+        if session is None:
+            _close_quietly(conn)
+            return
+
+        try:
+            if discard:
+                self._count("discarded")
+                _close_quietly(conn)
+            else:
+                session.last_used = time.monotonic()
+                with self._lock:
+                    self._idle[id(conn)] = session
+                self._evict_lru()
+        finally:
+            self._host_semaphore(session.key[0]).release()
+
+    def mark_broken(self, conn):
+        """Đánh dấu phiên đang mượn là không dùng lại được (ví dụ: lệnh bị ReadTimeout, buffer còn rác)."""
+        with self._lock:
+            if id(conn) in self._in_use:
+                self._broken.add(id(conn))
+
+    def reap_idle(self) -> int:
+        """Đóng các phiên rảnh quá max_idle_s. Trả về số phiên đã đóng."""
+        now = time.monotonic()
+        with self._lock:
+            expired = [sid for sid, s in self._idle.items() if now - s.last_used > self.max_idle_s]
+            sessions = [self._idle.pop(sid) for sid in expired]
+            self._stats["expired"] += len(sessions)
+        for session in sessions:
+            _close_quietly(session.conn)
+        return len(sessions)
+
+    def close_all(self):
+        """Đóng toàn bộ phiên rảnh (phiên đang dùng sẽ bị đóng khi được release)."""
+        with self._lock:
+            sessions = list(self._idle.values())
+            self._idle.clear()
+        for session in sessions:
+            _close_quietly(session.conn)
+
+    def session_uses(self, conn) -> int:
+        """Số lần phiên đang mượn đã được cấp (1 = vừa tạo mới), 0 nếu không thuộc pool."""
+        with self._lock:
+            session = self._in_use.get(id(conn))
+            return session.uses if session is not None else 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, idle=len(self._idle), in_use=len(self._in_use),
+                        max_sessions=self.max_sessions, max_idle_s=self.max_idle_s,
+                        per_host_limit=self.per_host_limit)
+
+
+# ----------------------------------------------------
+# Pool mặc định của tiến trình
+# ----------------------------------------------------
+
+_default_pool: Optional[ConnectionPool] = None
+
+
+def enable_default_pool(**kwargs) -> ConnectionPool:
+    """Bật pool mặc định (gọi một lần trong tiến trình thường trú, ví dụ script_worker.py)."""
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = ConnectionPool(**kwargs)
+    return _default_pool
+
+
+def get_default_pool() -> Optional[ConnectionPool]:
+    return _default_pool
+
+
+def disable_default_pool():
+    """Tắt pool mặc định và đóng các phiên rảnh."""
+    global _default_pool
+    if _default_pool is not None:
+        _default_pool.close_all()
+        _default_pool = None
+
+
+def discard_on_release(conn):
+    """Yêu cầu pool mặc định hủy phiên `conn` khi trả lại (không có tác dụng nếu pool tắt)."""
+    if _default_pool is not None:
+        _default_pool.mark_broken(conn)
+
+
+def is_reused_session(conn) -> bool:
+    """True nếu `conn` là phiên dùng lại từ pool mặc định (không phải vừa login)."""
+    return _default_pool is not None and _default_pool.session_uses(conn) > 1
+
+
+@contextlib.contextmanager
+def pooled_connection(device_params: Dict[str, Any], pool: Optional[ConnectionPool] = None):
+    """
+    Context manager thay cho `with ConnectHandler(**device_params) as conn`.
+
+    Có pool: mượn phiên từ pool, trả lại khi xong; nếu khối lệnh ném exception thì phiên bị hủy.
+    Không có pool: mở kết nối mới và ngắt khi xong (hành vi cũ).
+    """
+    pool = pool or _default_pool
+    if pool is None:
+        from netmiko import ConnectHandler
+
+        with ConnectHandler(**device_params) as conn:
+            yield conn
+        return
+
+    conn = pool.acquire(device_params)
+    try:
+        yield conn
+    except BaseException:
+        pool.release(conn, discard=True)
+        raise
+    else:
+        pool.release(conn)
@@ -0,0 +1,173 @@
+import csv
+from typing import Any, Dict, List, Optional
+
+# ----------------------------------------------------
+# Đọc CSV có kiểu theo cột (pandas), kiểm tra hàng loạt
+# ----------------------------------------------------
+# Các loader cũ dùng csv.DictReader + float()/int() trong try/except cho từng dòng và dựng
+# tuple/dict cho mỗi dòng. Ở đây cả file được đọc một lần thành chuỗi (giữ nguyên giá trị gốc),
+# mỗi cột số được chuyển kiểu bằng một phép vector hóa; dòng lỗi được đánh dấu bằng mask,
+# thông báo lỗi chỉ được dựng cho các dòng lỗi.
+#
+# Kiểu cột: "float", "int" (số nguyên viết dạng 12, không nhận 12.0 — giống int()) và "str" (strip,
+# ô trống không làm dòng lỗi). Cột "float" chỉ nhận số hữu hạn: "nan" / "inf" là ô không hợp lệ.
+#
+# Dòng có nhiều trường hơn header (parser C của pandas dừng cả file với ParserError) được đọc lại
+# bằng module csv như csv.DictReader cũ: dòng vẫn giữ đúng vị trí với các trường đầu tiên, nhưng bị
+# đánh dấu lỗi (field_errors: reason 'extra_fields'). Dòng thiếu trường được coi như ô trống.
+
+COLUMN_TYPES = ("float", "int", "str")
+
+
+class TypedCsv:
+    """
+    Kết quả load_typed_csv.
+
+    Attributes:
+        fieldnames: Tên cột theo thứ tự trong file.
+        raw: DataFrame chuỗi gốc (không strip, ô trống là "") — dùng khi cần ghi lại dữ liệu gốc.
+        columns: {cột: numpy array} đã chuyển kiểu (float64 / int64 / object); giá trị tại dòng lỗi không dùng được.
+        empty / invalid: {cột: mask bool} ô trống / ô không chuyển được kiểu.
+        missing_columns: Cột được yêu cầu nhưng không có trong header (mọi dòng bị coi là trống).
+        extra_fields: {chỉ số dòng: [các trường thừa]} của dòng có nhiều trường hơn header.
+        valid: mask bool các dòng hợp lệ ở mọi cột số được yêu cầu (và không có trường thừa).
+    """
+
+    def __init__(self, fieldnames, raw, column_types, columns, empty, invalid, missing_columns, valid,
+                 extra_fields: Optional[Dict[int, List[str]]] = None):
+        self.fieldnames: List[str] = fieldnames
+        self.column_types: Dict[str, str] = column_types
+        self.raw = raw
+        self.columns: Dict[str, Any] = columns
+        self.empty: Dict[str, Any] = empty
+        self.invalid: Dict[str, Any] = invalid
+        self.missing_columns: List[str] = missing_columns
+        self.extra_fields: Dict[int, List[str]] = extra_fields or {}
+        self.valid = valid
+
+    def __len__(self) -> int:
+        return len(self.valid)
+
+    @property
+    def error_rows(self):
+        """Chỉ số (0-based, không tính header) các dòng lỗi."""
+        import numpy as np
+
+        return np.flatnonzero(~self.valid)
+
+    def raw_row(self, index: int) -> Dict[str, str]:
+        """Dòng gốc dạng dict (như csv.DictReader) — dùng cho log dòng lỗi."""
+        return {name: self.raw.iat[index, i] for i, name in enumerate(self.fieldnames)}
+
+    def field_errors(self, index: int) -> List[Dict[str, Any]]:
+        """
+        [{field, value, reason: 'empty' | 'invalid' | 'extra_fields'}] của một dòng, theo thứ tự cột số được
+        yêu cầu; trường thừa (field None, value là danh sách trường thừa) đứng cuối.
+        """
+        errors = []
+        for field, kind in self.column_types.items():
+            if kind == "str":
+                continue
+            if self.empty[field][index]:
+                errors.append({"field": field, "value": None, "reason": "empty"})
+            elif self.invalid[field][index]:
+                errors.append({"field": field, "value": self.raw.at[index, field], "reason": "invalid"})
+        if index in self.extra_fields:
+            errors.append({"field": None, "value": self.extra_fields[index], "reason": "extra_fields"})
+        return errors
+
+
+def _read_rows_with_csv(csv_path: str, encoding: str):
+    """
+    Đọc CSV bằng module csv (như csv.DictReader): trả về (DataFrame chuỗi, {dòng: trường thừa}).
+    Dòng dài hơn header bị cắt (phần thừa được ghi lại), dòng ngắn hơn được bù "".
+    """
+    import pandas as pd
+
+    with open(csv_path, "r", encoding=encoding, newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return pd.DataFrame(), {}
+        width = len(header)
+        rows, extra_fields = [], {}
+        for row in reader:
+            if not row:
+                continue   # dòng trống bị bỏ qua như csv.DictReader / pandas
+            if len(row) > width:
+                extra_fields[len(rows)] = row[width:]
+                row = row[:width]
+            elif len(row) < width:
+                row = row + [""] * (width - len(row))
+            rows.append(row)
+    return pd.DataFrame(rows, columns=header, dtype=object), extra_fields
+
+
+def load_typed_csv(csv_path: str, column_types: Dict[str, str], encoding: str = "utf-8-sig") -> TypedCsv:
+    """
+    Đọc CSV (mặc định utf-8-sig để bỏ BOM của Excel) và chuyển kiểu các cột trong `column_types`.
+    Các cột khác được giữ nguyên dạng chuỗi trong `raw`.
+
+    Raises:
+        FileNotFoundError, ValueError (kiểu cột không hỗ trợ), lỗi đọc file của pandas.
+    """
+    unknown = {t for t in column_types.values() if t not in COLUMN_TYPES}
+    if unknown:
+        raise ValueError(f"Kiểu cột không hỗ trợ: {', '.join(sorted(unknown))}")
+
+    import numpy as np
+    import pandas as pd
+
+    extra_fields: Dict[int, List[str]] = {}
+    try:
+        raw = pd.read_csv(csv_path, dtype=object, keep_default_na=False, encoding=encoding, index_col=False)
+    except pd.errors.EmptyDataError:
+        raw = pd.DataFrame()
+    except pd.errors.ParserError:
+        # Có dòng nhiều trường hơn header: đọc lại từng dòng, giữ dòng đó nhưng đánh dấu lỗi
+        raw, extra_fields = _read_rows_with_csv(csv_path, encoding)
+    raw = raw.fillna("")
+    row_count = len(raw)
+
+    columns, empty, invalid = {}, {}, {}
+    missing_columns = [field for field in column_types if field not in raw.columns]
+    valid = np.ones(row_count, dtype=bool)
+    for field, kind in column_types.items():
+        if field in missing_columns:
+            empty[field] = np.ones(row_count, dtype=bool)
+            invalid[field] = np.zeros(row_count, dtype=bool)
+            columns[field] = np.full(row_count, np.nan if kind == "float" else None,
+                                     dtype=float if kind == "float" else object)
+        elif kind == "str":
+            stripped = raw[field].str.strip()
+            empty[field] = (stripped == "").to_numpy(dtype=bool)
+            invalid[field] = np.zeros(row_count, dtype=bool)
+            columns[field] = stripped.to_numpy(dtype=object)
+        else:
+            try:
+                # Đường nhanh: cả cột hợp lệ (trường hợp thường gặp), numpy chuyển kiểu trực tiếp
+                converted = raw[field].to_numpy(dtype=object).astype(float if kind == "float" else np.int64)
+                if kind == "float" and not np.isfinite(converted).all():
+                    raise ValueError("nan/inf")   # để đường chậm đánh dấu đúng các ô đó như không hợp lệ
+                columns[field] = converted
+                empty[field] = np.zeros(row_count, dtype=bool)
+                invalid[field] = np.zeros(row_count, dtype=bool)
+            except (ValueError, TypeError, OverflowError):
+                stripped = raw[field].str.strip()
+                empty[field] = (stripped == "").to_numpy(dtype=bool)
+                numbers = pd.to_numeric(stripped, errors="coerce")
+                if kind == "int":
+                    bad = numbers.isna().to_numpy(dtype=bool, copy=True)
+                    bad |= ~stripped.str.fullmatch(r"[+-]?\d+").to_numpy(dtype=bool)
+                    columns[field] = numbers.where(~bad, 0).to_numpy(dtype=np.int64)
+                else:
+                    columns[field] = numbers.to_numpy(dtype=float, na_value=np.nan)
+                    bad = ~np.isfinite(columns[field])
+                invalid[field] = bad & ~empty[field]
+        if kind != "str":
+            valid &= ~(empty[field] | invalid[field])
+    if extra_fields:
+        valid[list(extra_fields)] = False
+
+    return TypedCsv([str(c) for c in raw.columns], raw, dict(column_types), columns, empty, invalid, missing_columns, valid,
+                    extra_fields)
@@ -0,0 +1,192 @@
+import json
+import time
+import hashlib
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from libs.state_store import StateStore
+
+# ----------------------------------------------------
+# Chế độ delta: chỉ trả về các dòng thay đổi so với lần poll trước
+# ----------------------------------------------------
+# Workflow poll alarm/optics trước đây gửi cả bảng TextFSM cho n8n mỗi lần chạy rồi diff
+# bằng JavaScript. Ở đây mỗi dòng được định danh bằng các trường khóa (Interface, ALARM_ID...)
+# và băm nội dung; snapshot trước của mỗi (host, command) lưu trong SQLite. Kết quả chỉ
+# gồm các dòng thêm mới / biến mất / thay đổi, ở trạng thái ổn định gần như rỗng.
+
+# Trường khóa thử lần lượt khi không chỉ định: trường đầu tiên có mặt ở mọi dòng được dùng
+DEFAULT_KEY_CANDIDATES = ("Interface", "INTERFACE", "Port", "PORT", "ALARM_ID", "INDEX")
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS delta_snapshots (
+        host TEXT NOT NULL,
+        command TEXT NOT NULL,
+        row_key TEXT NOT NULL,
+        row_hash TEXT NOT NULL,
+        data TEXT NOT NULL,
+        PRIMARY KEY (host, command, row_key)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS delta_polls (
+        host TEXT NOT NULL,
+        command TEXT NOT NULL,
+        key_fields TEXT NOT NULL,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (host, command)
+    )
+    """,
+]
+
+
+def infer_key_fields(rows: Sequence[Dict[str, Any]], ignore_fields: Iterable[str] = ()) -> List[str]:
+    """
+    Chọn trường khóa mặc định; [] nếu không có (khi đó cả dòng là khóa: chỉ có thêm/mất).
+    Trường trong ignore_fields không bao giờ được chọn (giá trị đổi mỗi lần poll sẽ làm mọi dòng thành thêm/mất).
+    """
+    ignored = set(ignore_fields)
+    for field in DEFAULT_KEY_CANDIDATES:
+        if field in ignored:
+            continue
+        if rows and all(row.get(field) not in (None, "") for row in rows):
+            return [field]
+    return []
+
+
+def _row_hash(row: Dict[str, Any], ignore_fields: Iterable[str]) -> str:
+    ignored = set(ignore_fields)
+    payload = json.dumps({k: v for k, v in row.items() if k not in ignored}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _row_keys(rows: Sequence[Dict[str, Any]], key_fields: Sequence[str], hashes: Sequence[str]) -> List[str]:
+    """Khóa của từng dòng; khóa trùng trong cùng snapshot được đánh số thứ tự (#2, #3...)."""
+    keys, seen = [], {}
+    for row, row_hash in zip(rows, hashes):
+        key = json.dumps([row.get(f) for f in key_fields], ensure_ascii=False) if key_fields else row_hash
+        seen[key] = seen.get(key, 0) + 1
+        keys.append(key if seen[key] == 1 else f"{key}#{seen[key]}")
+    return keys
+
+
+class DeltaTracker:
+    """So sánh kết quả parse với snapshot trước của cùng (host, command) và cập nhật snapshot."""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.store = StateStore(db_path)
+        self.store.ensure_schema("delta_snapshots", _SCHEMA)
+
+    def diff(self, host: str, command: str, rows: Sequence[Dict[str, Any]],
+             key_fields: Optional[Sequence[str]] = None, ignore_fields: Sequence[str] = ()) -> Dict[str, Any]:
+        """
+        Tính delta của `rows` so với lần poll trước rồi lưu `rows` làm snapshot mới.
+
+        Args:
+            key_fields: Trường định danh dòng (None = tự chọn trong các trường không bị bỏ qua, xem infer_key_fields).
+            ignore_fields: Trường bỏ qua khi so sánh (ví dụ thời gian cập nhật).
+
+        Returns:
+            dict: baseline (lần đầu / đổi trường khóa: mọi dòng là 'added'), key_fields,
+                  added, removed, changed ([{key, current, changed_fields: {trường: [cũ, mới]}}]),
+                  unchanged, total.
+        """
+        rows = list(rows)
+        added, changed, removed = [], [], []
+        with self.store.connect() as conn:
+            poll = conn.execute("SELECT key_fields FROM delta_polls WHERE host = ? AND command = ?",
+                                (host, command)).fetchone()
+            if key_fields is not None:
+                key_fields = list(key_fields)
+            elif not rows and poll is not None:
+                # Bảng rỗng (alarm cuối cùng vừa hết): không có dòng để tự chọn khóa, giữ khóa của lần
+                # trước để mọi dòng cũ được báo 'removed' thay vì coi là baseline mới
+                key_fields = json.loads(poll["key_fields"])
+            else:
+                key_fields = infer_key_fields(rows, ignore_fields)
+            hashes = [_row_hash(row, ignore_fields) for row in rows]
+            keys = _row_keys(rows, key_fields, hashes)
+            current = {key: (row_hash, row) for key, row_hash, row in zip(keys, hashes, rows)}
+            key_spec = json.dumps(key_fields)
+            baseline = poll is None or poll["key_fields"] != key_spec
+            previous = {}
+            if not baseline:
+                previous = {r["row_key"]: (r["row_hash"], r["data"]) for r in conn.execute(
+                    "SELECT row_key, row_hash, data FROM delta_snapshots WHERE host = ? AND command = ?",
+                    (host, command))}
+
+            for key, (row_hash, row) in current.items():
+                if key not in previous:
+                    added.append(row)
+                elif previous[key][0] != row_hash:
+                    old = json.loads(previous[key][1])
+                    changed.append({
+                        "key": {f: row.get(f) for f in key_fields} if key_fields else key,
+                        "current": row,
+                        "changed_fields": {f: [old.get(f), row.get(f)] for f in sorted(set(old) | set(row))
+                                           if f not in ignore_fields and old.get(f) != row.get(f)},
+                    })
+            removed = [json.loads(data) for key, (_, data) in previous.items() if key not in current]
+
+            # Ghi snapshot mới: chỉ động vào các dòng thay đổi
+            if baseline:
+                conn.execute("DELETE FROM delta_snapshots WHERE host = ? AND command = ?", (host, command))
+            stale = [key for key in previous if key not in current]
+            conn.executemany("DELETE FROM delta_snapshots WHERE host = ? AND command = ? AND row_key = ?",
+                             [(host, command, key) for key in stale])
+            conn.executemany(
+                "INSERT OR REPLACE INTO delta_snapshots (host, command, row_key, row_hash, data) VALUES (?, ?, ?, ?, ?)",
+                [(host, command, key, row_hash, json.dumps(row, ensure_ascii=False))
+                 for key, (row_hash, row) in current.items()
+                 if key not in previous or previous[key][0] != row_hash],
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO delta_polls (host, command, key_fields, updated_at) VALUES (?, ?, ?, ?)",
+                (host, command, key_spec, time.time()),
+            )
+
+        return {
+            "baseline": baseline,
+            "key_fields": key_fields,
+            "added": added,
+            "removed": removed,
+            "changed": changed,
+            "unchanged": len(current) - len(added) - len(changed),
+            "total": len(current),
+        }
+
+    def reset(self, host: Optional[str] = None, command: Optional[str] = None):
+        """Xóa snapshot (lọc theo host/command nếu có) để lần poll sau là baseline."""
+        clauses, params = [], []
+        if host is not None:
+            clauses.append("host = ?")
+            params.append(host)
+        if command is not None:
+            clauses.append("command = ?")
+            params.append(command)
+        where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+        with self.store.connect() as conn:
+            conn.execute("DELETE FROM delta_snapshots" + where, params)
+            conn.execute("DELETE FROM delta_polls" + where, params)
+
+    def apply_to_result(self, host: str, result: Dict[str, Any], command: Optional[str] = None,
+                        key_fields: Optional[Sequence[str]] = None, ignore_fields: Sequence[str] = ()) -> Dict[str, Any]:
+        """
+        Thay bảng đầy đủ trong kết quả execute_network_action / ssh_to_router_with_wrapper bằng delta.
+        Hỗ trợ một lệnh (parsed_output) và nhiều lệnh ('results': {command: {...}}). Lệnh có
+        parsed_output dạng list (kể cả list rỗng: template khớp nhưng không còn dòng nào) được thay
+        bằng 'delta' (bỏ output/parsed_output); lệnh lỗi hoặc không có template giữ nguyên và không
+        cập nhật snapshot.
+        """
+        def apply(cmd, res):
+            if isinstance(res, dict) and isinstance(res.get("parsed_output"), list):
+                res["delta"] = self.diff(host, cmd, res["parsed_output"], key_fields, ignore_fields)
+                for field in ("output", "parsed_output", "raw_output"):
+                    res.pop(field, None)
+
+        per_command = result.get("results")
+        if isinstance(per_command, dict) and per_command:
+            for cmd, res in per_command.items():
+                apply(cmd, res)
+        elif command:
+            apply(command, result)
+        return result
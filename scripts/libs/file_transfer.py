@@ -0,0 +1,244 @@
+import os
+import gzip
+import json
+import time
+import logging
+import threading
+import posixpath
+from typing import Any, Callable, Dict, Optional
+
+# ----------------------------------------------------
+# Tải file từ thiết bị mạng: SFTP dạng stream, resume, nén, giới hạn băng thông
+# ----------------------------------------------------
+# Dùng lại transport SSH (paramiko) của phiên Netmiko đã login, mở kênh SFTP và đọc file
+# theo từng khối buffer_size (có prefetch). Dữ liệu được ghi vào '<đích>.part' kèm file
+# trạng thái '<đích>.part.json'; lần tải sau tiếp tục từ checkpoint cuối nếu file trên
+# thiết bị không đổi (cùng kích thước/mtime). Thiết bị không hỗ trợ SFTP thì fallback
+# về SCP qua netmiko.file_transfer (không resume/nén).
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUFFER_SIZE = 32768
+CHECKPOINT_BYTES = 4 * 1024 * 1024  # Ghi checkpoint (và đóng member gzip) mỗi 4 MB
+
+
+class RateLimiter:
+    """
+    Token bucket giới hạn băng thông (bytes/giây), an toàn đa luồng.
+    Dùng chung một instance cho nhiều thiết bị để giới hạn tổng băng thông;
+    `parent` cho phép xếp chồng giới hạn (ví dụ: mỗi thiết bị + tổng toàn fleet).
+    """
+
+    def __init__(self, rate_bytes_per_s: float, burst_bytes: Optional[float] = None,
+                 parent: Optional["RateLimiter"] = None):
+        self.rate = float(rate_bytes_per_s)
+        self.parent = parent
+        self.capacity = float(burst_bytes or max(rate_bytes_per_s, DEFAULT_BUFFER_SIZE))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount: int):
+        """Chờ cho tới khi đủ token cho `amount` bytes."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                # Khối lớn hơn capacity: cho phép nợ token để không chờ mãi
+                need = min(amount, self.capacity)
+                if self._tokens >= need:
+                    self._tokens -= amount
+                    break
+                wait = (need - self._tokens) / self.rate
+            time.sleep(wait)
+        if self.parent is not None:
+            self.parent.consume(amount)
+
+
+class _PartWriter:
+    """Ghi file .part (thô hoặc gzip) với checkpoint có thể resume."""
+
+    def __init__(self, part_path: str, compress: bool, truncate_to: int):
+        self.compress = compress
+        mode = "r+b" if os.path.exists(part_path) else "wb"
+        self._file = open(part_path, mode)
+        # Bỏ phần dữ liệu ghi sau checkpoint cuối (có thể dở dang khi lần trước bị ngắt)
+        self._file.truncate(truncate_to)
+        self._file.seek(truncate_to)
+        self._member = gzip.GzipFile(fileobj=self._file, mode="wb") if compress else None
+
+    def write(self, data: bytes):
+        (self._member or self._file).write(data)
+
+    def checkpoint(self) -> int:
+        """Đẩy dữ liệu xuống đĩa; với gzip đóng member hiện tại (member hoàn chỉnh = điểm resume hợp lệ)."""
+        if self._member is not None:
+            self._member.close()  # ghi trailer, không đóng file bên dưới
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        # Vị trí phải lấy trước khi mở member mới (GzipFile ghi header ngay khi khởi tạo)
+        position = self._file.tell()
+        if self._member is not None:
+            self._member = gzip.GzipFile(fileobj=self._file, mode="wb")
+        return position
+
+    def close(self) -> int:
+        if self._member is not None:
+            self._member.close()
+        self._file.flush()
+        size = self._file.tell()
+        self._file.close()
+        return size
+
+
+def _load_state(state_path: str) -> Dict[str, Any]:
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_state(state_path: str, state: Dict[str, Any]):
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+
+def open_sftp(net_connect):
+    """Mở SFTP client trên transport SSH của phiên Netmiko (không login lại)."""
+    import paramiko
+
+    transport = net_connect.remote_conn.get_transport()
+    return paramiko.SFTPClient.from_transport(transport)
+
+
+def sftp_download(sftp, remote_path: str, local_path: str, buffer_size: int = DEFAULT_BUFFER_SIZE,
+                  resume: bool = True, compress: bool = False, rate_limiter: Optional[RateLimiter] = None,
+                  progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+    """
+    Tải remote_path về local_path qua SFTP theo từng khối.
+
+    Args:
+        buffer_size: Kích thước mỗi lần đọc (bytes).
+        resume: Tiếp tục từ file .part nếu file nguồn không đổi.
+        compress: Nén gzip khi ghi (local_path nên có đuôi .gz).
+        rate_limiter: Giới hạn băng thông (có thể dùng chung giữa nhiều thiết bị).
+        progress: callback(bytes_đã_tải, tổng_bytes).
+
+    Returns:
+        dict: bytes, remote_size, resumed_from, local_path, compressed_size, duration_s.
+    """
+    start = time.monotonic()
+    remote_stat = sftp.stat(remote_path)
+    remote_size = remote_stat.st_size or 0
+    source_id = {"remote_path": remote_path, "remote_size": remote_size,
+                 "remote_mtime": remote_stat.st_mtime, "compress": compress}
+
+    part_path = local_path + ".part"
+    state_path = part_path + ".json"
+    state = _load_state(state_path) if resume and os.path.exists(part_path) else {}
+    if state and all(state.get(k) == v for k, v in source_id.items()):
+        offset, part_size = int(state["offset"]), int(state["part_size"])
+    else:
+        offset, part_size = 0, 0
+    if offset:
+        logger.info(f"⏯️ Tiếp tục tải {remote_path} từ byte {offset}/{remote_size}.")
+
+    os.makedirs(os.path.dirname(os.path.abspath(local_path)), exist_ok=True)
+    writer = _PartWriter(part_path, compress, truncate_to=part_size)
+    done = offset
+    since_checkpoint = 0
+    try:
+        with sftp.open(remote_path, "rb", bufsize=buffer_size) as remote_file:
+            remote_file.seek(offset)
+            # Gửi nhiều request đọc song song thay vì chờ từng khối (tăng thông lượng trên link có độ trễ)
+            remote_file.prefetch(remote_size)
+            while True:
+                chunk = remote_file.read(buffer_size)
+                if not chunk:
+                    break
+                if rate_limiter is not None:
+                    rate_limiter.consume(len(chunk))
+                writer.write(chunk)
+                done += len(chunk)
+                since_checkpoint += len(chunk)
+                if since_checkpoint >= CHECKPOINT_BYTES:
+                    _save_state(state_path, dict(source_id, offset=done, part_size=writer.checkpoint()))
+                    since_checkpoint = 0
+                if progress is not None:
+                    progress(done, remote_size)
+    except BaseException:
+        # Giữ lại checkpoint cuối để lần sau resume
+        try:
+            _save_state(state_path, dict(source_id, offset=done, part_size=writer.checkpoint()))
+        finally:
+            writer.close()
+        raise
+
+    compressed_size = writer.close()
+    os.replace(part_path, local_path)
+    if os.path.exists(state_path):
+        os.remove(state_path)
+
+    return {
+        "local_path": local_path,
+        "bytes": done,
+        "remote_size": remote_size,
+        "resumed_from": offset,
+        "compressed_size": compressed_size if compress else None,
+        "duration_s": round(time.monotonic() - start, 3),
+    }
+
+
+def download_file(net_connect, remote_path: str, local_path: str, buffer_size: int = DEFAULT_BUFFER_SIZE,
+                  resume: bool = True, compress: bool = False, rate_limiter: Optional[RateLimiter] = None,
+                  progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+    """
+    Tải file từ thiết bị qua phiên Netmiko đã mở: SFTP stream nếu được, ngược lại SCP.
+
+    Returns:
+        dict: method ('sftp' | 'scp') và thông tin truyền file (xem sftp_download).
+    """
+    if compress and not local_path.endswith(".gz"):
+        local_path += ".gz"
+
+    try:
+        sftp = open_sftp(net_connect)
+    except Exception as e:
+        logger.warning(f"⚠️ Không mở được SFTP ({e}), fallback SCP (không resume/nén).")
+        sftp = None
+
+    if sftp is not None:
+        try:
+            result = sftp_download(sftp, remote_path, local_path, buffer_size=buffer_size, resume=resume,
+                                   compress=compress, rate_limiter=rate_limiter, progress=progress)
+        finally:
+            sftp.close()
+        result["method"] = "sftp"
+        return result
+
+    from netmiko import file_transfer
+
+    start = time.monotonic()
+    local_path = local_path[:-len(".gz")] if compress else local_path
+    transfer = file_transfer(
+        net_connect,
+        source_file=posixpath.basename(remote_path),
+        dest_file=local_path,
+        file_system=posixpath.dirname(remote_path) or None,
+        direction="get",
+        overwrite_file=True,
+    )
+    size = os.path.getsize(local_path) if os.path.exists(local_path) else 0
+    return {
+        "method": "scp",
+        "local_path": local_path,
+        "bytes": size,
+        "remote_size": size if transfer.get("file_transferred") or transfer.get("file_exists") else None,
+        "resumed_from": 0,
+        "compressed_size": None,
+        "duration_s": round(time.monotonic() - start, 3),
+    }
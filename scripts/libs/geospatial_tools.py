@@ -1,7 +1,16 @@
 import math
-from pykml import parser as kmlparser
-from shapely.geometry import Point, LineString
+import os
+from collections import OrderedDict
 import sys # Dùng cho việc in cảnh báo lỗi
+from libs import instrumentation as metrics
+
+# pykml và shapely được import trong hàm sử dụng chúng (import trì hoãn),
+# để các script chỉ cần haversine() không phải trả phí import lxml/GEOS.
+
+# Cache kết quả parse KML theo (đường dẫn, mtime, kích thước) để tiến trình thường trú
+# (script_worker.py) không phải parse lại cùng một file KML cho mỗi request.
+KML_CACHE_MAX_ENTRIES = 8
+_kml_routes_cache = OrderedDict()
 
 # -----------------------------
 # 1. Hàm tính toán địa lý cốt lõi
@@ -75,21 +84,64 @@ def _scan_kml_node(node, current_path, routes):
             # print(f"    ✔ Total points: {len(all_coords)}")
             routes.append((full_name, all_coords))
 
-def extract_routes_from_kml(kml_path):
-    """Quét KML/KMZ và trích xuất tất cả các LineString (tuyến đường) cùng đường dẫn thư mục."""
-    print(f"📥 Đang load file KML: {kml_path}")
+def _parse_kml_routes(fileobj):
+    """Parse KML từ file object (nhị phân) -> [(full_name, [(lon, lat), ...]), ...]."""
+    from pykml import parser as kmlparser
+
+    root = kmlparser.parse(fileobj).getroot()
     routes = []
+    for elem in root.getchildren():
+        _scan_kml_node(elem, "", routes)
+    return routes
+
+def extract_routes_from_kml_bytes(data):
+    """
+    Như extract_routes_from_kml nhưng đọc từ nội dung file (ví dụ file upload Streamlit), không cache.
+    Nội dung không parse được (KML hỏng) trả về [] như bản đọc từ đường dẫn.
+    """
+    import io
+
     try:
-        with open(kml_path, "rb") as f:
-            root = kmlparser.parse(f).getroot()
+        with metrics.timer("kml_parse_seconds"):
+            return _parse_kml_routes(io.BytesIO(data))
     except Exception as e:
-        print(f"❌ Lỗi khi đọc/parse file KML: {e}")
+        print(f"❌ Lỗi khi parse nội dung KML: {e}")
         return []
 
-    for elem in root.getchildren():
-        _scan_kml_node(elem, "", routes)
+def _kml_cache_key(kml_path):
+    """Khóa cache: đường dẫn tuyệt đối + mtime + kích thước file (None nếu không stat được)."""
+    try:
+        st = os.stat(kml_path)
+    except OSError:
+        return None
+    return (os.path.abspath(kml_path), st.st_mtime_ns, st.st_size)
+
+def extract_routes_from_kml(kml_path, use_cache=True):
+    """
+    Quét KML/KMZ và trích xuất tất cả các LineString (tuyến đường) cùng đường dẫn thư mục.
+    Kết quả được cache theo nội dung file; danh sách trả về được dùng chung, không nên sửa trực tiếp.
+    """
+    cache_key = _kml_cache_key(kml_path) if use_cache else None
+    if cache_key is not None and cache_key in _kml_routes_cache:
+        _kml_routes_cache.move_to_end(cache_key)
+        routes = _kml_routes_cache[cache_key]
+        metrics.inc("kml_parse_cache_hits_total")
+        print(f"📥 Dùng lại KML đã parse (cache): {kml_path} ({len(routes)} tuyến)")
+        return routes
+
+    print(f"📥 Đang load file KML: {kml_path}")
+    try:
+        with metrics.timer("kml_parse_seconds"), open(kml_path, "rb") as f:
+            routes = _parse_kml_routes(f)
+    except Exception as e:
+        print(f"❌ Lỗi khi đọc/parse file KML: {e}")
+        return []
 
     print(f"🎉 Tổng số tuyến đọc được: {len(routes)}")
+    if cache_key is not None:
+        _kml_routes_cache[cache_key] = routes
+        while len(_kml_routes_cache) > KML_CACHE_MAX_ENTRIES:
+            _kml_routes_cache.popitem(last=False)
     return routes
 
 # -----------------------------
@@ -147,6 +199,8 @@ def compute_nearest_point(lat, lon, coords):
     Tìm điểm gần nhất trên tuyến đường (coords) so với điểm (lat, lon). Sử dung Shapely.
     Trả về (distance, (nearest_lat, nearest_lon)) hoặc (float('inf'), (0, 0)) nếu lỗi.
     """
+    from shapely.geometry import Point, LineString
+
     MAX_DISTANCE = float('inf') 
     
     # Shapely hoạt động với (lon, lat)
@@ -173,44 +227,105 @@ def compute_nearest_point(lat, lon, coords):
         print(f"    ⚠ Lỗi Shapely/Tính toán: {e} khi xử lý tuyến.")
         return MAX_DISTANCE, (0, 0)
 
-def find_nearest_routes(kml_path, target_lat, target_lon):
-    """
-    Xử lý file KML/KMZ, tính toán khoảng cách đến một điểm,
-    và trả về danh sách các tuyến đường gần nhất đã sắp xếp.
-    """
-    routes = extract_routes_from_kml(kml_path)
+def haversine_many(lat, lon, lats, lons):
+    """Khoảng cách Haversine (meters) từ một điểm tới các mảng tọa độ (vector hóa numpy)."""
+    import numpy as np
 
-    if not routes:
-        return []
+    phi1 = math.radians(lat)
+    phi2 = np.radians(lats)
+    dphi = phi2 - phi1
+    dlambda = np.radians(lons) - math.radians(lon)
+    a = np.sin(dphi / 2)**2 + math.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2)**2
+    return 6371000 * (2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a)))
 
-    results = []
+def short_route_name(route_name):
+    """Tên ngắn của tuyến: phần tử áp chót của đường dẫn (thư mục chứa tuyến)."""
+    parts = route_name.split('/')
+    return parts[-2].strip() if len(parts) >= 2 else route_name
 
-    for route_name, coords in routes:
-        
-        # 💡 Tối ưu hóa: Bỏ qua tuyến có ít hơn 2 điểm.
-        if len(coords) < 2:
-            continue
-            
-        # Trích xuất tên ngắn
-        parts = route_name.split('/')
-        # Lấy phần tử áp chót (thư mục chứa tuyến)
-        short_route_name = parts[-2].strip() if len(parts) >= 2 else route_name
-
-        dist, nearest_pt = compute_nearest_point(target_lat, target_lon, coords)
-
-        # Chỉ thêm vào kết quả nếu khoảng cách không phải là vô cực (tức là không bị lỗi)
-        if dist != float('inf'):
-            results.append({
-                "full_name": route_name,
-                "short_name": short_route_name,
-                "distance_m": dist,
-                "nearest_lat": nearest_pt[0],
-                "nearest_lon": nearest_pt[1]
-            })
-
-    # Sắp xếp kết quả theo khoảng cách
-    results.sort(key=lambda x: x["distance_m"])
-    return results
+class RouteIndex:
+    """
+    Chỉ mục tuyến dựng một lần cho mỗi file KML: mảng LineString (shapely 2) cùng tên đầy đủ / tên ngắn.
+    Mỗi truy vấn là vài phép toán vector hóa trên toàn bộ tuyến (project / interpolate / haversine),
+    không parse lại KML hay dựng lại LineString -> vài mili giây thay vì vài giây.
+    Kết quả giống compute_nearest_point + find_nearest_routes (bỏ tuyến < 2 điểm / không hợp lệ).
+    """
+
+    def __init__(self, routes):
+        import numpy as np
+        import shapely
+
+        with metrics.timer("route_index_build_seconds"):
+            kept = [(name, coords) for name, coords in routes if len(coords) >= 2]
+            lines = np.array([shapely.LineString(coords) for _, coords in kept], dtype=object)
+            valid = shapely.is_valid(lines) & ~shapely.is_empty(lines) if len(lines) else np.zeros(0, dtype=bool)
+        self.lines = lines[valid]
+        self.full_names = [name for (name, _), ok in zip(kept, valid) if ok]
+        self.short_names = [short_route_name(name) for name in self.full_names]
+
+    @classmethod
+    def from_kml(cls, kml_path):
+        return cls(extract_routes_from_kml(kml_path))
+
+    @classmethod
+    def from_kml_bytes(cls, data):
+        return cls(extract_routes_from_kml_bytes(data))
+
+    def __len__(self):
+        return len(self.full_names)
+
+    def nearest(self, target_lat, target_lon, limit=None):
+        """
+        Các tuyến sắp xếp theo khoảng cách tới (target_lat, target_lon), tối đa `limit` tuyến (None = tất cả):
+        [{full_name, short_name, distance_m, nearest_lat, nearest_lon}, ...]
+        """
+        if not len(self):
+            return []
+        import numpy as np
+        import shapely
+
+        with metrics.timer("route_index_query_seconds"):
+            point = shapely.Point(target_lon, target_lat)
+            nearest = shapely.line_interpolate_point(self.lines, shapely.line_locate_point(self.lines, point))
+            xy = shapely.get_coordinates(nearest)
+            distances = haversine_many(target_lat, target_lon, xy[:, 1], xy[:, 0])
+            order = np.argsort(distances, kind="stable")
+        if limit:
+            order = order[:limit]
+        return [{
+            "full_name": self.full_names[i],
+            "short_name": self.short_names[i],
+            "distance_m": float(distances[i]),
+            "nearest_lat": float(xy[i, 1]),
+            "nearest_lon": float(xy[i, 0]),
+        } for i in order.tolist()]
+
+    def nearest_many(self, points, limit=None):
+        """nearest() cho nhiều điểm [(lat, lon), ...]; trả về danh sách kết quả theo thứ tự điểm."""
+        return [self.nearest(lat, lon, limit) for lat, lon in points]
+
+# Chỉ mục đã dựng, theo cùng khóa với _kml_routes_cache (đường dẫn, mtime, kích thước)
+_route_index_cache = OrderedDict()
+
+def route_index_for_file(kml_path):
+    """RouteIndex của file KML, cache theo nội dung file (tối đa KML_CACHE_MAX_ENTRIES file)."""
+    cache_key = _kml_cache_key(kml_path)
+    if cache_key is not None and cache_key in _route_index_cache:
+        _route_index_cache.move_to_end(cache_key)
+        return _route_index_cache[cache_key]
+    index = RouteIndex.from_kml(kml_path)
+    if cache_key is not None:
+        _route_index_cache[cache_key] = index
+        while len(_route_index_cache) > KML_CACHE_MAX_ENTRIES:
+            _route_index_cache.popitem(last=False)
+    return index
+
+def find_nearest_routes(kml_path, target_lat, target_lon, limit=None):
+    """
+    Xử lý file KML/KMZ, tính toán khoảng cách đến một điểm,
+    và trả về danh sách các tuyến đường gần nhất đã sắp xếp (tối đa `limit` tuyến nếu có).
+    """
+    return route_index_for_file(kml_path).nearest(target_lat, target_lon, limit)
 
 
 
@@ -0,0 +1,264 @@
+import os
+import sys
+import json
+import math
+import time
+import threading
+import contextlib
+import functools
+from typing import Any, Callable, Dict, Optional, Sequence
+
+# ----------------------------------------------------
+# Đo đạc thời gian & bộ đếm cho script và libs
+# ----------------------------------------------------
+# Trước đây "số liệu" duy nhất là các dòng print/logger.info cho từng request (ví dụ "OSRM OK: ...
+# km"), tự chúng đã tốn thời gian khi chạy hàng nghìn request và n8n không đọc được. Module này giữ
+# trong tiến trình:
+#   - counter: bộ đếm cộng dồn (tên kết thúc bằng _total);
+#   - histogram: phân bố giá trị theo bucket cố định + count/sum/min/max (timer ghi vào histogram,
+#     tên kết thúc bằng _seconds).
+# Cuối mỗi lần chạy, emit_run_summary() xuất MỘT bản tóm tắt JSON (gắn vào dict kết quả của script
+# hoặc in thành dòng cuối cùng của stdout) và, nếu cấu hình, ghi file Prometheus textfile cho
+# node_exporter. Chỉ dùng thư viện chuẩn; chi phí mỗi lần đo ~1 µs.
+#
+# Biến môi trường:
+#   N8N_SCRIPTS_METRICS=0               tắt thu thập và xuất (mặc định bật)
+#   N8N_SCRIPTS_METRICS_TEXTFILE=PATH   ghi thêm Prometheus textfile (PATH là file .prom, hoặc thư mục:
+#                                       mỗi script một file <script>.prom)
+#
+# Các metric do libs ghi: kml_parse_seconds, route_index_build_seconds, route_index_query_seconds,
+# osrm_route_seconds / osrm_table_seconds / osrm_requests_total / osrm_errors_total,
+# excel_write_seconds / columnar_write_seconds (+ excel_rows_total / columnar_rows_total), ssh_connect_seconds,
+# ssh_command_seconds / ssh_command_errors_total.
+
+METRICS_ENV = "N8N_SCRIPTS_METRICS"
+TEXTFILE_ENV = "N8N_SCRIPTS_METRICS_TEXTFILE"
+PROMETHEUS_PREFIX = "n8n_scripts"
+
+# Cận trên bucket (giây): từ thao tác cục bộ vài ms tới lệnh SSH / file lớn vài phút
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def metrics_enabled() -> bool:
+    return os.environ.get(METRICS_ENV, "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+class Histogram:
+    """Phân bố giá trị theo bucket cố định (như Prometheus histogram) kèm count/sum/min/max."""
+
+    __slots__ = ("bounds", "bucket_counts", "count", "sum", "min", "max")
+
+    def __init__(self, bounds: Sequence[float] = DEFAULT_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.bucket_counts = [0] * (len(self.bounds) + 1)   # phần tử cuối: > bucket lớn nhất (+Inf)
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def observe(self, value: float):
+        position = len(self.bounds)
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                position = i
+                break
+        self.bucket_counts[position] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Phân vị xấp xỉ: cận trên của bucket chứa phân vị (không vượt quá max thực tế)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.bucket_counts):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6),
+            "min": round(self.min, 6),
+            "p50": round(self.quantile(0.5), 6),
+            "p95": round(self.quantile(0.95), 6),
+            "max": round(self.max, 6),
+        }
+
+
+class MetricsRegistry:
+    """Counter + histogram của một tiến trình (an toàn luồng)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters: Dict[str, float] = {}
+            self.histograms: Dict[str, Histogram] = {}
+            self.started_at = time.time()
+            self._started_perf = time.perf_counter()
+
+    def inc(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(buckets)
+            histogram.observe(value)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "wall_seconds": round(time.perf_counter() - self._started_perf, 6),
+                "counters": {name: self.counters[name] for name in sorted(self.counters)},
+                "histograms": {name: self.histograms[name].to_dict() for name in sorted(self.histograms)},
+            }
+
+    def prometheus_text(self, script: str) -> str:
+        """Định dạng Prometheus text exposition (counter, histogram, thời lượng và thời điểm chạy)."""
+        label = f'script="{_escape_label(script)}"'
+        lines = []
+        with self._lock:
+            for name in sorted(self.counters):
+                metric = _metric_name(name)
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric}{{{label}}} {_number(self.counters[name])}")
+            for name in sorted(self.histograms):
+                metric = _metric_name(name)
+                histogram = self.histograms[name]
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.bounds, histogram.bucket_counts):
+                    cumulative += bucket_count
+                    lines.append(f'{metric}_bucket{{{label},le="{_number(bound)}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{{label},le="+Inf"}} {histogram.count}')
+                lines.append(f"{metric}_sum{{{label}}} {_number(histogram.sum)}")
+                lines.append(f"{metric}_count{{{label}}} {histogram.count}")
+            duration = time.perf_counter() - self._started_perf
+        for name, value in (("run_duration_seconds", duration), ("last_run_timestamp_seconds", time.time())):
+            metric = _metric_name(name)
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric}{{{label}}} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _metric_name(name: str) -> str:
+    cleaned = "".join(ch if ch.isalnum() or ch == "_" else "_" for ch in name)
+    return f"{PROMETHEUS_PREFIX}_{cleaned}"
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+_registry = MetricsRegistry()
+_enabled = metrics_enabled()
+
+
+# -----------------------------
+# 1. API ghi metric
+# -----------------------------
+
+def get_registry() -> MetricsRegistry:
+    return _registry
+
+
+def inc(name: str, value: float = 1):
+    """Cộng vào counter `name` (quy ước tên kết thúc bằng _total)."""
+    if _enabled:
+        _registry.inc(name, value)
+
+
+def observe(name: str, value: float):
+    """Ghi một giá trị vào histogram `name`."""
+    if _enabled:
+        _registry.observe(name, value)
+
+
+@contextlib.contextmanager
+def timer(name: str):
+    """Đo thời gian khối lệnh (giây) vào histogram `name` (quy ước tên kết thúc bằng _seconds), kể cả khi lỗi."""
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _registry.observe(name, time.perf_counter() - start)
+
+
+def timed(name: str) -> Callable:
+    """Decorator: đo thời gian mỗi lần gọi hàm vào histogram `name`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# -----------------------------
+# 2. Xuất cuối lần chạy
+# -----------------------------
+
+def write_prometheus_textfile(script: str, path: Optional[str] = None) -> Optional[str]:
+    """
+    Ghi metric dạng Prometheus textfile (ghi file tạm rồi đổi tên để node_exporter không đọc file dở).
+    `path` mặc định lấy từ N8N_SCRIPTS_METRICS_TEXTFILE; là thư mục thì ghi <script>.prom. Trả về đường dẫn đã ghi.
+    """
+    path = path or os.environ.get(TEXTFILE_ENV)
+    if not path:
+        return None
+    if os.path.isdir(path):
+        path = os.path.join(path, f"{script}.prom")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(_registry.prometheus_text(script))
+    os.replace(tmp_path, path)
+    return path
+
+
+def emit_run_summary(script: str, result: Optional[Dict[str, Any]] = None, stream=None) -> Optional[Dict[str, Any]]:
+    """
+    Kết thúc một lần chạy của script: tóm tắt metric được gắn vào result["metrics"] nếu script trả về
+    dict JSON (script tự in result như cũ), ngược lại in thành một dòng JSON {"metrics": ...} (mặc định ra
+    stdout, là dòng cuối để n8n đọc). Ghi Prometheus textfile nếu được cấu hình, rồi xóa số liệu để lần
+    chạy sau trong cùng tiến trình (script_worker.py) bắt đầu lại từ đầu.
+    """
+    if not _enabled:
+        return None
+    summary = dict(script=script, **_registry.summary())
+    try:
+        textfile = write_prometheus_textfile(script)
+        if textfile:
+            summary["prometheus_textfile"] = textfile
+    except OSError as e:
+        summary["prometheus_error"] = str(e)
+
+    if result is not None:
+        result["metrics"] = summary
+    else:
+        out = stream or sys.stdout
+        out.write(json.dumps({"metrics": summary}, ensure_ascii=False) + "\n")
+        out.flush()
+    _registry.reset()
+    return summary
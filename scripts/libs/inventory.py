@@ -0,0 +1,274 @@
+import os
+import csv
+import json
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+from libs.state_store import SCRIPTS_DIR
+
+# ----------------------------------------------------
+# Inventory thiết bị & thông tin đăng nhập
+# ----------------------------------------------------
+# n8n trước đây phải tự lấy secret và dựng --username/--password cho từng lần gọi script.
+# Module này đọc danh sách thiết bị (CSV / JSON / YAML có nhóm) một lần, lấy thông tin đăng nhập
+# theo tên tham chiếu từ biến môi trường hoặc file mã hóa Fernet cục bộ, và cache tham số kết nối
+# đã giải quyết theo tên thiết bị (có ích nhất trong tiến trình thường trú script_worker.py).
+#
+# Thông tin đăng nhập của tham chiếu REF (cột/trường 'credentials'):
+#   1. Biến môi trường NETMIKO_CRED_<REF>_USERNAME / _PASSWORD / _SECRET
+#      (không có tham chiếu: NETMIKO_USERNAME / NETMIKO_PASSWORD / NETMIKO_SECRET)
+#   2. File mã hóa N8N_SCRIPTS_CREDENTIALS_FILE (mặc định scripts/state/credentials.enc), khóa Fernet
+#      trong N8N_SCRIPTS_CREDENTIALS_KEY. Nội dung sau giải mã: {"<ref>": {"username", "password",
+#      "secret"}, ...}; không có tham chiếu dùng mục "default". Tạo file bằng inventory_tool.py.
+
+REQUIRED_FIELDS = ['host', 'device_type']
+DEFAULT_INVENTORY = os.environ.get("N8N_SCRIPTS_INVENTORY")
+DEFAULT_CREDENTIALS_FILE = os.environ.get("N8N_SCRIPTS_CREDENTIALS_FILE",
+                                          os.path.join(SCRIPTS_DIR, "state", "credentials.enc"))
+CREDENTIALS_KEY_ENV = "N8N_SCRIPTS_CREDENTIALS_KEY"
+
+_cache_lock = threading.Lock()
+_inventory_cache: Dict[str, Any] = {}    # đường dẫn -> ((mtime, size), danh sách thiết bị)
+_vault_cache: Dict[str, Any] = {}        # đường dẫn -> ((mtime, size), dict thông tin đăng nhập)
+_params_cache: Dict[Any, Dict[str, Any]] = {}
+
+
+def _file_signature(path: str):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def clear_cache():
+    """Bỏ cache inventory / thông tin đăng nhập (ví dụ sau khi đổi biến môi trường)."""
+    with _cache_lock:
+        _inventory_cache.clear()
+        _vault_cache.clear()
+        _params_cache.clear()
+
+
+# -----------------------------
+# 1. Đọc inventory
+# -----------------------------
+
+def _split_groups(value: Any) -> List[str]:
+    if isinstance(value, (list, tuple)):
+        return [str(v).strip() for v in value if str(v).strip()]
+    return [g.strip() for g in str(value or '').replace(';', ',').split(',') if g.strip()]
+
+
+def _normalize_device(device: Dict[str, Any], position: int) -> Dict[str, Any]:
+    missing = [field for field in REQUIRED_FIELDS if not str(device.get(field) or '').strip()]
+    if missing:
+        raise ValueError(f"Thiết bị thứ {position} thiếu trường bắt buộc: {', '.join(missing)}")
+    return {
+        'name': str(device.get('name') or device['host']).strip(),
+        'host': str(device['host']).strip(),
+        'device_type': str(device['device_type']).strip(),
+        'port': int(device.get('port') or 22),
+        'credentials': str(device.get('credentials') or '').strip(),
+        'groups': _split_groups(device.get('groups') or device.get('group')),
+    }
+
+
+def _expand_yaml(data: Any) -> List[Dict[str, Any]]:
+    """
+    YAML dạng danh sách thiết bị, hoặc:
+        defaults: {device_type: juniper_junos, credentials: core}
+        groups:
+          core:
+            defaults: {port: 22}
+            devices: [{name: r1, host: 10.0.0.1}, ...]
+        devices: [...]   # thiết bị không thuộc nhóm
+    Giá trị của thiết bị ghi đè defaults của nhóm, defaults của nhóm ghi đè defaults chung.
+    """
+    if isinstance(data, list):
+        return data
+    if not isinstance(data, dict):
+        raise ValueError("File inventory YAML phải là danh sách thiết bị hoặc object có 'groups'/'devices'.")
+    defaults = data.get('defaults') or {}
+    devices = [dict(defaults, **device) for device in data.get('devices') or []]
+    for group_name, group in (data.get('groups') or {}).items():
+        if isinstance(group, list):
+            group = {'devices': group}
+        group_defaults = dict(defaults, **(group.get('defaults') or {}))
+        for device in group.get('devices') or []:
+            merged = dict(group_defaults, **device)
+            merged['groups'] = [str(group_name)] + _split_groups(device.get('groups') or device.get('group'))
+            devices.append(merged)
+    return devices
+
+
+def _read_inventory_file(inventory_path: str) -> List[Dict[str, Any]]:
+    lower = inventory_path.lower()
+    if lower.endswith('.json'):
+        with open(inventory_path, 'r', encoding='utf-8') as f:
+            devices = json.load(f)
+        if not isinstance(devices, list):
+            raise ValueError("File inventory JSON phải là một mảng các thiết bị.")
+    elif lower.endswith(('.yaml', '.yml')):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError("Cần cài PyYAML để đọc inventory YAML (pip install pyyaml).")
+        with open(inventory_path, 'r', encoding='utf-8') as f:
+            devices = _expand_yaml(yaml.safe_load(f))
+    else:
+        with open(inventory_path, 'r', encoding='utf-8-sig') as f:
+            devices = list(csv.DictReader(f))
+    devices = [_normalize_device(device, i + 1) for i, device in enumerate(devices)]
+    # Tên thiết bị là khóa của --device, kho kết quả và file log: trùng tên thì từ chối cả file
+    seen: Dict[str, int] = {}
+    duplicates = []
+    for i, device in enumerate(devices):
+        if device['name'] in seen:
+            duplicates.append(f"'{device['name']}' (thiết bị thứ {seen[device['name']]} và {i + 1})")
+        else:
+            seen[device['name']] = i + 1
+    if duplicates:
+        raise ValueError(f"Inventory {inventory_path} có tên thiết bị trùng: {', '.join(duplicates)}")
+    return devices
+
+
+def load_inventory(inventory_path: str, groups: Optional[Iterable[str]] = None,
+                   names: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Đọc danh sách thiết bị từ file CSV, JSON (list các object) hoặc YAML (có nhóm).
+    Kết quả được cache theo thời điểm sửa file. Lọc theo nhóm và/hoặc tên nếu có.
+    CSV/JSON khai báo nhóm bằng cột 'group' (nhiều nhóm cách nhau bởi dấu phẩy).
+    """
+    path = os.path.abspath(inventory_path)
+    signature = _file_signature(path)
+    with _cache_lock:
+        cached = _inventory_cache.get(path)
+    if cached is None or cached[0] != signature:
+        cached = (signature, _read_inventory_file(path))
+        with _cache_lock:
+            _inventory_cache[path] = cached
+    devices = cached[1]
+
+    if groups:
+        wanted = set(groups)
+        devices = [d for d in devices if wanted.intersection(d['groups'])]
+    if names:
+        wanted_names = list(names)
+        by_name = {d['name']: d for d in cached[1]}
+        unknown = [name for name in wanted_names if name not in by_name]
+        if unknown:
+            raise ValueError(f"Không có thiết bị trong inventory: {', '.join(unknown)}")
+        devices = [d for d in devices if d['name'] in set(wanted_names)]
+    return [dict(d) for d in devices]
+
+
+def get_device(name: str, inventory_path: Optional[str] = None) -> Dict[str, Any]:
+    """Một thiết bị theo tên (hoặc host) trong inventory."""
+    inventory_path = inventory_path or DEFAULT_INVENTORY
+    if not inventory_path:
+        raise ValueError("Chưa chỉ định inventory (--inventory hoặc biến môi trường N8N_SCRIPTS_INVENTORY).")
+    for device in load_inventory(inventory_path):
+        if device['name'] == name or device['host'] == name:
+            return device
+    raise ValueError(f"Không có thiết bị '{name}' trong inventory {inventory_path}.")
+
+
+# -----------------------------
+# 2. Thông tin đăng nhập
+# -----------------------------
+
+def generate_key() -> str:
+    """Sinh khóa Fernet mới (đặt vào biến môi trường N8N_SCRIPTS_CREDENTIALS_KEY)."""
+    from cryptography.fernet import Fernet
+
+    return Fernet.generate_key().decode('ascii')
+
+
+def encrypt_credentials(credentials: Dict[str, Dict[str, Optional[str]]], key: str,
+                        path: Optional[str] = None) -> str:
+    """Mã hóa {ref: {username, password, secret}} vào file (ghi nguyên tử). Trả về đường dẫn file."""
+    from cryptography.fernet import Fernet
+
+    path = os.path.abspath(path or DEFAULT_CREDENTIALS_FILE)
+    token = Fernet(key.encode('ascii')).encrypt(json.dumps(credentials).encode('utf-8'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(token)
+    os.chmod(tmp_path, 0o600)
+    os.replace(tmp_path, path)
+    with _cache_lock:
+        _vault_cache.pop(path, None)
+        _params_cache.clear()
+    return path
+
+
+def load_encrypted_credentials(path: Optional[str] = None, key: Optional[str] = None) -> Dict[str, Dict[str, Optional[str]]]:
+    """Giải mã file thông tin đăng nhập (cache theo thời điểm sửa file); {} nếu file không tồn tại."""
+    path = os.path.abspath(path or DEFAULT_CREDENTIALS_FILE)
+    if not os.path.exists(path):
+        return {}
+    signature = _file_signature(path)
+    with _cache_lock:
+        cached = _vault_cache.get(path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    key = key or os.environ.get(CREDENTIALS_KEY_ENV)
+    if not key:
+        raise ValueError(f"Thiếu biến môi trường {CREDENTIALS_KEY_ENV} để giải mã {path}.")
+    from cryptography.fernet import Fernet, InvalidToken
+
+    with open(path, 'rb') as f:
+        token = f.read()
+    try:
+        credentials = json.loads(Fernet(key.encode('ascii')).decrypt(token))
+    except (InvalidToken, ValueError):
+        raise ValueError(f"Không giải mã được {path}: sai khóa hoặc file hỏng.")
+    with _cache_lock:
+        _vault_cache[path] = (signature, credentials)
+    return credentials
+
+
+def resolve_credentials(credentials_ref: str) -> Dict[str, Optional[str]]:
+    """Lấy username/password/secret theo tên tham chiếu: biến môi trường trước, rồi file mã hóa."""
+    prefix = f"NETMIKO_CRED_{credentials_ref.upper()}_" if credentials_ref else "NETMIKO_"
+    username = os.environ.get(prefix + "USERNAME")
+    password = os.environ.get(prefix + "PASSWORD")
+    if username is not None and password is not None:
+        return {
+            'username': username,
+            'password': password,
+            'secret': os.environ.get(prefix + "SECRET"),
+        }
+
+    entry = load_encrypted_credentials().get(credentials_ref or "default")
+    if entry and entry.get('username') is not None and entry.get('password') is not None:
+        return {
+            'username': entry['username'],
+            'password': entry['password'],
+            'secret': entry.get('secret'),
+        }
+    raise ValueError(f"Thiếu biến môi trường {prefix}USERNAME/{prefix}PASSWORD "
+                     f"và không có mục '{credentials_ref or 'default'}' trong file thông tin đăng nhập.")
+
+
+def device_params(name: str, inventory_path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Tham số kết nối đầy đủ của thiết bị theo tên: device_type, host, port, username, password, secret.
+    Cache trong tiến trình; tự làm mới khi file inventory / file thông tin đăng nhập thay đổi.
+    """
+    device = get_device(name, inventory_path)
+    inventory_path = os.path.abspath(inventory_path or DEFAULT_INVENTORY)
+    vault_path = os.path.abspath(DEFAULT_CREDENTIALS_FILE)
+    vault_signature = _file_signature(vault_path) if os.path.exists(vault_path) else None
+    cache_key = (inventory_path, _file_signature(inventory_path), vault_signature, name)
+    with _cache_lock:
+        cached = _params_cache.get(cache_key)
+    if cached is None:
+        cached = {
+            'device_type': device['device_type'],
+            'host': device['host'],
+            'port': device['port'],
+            **resolve_credentials(device['credentials']),
+        }
+        with _cache_lock:
+            _params_cache[cache_key] = cached
+    return dict(cached)
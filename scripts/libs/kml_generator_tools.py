@@ -2,12 +2,15 @@ import sys
 import json
 import logging
 import os
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Optional, Tuple
+from xml.sax.saxutils import escape
 from logger_setup import setup_logger
+from osrm_tools import get_osrm_route_cached
 
 # Định nghĩa kiểu dữ liệu chung
 SiteItem = Dict[str, Any]
 LineItem = Dict[str, Any]
+RouteItem = Dict[str, Any]   # {RouteName, CoordinatesList: [(lon, lat), ...], Description, FolderName, ...}
 KMLFolderNode = Dict[str, Any]
 
 # # --- Thiết lập Logging ---
@@ -108,6 +111,37 @@ def _create_line_placemark(coord1: Tuple[float, float], coord2: Tuple[float, flo
     return style_kml, placemark_kml
 
 
+def _create_route_placemark(route_name: str, coords: List[Tuple[float, float]], description: str, line_color: str, line_width: int) -> Tuple[str, str]:
+    """Placemark LineString nhiều điểm cho tuyến; style dùng chung theo (màu, độ rộng)."""
+    style_id = f"routeStyle_{''.join(ch for ch in line_color if ch.isalnum())}_{line_width}"
+
+    style_kml = f"""
+    <Style id="{style_id}">
+      <LineStyle>
+        <color>{line_color}</color>
+        <width>{line_width}</width>
+      </LineStyle>
+    </Style>"""
+
+    description_kml = f"<description>{escape(description)}</description>" if description else ""
+    coords_kml = "\n          ".join(_format_coord(lon, lat) for lon, lat in coords)
+
+    placemark_kml = f"""
+    <Placemark>
+      <name>{escape(route_name)}</name>
+      {description_kml}
+      <styleUrl>#{style_id}</styleUrl>
+      <LineString>
+        <tessellate>1</tessellate>
+        <coordinates>
+          {coords_kml}
+        </coordinates>
+      </LineString>
+    </Placemark>"""
+
+    return style_kml, placemark_kml
+
+
 def _generate_folder_kml_recursive(current_folder_node: KMLFolderNode) -> str:
     # ... (Hàm đệ quy giữ nguyên)
     content: List[str] = []
@@ -134,6 +168,32 @@ def _generate_folder_kml_recursive(current_folder_node: KMLFolderNode) -> str:
     
     return "".join(content)
 
+def _add_placemark_to_tree(grouped_placemarks: KMLFolderNode, placemark_kml: str, folder_name: str,
+                           second_folder_name: str, third_folder_name: str):
+    """Thêm placemark vào cây thư mục 3 cấp (FolderName / SecondFolderName / ThirdFolderName)."""
+    current_level_node = grouped_placemarks
+    
+    # Cấp 1: FolderName
+    if folder_name:
+        if folder_name not in current_level_node['subfolders']:
+            current_level_node['subfolders'][folder_name] = {'placemarks': [], 'subfolders': {}}
+        current_level_node = current_level_node['subfolders'][folder_name]
+
+        # Cấp 2: SecondFolderName
+        if second_folder_name:
+            if second_folder_name not in current_level_node['subfolders']:
+                current_level_node['subfolders'][second_folder_name] = {'placemarks': [], 'subfolders': {}}
+            current_level_node = current_level_node['subfolders'][second_folder_name]
+
+            # Cấp 3: ThirdFolderName
+            if third_folder_name:
+                if third_folder_name not in current_level_node['subfolders']:
+                    current_level_node['subfolders'][third_folder_name] = {'placemarks': [], 'subfolders': {}}
+                current_level_node = current_level_node['subfolders'][third_folder_name]
+    
+    # Thêm placemark vào node đích cuối cùng
+    current_level_node['placemarks'].append(placemark_kml)
+
 # Hàm phụ nay cần nhận logger làm tham số
 def _process_item_and_group(data_item: Dict[str, Any], i: int, grouped_placemarks: KMLFolderNode, is_point: bool, logger: logging.Logger) -> Tuple[str | None, str | None, bool]:
     """
@@ -212,28 +272,7 @@ def _process_item_and_group(data_item: Dict[str, Any], i: int, grouped_placemark
         return None, None, False
         
     # --- Logic nhóm 3 cấp thư mục (KHÔNG ĐỔI) ---
-    current_level_node = grouped_placemarks
-    
-    # Cấp 1: FolderName
-    if folder_name:
-        if folder_name not in current_level_node['subfolders']:
-            current_level_node['subfolders'][folder_name] = {'placemarks': [], 'subfolders': {}}
-        current_level_node = current_level_node['subfolders'][folder_name]
-
-        # Cấp 2: SecondFolderName
-        if second_folder_name:
-            if second_folder_name not in current_level_node['subfolders']:
-                current_level_node['subfolders'][second_folder_name] = {'placemarks': [], 'subfolders': {}}
-            current_level_node = current_level_node['subfolders'][second_folder_name]
-
-            # Cấp 3: ThirdFolderName
-            if third_folder_name:
-                if third_folder_name not in current_level_node['subfolders']:
-                    current_level_node['subfolders'][third_folder_name] = {'placemarks': [], 'subfolders': {}}
-                current_level_node = current_level_node['subfolders'][third_folder_name]
-    
-    # Thêm placemark vào node đích cuối cùng
-    current_level_node['placemarks'].append(placemark_kml)
+    _add_placemark_to_tree(grouped_placemarks, placemark_kml, folder_name, second_folder_name, third_folder_name)
     
     return style_kml, placemark_kml, True
 
@@ -313,6 +352,128 @@ def generate_kml_for_lines(items_to_process: List[LineItem], logger: logging.Log
     return full_kml_content
 
 
+# --- Tuyến (Routes): dẫn đường OSRM cho tuyến 2 điểm ---
+
+ROUTE_COLOR_DEFAULT = "ff00aa00"  # aabbggrr: xanh lá, cùng màu bản đồ xem trước
+ROUTE_WIDTH_DEFAULT = 4
+OSRM_WORKERS_DEFAULT = 8
+
+def route_two_point_items(items_to_process: List[RouteItem], osrm_url: str, profile: str = "car",
+                          workers: int = OSRM_WORKERS_DEFAULT, progress_callback=None, cancel_event=None,
+                          logger: Optional[logging.Logger] = None, max_retries: int = 2) -> Dict[int, Tuple[List[Tuple[float, float]], float]]:
+    """
+    Dẫn đường qua OSRM (song song, `workers` request cùng lúc) cho các tuyến chỉ có 2 điểm (đầu, cuối).
+    Kết quả được cache trong tiến trình (osrm_tools.get_osrm_route_cached): tạo lại cùng tập tuyến không gọi OSRM nữa.
+
+    progress_callback(done, total) được gọi trong luồng gọi hàm (dùng được với st.progress). Dừng sớm khi
+    `cancel_event` (threading.Event) được set hoặc khi progress_callback ném ngoại lệ (Streamlit dừng script
+    khi người dùng bấm nút khác); các request chưa chạy bị hủy.
+
+    Returns:
+        {chỉ số trong items_to_process: (tọa độ tuyến [(lon, lat), ...], khoảng cách km)} của các tuyến thành công.
+    """
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+    logger = logger or logging.getLogger(__name__)
+    targets = [i for i, item in enumerate(items_to_process) if len(item.get("CoordinatesList") or []) == 2]
+    routed: Dict[int, Tuple[List[Tuple[float, float]], float]] = {}
+    if not targets:
+        return routed
+    if progress_callback:
+        progress_callback(0, len(targets))
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(workers, len(targets))))
+    try:
+        futures = {
+            executor.submit(get_osrm_route_cached, osrm_url, tuple(items_to_process[i]["CoordinatesList"][0]),
+                            tuple(items_to_process[i]["CoordinatesList"][1]), profile, max_retries, logger): i
+            for i in targets
+        }
+        pending = set(futures)
+        done_count = 0
+        while pending:
+            if cancel_event is not None and cancel_event.is_set():
+                logger.warning(f"Đã hủy dẫn đường OSRM: còn {len(pending)}/{len(targets)} tuyến chưa xử lý.")
+                break
+            done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = futures[future]
+                done_count += 1
+                try:
+                    coords, distance_km = future.result()
+                except Exception as e:
+                    logger.error(f"Tuyến '{items_to_process[i].get('RouteName', i + 1)}': lỗi gọi OSRM: {e}")
+                    continue
+                if coords:
+                    routed[i] = (coords, distance_km)
+            if done and progress_callback:
+                progress_callback(done_count, len(targets))
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return routed
+
+def generate_kml_for_routes(items_to_process: List[RouteItem], logger: Optional[logging.Logger] = None,
+                            doc_name: str = "Routes KML", routed: Optional[Dict[int, Tuple[List[Tuple[float, float]], float]]] = None,
+                            osrm_url: Optional[str] = None, profile: str = "car", workers: int = OSRM_WORKERS_DEFAULT) -> str | None:
+    """
+    Tạo nội dung KML từ danh sách tuyến (CSV RouteName,Coordinates: "lon,lat;lon,lat;...").
+
+    Tuyến 2 điểm dùng đường đi OSRM nếu có trong `routed` (kết quả route_two_point_items), hoặc được
+    dẫn đường ngay khi chỉ truyền `osrm_url`; tuyến OSRM lỗi / không dẫn đường giữ nguyên đường thẳng.
+    Màu (Color, aabbggrr) và độ rộng (Width) lấy từ cột nếu có.
+    """
+    logger = logger or logging.getLogger(__name__)
+    if routed is None:
+        routed = route_two_point_items(items_to_process, osrm_url, profile, workers, logger=logger) if osrm_url else {}
+
+    all_styles: List[str] = []
+    grouped_placemarks: KMLFolderNode = {'placemarks': [], 'subfolders': {}}
+    has_valid_data = False
+
+    for i, data_item in enumerate(items_to_process):
+        item_name = str(data_item.get("RouteName") or f"Route {i+1}")
+        coords = data_item.get("CoordinatesList") or []
+        description = str(data_item.get("Description", "")).strip()
+        if i in routed:
+            coords, distance_km = routed[i]
+            description = f"{description} (OSRM: {distance_km:.2f} km)".strip()
+        if len(coords) < 2:
+            logger.error(f"Hàng {i+1} ('{item_name}'): Tuyến cần ít nhất 2 điểm tọa độ. Bỏ qua.")
+            continue
+        try:
+            line_width = int(float(data_item.get("Width") or ROUTE_WIDTH_DEFAULT))
+        except ValueError:
+            line_width = ROUTE_WIDTH_DEFAULT
+        line_color = str(data_item.get("Color") or ROUTE_COLOR_DEFAULT).strip()
+
+        style_kml, placemark_kml = _create_route_placemark(item_name, coords, description, line_color, line_width)
+        _add_placemark_to_tree(grouped_placemarks, placemark_kml,
+                               str(data_item.get("FolderName", "")).strip(),
+                               str(data_item.get("SecondFolderName", "")).strip(),
+                               str(data_item.get("ThirdFolderName", "")).strip())
+        all_styles.append(style_kml)
+        has_valid_data = True
+
+    if not has_valid_data:
+        logger.warning(f"Không có dữ liệu Tuyến hợp lệ nào được xử lý cho tài liệu: {doc_name}.")
+        return None
+
+    unique_styles = sorted(list(set(all_styles)))
+    styles_combined = "".join(unique_styles)
+    placemarks_combined_in_folders = _generate_folder_kml_recursive(grouped_placemarks)
+
+    full_kml_content = f"""<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2">
+  <Document>
+    <name>{doc_name}</name>
+    {styles_combined}
+    {placemarks_combined_in_folders}
+  </Document>
+</kml>
+"""
+    return full_kml_content
+
+
 # --- 3. Khối Thực thi chính (Dùng để test) ---
 
 if __name__ == "__main__":
@@ -0,0 +1,49 @@
+import importlib
+import sys
+import types
+
+# ----------------------------------------------------
+# Import trì hoãn (lazy) cho các thư viện nặng
+# ----------------------------------------------------
+# Các script CLI được n8n gọi hàng trăm lần mỗi ngày; import pandas/openpyxl/pykml/lxml
+# ở đầu file tốn thời gian ngay cả khi chỉ chạy --help hoặc nhánh không dùng tới.
+# lazy_module("pandas") trả về một module proxy, chỉ import thật khi truy cập thuộc tính đầu tiên.
+
+
+class _LazyModule(types.ModuleType):
+    """Module proxy: import module thật ở lần truy cập thuộc tính đầu tiên."""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_lazy_target"] = None
+
+    def _load(self):
+        target = self.__dict__["_lazy_target"]
+        if target is None:
+            target = importlib.import_module(self.__name__)
+            self.__dict__["_lazy_target"] = target
+        return target
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_lazy_target"] is not None else "not loaded"
+        return f"<lazy module '{self.__name__}' ({state})>"
+
+
+def lazy_module(name: str) -> types.ModuleType:
+    """
+    Trả về module `name` nếu đã được import, ngược lại trả về proxy import trì hoãn.
+
+    Ví dụ:
+        pd = lazy_module("pandas")          # chưa import gì
+        df = pd.DataFrame(rows)             # pandas được import tại đây
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    return _LazyModule(name)
@@ -0,0 +1,155 @@
+import os
+import time
+import hashlib
+import logging
+from typing import Any, Callable, Dict, Optional
+
+from libs.state_store import StateStore
+from libs.file_transfer import RateLimiter, DEFAULT_BUFFER_SIZE
+
+# ----------------------------------------------------
+# Thu thập log tăng dần (tail) theo offset của từng thiết bị
+# ----------------------------------------------------
+# Mỗi lần n8n poll, chỉ đọc phần mới của file log (ranged SFTP read từ offset đã lưu)
+# thay vì tải lại cả file. Offset và dấu vân tay (kích thước + hash phần đầu file) được
+# lưu trong SQLite theo (host, remote_path). File bị rotate (nhỏ đi hoặc phần đầu thay đổi)
+# thì đọc lại từ đầu.
+
+logger = logging.getLogger(__name__)
+
+HEAD_FINGERPRINT_BYTES = 4096
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS log_offsets (
+        host TEXT NOT NULL,
+        remote_path TEXT NOT NULL,
+        offset INTEGER NOT NULL,
+        size INTEGER NOT NULL,
+        mtime REAL,
+        head_len INTEGER NOT NULL,
+        head_hash TEXT NOT NULL,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (host, remote_path)
+    )
+    """,
+]
+
+
+def _store(db_path: Optional[str]) -> StateStore:
+    store = StateStore(db_path)
+    store.ensure_schema("log_offsets", _SCHEMA)
+    return store
+
+
+def get_offset(host: str, remote_path: str, db_path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Trạng thái đã lưu cho (host, remote_path), hoặc None nếu chưa từng thu thập."""
+    with _store(db_path).connect() as conn:
+        row = conn.execute("SELECT * FROM log_offsets WHERE host = ? AND remote_path = ?",
+                           (host, remote_path)).fetchone()
+    return dict(row) if row else None
+
+
+def save_offset(host: str, remote_path: str, offset: int, size: int, mtime: Optional[float],
+                head_len: int, head_hash: str, db_path: Optional[str] = None):
+    with _store(db_path).connect() as conn:
+        conn.execute(
+            """
+            INSERT INTO log_offsets (host, remote_path, offset, size, mtime, head_len, head_hash, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (host, remote_path) DO UPDATE SET
+                offset = excluded.offset, size = excluded.size, mtime = excluded.mtime,
+                head_len = excluded.head_len, head_hash = excluded.head_hash, updated_at = excluded.updated_at
+            """,
+            (host, remote_path, offset, size, mtime, head_len, head_hash, time.time()),
+        )
+
+
+def reset_offset(host: str, remote_path: str, db_path: Optional[str] = None):
+    """Xóa trạng thái để lần sau tải lại toàn bộ file."""
+    with _store(db_path).connect() as conn:
+        conn.execute("DELETE FROM log_offsets WHERE host = ? AND remote_path = ?", (host, remote_path))
+
+
+def _head_hash(remote_file, length: int) -> str:
+    remote_file.seek(0)
+    return hashlib.sha1(remote_file.read(length)).hexdigest()
+
+
+def sftp_tail(sftp, host: str, remote_path: str, local_path: str, db_path: Optional[str] = None,
+              buffer_size: int = DEFAULT_BUFFER_SIZE, rate_limiter: Optional[RateLimiter] = None,
+              append: bool = False, progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+    """
+    Đọc phần mới của remote_path kể từ lần thu thập trước và ghi vào local_path.
+
+    Chỉ tiến offset tới ký tự xuống dòng cuối cùng, dòng log chưa ghi xong sẽ được đọc ở lần sau.
+
+    Args:
+        append: True -> nối thêm vào local_path; False -> local_path chỉ chứa phần mới lần này.
+
+    Returns:
+        dict: mode ('full' | 'incremental'), rotated, from_offset, to_offset, bytes, remote_size, local_path.
+    """
+    start = time.monotonic()
+    remote_stat = sftp.stat(remote_path)
+    size = remote_stat.st_size or 0
+    previous = get_offset(host, remote_path, db_path)
+
+    with sftp.open(remote_path, "rb", bufsize=buffer_size) as remote_file:
+        # So khớp dấu vân tay trên đúng số byte đầu đã hash lần trước
+        # (file nhỏ hơn 4 KB lớn dần không bị coi là rotate)
+        rotated = False
+        from_offset = 0
+        if previous is not None:
+            if size < previous["offset"] or size < previous["head_len"]:
+                rotated = True
+            elif previous["head_len"] and _head_hash(remote_file, previous["head_len"]) != previous["head_hash"]:
+                rotated = True
+            else:
+                from_offset = previous["offset"]
+        if rotated:
+            logger.info(f"🔄 {host}:{remote_path} đã bị rotate, đọc lại từ đầu.")
+
+        head_len = min(size, HEAD_FINGERPRINT_BYTES)
+        head_hash = _head_hash(remote_file, head_len)
+
+        os.makedirs(os.path.dirname(os.path.abspath(local_path)), exist_ok=True)
+        remaining = size - from_offset
+        written = 0
+        last_newline = -1
+        with open(local_path, "ab" if append else "wb") as local_file:
+            if remaining > 0:
+                remote_file.seek(from_offset)
+                remote_file.prefetch(size)
+                while written < remaining:
+                    chunk = remote_file.read(min(buffer_size, remaining - written))
+                    if not chunk:
+                        break
+                    if rate_limiter is not None:
+                        rate_limiter.consume(len(chunk))
+                    newline_at = chunk.rfind(b"\n")
+                    if newline_at >= 0:
+                        last_newline = written + newline_at
+                    local_file.write(chunk)
+                    written += len(chunk)
+                    if progress is not None:
+                        progress(written, remaining)
+                # Cắt bỏ dòng cuối chưa hoàn chỉnh: lần sau đọc lại từ đầu dòng đó
+                keep = last_newline + 1
+                if keep < written:
+                    local_file.truncate(local_file.tell() - (written - keep))
+                    written = keep
+
+    to_offset = from_offset + written
+    save_offset(host, remote_path, to_offset, size, remote_stat.st_mtime, head_len, head_hash, db_path)
+
+    return {
+        "mode": "incremental" if previous is not None and not rotated else "full",
+        "rotated": rotated,
+        "from_offset": from_offset,
+        "to_offset": to_offset,
+        "bytes": written,
+        "remote_size": size,
+        "local_path": local_path,
+        "duration_s": round(time.monotonic() - start, 3),
+    }
@@ -0,0 +1,215 @@
+import math
+import html
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# ----------------------------------------------------
+# Dựng bản đồ folium cho dữ liệu lớn (điểm / đường / tuyến)
+# ----------------------------------------------------
+# display_map cũ thêm một folium.Marker / PolyLine cho mỗi dòng: mỗi đối tượng là một đoạn JS
+# riêng trong HTML, với vài nghìn site hoặc tuyến trình duyệt bị treo và mỗi lần rerun Streamlit
+# mất vài giây chỉ để sinh HTML. Ở đây:
+#   - Điểm: Marker riêng khi ít, MarkerCluster khi vừa, FastMarkerCluster (dữ liệu là một mảng JS,
+#     marker dựng phía trình duyệt) khi nhiều.
+#   - Đường/tuyến: đơn giản hóa Douglas-Peucker (shapely, vector hóa) với sai số ~1 pixel ở mức zoom
+#     hiển thị ban đầu, làm tròn tọa độ 6 chữ số; quá ngưỡng thì gom tất cả vào MỘT lớp GeoJSON
+#     (vẽ bằng canvas) thay vì hàng nghìn PolyLine.
+# folium / shapely / numpy được import trong hàm để module nhẹ khi chỉ import.
+#
+# Điểm: {"lat", "lon", "name", "popup"(tùy chọn, HTML)}
+# Đường: {"coords": [(lon, lat), ...], "name", "color"(tùy chọn), "weight"(tùy chọn)}
+
+MARKER_LIMIT = 300                # <= ngưỡng này: Marker riêng (có popup, icon)
+FAST_CLUSTER_THRESHOLD = 3000     # > ngưỡng này: FastMarkerCluster thay cho MarkerCluster
+GEOJSON_LINE_THRESHOLD = 500      # > ngưỡng này: một lớp GeoJSON thay cho từng PolyLine
+SIMPLIFY_PIXEL_TOLERANCE = 1.0    # sai số đơn giản hóa (pixel ở mức zoom ban đầu)
+COORD_DECIMALS = 6                # ~0.1 m, đủ cho hiển thị
+
+MIN_ZOOM, MAX_ZOOM = 1, 18
+TILE_SIZE = 256
+
+Point = Dict[str, Any]
+Line = Dict[str, Any]
+
+
+# -----------------------------
+# 1. Mức zoom & đơn giản hóa
+# -----------------------------
+
+def _mercator_y(lat: float) -> float:
+    lat = max(min(lat, 85.0511), -85.0511)
+    return math.log(math.tan(math.pi / 4 + math.radians(lat) / 2))
+
+
+def bounds_of(points: Sequence[Point] = (), lines: Sequence[Line] = ()) -> Optional[Tuple[float, float, float, float]]:
+    """(min_lat, min_lon, max_lat, max_lon) của toàn bộ dữ liệu; None nếu rỗng."""
+    lats: List[float] = [p["lat"] for p in points]
+    lons: List[float] = [p["lon"] for p in points]
+    for line in lines:
+        for lon, lat in line["coords"]:
+            lats.append(lat)
+            lons.append(lon)
+    if not lats:
+        return None
+    return min(lats), min(lons), max(lats), max(lons)
+
+
+def estimate_zoom(bounds: Tuple[float, float, float, float], width_px: int = 700, height_px: int = 400) -> int:
+    """Mức zoom Web Mercator lớn nhất để `bounds` vừa khung width_px x height_px (như fit_bounds)."""
+    min_lat, min_lon, max_lat, max_lon = bounds
+    lon_span = max(max_lon - min_lon, 1e-9)
+    y_span = max(_mercator_y(max_lat) - _mercator_y(min_lat), 1e-9)
+    zoom_x = math.log2(width_px * 360.0 / (lon_span * TILE_SIZE))
+    zoom_y = math.log2(height_px * 2 * math.pi / (y_span * TILE_SIZE))
+    return int(max(MIN_ZOOM, min(MAX_ZOOM, math.floor(min(zoom_x, zoom_y)))))
+
+
+def simplify_tolerance(zoom: int, pixel_tolerance: float = SIMPLIFY_PIXEL_TOLERANCE) -> float:
+    """Sai số (độ kinh tuyến) tương ứng `pixel_tolerance` pixel ở mức zoom."""
+    return pixel_tolerance * 360.0 / (TILE_SIZE * 2 ** zoom)
+
+
+def simplify_lines(coords_list: Sequence[Sequence[Tuple[float, float]]], tolerance: float) -> List[List[Tuple[float, float]]]:
+    """
+    Đơn giản hóa nhiều polyline [(lon, lat), ...] cùng lúc (Douglas-Peucker của shapely, vector hóa),
+    làm tròn COORD_DECIMALS chữ số. Đường < 3 điểm giữ nguyên (chỉ làm tròn).
+    """
+    import numpy as np
+    import shapely
+
+    result: List[List[Tuple[float, float]]] = [
+        [(round(lon, COORD_DECIMALS), round(lat, COORD_DECIMALS)) for lon, lat in coords] for coords in coords_list
+    ]
+    targets = [i for i, coords in enumerate(coords_list) if len(coords) >= 3]
+    if not targets or tolerance <= 0:
+        return result
+
+    geoms = shapely.simplify(
+        np.array([shapely.LineString(coords_list[i]) for i in targets], dtype=object),
+        tolerance, preserve_topology=False,
+    )
+    xy = np.round(shapely.get_coordinates(geoms), COORD_DECIMALS)
+    counts = shapely.get_num_coordinates(geoms)
+    for i, chunk in zip(targets, np.split(xy, np.cumsum(counts)[:-1])):
+        if len(chunk) >= 2:
+            result[i] = [tuple(pair) for pair in chunk.tolist()]
+    return result
+
+
+# -----------------------------
+# 2. Lớp điểm
+# -----------------------------
+
+_FAST_CLUSTER_CALLBACK = """
+function (row) {
+    var marker = L.marker(new L.LatLng(row[0], row[1]));
+    marker.bindTooltip(row[2]);
+    return marker;
+}
+"""
+
+
+def add_points(m, points: Sequence[Point]) -> str:
+    """Thêm điểm vào bản đồ theo số lượng; trả về chế độ đã dùng: markers / cluster / fast_cluster."""
+    import folium
+    from folium.plugins import FastMarkerCluster, MarkerCluster
+
+    if len(points) > FAST_CLUSTER_THRESHOLD:
+        data = [[round(p["lat"], COORD_DECIMALS), round(p["lon"], COORD_DECIMALS), html.escape(str(p.get("name", "")))]
+                for p in points]
+        FastMarkerCluster(data, callback=_FAST_CLUSTER_CALLBACK).add_to(m)
+        return "fast_cluster"
+
+    target = MarkerCluster().add_to(m) if len(points) > MARKER_LIMIT else m
+    for p in points:
+        name = html.escape(str(p.get("name", "")))
+        folium.Marker(
+            [p["lat"], p["lon"]], tooltip=name,
+            popup=p.get("popup") or f"<b>{name}</b>",
+            icon=folium.Icon(color='blue', icon='info-sign'),
+        ).add_to(target)
+    return "cluster" if len(points) > MARKER_LIMIT else "markers"
+
+
+# -----------------------------
+# 3. Lớp đường / tuyến
+# -----------------------------
+
+def add_lines(m, lines: Sequence[Line], zoom: int, default_color: str = "#FF0000", default_weight: int = 2) -> Dict[str, Any]:
+    """
+    Thêm đường (đã đơn giản hóa theo zoom) vào bản đồ: PolyLine riêng khi ít, một lớp GeoJSON khi nhiều.
+    Trả về thống kê {mode, vertices_in, vertices_out}.
+    """
+    import folium
+
+    coords_in = [line["coords"] for line in lines]
+    simplified = simplify_lines(coords_in, simplify_tolerance(zoom))
+    stats = {
+        "mode": "polylines",
+        "vertices_in": sum(len(c) for c in coords_in),
+        "vertices_out": sum(len(c) for c in simplified),
+    }
+
+    if len(lines) > GEOJSON_LINE_THRESHOLD:
+        features = [{
+            "type": "Feature",
+            "properties": {
+                "name": str(line.get("name", "")),
+                "color": line.get("color") or default_color,
+                "weight": line.get("weight") or default_weight,
+            },
+            "geometry": {"type": "LineString", "coordinates": coords},
+        } for line, coords in zip(lines, simplified) if len(coords) >= 2]
+        folium.GeoJson(
+            {"type": "FeatureCollection", "features": features},
+            style_function=lambda feature: {
+                "color": feature["properties"]["color"],
+                "weight": feature["properties"]["weight"],
+            },
+            tooltip=folium.GeoJsonTooltip(fields=["name"], labels=False),
+            smooth_factor=1.5,
+        ).add_to(m)
+        stats["mode"] = "geojson"
+        return stats
+
+    for line, coords in zip(lines, simplified):
+        if len(coords) < 2:
+            continue
+        folium.PolyLine(
+            locations=[[lat, lon] for lon, lat in coords],
+            tooltip=html.escape(str(line.get("name", ""))),
+            color=line.get("color") or default_color,
+            weight=line.get("weight") or default_weight,
+        ).add_to(m)
+    return stats
+
+
+# -----------------------------
+# 4. Bản đồ hoàn chỉnh
+# -----------------------------
+
+def render_map(points: Sequence[Point] = (), lines: Sequence[Line] = (), width_px: int = 700, height_px: int = 400,
+               line_color: str = "#FF0000", line_weight: int = 2):
+    """
+    Dựng folium.Map vừa khung dữ liệu. Trả về (map, stats) với stats gồm số điểm/đường,
+    chế độ vẽ, mức zoom và số đỉnh trước/sau đơn giản hóa; (None, {}) nếu không có dữ liệu.
+    """
+    import folium
+
+    bounds = bounds_of(points, lines)
+    if bounds is None:
+        return None, {}
+    zoom = estimate_zoom(bounds, width_px, height_px)
+    min_lat, min_lon, max_lat, max_lon = bounds
+    m = folium.Map(location=[(min_lat + max_lat) / 2, (min_lon + max_lon) / 2], zoom_start=zoom,
+                   prefer_canvas=True)
+
+    stats: Dict[str, Any] = {"zoom": zoom, "points": len(points), "lines": len(lines)}
+    if points:
+        stats["point_mode"] = add_points(m, points)
+    if lines:
+        line_stats = add_lines(m, lines, zoom, default_color=line_color, default_weight=line_weight)
+        stats["line_mode"] = line_stats.pop("mode")
+        stats.update(line_stats)
+    if min_lat != max_lat or min_lon != max_lon:
+        m.fit_bounds([[min_lat, min_lon], [max_lat, max_lon]])
+    return m, stats
@@ -1,8 +1,16 @@
-import requests
 import time
 import logging
 import sys
+import threading
+from collections import OrderedDict
 from typing import Tuple, List, Optional, Any, Dict
+from libs import instrumentation as metrics
+
+# 'requests' được import trong từng hàm gọi OSRM (import trì hoãn) để không làm chậm
+# các script chỉ import module này mà không gọi mạng.
+# Mỗi lần gọi HTTP được đo vào libs/instrumentation (osrm_route_seconds, osrm_table_seconds, ...,
+# osrm_requests_total, osrm_errors_total); log từng route thành công ở mức DEBUG vì với hàng nghìn
+# route, bản thân các dòng log đã tốn thời gian — số liệu tổng hợp nằm trong bản tóm tắt cuối lần chạy.
 
 # Thiết lập logger cơ bản nếu không được cung cấp
 default_logger = logging.getLogger(__name__)
@@ -41,6 +49,8 @@ def get_osrm_route(
     Returns:
         (coords_list, distance_km) hoặc (None, None) nếu lỗi.
     """
+    import requests
+
     if start_coords == end_coords:
         if logger:
             logger.warning(f"Tọa độ trùng nhau, bỏ qua route: {start_coords} -> {end_coords}")
@@ -55,12 +65,15 @@ def get_osrm_route(
 
     for attempt in range(max_retries):
         try:
-            response = requests.get(url, timeout=20)
-            response.raise_for_status()
-            data = response.json()
+            metrics.inc("osrm_requests_total")
+            with metrics.timer("osrm_route_seconds"):
+                response = requests.get(url, timeout=20)
+                response.raise_for_status()
+                data = response.json()
 
             # --- Kiểm tra Lỗi OSRM ---
             if data.get("code") != "Ok":
+                metrics.inc("osrm_errors_total")
                 error_message = data.get("message", data.get("code", "Unknown OSRM error"))
                 if logger:
                     logger.error(f"OSRM trả về lỗi: {error_message}")
@@ -96,11 +109,12 @@ def get_osrm_route(
             coords = [tuple(pt) for pt in coords_raw] 
 
             if logger:
-                logger.info(f"OSRM OK: {start_coords} -> {end_coords} ({distance_km:.2f} km)")
+                logger.debug(f"OSRM OK: {start_coords} -> {end_coords} ({distance_km:.2f} km)")
 
             return coords, distance_km
 
         except requests.exceptions.RequestException as e:
+            metrics.inc("osrm_errors_total")
             if logger:
                 logger.error(f"Lỗi khi gọi OSRM: {e}. Attempt {attempt+1}/{max_retries}")
             time.sleep(1)
@@ -123,13 +137,17 @@ def get_route_distance(
     """
     Chỉ lấy khoảng cách tuyến đường (km), bỏ qua tọa độ chi tiết của tuyến.
     """
+    import requests
+
     # overview=false để giảm tải cho OSRM server nếu chỉ cần khoảng cách
     url = f"{osrm_base_url}/route/v1/{profile}/{start_coords[0]},{start_coords[1]};{end_coords[0]},{end_coords[1]}?overview=false"
     
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        metrics.inc("osrm_requests_total")
+        with metrics.timer("osrm_route_seconds"):
+            response = requests.get(url, timeout=10)
+            response.raise_for_status()
+            data = response.json()
 
         if data.get("code") != "Ok" or not data.get("routes"):
             return None
@@ -139,6 +157,7 @@ def get_route_distance(
             return distance_m / 1000
         
     except requests.exceptions.RequestException as e:
+        metrics.inc("osrm_errors_total")
         if logger:
             logger.error(f"Lỗi khi gọi OSRM để lấy distance: {e}")
         return None
@@ -165,13 +184,17 @@ def osrm_nearest(
     Returns:
         Tọa độ của điểm gần nhất trên đường (lon, lat) hoặc None.
     """
+    import requests
+
     lon, lat = target_coords
     url = f"{osrm_base_url}/nearest/v1/{profile}/{lon},{lat}"
     
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        metrics.inc("osrm_requests_total")
+        with metrics.timer("osrm_nearest_seconds"):
+            response = requests.get(url, timeout=10)
+            response.raise_for_status()
+            data = response.json()
 
         if data.get("code") == "Ok" and data.get("waypoints"):
             # Lấy tọa độ của waypoint đầu tiên (điểm gần nhất trên đường)
@@ -181,6 +204,7 @@ def osrm_nearest(
                 return tuple(coords_raw) 
         
     except requests.exceptions.RequestException as e:
+        metrics.inc("osrm_errors_total")
         if logger:
             logger.error(f"Lỗi khi gọi OSRM /nearest: {e}")
     except Exception as e:
@@ -204,7 +228,8 @@ def get_route_distances_table(
     Returns:
         Danh sách khoảng cách (km) tương ứng với dest_coords_list, hoặc None nếu lỗi.
     """
-    
+    import requests
+
     # 1. Chuẩn bị chuỗi tọa độ (Start Coords + Destination Coords)
     all_coords = [start_coords] + dest_coords_list
     
@@ -227,11 +252,14 @@ def get_route_distances_table(
     )
 
     try:
-        response = requests.get(url, timeout=30)
-        response.raise_for_status()
-        data = response.json()
+        metrics.inc("osrm_requests_total")
+        with metrics.timer("osrm_table_seconds"):
+            response = requests.get(url, timeout=30)
+            response.raise_for_status()
+            data = response.json()
 
         if data.get("code") != "Ok":
+            metrics.inc("osrm_errors_total")
             if logger:
                 logger.error(f"OSRM /table trả về lỗi: {data.get('message', data.get('code'))}")
             return None
@@ -251,6 +279,49 @@ def get_route_distances_table(
         return distances_km
 
     except requests.exceptions.RequestException as e:
+        metrics.inc("osrm_errors_total")
         if logger:
             logger.error(f"Lỗi khi gọi OSRM /table: {e}")
-        return None
\ No newline at end of file
+        return None
+
+# ----------------------------------------------------
+# 4. CACHE ROUTE: nhớ kết quả theo (server, profile, điểm đầu, điểm cuối)
+# ----------------------------------------------------
+# Dùng cho các công cụ tương tác (Streamlit) hay tạo lại cùng một tập tuyến: lần thứ hai không gọi
+# OSRM nữa. Chỉ cache kết quả thành công; an toàn khi gọi từ nhiều luồng.
+ROUTE_CACHE_MAX_ENTRIES = 4096
+_route_cache: "OrderedDict[Tuple[str, str, Coords, Coords], Tuple[List[Coords], float]]" = OrderedDict()
+_route_cache_lock = threading.Lock()
+
+def get_osrm_route_cached(
+    osrm_base_url: str,
+    start_coords: Coords,
+    end_coords: Coords,
+    profile: str = "car",
+    max_retries: int = 5,
+    logger: Optional[logging.Logger] = default_logger
+) -> RouteResult:
+    """
+    Như get_osrm_route nhưng dùng lại kết quả đã có trong tiến trình (LRU, tối đa ROUTE_CACHE_MAX_ENTRIES tuyến).
+    """
+    key = (osrm_base_url.rstrip("/"), profile, tuple(start_coords), tuple(end_coords))
+    with _route_cache_lock:
+        cached = _route_cache.get(key)
+        if cached is not None:
+            _route_cache.move_to_end(key)
+            metrics.inc("osrm_route_cache_hits_total")
+            return cached
+
+    coords, distance_km = get_osrm_route(osrm_base_url, start_coords, end_coords, profile=profile,
+                                         max_retries=max_retries, logger=logger)
+    if coords is not None:
+        with _route_cache_lock:
+            _route_cache[key] = (coords, distance_km)
+            while len(_route_cache) > ROUTE_CACHE_MAX_ENTRIES:
+                _route_cache.popitem(last=False)
+    return coords, distance_km
+
+def clear_route_cache():
+    """Bỏ toàn bộ route đã cache."""
+    with _route_cache_lock:
+        _route_cache.clear()
@@ -0,0 +1,220 @@
+import math
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from libs.geospatial_tools import haversine_many
+
+# ----------------------------------------------------
+# Mô hình dữ liệu dạng cột cho quy hoạch router / trạm / cặp điểm
+# ----------------------------------------------------
+# Code quy hoạch cũ truyền router dạng tuple 6 trường (RouterDataFull), kết quả dạng dict ~13 key
+# chuỗi và cặp điểm dạng dict lồng (original_data / coordinates / status). Với 3.800 router và
+# nhiều vòng gán, việc cấp phát tuple/dict và lọc bán kính từng phần tử chiếm phần đáng kể.
+# Ở đây mỗi bảng là struct-of-arrays NumPy (tọa độ float64, chỉ số int64, chuỗi dạng object);
+# router / cặp điểm được tham chiếu bằng chỉ số dòng, record __slots__ chỉ tạo khi cần đọc một dòng.
+# numpy được import trong hàm để các script chỉ chạy --help không phải trả phí import.
+
+# Cột kết quả gán router (thứ tự ghi ra Excel / Parquet)
+ASSIGNMENT_COLUMNS = [
+    'BS_Name', 'BS_Lat', 'BS_Lon',
+    'Nearest_Router_Name', 'Nearest_Router_Lat', 'Nearest_Router_Lon',
+    'Router_Type', 'Router_Priority', 'Router_Site_ID',
+    'Route_Distance_KM', 'Status',
+]
+
+
+def haversine_km_many(lat: float, lon: float, lats, lons):
+    """Khoảng cách Haversine (km) từ một điểm tới các mảng tọa độ (geospatial_tools.haversine_many đổi ra km)."""
+    return haversine_many(lat, lon, lats, lons) / 1000.0
+
+
+# -----------------------------
+# 1. Router
+# -----------------------------
+
+class RouterRecord:
+    """Một router (đọc từ RouterTable theo chỉ số)."""
+
+    __slots__ = ("index", "name", "lon", "lat", "type", "priority", "site_id")
+
+    def __init__(self, index: int, name: str, lon: float, lat: float, type: str, priority: int, site_id: str):
+        self.index = index
+        self.name = name
+        self.lon = lon
+        self.lat = lat
+        self.type = type
+        self.priority = priority
+        self.site_id = site_id
+
+
+class RouterTable:
+    """Danh sách router dạng cột: names, lon, lat, types, priority, site_ids."""
+
+    __slots__ = ("names", "lon", "lat", "types", "priority", "site_ids")
+
+    def __init__(self, names: Sequence[str], lon: Sequence[float], lat: Sequence[float],
+                 types: Sequence[str], priority: Sequence[int], site_ids: Sequence[str]):
+        import numpy as np
+
+        self.names = np.asarray(names, dtype=object)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.types = np.asarray(types, dtype=object)
+        self.priority = np.asarray(priority, dtype=np.int64)
+        self.site_ids = np.asarray(site_ids, dtype=object)
+
+    @classmethod
+    def from_typed_csv(cls, table) -> "RouterTable":
+        """Từ kết quả libs.csv_loaders.load_typed_csv (cột Name, Lat, Lon, Type, Priority, Site ID); bỏ dòng lỗi."""
+        valid = table.valid
+        cols = table.columns
+        return cls(cols['Name'][valid], cols['Lon'][valid], cols['Lat'][valid],
+                   cols['Type'][valid], cols['Priority'][valid], cols['Site ID'][valid])
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def record(self, index: int) -> RouterRecord:
+        return RouterRecord(int(index), self.names[index], float(self.lon[index]), float(self.lat[index]),
+                            self.types[index], int(self.priority[index]), self.site_ids[index])
+
+    def within_radius(self, lat: float, lon: float, radius_km: float, available=None):
+        """Chỉ số các router cách (lat, lon) không quá radius_km (Haversine), chỉ trong mask `available` nếu có."""
+        import numpy as np
+
+        candidates = np.arange(len(self)) if available is None else np.flatnonzero(available)
+        if not len(candidates):
+            return candidates
+        distances = haversine_km_many(lat, lon, self.lat[candidates], self.lon[candidates])
+        return candidates[distances <= radius_km]
+
+    def coords(self, indices) -> List[Tuple[float, float]]:
+        """[(lon, lat)] của các router theo chỉ số (định dạng OSRM)."""
+        return list(zip(self.lon[indices].tolist(), self.lat[indices].tolist()))
+
+
+# -----------------------------
+# 2. Trạm mục tiêu & kết quả gán
+# -----------------------------
+
+class TargetTable:
+    """Danh sách trạm mục tiêu dạng cột: names, lon, lat."""
+
+    __slots__ = ("names", "lon", "lat")
+
+    def __init__(self, names: Sequence[str], lon: Sequence[float], lat: Sequence[float]):
+        import numpy as np
+
+        self.names = np.asarray(names, dtype=object)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.lat = np.asarray(lat, dtype=np.float64)
+
+    @classmethod
+    def from_typed_csv(cls, table) -> "TargetTable":
+        """Từ kết quả load_typed_csv (cột Name, Lat, Lon); bỏ dòng lỗi."""
+        valid = table.valid
+        cols = table.columns
+        return cls(cols['Name'][valid], cols['Lon'][valid], cols['Lat'][valid])
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+class AssignmentTable:
+    """
+    Kết quả gán router cho từng trạm (cùng thứ tự TargetTable):
+    router_index (-1 = chưa gán), distance_km (NaN nếu không có) và status.
+    """
+
+    __slots__ = ("targets", "routers", "router_index", "distance_km", "status")
+
+    def __init__(self, targets: TargetTable, routers: RouterTable, default_status: str):
+        import numpy as np
+
+        self.targets = targets
+        self.routers = routers
+        self.router_index = np.full(len(targets), -1, dtype=np.int64)
+        self.distance_km = np.full(len(targets), np.nan, dtype=np.float64)
+        self.status = np.full(len(targets), default_status, dtype=object)
+
+    def set(self, target_index: int, status: str, router_index: int = -1, distance_km: float = math.nan):
+        self.router_index[target_index] = router_index
+        self.distance_km[target_index] = distance_km
+        self.status[target_index] = status
+
+    def row(self, target_index: int) -> List[Any]:
+        """Một dòng theo ASSIGNMENT_COLUMNS ('N/A' cho các trường router khi chưa gán)."""
+        targets = self.targets
+        head = [targets.names[target_index], float(targets.lat[target_index]), float(targets.lon[target_index])]
+        router_index = int(self.router_index[target_index])
+        if router_index < 0:
+            return head + ['N/A'] * 7 + [self.status[target_index]]
+        router = self.routers.record(router_index)
+        return head + [router.name, router.lat, router.lon, router.type, router.priority, router.site_id,
+                       float(self.distance_km[target_index]), self.status[target_index]]
+
+    def rows(self) -> Iterator[List[Any]]:
+        for target_index in range(len(self.targets)):
+            yield self.row(target_index)
+
+
+# -----------------------------
+# 3. Cặp điểm (P1-P2)
+# -----------------------------
+
+PAIR_FIELDS = ('lat1', 'lon1', 'lat2', 'lon2')
+
+
+class PairRow:
+    """Một cặp điểm (đọc từ PairTable theo chỉ số); `original` là dict giá trị gốc của dòng CSV."""
+
+    __slots__ = ("index", "original", "status", "error_msg", "lat1", "lon1", "lat2", "lon2")
+
+    def __init__(self, index: int, original: Dict[str, Any], status: str, error_msg: Optional[str],
+                 lat1: float, lon1: float, lat2: float, lon2: float):
+        self.index = index
+        self.original = original
+        self.status = status
+        self.error_msg = error_msg
+        self.lat1 = lat1
+        self.lon1 = lon1
+        self.lat2 = lat2
+        self.lon2 = lon2
+
+    @property
+    def coordinates(self) -> Dict[str, float]:
+        return {'lat1': self.lat1, 'lon1': self.lon1, 'lat2': self.lat2, 'lon2': self.lon2}
+
+
+class PairTable:
+    """
+    Cặp điểm dạng cột: tọa độ float64 (NaN ở dòng lỗi), mask hợp lệ và thông báo lỗi theo dòng;
+    giá trị gốc giữ theo cột (fieldnames / raw_columns) để ghi lại đúng thứ tự cột của file.
+    """
+
+    __slots__ = ("fieldnames", "raw_columns", "lat1", "lon1", "lat2", "lon2", "valid", "errors")
+
+    def __init__(self, fieldnames: List[str], raw_columns: List[List[Any]], coords: Dict[str, Any],
+                 valid, errors: Dict[int, str]):
+        self.fieldnames = fieldnames
+        self.raw_columns = raw_columns
+        self.lat1, self.lon1, self.lat2, self.lon2 = (coords[field] for field in PAIR_FIELDS)
+        self.valid = valid
+        self.errors = errors
+
+    def __len__(self) -> int:
+        return len(self.valid)
+
+    def original_values(self, index: int) -> List[Any]:
+        """Giá trị gốc của dòng theo thứ tự fieldnames."""
+        return [column[index] for column in self.raw_columns]
+
+    def row(self, index: int) -> PairRow:
+        error_msg = self.errors.get(index)
+        return PairRow(index, dict(zip(self.fieldnames, self.original_values(index))),
+                       'ERROR' if error_msg else 'OK', error_msg,
+                       float(self.lat1[index]), float(self.lon1[index]),
+                       float(self.lat2[index]), float(self.lon2[index]))
+
+    def __iter__(self) -> Iterator[PairRow]:
+        for index in range(len(self)):
+            yield self.row(index)
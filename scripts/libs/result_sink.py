@@ -0,0 +1,335 @@
+import os
+import math
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Union
+from libs import instrumentation as metrics
+
+# ----------------------------------------------------
+# Ghi kết quả dạng bảng theo kiểu streaming
+# ----------------------------------------------------
+# Các script quy hoạch (v5, route_kml_gen_final, batch_routing_plan_v3, h04) trước đây dựng
+# toàn bộ workbook openpyxl / DataFrame trong bộ nhớ rồi mới lưu: với vài nghìn dòng phần lớn
+# thời gian nằm ở các đối tượng cell của openpyxl. Sink ở đây ghi từng dòng ngay khi có kết quả:
+#   - xlsxwriter với constant_memory (nhanh nhất, mỗi dòng được flush ra file tạm ngay);
+#   - openpyxl write_only nếu không có xlsxwriter.
+# Bộ nhớ giữ ổn định bất kể số dòng.
+#
+# ColumnarSink ghi song song Parquet (hoặc Arrow IPC / Feather) với cột có kiểu (float cho khoảng
+# cách thay vì chuỗi "123.45"), để n8n / pandas đọc lại gần như tức thì thay vì parse lại xlsx.
+# MultiSink gom nhiều sink để script chỉ gọi write_row một lần.
+#
+# Mỗi sink cộng dồn thời gian ghi dòng + đóng file và ghi MỘT lần vào libs/instrumentation khi đóng:
+# <METRIC>_write_seconds (excel_write_seconds, columnar_write_seconds) và <METRIC>_rows_total.
+
+Row = Union[Sequence[Any], Dict[str, Any]]
+
+EXCEL_ENGINES = ("xlsxwriter", "openpyxl")
+
+
+def _default_excel_engine() -> str:
+    try:
+        import xlsxwriter  # noqa: F401
+        return "xlsxwriter"
+    except ImportError:
+        return "openpyxl"
+
+
+class ResultSink:
+    """
+    Đích ghi kết quả: nhận từng dòng (list theo thứ tự cột hoặc dict theo tên cột).
+    Dùng với `with` để file luôn được đóng (và lưu) kể cả khi có lỗi giữa chừng.
+    """
+
+    METRIC: Optional[str] = None   # tiền tố metric thời gian ghi (None = không đo)
+
+    def __init__(self, path: str, columns: Sequence[str]):
+        self.path = path
+        self.columns: List[str] = [str(c) for c in columns]
+        self.rows_written = 0
+        self.closed = False
+        self.write_seconds = 0.0
+        output_dir = os.path.dirname(path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+    def _values(self, row: Row) -> List[Any]:
+        if isinstance(row, dict):
+            return [row.get(c) for c in self.columns]
+        return list(row)
+
+    def write_row(self, row: Row):
+        start = time.perf_counter()
+        self._write(self._values(row))
+        self.write_seconds += time.perf_counter() - start
+        self.rows_written += 1
+
+    def write_rows(self, rows: Iterable[Row]) -> int:
+        for row in rows:
+            self.write_row(row)
+        return self.rows_written
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            start = time.perf_counter()
+            try:
+                self._close()
+            finally:
+                self.write_seconds += time.perf_counter() - start
+                if self.METRIC:
+                    metrics.observe(f"{self.METRIC}_write_seconds", self.write_seconds)
+                    metrics.inc(f"{self.METRIC}_rows_total", self.rows_written)
+
+    def _write(self, values: List[Any]):
+        raise NotImplementedError
+
+    def _close(self):
+        raise NotImplementedError
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class ExcelSink(ResultSink):
+    """
+    File .xlsx một sheet, ghi dòng tiêu đề rồi từng dòng kết quả.
+
+    Args:
+        engine: "xlsxwriter" (constant_memory) hoặc "openpyxl" (write_only); None = xlsxwriter nếu đã cài.
+    """
+
+    METRIC = "excel"
+
+    def __init__(self, path: str, columns: Sequence[str], sheet_name: str = "Sheet1",
+                 engine: Optional[str] = None):
+        super().__init__(path, columns)
+        self.engine = engine or _default_excel_engine()
+        if self.engine not in EXCEL_ENGINES:
+            raise ValueError(f"Engine Excel không hỗ trợ: {self.engine} (chọn một trong {', '.join(EXCEL_ENGINES)})")
+
+        if self.engine == "xlsxwriter":
+            import xlsxwriter
+
+            self._workbook = xlsxwriter.Workbook(path, {
+                "constant_memory": True,
+                "strings_to_urls": False,       # tránh giới hạn 65k URL / sheet và chi phí dò URL
+                "nan_inf_to_errors": True,      # khoảng cách inf (không có tuyến) không làm hỏng file
+            })
+            self._sheet = self._workbook.add_worksheet(sheet_name)
+            self._sheet.write_row(0, 0, self.columns)
+        else:
+            import openpyxl
+
+            self._workbook = openpyxl.Workbook(write_only=True)
+            self._sheet = self._workbook.create_sheet(sheet_name)
+            self._sheet.append(self.columns)
+
+    def _write(self, values: List[Any]):
+        if self.engine == "xlsxwriter":
+            self._sheet.write_row(self.rows_written + 1, 0, values)
+        else:
+            self._sheet.append(values)
+
+    def _close(self):
+        if self.engine == "xlsxwriter":
+            self._workbook.close()
+        else:
+            self._workbook.save(self.path)
+
+
+class ColumnarSink(ResultSink):
+    """
+    File Parquet (.parquet) hoặc Arrow IPC (.arrow / .feather / .ipc), ghi theo từng lô dòng.
+
+    Args:
+        types: {cột: "float" | "int" | "str" | "bool"}. Cột không khai báo được suy ra từ lô đầu tiên
+               (toàn số -> float, toàn bool -> bool, còn lại -> str). Schema bị khóa sau lô đầu tiên nên
+               cột số suy ra luôn là float (không bao giờ int): lô sau có số thực vẫn ghi đúng; cột int
+               phải khai báo rõ.
+               None, chuỗi rỗng và chuỗi "không có giá trị" ('N/A', 'null'...) ghi thành null. Giá trị khác
+               không vừa kiểu của cột (ví dụ 'abc' ở cột float, 2.5 ở cột int) gây ValueError thay vì
+               bị ghi thành null / cắt cụt.
+        batch_size: Số dòng giữ trong bộ nhớ trước khi ghi một row group / record batch.
+    """
+
+    METRIC = "columnar"
+    IPC_EXTENSIONS = (".arrow", ".feather", ".ipc")
+
+    def __init__(self, path: str, columns: Sequence[str], types: Optional[Dict[str, str]] = None,
+                 batch_size: int = 10000):
+        super().__init__(path, columns)
+        self.types: Dict[str, str] = dict(types or {})
+        unknown = {t for t in self.types.values() if t not in _COERCE}
+        if unknown:
+            raise ValueError(f"Kiểu cột không hỗ trợ: {', '.join(sorted(unknown))}")
+        self.batch_size = max(1, batch_size)
+        self.format = "ipc" if path.lower().endswith(self.IPC_EXTENSIONS) else "parquet"
+        self._buffer: List[List[Any]] = []
+        self._writer = None
+        self._schema = None
+        self._flushed_rows = 0
+
+    def _write(self, values: List[Any]):
+        self._buffer.append(values)
+        if len(self._buffer) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffer and self._writer is not None:
+            return
+        import pyarrow as pa
+
+        if self._schema is None:
+            for i, column in enumerate(self.columns):
+                if column not in self.types:
+                    self.types[column] = _infer_type(row[i] if i < len(row) else None for row in self._buffer)
+            self._schema = pa.schema([(c, _ARROW_TYPES[self.types[c]](pa)) for c in self.columns])
+            if self.format == "ipc":
+                import pyarrow.ipc
+
+                self._writer = pyarrow.ipc.new_file(self.path, self._schema)
+            else:
+                import pyarrow.parquet
+
+                self._writer = pyarrow.parquet.ParquetWriter(self.path, self._schema)
+
+        arrays = {}
+        for i, column in enumerate(self.columns):
+            coerce = _COERCE[self.types[column]]
+            values = []
+            for n, row in enumerate(self._buffer):
+                try:
+                    values.append(coerce(row[i]) if i < len(row) else None)
+                except ValueError as e:
+                    raise ValueError(f"{self.path}: cột '{column}' dòng {self._flushed_rows + n + 1}: {e}") from None
+            arrays[column] = values
+        self._writer.write_table(pa.Table.from_pydict(arrays, schema=self._schema))
+        self._flushed_rows += len(self._buffer)
+        self._buffer = []
+
+    def _close(self):
+        self._flush()
+        self._writer.close()
+
+
+class MultiSink(ResultSink):
+    """Ghi cùng một dòng vào nhiều sink (ví dụ Excel + Parquet)."""
+
+    def __init__(self, sinks: Sequence[ResultSink]):
+        self.sinks = list(sinks)
+        self.columns = self.sinks[0].columns if self.sinks else []
+        self.path = self.sinks[0].path if self.sinks else ""
+        self.rows_written = 0
+        self.closed = False
+        self.write_seconds = 0.0
+
+    def write_row(self, row: Row):
+        for sink in self.sinks:
+            sink.write_row(row)
+        self.rows_written += 1
+
+    def _close(self):
+        errors = []
+        for sink in self.sinks:
+            try:
+                sink.close()
+            except Exception as e:
+                errors.append(f"{sink.path}: {e}")
+        if errors:
+            raise RuntimeError("; ".join(errors))
+
+
+def open_result_sink(excel_path: str, columns: Sequence[str], sheet_name: str = "Sheet1",
+                     columnar_path: Optional[str] = None, types: Optional[Dict[str, str]] = None) -> ResultSink:
+    """ExcelSink, kèm ColumnarSink (qua MultiSink) nếu có `columnar_path` (tham số --parquet-out)."""
+    excel = ExcelSink(excel_path, columns, sheet_name=sheet_name)
+    if not columnar_path:
+        return excel
+    try:
+        columnar = ColumnarSink(columnar_path, columns, types=types)
+    except Exception:
+        excel.close()
+        raise
+    return MultiSink([excel, columnar])
+
+
+# -----------------------------
+# Kiểu cột cho ColumnarSink
+# -----------------------------
+
+# Chuỗi coi là "không có giá trị" (ghi null) ở cột float / int / bool
+NULL_STRINGS = ("", "n/a", "na", "none", "null", "nan")
+
+
+def _is_null(value: Any) -> bool:
+    return value is None or (isinstance(value, str) and value.strip().lower() in NULL_STRINGS)
+
+
+def _to_float(value: Any) -> Optional[float]:
+    if _is_null(value):
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f"giá trị bool {value!r} không phải số")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{value!r} không chuyển được sang float") from None
+
+
+def _to_int(value: Any) -> Optional[int]:
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    number = _to_float(value)
+    if number is None:
+        return None
+    if not math.isfinite(number) or number != int(number):
+        raise ValueError(f"{value!r} không phải số nguyên (khai báo cột float nếu cần số thực)")
+    return int(number)
+
+
+def _to_bool(value: Any) -> Optional[bool]:
+    if isinstance(value, bool):
+        return value
+    if _is_null(value):
+        return None
+    if isinstance(value, str):
+        lowered = value.strip().lower()
+        if lowered in ("true", "1", "yes"):
+            return True
+        if lowered in ("false", "0", "no"):
+            return False
+        raise ValueError(f"{value!r} không chuyển được sang bool")
+    if isinstance(value, (int, float)) and value in (0, 1):
+        return bool(value)
+    raise ValueError(f"{value!r} không chuyển được sang bool")
+
+
+_COERCE = {
+    "float": _to_float,
+    "int": _to_int,
+    "bool": _to_bool,
+    "str": lambda value: None if value is None else str(value),
+}
+
+_ARROW_TYPES = {
+    "float": lambda pa: pa.float64(),
+    "int": lambda pa: pa.int64(),
+    "bool": lambda pa: pa.bool_(),
+    "str": lambda pa: pa.string(),
+}
+
+
+def _infer_type(values: Iterable[Any]) -> str:
+    present = [v for v in values if v is not None and v != ""]
+    if not present:
+        return "str"
+    if all(isinstance(v, bool) for v in present):
+        return "bool"
+    # Toàn số (kể cả toàn số nguyên) -> float: schema khóa theo lô đầu, số thực ở lô sau không bị cắt
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in present):
+        return "float"
+    return "str"
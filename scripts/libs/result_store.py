@@ -0,0 +1,197 @@
+import os
+import json
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from libs.state_store import StateStore, SCRIPTS_DIR
+
+# ----------------------------------------------------
+# Kho lưu kết quả poll thiết bị (chuỗi thời gian)
+# ----------------------------------------------------
+# Kết quả của netmiko_exec.py/ssh2.py/netmiko_fleet.py trước đây chỉ được in ra JSON rồi mất.
+# Mỗi dòng TextFSM đã parse (optics Juniper, transceiver Cisco, alarm Nokia...) được lưu kèm
+# thời điểm poll, host, device_type và lệnh vào SQLite để dashboard lịch sử đọc từ kho
+# thay vì poll lại thiết bị. Các dòng của cùng một lần poll có cùng ts (một "snapshot").
+# Lần poll có template khớp nhưng không có dòng nào (alarm đã hết, optics mất) được lưu bằng một
+# dòng đánh dấu row_index = -1, data = {}: chuỗi thời gian thấy được thời điểm bảng trở về rỗng
+# và snapshot mới nhất là rỗng thay vì snapshot có dữ liệu trước đó.
+
+DEFAULT_RESULTS_DB = os.environ.get("N8N_SCRIPTS_RESULTS_DB", os.path.join(SCRIPTS_DIR, "state", "results.sqlite3"))
+EMPTY_SNAPSHOT_ROW_INDEX = -1   # row_index của dòng đánh dấu snapshot rỗng
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS poll_results (
+        id INTEGER PRIMARY KEY,
+        ts REAL NOT NULL,
+        host TEXT NOT NULL,
+        device_type TEXT,
+        command TEXT NOT NULL,
+        row_index INTEGER NOT NULL,
+        data TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_poll_results_cmd_host_ts ON poll_results (command, host, ts)",
+    "CREATE INDEX IF NOT EXISTS idx_poll_results_ts ON poll_results (ts)",
+]
+
+
+class ResultStore:
+    """Lưu và truy vấn các dòng kết quả đã parse theo (ts, host, command)."""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.store = StateStore(db_path or DEFAULT_RESULTS_DB)
+        self.store.ensure_schema("poll_results", _SCHEMA)
+
+    # ---- Ghi ----
+
+    def append(self, host: str, device_type: Optional[str], command: str,
+               rows: Iterable[Dict[str, Any]], ts: Optional[float] = None) -> int:
+        """
+        Thêm một snapshot (các dòng parse của một lệnh trên một host). Trả về số dòng dữ liệu đã ghi;
+        `rows` rỗng được lưu thành dòng đánh dấu snapshot rỗng (trả về 0).
+        """
+        ts = time.time() if ts is None else ts
+        records = [(ts, host, device_type, command, i, json.dumps(row, ensure_ascii=False))
+                   for i, row in enumerate(rows)]
+        with self.store.connect() as conn:
+            conn.executemany(
+                "INSERT INTO poll_results (ts, host, device_type, command, row_index, data) VALUES (?, ?, ?, ?, ?, ?)",
+                records or [(ts, host, device_type, command, EMPTY_SNAPSHOT_ROW_INDEX, "{}")],
+            )
+        return len(records)
+
+    def append_action_result(self, host: str, device_type: Optional[str], result: Dict[str, Any],
+                             command: Optional[str] = None, ts: Optional[float] = None) -> int:
+        """
+        Lưu kết quả theo định dạng JSON của execute_network_action / ssh_to_router_with_wrapper.
+        Hỗ trợ một lệnh (parsed_output) và nhiều lệnh ('results': {command: {...}}).
+        Chỉ lưu các lệnh có parsed_output dạng list (list rỗng: snapshot rỗng).
+        """
+        ts = time.time() if ts is None else ts
+        written = 0
+        per_command = result.get("results")
+        if isinstance(per_command, dict) and per_command:
+            for cmd, res in per_command.items():
+                if isinstance(res, dict) and isinstance(res.get("parsed_output"), list):
+                    written += self.append(host, device_type, cmd, res["parsed_output"], ts=ts)
+        elif command and isinstance(result.get("parsed_output"), list):
+            written += self.append(host, device_type, command, result["parsed_output"], ts=ts)
+        return written
+
+    # ---- Đọc ----
+
+    def query(self, command: Optional[str] = None, host: Optional[str] = None,
+              since: Optional[float] = None, until: Optional[float] = None,
+              fields: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None,
+              latest_only: bool = False, limit: Optional[int] = None,
+              include_empty: bool = False) -> List[Dict[str, Any]]:
+        """
+        Truy vấn các dòng đã lưu, sắp xếp theo thời gian.
+
+        Args:
+            command / host: Lọc theo lệnh / host (khớp chính xác).
+            since / until: Khoảng thời gian (epoch giây).
+            fields: Chỉ lấy các trường này của dữ liệu parse (mặc định: tất cả).
+            where: Lọc theo giá trị trường dữ liệu, ví dụ {"Interface": "xe-0/0/1"}.
+            latest_only: Chỉ lấy snapshot mới nhất của mỗi (host, command) (snapshot rỗng mới nhất -> không có dòng).
+            limit: Số dòng tối đa.
+            include_empty: Trả thêm một dòng data=None cho mỗi snapshot rỗng (thời điểm bảng trở về rỗng).
+
+        Returns:
+            list: [{ts, host, device_type, command, data: {<các trường dữ liệu>}}, ...] — trường dữ liệu nằm
+                  riêng trong `data` để trường parse trùng tên (ví dụ 'host', 'command') không ghi đè metadata.
+        """
+        clauses, params = [], []
+        if not include_empty:
+            clauses.append("row_index >= 0")
+        if command is not None:
+            clauses.append("command = ?")
+            params.append(command)
+        if host is not None:
+            clauses.append("host = ?")
+            params.append(host)
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("ts < ?")
+            params.append(until)
+        for field, value in (where or {}).items():
+            # Dòng đánh dấu snapshot rỗng luôn khớp bộ lọc trường để vẫn thấy lúc giá trị biến mất
+            clauses.append("(row_index < 0 OR json_extract(data, ?) = ?)")
+            params.extend([f'$."{field}"', value])
+        if latest_only:
+            clauses.append("ts = (SELECT MAX(p2.ts) FROM poll_results p2 "
+                           "WHERE p2.host = poll_results.host AND p2.command = poll_results.command)")
+
+        sql = "SELECT ts, host, device_type, command, row_index, data FROM poll_results"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY ts, host, command, row_index"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+
+        with self.store.connect() as conn:
+            rows = conn.execute(sql, params).fetchall()
+
+        results = []
+        for row in rows:
+            if row["row_index"] < 0:
+                results.append({"ts": row["ts"], "host": row["host"], "device_type": row["device_type"],
+                                "command": row["command"], "data": None})
+                continue
+            data = json.loads(row["data"])
+            if fields:
+                data = {f: data.get(f) for f in fields}
+            results.append({"ts": row["ts"], "host": row["host"], "device_type": row["device_type"],
+                            "command": row["command"], "data": data})
+        return results
+
+    # ---- Bảo trì ----
+
+    def compact(self, retention_days: Optional[float] = None, downsample_after_days: Optional[float] = None,
+                bucket_s: float = 3600.0, vacuum: bool = True) -> Dict[str, int]:
+        """
+        Thu gọn kho:
+          - Xóa dữ liệu cũ hơn retention_days.
+          - Với dữ liệu cũ hơn downsample_after_days, chỉ giữ snapshot đầu tiên của mỗi
+            (host, command) trong mỗi khoảng bucket_s giây.
+          - VACUUM để trả lại dung lượng đĩa.
+        """
+        now = time.time()
+        deleted_retention = deleted_downsample = 0
+        with self.store.connect() as conn:
+            if retention_days is not None:
+                cur = conn.execute("DELETE FROM poll_results WHERE ts < ?", (now - retention_days * 86400,))
+                deleted_retention = cur.rowcount
+            if downsample_after_days is not None:
+                cutoff = now - downsample_after_days * 86400
+                cur = conn.execute(
+                    """
+                    DELETE FROM poll_results
+                    WHERE ts < :cutoff AND (host, command, ts) NOT IN (
+                        SELECT host, command, MIN(ts) FROM poll_results
+                        WHERE ts < :cutoff
+                        GROUP BY host, command, CAST(ts / :bucket AS INTEGER)
+                    )
+                    """,
+                    {"cutoff": cutoff, "bucket": bucket_s},
+                )
+                deleted_downsample = cur.rowcount
+        if vacuum:
+            with self.store.connect() as conn:
+                conn.execute("VACUUM")
+        return {"deleted_retention": deleted_retention, "deleted_downsample": deleted_downsample}
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Số snapshot/dòng và khoảng thời gian theo (command, host)."""
+        with self.store.connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT command, host, COUNT(DISTINCT ts) AS snapshots, SUM(row_index >= 0) AS rows,
+                       MIN(ts) AS first_ts, MAX(ts) AS last_ts
+                FROM poll_results GROUP BY command, host ORDER BY command, host
+                """
+            ).fetchall()
+        return [dict(row) for row in rows]
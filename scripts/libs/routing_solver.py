@@ -103,15 +103,45 @@ def find_nearest_router_by_osrm_route_table(
         Hoặc None nếu không tìm thấy tuyến đường hợp lệ nào.
     """  
       
-    # Target BS (Điểm Bắt đầu): OSRM cần (lon, lat)
-    start_coords: Coords = (target_bs_lon, target_bs_lat)
-    
-    start_coords: Coords = (target_bs_lon, target_bs_lat)
-    
     # Trích xuất tọa độ đích (lon, lat) từ danh sách Router đã lọc
     dest_coords_list = [(lon, lat) for _, lon, lat,_,_,_ in routers_list]
-    
-    print(f"Bắt đầu gọi OSRM /table cho {len(routers_list)} router...")
+
+    nearest = nearest_by_osrm_route_table(osrm_base_url, target_bs_lat, target_bs_lon, dest_coords_list, profile)
+    if nearest is None:
+        return None # Lỗi OSRM /table hoặc không có tuyến hợp lệ
+
+    best_index, distance_km = nearest
+    # Lấy thông tin chi tiết của router tương ứng từ danh sách đã lọc
+    router_name, router_lon, router_lat,router_type, router_priority, router_site_id = routers_list[best_index]
+    return {
+        'name': router_name,
+        'lat': router_lat,
+        'lon': router_lon,
+        'type' : router_type,
+        'priority' : router_priority,
+        'site_id' : router_site_id,
+        'distance_km': distance_km
+    }
+
+
+def nearest_by_osrm_route_table(
+    osrm_base_url: str,
+    target_bs_lat: float,
+    target_bs_lon: float,
+    dest_coords_list: List[Coords],
+    profile: str = "car",
+) -> Optional[Tuple[int, float]]:
+    """
+    Một lệnh gọi OSRM /table từ trạm tới các điểm đích (lon, lat).
+
+    Returns:
+        (vị trí trong dest_coords_list, khoảng cách km) của đích gần nhất theo tuyến đường,
+        hoặc None nếu OSRM lỗi / không có tuyến hợp lệ nào.
+    """
+    # Target BS (Điểm Bắt đầu): OSRM cần (lon, lat)
+    start_coords: Coords = (target_bs_lon, target_bs_lat)
+
+    print(f"Bắt đầu gọi OSRM /table cho {len(dest_coords_list)} router...")
 
     # LỆNH GỌI DUY NHẤT ĐẾN OSRM
     distances_km_list = get_route_distances_table(
@@ -124,29 +154,12 @@ def find_nearest_router_by_osrm_route_table(
     if distances_km_list is None:
         return None # Lỗi OSRM /table
 
-    # =================================================================
-    # BƯỚC 3: XỬ LÝ KẾT QUẢ ĐỂ TÌM GIÁ TRỊ NHỎ NHẤT
-    # =================================================================
-    
-    min_distance = float('inf')
-    best_router_result = None
-
-    # Lặp qua các khoảng cách và so sánh
+    # Tìm khoảng cách nhỏ nhất (đích không có tuyến: None / inf được bỏ qua)
+    best_index, min_distance = None, float('inf')
     for i, distance_km in enumerate(distances_km_list):
-        if distance_km < min_distance:
-            min_distance = distance_km
-            
-            # Lấy thông tin chi tiết của router tương ứng từ danh sách đã lọc
-            router_name, router_lon, router_lat,router_type, router_priority, router_site_id = routers_list[i]
-            
-            best_router_result = {
-                'name': router_name,
-                'lat': router_lat,
-                'lon': router_lon,
-                'type' : router_type,
-                'priority' : router_priority,
-                'site_id' : router_site_id,
-                'distance_km': distance_km
-            }
+        if distance_km is not None and distance_km < min_distance:
+            best_index, min_distance = i, distance_km
 
-    return best_router_result
+    if best_index is None:
+        return None
+    return best_index, min_distance
@@ -0,0 +1,57 @@
+import os
+import sqlite3
+import threading
+import contextlib
+from typing import Iterable, Optional
+
+# ----------------------------------------------------
+# Kho trạng thái SQLite cục bộ dùng chung cho các script
+# ----------------------------------------------------
+# Các script được n8n gọi rời rạc (mỗi lần một tiến trình) nên trạng thái giữa các lần chạy
+# (offset log, ...) được lưu trong một file SQLite. Mỗi thao tác mở kết nối riêng
+# (an toàn khi nhiều thread/tiến trình dùng chung), bật WAL để đọc không chặn ghi.
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_STATE_DB = os.environ.get("N8N_SCRIPTS_STATE_DB", os.path.join(SCRIPTS_DIR, "state", "state.sqlite3"))
+
+BUSY_TIMEOUT_S = 30.0
+
+_schema_lock = threading.Lock()
+_initialized = set()  # (đường dẫn db, tên schema) đã tạo bảng trong tiến trình này
+
+
+class StateStore:
+    """Bao bọc một file SQLite: kết nối theo từng thao tác, giao dịch tự commit/rollback."""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = os.path.abspath(db_path or DEFAULT_STATE_DB)
+
+    @contextlib.contextmanager
+    def connect(self):
+        """Mở kết nối, commit khi khối lệnh thành công, rollback khi có exception."""
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_S)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def ensure_schema(self, name: str, statements: Iterable[str]):
+        """Tạo bảng/index (CREATE ... IF NOT EXISTS) một lần cho mỗi tiến trình."""
+        key = (self.db_path, name)
+        if key in _initialized:
+            return
+        with _schema_lock:
+            if key in _initialized:
+                return
+            with self.connect() as conn:
+                for statement in statements:
+                    conn.execute(statement)
+            _initialized.add(key)
@@ -0,0 +1,177 @@
+import os
+import io
+import re
+import csv
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+# ----------------------------------------------------
+# Registry template TextFSM (quét một lần, đọc template một lần)
+# ----------------------------------------------------
+# Trước đây mỗi lần parse, netmiko_wrapper/ssh.py đều dò file template trên đĩa rồi mở và
+# compile lại .textfsm. Registry quét các thư mục template một lần, đọc mỗi template một lần
+# và dựng FSM mới từ nội dung đã cache cho mỗi lần parse (FSM có trạng thái, không dùng chung
+# được; dựng từ nội dung nhanh hơn deepcopy một FSM đã compile).
+#
+# Cách ánh xạ (device_type, command) -> template, theo thứ tự ưu tiên:
+#   1. Quy ước tên file trong templates/: {device_type}_{command chuẩn hóa}.textfsm
+#      (giống get_custom_template cũ: chữ thường, ' ' và '/' -> '_').
+#   2. File `index` (định dạng ntc-templates) trong từng thư mục:
+#          Template, Hostname, Platform, Command
+#          juniper_show_optical.textfsm, .*, juniper_junos, sh[[ow]] int[[erfaces]] diag[[nostics]] opt[[ics]]
+#      Platform và Command là regex khớp toàn bộ chuỗi; 'sh[[ow]]' nghĩa là 'sh', 'sho' hoặc 'show'.
+
+logger = logging.getLogger(__name__)
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_TEMPLATE_DIRS = [
+    os.path.join(SCRIPTS_DIR, "templates"),
+    os.path.join(SCRIPTS_DIR, "textfsm_template"),
+]
+INDEX_FILE_NAME = "index"
+
+
+def normalize_command(command: str) -> str:
+    """Chuẩn hóa lệnh theo quy ước tên file template (giống get_custom_template)."""
+    return command.lower().strip().replace(" ", "_").replace("/", "_")
+
+
+def _expand_completion(pattern: str) -> str:
+    """Chuyển cú pháp viết tắt của ntc-templates 'sh[[ow]]' thành regex 'sh(o(w)?)?'."""
+    def repl(match):
+        chars = match.group(1)
+        return "".join(f"({re.escape(c)}" for c in chars) + ")?" * len(chars)
+    return re.sub(r"\[\[(.+?)\]\]", repl, pattern)
+
+
+class _IndexEntry:
+    __slots__ = ("template_path", "platform_re", "command_re")
+
+    def __init__(self, template_path: str, platform: str, command: str):
+        self.template_path = template_path
+        # fullmatch: 'cisco_ios|cisco_xe' không được khớp tiền tố như 'cisco_ios_telnet'
+        self.platform_re = re.compile(platform.strip())
+        self.command_re = re.compile(_expand_completion(command.strip()))
+
+    def matches(self, device_type: str, command: str) -> bool:
+        return bool(self.platform_re.fullmatch(device_type) and self.command_re.fullmatch(command))
+
+
+class TemplateRegistry:
+    """Chỉ mục template TextFSM + cache nội dung template theo đường dẫn file."""
+
+    def __init__(self, template_dirs: Optional[List[str]] = None):
+        self.template_dirs = list(template_dirs or DEFAULT_TEMPLATE_DIRS)
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._by_name: Dict[str, str] = {}          # "{device_type}_{command}" -> path
+        self._index: List[_IndexEntry] = []
+        self._lookup_cache: Dict[Tuple[str, str], Optional[str]] = {}
+        self._sources: Dict[str, str] = {}          # path -> nội dung template (đọc đĩa một lần)
+
+    # ---- Quét thư mục ----
+
+    def _load_index(self, directory: str):
+        index_path = os.path.join(directory, INDEX_FILE_NAME)
+        if not os.path.isfile(index_path):
+            return
+        with open(index_path, encoding="utf-8") as f:
+            rows = [line for line in f if line.strip() and not line.lstrip().startswith("#")]
+        reader = csv.reader(rows, skipinitialspace=True)
+        header = None
+        for row in reader:
+            if header is None:
+                header = [col.strip() for col in row]
+                continue
+            record = dict(zip(header, (col.strip() for col in row)))
+            template_name = record.get("Template")
+            if not template_name:
+                continue
+            template_path = os.path.join(directory, template_name)
+            if not os.path.isfile(template_path):
+                logger.warning(f"⚠️ Index {index_path} trỏ tới template không tồn tại: {template_name}")
+                continue
+            try:
+                self._index.append(_IndexEntry(template_path, record.get("Platform") or ".*", record.get("Command") or ""))
+            except re.error as e:
+                logger.warning(f"⚠️ Bỏ qua dòng index lỗi regex ({template_name}): {e}")
+
+    def load(self):
+        """Quét các thư mục template (chỉ thực hiện một lần)."""
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            for directory in self.template_dirs:
+                if not os.path.isdir(directory):
+                    continue
+                for name in sorted(os.listdir(directory)):
+                    if name.endswith(".textfsm"):
+                        self._by_name.setdefault(name[:-len(".textfsm")], os.path.join(directory, name))
+                self._load_index(directory)
+            self._loaded = True
+            logger.info(f"📚 Đã nạp {len(self._by_name)} template TextFSM, {len(self._index)} dòng index.")
+
+    # ---- Tra cứu ----
+
+    def find(self, device_type: str, command: str) -> Optional[str]:
+        """Trả về đường dẫn template cho (device_type, command), hoặc None."""
+        self.load()
+        command_clean = " ".join(command.split())
+        key = (device_type, command_clean)
+        if key in self._lookup_cache:
+            return self._lookup_cache[key]
+
+        path = self._by_name.get(f"{device_type}_{normalize_command(command_clean)}")
+        if path is None:
+            for entry in self._index:
+                if entry.matches(device_type, command_clean):
+                    path = entry.template_path
+                    break
+        with self._lock:
+            self._lookup_cache[key] = path
+        return path
+
+    # ---- Dựng FSM ----
+
+    def _source(self, template_path: str) -> str:
+        source = self._sources.get(template_path)
+        if source is None:
+            with open(template_path, encoding="utf-8") as f:
+                source = f.read()
+            with self._lock:
+                self._sources[template_path] = source
+        return source
+
+    def get_fsm(self, template_path: str):
+        """Trả về một FSM mới cho template_path, dựng từ nội dung template đã cache (không đọc lại đĩa)."""
+        import textfsm
+
+        return textfsm.TextFSM(io.StringIO(self._source(template_path)))
+
+    def parse_file(self, template_path: str, output: str) -> List[Dict[str, Any]]:
+        """Parse output bằng template chỉ định (đường dẫn file)."""
+        return self.get_fsm(template_path).ParseTextToDicts(output)
+
+    def parse(self, device_type: str, command: str, output: str) -> Optional[List[Dict[str, Any]]]:
+        """Parse output theo template tìm được trong registry; None nếu không có template."""
+        template_path = self.find(device_type, command)
+        if template_path is None:
+            return None
+        return self.parse_file(template_path, output)
+
+
+_default_registry: Optional[TemplateRegistry] = None
+_default_registry_lock = threading.Lock()
+
+
+def get_registry() -> TemplateRegistry:
+    """Registry dùng chung của tiến trình (templates/ + textfsm_template/)."""
+    global _default_registry
+    if _default_registry is None:
+        with _default_registry_lock:
+            if _default_registry is None:
+                _default_registry = TemplateRegistry()
+    return _default_registry
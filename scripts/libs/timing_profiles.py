@@ -0,0 +1,294 @@
+import os
+import time
+import logging
+import threading
+import contextlib
+from typing import Any, Dict, Optional
+
+from libs.state_store import StateStore
+from libs.connection_pool import pooled_connection, is_reused_session
+from libs import instrumentation as metrics
+
+# ----------------------------------------------------
+# Hồ sơ timing theo thiết bị (thay cho global_delay_factor=2 cố định)
+# ----------------------------------------------------
+# Trước đây mọi kết nối Netmiko đều dùng global_delay_factor=2, nhân đôi mọi khoảng sleep nội
+# bộ kể cả với thiết bị nhanh. Ở đây mỗi host có hồ sơ học từ các lần chạy trước (lưu SQLite):
+# thời gian login/dò prompt (EWMA), thời gian từng lệnh, số lần chạy ổn định liên tiếp và số
+# lỗi timeout liên tiếp. Từ đó chọn fast_cli / global_delay_factor khi kết nối và read_timeout
+# cho từng lệnh. Host chưa có dữ liệu hoặc vừa lỗi dùng cấu hình bảo thủ cũ (delay factor 2).
+#
+# Tắt hẳn bằng biến môi trường N8N_SCRIPTS_ADAPTIVE_TIMING=0 (luôn dùng cấu hình bảo thủ).
+
+logger = logging.getLogger(__name__)
+
+EWMA_ALPHA = 0.3
+MIN_HEALTHY_RUNS = 2          # Số lần kết nối thành công liên tiếp trước khi bật chế độ nhanh
+FAST_CONNECT_S = 4.0          # Login + chuẩn bị phiên dưới ngưỡng này: fast_cli
+NORMAL_CONNECT_S = 10.0       # Dưới ngưỡng này: delay factor 1 (không fast_cli)
+MAX_DELAY_FACTOR = 4
+MIN_READ_TIMEOUT = 30.0
+MAX_READ_TIMEOUT = 600.0
+READ_TIMEOUT_MULTIPLIER = 3.0  # read_timeout = bội số của thời gian chạy chậm nhất đã thấy
+
+CONSERVATIVE = {"fast_cli": False, "global_delay_factor": 2}
+NORMAL = {"fast_cli": False, "global_delay_factor": 1}
+FAST = {"fast_cli": True, "global_delay_factor": 1}
+
+_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS timing_hosts (
+        host TEXT PRIMARY KEY,
+        device_type TEXT,
+        connect_ewma_s REAL,
+        connect_samples INTEGER NOT NULL DEFAULT 0,
+        healthy_streak INTEGER NOT NULL DEFAULT 0,
+        consecutive_failures INTEGER NOT NULL DEFAULT 0,
+        last_failure TEXT,
+        updated_at REAL NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS timing_commands (
+        host TEXT NOT NULL,
+        command TEXT NOT NULL,
+        ewma_s REAL NOT NULL,
+        max_s REAL NOT NULL,
+        samples INTEGER NOT NULL,
+        timeouts INTEGER NOT NULL DEFAULT 0,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (host, command)
+    )
+    """,
+]
+
+
+def adaptive_timing_enabled() -> bool:
+    return os.environ.get("N8N_SCRIPTS_ADAPTIVE_TIMING", "1").lower() not in ("0", "false", "no")
+
+
+class TimingProfiles:
+    """Đọc/ghi hồ sơ timing theo host và chọn tham số Netmiko tương ứng."""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.store = StateStore(db_path)
+        self.store.ensure_schema("timing_profiles", _SCHEMA)
+
+    # ---- Chọn tham số ----
+
+    def profile(self, host: str) -> Optional[Dict[str, Any]]:
+        with self.store.connect() as conn:
+            row = conn.execute("SELECT * FROM timing_hosts WHERE host = ?", (host,)).fetchone()
+        return dict(row) if row else None
+
+    def connection_settings(self, host: str) -> Dict[str, Any]:
+        """
+        fast_cli / global_delay_factor cho host:
+          - vừa lỗi timeout: bảo thủ, delay factor tăng theo số lỗi liên tiếp (tối đa MAX_DELAY_FACTOR);
+          - chưa đủ MIN_HEALTHY_RUNS lần ổn định: bảo thủ (như cấu hình cũ);
+          - login nhanh: FAST; trung bình: NORMAL; chậm: bảo thủ.
+        """
+        profile = self.profile(host)
+        if profile is None:
+            return dict(CONSERVATIVE)
+        if profile["consecutive_failures"]:
+            return {"fast_cli": False,
+                    "global_delay_factor": min(MAX_DELAY_FACTOR, 2 * profile["consecutive_failures"])}
+        if profile["healthy_streak"] < MIN_HEALTHY_RUNS or profile["connect_ewma_s"] is None:
+            return dict(CONSERVATIVE)
+        if profile["connect_ewma_s"] <= FAST_CONNECT_S:
+            return dict(FAST)
+        if profile["connect_ewma_s"] <= NORMAL_CONNECT_S:
+            return dict(NORMAL)
+        return dict(CONSERVATIVE)
+
+    def read_timeout(self, host: str, command: str, default: float) -> float:
+        """
+        read_timeout cho lệnh: READ_TIMEOUT_MULTIPLIER x thời gian chậm nhất đã thấy (trong khoảng
+        MIN_READ_TIMEOUT..MAX_READ_TIMEOUT). `default` là giá trị nơi gọi truyền vào (--timeout, 120s...)
+        và luôn là mức sàn: hồ sơ chỉ kéo dài read_timeout cho lệnh chậm, không bao giờ rút ngắn.
+        """
+        with self.store.connect() as conn:
+            row = conn.execute("SELECT max_s, samples, timeouts FROM timing_commands WHERE host = ? AND command = ?",
+                               (host, command)).fetchone()
+        if row is None or not row["samples"]:
+            return default
+        learned = min(MAX_READ_TIMEOUT, max(MIN_READ_TIMEOUT, row["max_s"] * READ_TIMEOUT_MULTIPLIER))
+        return max(default, learned)
+
+    # ---- Ghi nhận ----
+
+    def record_connect(self, host: str, device_type: Optional[str], seconds: float):
+        """Một lần login thành công (không tính phiên dùng lại từ pool)."""
+        with self.store.connect() as conn:
+            conn.execute(
+                """
+                INSERT INTO timing_hosts (host, device_type, connect_ewma_s, connect_samples, healthy_streak,
+                                          consecutive_failures, updated_at)
+                VALUES (:host, :device_type, :seconds, 1, 1, 0, :now)
+                ON CONFLICT (host) DO UPDATE SET
+                    device_type = excluded.device_type,
+                    connect_ewma_s = CASE WHEN connect_ewma_s IS NULL THEN :seconds
+                                          ELSE :alpha * :seconds + (1 - :alpha) * connect_ewma_s END,
+                    connect_samples = connect_samples + 1,
+                    healthy_streak = healthy_streak + 1,
+                    consecutive_failures = 0,
+                    updated_at = :now
+                """,
+                {"host": host, "device_type": device_type, "seconds": seconds, "alpha": EWMA_ALPHA, "now": time.time()},
+            )
+
+    def record_command(self, host: str, command: str, seconds: float):
+        with self.store.connect() as conn:
+            conn.execute(
+                """
+                INSERT INTO timing_commands (host, command, ewma_s, max_s, samples, timeouts, updated_at)
+                VALUES (:host, :command, :seconds, :seconds, 1, 0, :now)
+                ON CONFLICT (host, command) DO UPDATE SET
+                    ewma_s = :alpha * :seconds + (1 - :alpha) * ewma_s,
+                    max_s = MAX(max_s, :seconds),
+                    samples = samples + 1,
+                    updated_at = :now
+                """,
+                {"host": host, "command": command, "seconds": seconds, "alpha": EWMA_ALPHA, "now": time.time()},
+            )
+
+    def record_failure(self, host: str, reason: str, command: Optional[str] = None):
+        """Thiết bị không phản hồi kịp (timeout kết nối/đọc): quay về cấu hình bảo thủ."""
+        now = time.time()
+        with self.store.connect() as conn:
+            conn.execute(
+                """
+                INSERT INTO timing_hosts (host, connect_samples, healthy_streak, consecutive_failures, last_failure, updated_at)
+                VALUES (?, 0, 0, 1, ?, ?)
+                ON CONFLICT (host) DO UPDATE SET
+                    healthy_streak = 0,
+                    consecutive_failures = consecutive_failures + 1,
+                    last_failure = excluded.last_failure,
+                    updated_at = excluded.updated_at
+                """,
+                (host, reason[:500], now),
+            )
+            if command is not None:
+                conn.execute(
+                    """
+                    INSERT INTO timing_commands (host, command, ewma_s, max_s, samples, timeouts, updated_at)
+                    VALUES (?, ?, 0, 0, 0, 1, ?)
+                    ON CONFLICT (host, command) DO UPDATE SET timeouts = timeouts + 1, updated_at = excluded.updated_at
+                    """,
+                    (host, command, now),
+                )
+
+    def reset(self, host: Optional[str] = None):
+        """Xóa hồ sơ (một host hoặc tất cả) để học lại từ đầu."""
+        with self.store.connect() as conn:
+            if host is None:
+                conn.execute("DELETE FROM timing_hosts")
+                conn.execute("DELETE FROM timing_commands")
+            else:
+                conn.execute("DELETE FROM timing_hosts WHERE host = ?", (host,))
+                conn.execute("DELETE FROM timing_commands WHERE host = ?", (host,))
+
+
+# ----------------------------------------------------
+# Hồ sơ mặc định của tiến trình
+# ----------------------------------------------------
+
+_profiles: Optional[TimingProfiles] = None
+_profiles_lock = threading.Lock()
+
+
+def get_profiles() -> Optional[TimingProfiles]:
+    """Hồ sơ timing dùng chung (file state mặc định), None nếu đã tắt qua biến môi trường."""
+    global _profiles
+    if not adaptive_timing_enabled():
+        return None
+    if _profiles is None:
+        with _profiles_lock:
+            if _profiles is None:
+                _profiles = TimingProfiles()
+    return _profiles
+
+
+def _is_timeout(exc: BaseException) -> bool:
+    from netmiko.exceptions import NetmikoTimeoutException, ReadTimeout
+
+    return isinstance(exc, (NetmikoTimeoutException, ReadTimeout, TimeoutError, EOFError))
+
+
+def command_read_timeout(host: str, command: str, default: float) -> float:
+    """read_timeout cho (host, command): không dưới `default`, dài hơn nếu hồ sơ cho thấy lệnh chạy chậm."""
+    profiles = get_profiles()
+    if profiles is None:
+        return default
+    try:
+        return profiles.read_timeout(host, command, default)
+    except Exception as e:
+        logger.debug(f"Không đọc được hồ sơ timing của {host}: {e}")
+        return default
+
+
+def record_command_result(host: str, command: str, seconds: Optional[float] = None,
+                          error: Optional[BaseException] = None):
+    """Ghi thời gian chạy lệnh (hoặc lỗi timeout của lệnh) vào hồ sơ; lỗi ghi không làm hỏng lệnh."""
+    # Metric của lần chạy được ghi kể cả khi tắt hồ sơ timing
+    if error is not None:
+        metrics.inc("ssh_command_errors_total")
+    elif seconds is not None:
+        metrics.observe("ssh_command_seconds", seconds)
+    profiles = get_profiles()
+    if profiles is None:
+        return
+    try:
+        if error is not None:
+            if _is_timeout(error):
+                profiles.record_failure(host, f"{type(error).__name__}: {error}", command=command)
+        elif seconds is not None:
+            profiles.record_command(host, command, seconds)
+    except Exception as e:
+        logger.debug(f"Không ghi được hồ sơ timing của {host}: {e}")
+
+
+@contextlib.contextmanager
+def tuned_connection(device_params: Dict[str, Any]):
+    """
+    Thay cho pooled_connection(): điền fast_cli / global_delay_factor theo hồ sơ của host
+    (trừ khi device_params đã chỉ định), ghi lại thời gian login và lỗi timeout.
+    """
+    profiles = get_profiles()
+    host = str(device_params.get("host") or device_params.get("ip"))
+    params = dict(device_params)
+    try:
+        settings = profiles.connection_settings(host) if profiles is not None else dict(CONSERVATIVE)
+    except Exception as e:
+        logger.debug(f"Không đọc được hồ sơ timing của {host}: {e}")
+        settings = dict(CONSERVATIVE)
+    for name, value in settings.items():
+        params.setdefault(name, value)
+
+    start = time.perf_counter()
+    connected = False
+    try:
+        with pooled_connection(params) as conn:
+            connected = True
+            reused = is_reused_session(conn)
+            if reused:
+                metrics.inc("ssh_session_reused_total")
+            else:
+                metrics.observe("ssh_connect_seconds", time.perf_counter() - start)
+            if profiles is not None and not reused:
+                try:
+                    profiles.record_connect(host, params.get("device_type"), time.perf_counter() - start)
+                except Exception as e:
+                    logger.debug(f"Không ghi được hồ sơ timing của {host}: {e}")
+            yield conn
+    except BaseException as e:
+        # Lỗi trong lúc chạy lệnh đã được ghi theo từng lệnh (record_command_result)
+        if not connected:
+            metrics.inc("ssh_connect_errors_total")
+        if profiles is not None and not connected and _is_timeout(e):
+            try:
+                profiles.record_failure(host, f"{type(e).__name__}: {e}")
+            except Exception as store_error:
+                logger.debug(f"Không ghi được hồ sơ timing của {host}: {store_error}")
+        raise
@@ -2,6 +2,7 @@ import sys
 import json
 import os
 import argparse
+from libs.cli_bootstrap import run_main
 
 # Hàm tạo một placemark cho một đoạn thẳng
 def create_single_line_placemark(coord1, coord2, line_name, description, line_color, line_width):
@@ -151,7 +152,7 @@ def generate_kml_from_lines(items_to_process, doc_name="Dữ liệu tuyến KML"
     return full_kml_content
 
 # Khối thực thi chính khi script được chạy trực tiếp
-if __name__ == "__main__":
+def main():
     parser = argparse.ArgumentParser(
         description="Tạo KML chứa dữ liệu tuyến (đoạn thẳng) từ một file JSON đầu vào.",
         formatter_class=argparse.RawTextHelpFormatter
@@ -216,4 +217,8 @@ if __name__ == "__main__":
     else:
         result = {"status": "error", "message": "Không thể tạo nội dung KML từ dữ liệu đã xử lý."}
         print(json.dumps(result))
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    run_main(main)
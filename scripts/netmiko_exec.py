@@ -1,19 +1,77 @@
 import sys
 import json
 import argparse
-from netmiko import ConnectHandler
-# Import các loại exception cụ thể để bắt lỗi chính xác
-from netmiko.exceptions import (
-    NetmikoTimeoutException,
-    NetmikoAuthenticationException,
-    NetmikoBaseException,
-    # NetmikoValueError, # Bắt các lỗi ValueError (ví dụ: device_type không hợp lệ)
-    ReadTimeout # Lỗi khi dùng use_textfsm=True mà không tìm thấy template
-)
 import os # Import os module để xử lý đường dẫn file cục bộ
+import time
+from libs import instrumentation as metrics
+from libs.cli_bootstrap import run_main
+# netmiko và các libs dùng khi kết nối (connection pool, hồ sơ timing/SQLite, parse, tải file,
+# kho kết quả, delta, inventory) được import bên trong hàm sử dụng (import trì hoãn) để --help
+# và các lỗi tham số không phải trả phí import (xem check_startup_budget.py).
 
 
-def execute_network_action(device_type, host, username, password, action_type, command=None, secret=None, use_textfsm=False, remote_file_path=None, local_save_path=None, port=22, timeout=60):
+def run_commands_in_session(net_connect, commands, use_textfsm=False, timeout=60, device_type=None):
+    """
+    Chạy lần lượt nhiều lệnh CLI trên một phiên SSH đã mở (không login lại cho mỗi lệnh).
+
+    Args:
+        net_connect: Đối tượng kết nối Netmiko đã sẵn sàng (đã enable nếu cần).
+        commands (list): Danh sách câu lệnh CLI.
+        use_textfsm (bool): True nếu muốn parse output (NTC-Templates, rồi template tùy chỉnh).
+        timeout (int): Thời gian chờ thực thi mỗi lệnh.
+        device_type (str, optional): Kiểu thiết bị để chọn template (mặc định lấy từ net_connect).
+
+    Returns:
+        dict: {command: {success, output, parsed_output, parser, error, timings}} theo thứ tự lệnh.
+              Sau lệnh bị timeout, các lệnh còn lại bị bỏ qua (success=False) và phiên bị hủy khỏi pool.
+    """
+    device_type = device_type or net_connect.device_type
+    from netmiko.exceptions import ReadTimeout
+    from libs.cli_parsing import send_and_parse
+    from libs.connection_pool import discard_on_release
+
+    results = {}
+    usable = True
+    for command in commands:
+        if not usable:
+            results[command] = {"success": False, "output": "", "parsed_output": None, "parser": None,
+                                "error": "Bỏ qua: phiên không còn đồng bộ sau lệnh bị timeout.", "timings": {}}
+            continue
+        output = None
+        parsed_output = None
+        error_message = None
+        success = False
+        parser = None
+        timings = {}
+        try:
+            # Gửi lệnh đúng một lần, parse cục bộ trên cùng buffer
+            sent = send_and_parse(net_connect, device_type, command, use_textfsm=use_textfsm, read_timeout=timeout + 30)
+            parsed_output = sent["parsed_output"]
+            # Giữ hợp đồng cũ: output là dữ liệu đã parse nếu có, ngược lại là output thô
+            output = parsed_output if parsed_output is not None else sent["raw_output"]
+            parser = sent["parser"]
+            timings = sent["timings"]
+            success = True
+        except ReadTimeout as e:
+            # Lệnh vẫn chạy trên thiết bị và output dở dang còn trong kênh: gửi tiếp sẽ đọc nhầm
+            # output của lệnh trước, nên dừng lại và không trả phiên này về pool
+            error_message = f"Lỗi timeout khi chạy lệnh: {e}"
+            usable = False
+            discard_on_release(net_connect)
+        results[command] = {
+            "success": success,
+            "output": output if output is not None else "",
+            "parsed_output": parsed_output,
+            "parser": parser,
+            "error": error_message,
+            "timings": timings,
+        }
+    return results
+
+
+def execute_network_action(device_type, host, username, password, action_type, command=None, secret=None, use_textfsm=False, remote_file_path=None, local_save_path=None, port=22, timeout=60, commands=None,
+                           buffer_size=None, resume=True, compress=False, rate_limiter=None,
+                           state_db=None, append=False, backend="netmiko"):
     """
     Kết nối tới thiết bị mạng bằng Netmiko và thực hiện một hành động (CLI command hoặc file transfer).
 
@@ -22,18 +80,54 @@ def execute_network_action(device_type, host, username, password, action_type, c
         host (str): Địa chỉ IP hoặc hostname của thiết bị.
         username (str): Tên người dùng SSH.
         password (str): Mật khẩu SSH.
-        action_type (str): Loại hành động ('cli_command' hoặc 'get_log_file').
+        action_type (str): Loại hành động ('cli_command', 'cli_commands', 'get_log_file' hoặc 'tail_log_file').
         command (str, optional): Câu lệnh CLI cần thực hiện nếu action_type là 'cli_command'.
+        commands (list, optional): Danh sách lệnh chạy trên cùng một phiên SSH nếu action_type là 'cli_commands'.
         secret (str, optional): Mật khẩu enable mode (nếu thiết bị yêu cầu).
         use_textfsm (bool): True nếu muốn parse output CLI bằng TextFSM.
         remote_file_path (str, optional): Đường dẫn file trên router nếu action_type là 'get_log_file'.
         local_save_path (str, optional): Đường dẫn cục bộ để lưu file nếu action_type là 'get_log_file'.
         port (int): Cổng SSH (mặc định: 22).
         timeout (int): Thời gian chờ kết nối và thực thi lệnh (mặc định: 60 giây).
+        buffer_size (int): Kích thước khối đọc khi tải file (get_log_file).
+        resume (bool): Tiếp tục tải từ file .part còn dở (get_log_file).
+        compress (bool): Nén gzip file tải về trong lúc ghi (get_log_file).
+        rate_limiter (RateLimiter, optional): Giới hạn băng thông tải file, có thể dùng chung giữa nhiều thiết bị.
+        state_db (str, optional): File SQLite lưu offset log cho tail_log_file (mặc định: scripts/state/state.sqlite3).
+        append (bool): tail_log_file nối phần mới vào local_save_path thay vì ghi đè.
+        backend (str): 'netmiko' (mặc định) hoặc 'asyncssh' (chỉ lệnh show với cli_command/cli_commands,
+                       juniper_junos / cisco_ios / nokia_sros; xem libs/asyncssh_backend.py).
 
     Returns:
-        dict: Kết quả hành động (output, parsed_output, error, success).
+        dict: Kết quả hành động (output, parsed_output, error, success) và 'timings' (giây) theo từng bước.
+              Với 'cli_command' có thêm 'parser' ('ntc' | 'custom' | 'raw').
+              Với 'cli_commands' có thêm 'results': {command: {success, output, parsed_output, parser, error, timings}}.
     """
+    if backend == "asyncssh":
+        # Cùng định dạng kết quả, nhưng chạy qua asyncssh (import trì hoãn)
+        from libs.asyncssh_backend import run_show_action
+        return run_show_action(
+            device_type=device_type, host=host, username=username, password=password,
+            action_type=action_type, command=command, commands=commands, secret=secret,
+            use_textfsm=use_textfsm, port=port, timeout=timeout,
+        )
+
+    # Import các loại exception cụ thể để bắt lỗi chính xác
+    from netmiko.exceptions import (
+        NetmikoTimeoutException,
+        NetmikoAuthenticationException,
+        NetmikoBaseException,
+        # NetmikoValueError, # Bắt các lỗi ValueError (ví dụ: device_type không hợp lệ)
+        ReadTimeout # Lệnh không trả về prompt trong read_timeout
+    )
+    from libs.connection_pool import discard_on_release
+    from libs.timing_profiles import tuned_connection
+    from libs.cli_parsing import send_and_parse
+    from libs.file_transfer import download_file, open_sftp, DEFAULT_BUFFER_SIZE
+    from libs.log_offsets import sftp_tail
+
+    buffer_size = buffer_size or DEFAULT_BUFFER_SIZE
+
     device_params = {
         'device_type': device_type,
         'host': host,
@@ -42,8 +136,7 @@ def execute_network_action(device_type, host, username, password, action_type, c
         'secret': secret,  # Mật khẩu enable mode
         'port': port,
         'timeout': timeout,
-        'global_delay_factor': 2,
-        # 'fast_cli': True, # Cố gắng tăng tốc độ CLI cho một số thiết bị
+        # fast_cli / global_delay_factor do hồ sơ timing của host chọn (libs/timing_profiles.py)
         # 'disable_paging': True, # Có thể cần bật nếu gặp lỗi phân trang
         # 'disable_paging_string': "environment no more", # Tùy chỉnh lệnh tắt phân trang cho Nokia
     }
@@ -52,54 +145,93 @@ def execute_network_action(device_type, host, username, password, action_type, c
     parsed_output = None
     error_message = None
     success = False
+    command_results = None
+    parser_used = None
+    timings = {}
+    action_start = time.perf_counter()
     net_connect = None # Khai báo biến net_connect trước khối try
 
     try:
-        # Tạo đối tượng kết nối Netmiko
-        with ConnectHandler(**device_params) as net_connect:
+        # Mượn phiên từ connection pool (nếu chạy trong worker) hoặc mở kết nối mới với timing
+        # theo hồ sơ của host; tự trả/đóng kết nối và hủy phiên nếu có lỗi.
+        with tuned_connection(device_params) as net_connect:
+            timings["connect_s"] = round(time.perf_counter() - action_start, 4)
             # Vào enable mode nếu là thiết bị Cisco (hoặc loại khác cần)
             if device_type.startswith("cisco_ios") or device_type.startswith("cisco_xe") or device_type.startswith("cisco_asa"):
                 net_connect.enable()
 
             if action_type == "cli_command":
-                # Thực thi lệnh CLI
-                if use_textfsm:
-                    # Gửi lệnh và tự động parse bằng TextFSM
-                    # Nếu lỗi ReadTimeout xảy ra ở đây, nó sẽ bị bắt ở khối except ReadTimeout
-                    parsed_output = net_connect.send_command(
-                        command, use_textfsm=True, read_timeout=timeout + 30 # Tăng timeout riêng cho parsing
-                    )
-                    # Lấy output thô sau khi parse thành công (có thể cần chạy lại lệnh nếu send_command with textfsm không trả raw)
-                    # Một số trường hợp, parsed_output có thể rỗng dù lệnh thành công nếu không có template
-                    if not parsed_output:
-                        output = net_connect.send_command(command, use_textfsm=False)
-                    else:
-                        output = parsed_output # Coi parsed_output là output chính nếu có
-                        
-                else:
-                    output = net_connect.send_command(command)
+                # Gửi lệnh một lần; NTC -> template tùy chỉnh -> output thô được thử cục bộ
+                sent = send_and_parse(
+                    net_connect, device_type, command,
+                    use_textfsm=use_textfsm,
+                    read_timeout=(timeout + 30) if use_textfsm else timeout, # Tăng timeout riêng cho parsing
+                )
+                parsed_output = sent["parsed_output"]
+                # Coi parsed_output là output chính nếu có, ngược lại dùng output thô
+                output = parsed_output if parsed_output is not None else sent["raw_output"]
+                parser_used = sent["parser"]
+                timings.update(sent["timings"])
                 success = True
 
+            elif action_type == "cli_commands":
+                # Nhiều lệnh trên cùng một phiên: chỉ login/tắt paging/enable một lần
+                if not commands:
+                    raise ValueError("commands là bắt buộc cho cli_commands.")
+                command_results = run_commands_in_session(net_connect, commands, use_textfsm=use_textfsm, timeout=timeout, device_type=device_type)
+                failed = [cmd for cmd, res in command_results.items() if not res["success"]]
+                success = not failed
+                if failed:
+                    error_message = f"{len(failed)}/{len(commands)} lệnh thất bại: {', '.join(failed)}"
+
             elif action_type == "get_log_file":
                 # Tải file log
                 if not remote_file_path or not local_save_path:
                     raise ValueError("remote_file_path và local_save_path là bắt buộc cho get_log_file.")
 
-                # Netmiko sẽ cố gắng sử dụng SCP/SFTP.
-                # transfer_result là một dictionary chứa thông tin về việc truyền file
-                transfer_result = net_connect.send_transfer_file(
-                    source_file=remote_file_path,
-                    dest_file=local_save_path,
-                    direction="get"
+                # Stream qua SFTP trên chính phiên SSH này (resume/nén/giới hạn băng thông), fallback SCP
+                transfer_result = download_file(
+                    net_connect, remote_file_path, local_save_path,
+                    buffer_size=buffer_size,
+                    resume=resume,
+                    compress=compress,
+                    rate_limiter=rate_limiter,
                 )
+                timings["transfer_s"] = transfer_result["duration_s"]
 
-                if transfer_result.get("file_exists", False) and transfer_result.get("file_size", 0) > 0:
-                    output = f"File {remote_file_path} đã được tải thành công về {local_save_path}. Kích thước: {transfer_result.get('file_size', 0)} bytes."
+                if transfer_result["bytes"] > 0:
+                    output = f"File {remote_file_path} đã được tải thành công về {transfer_result['local_path']}. Kích thước: {transfer_result['bytes']} bytes."
+                    if transfer_result["resumed_from"]:
+                        output += f" (tiếp tục từ byte {transfer_result['resumed_from']})"
+                    parsed_output = transfer_result
                     success = True
                 else:
                     output = f"Không thể tải file {remote_file_path}. Chi tiết: {transfer_result}"
                     success = False
                     error_message = "Lỗi tải file."
+            elif action_type == "tail_log_file":
+                # Chỉ đọc phần log mới kể từ offset đã lưu (đọc lại từ đầu nếu file bị rotate)
+                if not remote_file_path or not local_save_path:
+                    raise ValueError("remote_file_path và local_save_path là bắt buộc cho tail_log_file.")
+
+                sftp = open_sftp(net_connect)
+                try:
+                    tail_result = sftp_tail(
+                        sftp, host, remote_file_path, local_save_path,
+                        db_path=state_db,
+                        buffer_size=buffer_size,
+                        rate_limiter=rate_limiter,
+                        append=append,
+                    )
+                finally:
+                    sftp.close()
+                timings["transfer_s"] = tail_result["duration_s"]
+                output = (f"Đã đọc {tail_result['bytes']} bytes mới của {remote_file_path} "
+                          f"(offset {tail_result['from_offset']} -> {tail_result['to_offset']}, chế độ {tail_result['mode']}) "
+                          f"vào {local_save_path}.")
+                parsed_output = tail_result
+                success = True
+
             else:
                 error_message = f"Loại hành động '{action_type}' không được hỗ trợ."
 
@@ -108,74 +240,137 @@ def execute_network_action(device_type, host, username, password, action_type, c
     except NetmikoTimeoutException:
         error_message = "Lỗi timeout: Không thể kết nối hoặc thiết bị không phản hồi trong thời gian chờ."
     except ReadTimeout as e:
-        # Lỗi này thường xảy ra khi Netmiko.send_command(use_textfsm=True) không tìm thấy template
-        # hoặc output không khớp với template.
-        error_message = f"Lỗi phân tích TextFSM: {e}. (Có thể không tìm thấy template hoặc output không khớp)."
-        success = True # Coi là thành công về mặt kết nối, lỗi là do parsing
-        # Cố gắng lấy output thô nếu có thể, mặc dù có thể không hoàn chỉnh
-        if net_connect:
-            output = net_connect.send_command(command, use_textfsm=False)
-        else:
-            output = "Kết nối không thành công để lấy output thô."
+        # Lệnh không trả về prompt trong read_timeout; không gửi lại lệnh (tránh nhân đôi tải cho lệnh chậm)
+        error_message = f"Lỗi timeout khi đọc output lệnh: {e}"
     except NetmikoBaseException as e: # Bắt các lỗi ValueError do Netmiko ném ra
         error_message = f"Lỗi Netmiko cấu hình/giá trị: {e}"
     except ValueError as e: # Lỗi Python do tham số thiếu (nếu raise từ hàm này)
         error_message = f"Lỗi tham số: {e}"
     except Exception as e:
         error_message = f"Đã xảy ra lỗi không mong muốn: {e}"
-    finally:
-        # Đảm bảo kết nối được đóng, ngay cả khi có lỗi
-        if net_connect:
-            try:
-                net_connect.disconnect()
-            except Exception as e:
-                print(f"Lỗi khi đóng kết nối Netmiko: {e}", file=sys.stderr)
 
 
-    return {
+    result = {
         "success": success,
         "output": output if output is not None else "", # Đảm bảo luôn trả về chuỗi hoặc rỗng
         "parsed_output": parsed_output, # Sẽ là None nếu không parse được
         "error": error_message
     }
+    if action_type == "cli_command":
+        result["parser"] = parser_used # 'ntc' | 'custom' | 'raw'
+    timings["total_s"] = round(time.perf_counter() - action_start, 4)
+    result["timings"] = timings # Thời gian từng bước (connect, send, parse_*) tính bằng giây
+    if action_type == "cli_commands":
+        result["results"] = command_results or {}
+    return result
 
-if __name__ == "__main__":
+def main():
     parser = argparse.ArgumentParser(description="Ứng dụng Python Netmiko để chạy lệnh hoặc tải file trên thiết bị mạng.")
-    parser.add_argument('--device-type', type=str, required=True, help='Kiểu thiết bị Netmiko (ví dụ: juniper_junos, cisco_ios).')
-    parser.add_argument('--host', type=str, required=True, help='Địa chỉ IP hoặc hostname của thiết bị.')
-    parser.add_argument('--username', type=str, required=True, help='Tên người dùng SSH.')
-    parser.add_argument('--password', type=str, required=True, help='Mật khẩu SSH.')
+    parser.add_argument('--device-type', type=str, default=None, help='Kiểu thiết bị Netmiko (ví dụ: juniper_junos, cisco_ios) (bắt buộc nếu không dùng --device).')
+    parser.add_argument('--host', type=str, default=None, help='Địa chỉ IP hoặc hostname của thiết bị (bắt buộc nếu không dùng --device).')
+    parser.add_argument('--username', type=str, default=None, help='Tên người dùng SSH (bắt buộc nếu không dùng --device).')
+    parser.add_argument('--password', type=str, default=None, help='Mật khẩu SSH (bắt buộc nếu không dùng --device).')
     parser.add_argument('--secret', type=str, default=None, help='Mật khẩu enable mode (nếu cần).')
-    parser.add_argument('--port', type=int, default=22, help='Cổng SSH (mặc định: 22).')
+    parser.add_argument('--port', type=int, default=None, help='Cổng SSH (mặc định: 22).')
+    parser.add_argument('--device', type=str, default=None, help='Tên thiết bị trong inventory (thay cho --device-type/--host/--username/--password).')
+    parser.add_argument('--inventory', type=str, default=None, help='File inventory CSV/JSON/YAML cho --device (mặc định: biến môi trường N8N_SCRIPTS_INVENTORY).')
     parser.add_argument('--timeout', type=int, default=60, help='Thời gian chờ kết nối và thực thi lệnh (mặc định: 60 giây).')
     
-    parser.add_argument('--action-type', type=str, required=True, choices=['cli_command', 'get_log_file'], help='Loại hành động cần thực hiện.')
+    parser.add_argument('--action-type', type=str, required=True, choices=['cli_command', 'cli_commands', 'get_log_file', 'tail_log_file'], help='Loại hành động cần thực hiện.')
     
     parser.add_argument('--command', type=str, default=None, help='Câu lệnh CLI cần thực hiện (nếu action-type là cli_command).')
+    parser.add_argument('--commands', type=str, nargs='+', default=None, help='Danh sách lệnh CLI chạy trên cùng một phiên SSH (nếu action-type là cli_commands).')
     parser.add_argument('--use-textfsm', action='store_true', help='Set to true để parse output bằng TextFSM/NTC-Templates (nếu action-type là cli_command).')
 
     parser.add_argument('--remote-file-path', type=str, default=None, help='Đường dẫn file trên thiết bị từ xa (nếu action-type là get_log_file).')
     parser.add_argument('--local-save-path', type=str, default=None, help='Đường dẫn cục bộ để lưu file (nếu action-type là get_log_file).')
+    parser.add_argument('--buffer-size', type=int, default=None, help='Kích thước khối đọc khi tải file (bytes, mặc định: 32768).')
+    parser.add_argument('--no-resume', action='store_true', help='Không tiếp tục từ file .part còn dở, tải lại từ đầu.')
+    parser.add_argument('--compress', action='store_true', help='Nén gzip file log trong lúc tải (thêm đuôi .gz).')
+    parser.add_argument('--bandwidth-limit', type=float, default=None, help='Giới hạn băng thông tải file (KB/s).')
+    parser.add_argument('--state-db', type=str, default=None, help='File SQLite trạng thái: offset log cho tail_log_file, snapshot cho --delta (mặc định: scripts/state/state.sqlite3).')
+    parser.add_argument('--append', action='store_true', help='tail_log_file: nối phần log mới vào file cục bộ thay vì ghi đè.')
+    parser.add_argument('--backend', type=str, default='netmiko', choices=['netmiko', 'asyncssh'], help='Thư viện SSH: netmiko (mặc định) hoặc asyncssh (chỉ lệnh show, juniper_junos/cisco_ios/nokia_sros).')
+    parser.add_argument('--store', action='store_true', help='Lưu các dòng TextFSM đã parse vào kho kết quả (xem poll_history.py).')
+    parser.add_argument('--store-db', type=str, default=None, help='File SQLite của kho kết quả (mặc định: scripts/state/results.sqlite3).')
+    parser.add_argument('--delta', action='store_true', help='Chỉ trả về các dòng TextFSM thêm/mất/thay đổi so với lần poll trước (thay cho parsed_output).')
+    parser.add_argument('--delta-key', type=str, action='append', default=None, help='Trường định danh dòng cho --delta, ví dụ Interface (lặp lại được; mặc định: tự chọn).')
+    parser.add_argument('--delta-ignore', type=str, action='append', default=[], help='Trường bỏ qua khi so sánh --delta (lặp lại được).')
 
     args = parser.parse_args()
 
+    if args.device:
+        # Tham số kết nối + thông tin đăng nhập lấy từ inventory; tham số dòng lệnh được ưu tiên
+        from libs.inventory import device_params, DEFAULT_INVENTORY
+
+        try:
+            params = device_params(args.device, args.inventory or DEFAULT_INVENTORY)
+        except (OSError, ValueError) as e:
+            print(json.dumps({"success": False, "output": "", "parsed_output": None, "error": f"Lỗi inventory: {e}"}, indent=2))
+            sys.exit(1)
+        for name in ('device_type', 'host', 'username', 'password', 'secret', 'port'):
+            if getattr(args, name) is None:
+                setattr(args, name, params[name])
+    missing = [flag for flag, value in (('--device-type', args.device_type), ('--host', args.host),
+                                        ('--username', args.username), ('--password', args.password)) if not value]
+    if missing:
+        parser.error(f"Thiếu {', '.join(missing)} (hoặc dùng --device với inventory).")
+
+    rate_limiter = None
+    if args.bandwidth_limit:
+        from libs.file_transfer import RateLimiter
+        rate_limiter = RateLimiter(args.bandwidth_limit * 1024)
+
     result = execute_network_action( # Đổi tên hàm
         device_type=args.device_type,
         host=args.host,
         username=args.username,
         password=args.password,
         secret=args.secret,
-        port=args.port,
+        port=args.port or 22,
         timeout=args.timeout,
         action_type=args.action_type,
         command=args.command,
+        commands=args.commands,
         use_textfsm=args.use_textfsm,
         remote_file_path=args.remote_file_path,
-        local_save_path=args.local_save_path
+        local_save_path=args.local_save_path,
+        buffer_size=args.buffer_size,
+        resume=not args.no_resume,
+        compress=args.compress,
+        rate_limiter=rate_limiter,
+        state_db=args.state_db,
+        append=args.append,
+        backend=args.backend,
     )
 
+    if args.store:
+        # Lưu lịch sử để dashboard đọc lại mà không cần poll thiết bị
+        from libs.result_store import ResultStore
+        try:
+            result['stored_rows'] = ResultStore(args.store_db).append_action_result(
+                args.host, args.device_type, result, command=args.command
+            )
+        except Exception as e:
+            result['store_error'] = f"Lỗi ghi kho kết quả: {e}"
+
+    if args.delta:
+        from libs.delta_tracker import DeltaTracker
+        try:
+            DeltaTracker(args.state_db).apply_to_result(
+                args.host, result, command=args.command,
+                key_fields=args.delta_key, ignore_fields=args.delta_ignore,
+            )
+        except Exception as e:
+            result['delta_error'] = f"Lỗi tính delta: {e}"
+
+    metrics.emit_run_summary("netmiko_exec", result)
     print(json.dumps(result, indent=2))
 
     # Thoát với mã lỗi khác 0 nếu hành động thất bại
     if not result.get('success'):
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    run_main(main)
@@ -0,0 +1,472 @@
+"""
+Chạy lệnh trên nhiều thiết bị mạng song song (fleet runner) dựa trên netmiko_exec.execute_network_action.
+
+Thay vì n8n sinh một tiến trình cho mỗi router, script này đọc file inventory (CSV/JSON/YAML),
+chạy bộ lệnh trên toàn bộ thiết bị bằng thread pool giới hạn, và in kết quả của từng
+thiết bị dưới dạng một dòng JSON (NDJSON) ngay khi thiết bị đó hoàn tất.
+
+Inventory (CSV, JSON list hoặc YAML có nhóm; xem libs/inventory.py) gồm các cột:
+    host (bắt buộc), device_type (bắt buộc), name, port, credentials, group
+Cột 'credentials' là tên tham chiếu tới bộ thông tin đăng nhập trong biến môi trường:
+    NETMIKO_CRED_<REF>_USERNAME, NETMIKO_CRED_<REF>_PASSWORD, NETMIKO_CRED_<REF>_SECRET
+Nếu không có tham chiếu, dùng NETMIKO_USERNAME / NETMIKO_PASSWORD / NETMIKO_SECRET.
+Không có biến môi trường thì lấy từ file mã hóa (N8N_SCRIPTS_CREDENTIALS_FILE, tạo bằng
+inventory_tool.py). Chỉ chạy một phần inventory bằng --group / --device.
+
+Chế độ thu thập file (--remote-file-path): tải cùng một file log từ mọi thiết bị song song
+qua SFTP (resume/nén), lưu vào --local-dir/<name>__<tên file>, với giới hạn băng thông tổng
+(--bandwidth-limit) và theo từng thiết bị (--device-bandwidth-limit). Thêm --tail để chỉ
+lấy phần log mới kể từ lần chạy trước (offset theo thiết bị lưu trong SQLite).
+
+Backend asyncssh (--backend asyncssh): chỉ lệnh show trên juniper_junos / cisco_ios / nokia_sros,
+mọi thiết bị chạy trong một event loop nên --workers có thể lên tới hàng trăm phiên đồng thời.
+
+Ví dụ:
+    python netmiko_fleet.py --inventory routers.csv --command "show system alarms" \\
+        --command "show interfaces diagnostics optics" --use-textfsm --workers 30 \\
+        --device-timeout 90 --deadline 900
+    python netmiko_fleet.py --inventory routers.csv --remote-file-path /var/log/messages \\
+        --local-dir logs/ --compress --workers 10 --bandwidth-limit 20480
+    python netmiko_fleet.py --inventory routers.csv --backend asyncssh --workers 300 \\
+        --command "show system alarms" --use-textfsm
+    python netmiko_fleet.py --inventory routers.yaml --group core --command "show system alarms"
+"""
+import sys
+import os
+import json
+import time
+import argparse
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Any, Optional
+
+from netmiko_exec import execute_network_action
+from libs.file_transfer import RateLimiter, DEFAULT_BUFFER_SIZE
+from libs.result_store import ResultStore
+from libs.delta_tracker import DeltaTracker
+from libs.inventory import load_inventory, resolve_credentials, DEFAULT_INVENTORY
+from libs import instrumentation as metrics
+from libs.cli_bootstrap import run_main, hard_exit
+
+# -----------------------------
+# 1. Thực thi trên một thiết bị
+# -----------------------------
+
+class CancelToken:
+    """
+    Cờ hủy của một thiết bị: fleet đặt cờ khi báo timeout. Thread của thiết bị kiểm tra cờ một lần
+    rồi ghi kho + delta trong cùng `lock`, nên kết quả đến muộn được ghi đủ cả hai hoặc không ghi gì.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._cancelled = False
+
+    def set(self):
+        # Chờ thread đang ghi (nếu có) xong: sau set() không còn lần ghi nào bắt đầu
+        with self.lock:
+            self._cancelled = True
+
+    def is_set(self) -> bool:
+        return self._cancelled
+
+
+def _device_record(device: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'name': device['name'],
+        'host': device['host'],
+        'device_type': device['device_type'],
+        'success': False,
+        'results': {},
+        'error': None,
+    }
+
+
+def run_device(device: Dict[str, Any], commands: List[str], use_textfsm: bool, device_timeout: int,
+               transfer: Optional[Dict[str, Any]] = None, result_store: Optional[ResultStore] = None,
+               delta: Optional[Dict[str, Any]] = None, cancelled: Optional[CancelToken] = None) -> Dict[str, Any]:
+    """
+    Chạy bộ lệnh trên một thiết bị, trả về kết quả theo từng lệnh.
+    Nếu có `transfer` (remote_file_path, local_dir, compress, buffer_size, rate_limiter,
+    device_rate), tải file log thay vì chạy lệnh; kết quả lưu theo đường dẫn file.
+    Nếu có `result_store`, các dòng TextFSM đã parse được lưu vào kho kết quả.
+    Nếu có `delta` (tracker, key_fields, ignore_fields), bảng parse của mỗi lệnh được thay
+    bằng các dòng thêm/mất/thay đổi so với lần poll trước.
+    `cancelled` được đặt khi fleet đã báo timeout cho thiết bị: kết quả đến muộn không được lưu.
+    """
+    start = time.monotonic()
+    record = _device_record(device)
+    try:
+        creds = resolve_credentials(device['credentials'])
+    except ValueError as e:
+        record['error'] = f"Lỗi thông tin đăng nhập: {e}"
+        record['duration_s'] = round(time.monotonic() - start, 3)
+        return record
+
+    if transfer is not None:
+        return _run_device_transfer(device, creds, device_timeout, transfer, record, start)
+
+    # Toàn bộ lệnh chạy trên một phiên SSH duy nhất (login/enable một lần cho mỗi thiết bị)
+    result = execute_network_action(
+        device_type=device['device_type'],
+        host=device['host'],
+        username=creds['username'],
+        password=creds['password'],
+        secret=creds['secret'],
+        port=device['port'],
+        timeout=device_timeout,
+        action_type='cli_commands',
+        commands=commands,
+        use_textfsm=use_textfsm,
+    )
+    return _finish_command_record(record, result, device, commands, start, result_store, delta, cancelled)
+
+
+def _finish_command_record(record: Dict[str, Any], result: Dict[str, Any], device: Dict[str, Any],
+                           commands: List[str], start: float, result_store: Optional[ResultStore] = None,
+                           delta: Optional[Dict[str, Any]] = None,
+                           cancelled: Optional[CancelToken] = None) -> Dict[str, Any]:
+    """Điền kết quả cli_commands vào bản ghi thiết bị (lưu kho / tính delta nếu được yêu cầu)."""
+    record['results'] = result.get('results') or {}
+    with (cancelled.lock if cancelled is not None else contextlib.nullcontext()):
+        if cancelled is not None and cancelled.is_set():
+            # Thiết bị đã được báo timeout: không ghi kho / snapshot delta từ thread bị bỏ lại
+            record['error'] = "Kết quả đến sau timeout, không được lưu."
+            record['duration_s'] = round(time.monotonic() - start, 3)
+            return record
+        _write_command_result(record, result, device, result_store, delta)
+    if not record['results']:
+        # Lỗi kết nối/xác thực: không lệnh nào được chạy
+        record['error'] = result.get('error')
+        record['duration_s'] = round(time.monotonic() - start, 3)
+        return record
+
+    failed = [cmd for cmd, res in record['results'].items() if not res.get('success')]
+    record['success'] = not failed
+    if failed:
+        record['error'] = f"{len(failed)}/{len(commands)} lệnh thất bại."
+    record['duration_s'] = round(time.monotonic() - start, 3)
+    return record
+
+
+def _write_command_result(record: Dict[str, Any], result: Dict[str, Any], device: Dict[str, Any],
+                          result_store: Optional[ResultStore] = None, delta: Optional[Dict[str, Any]] = None):
+    """Ghi kho kết quả và snapshot delta của một thiết bị (lỗi ghi được báo trong bản ghi)."""
+    if result_store is not None and record['results']:
+        try:
+            record['stored_rows'] = result_store.append_action_result(device['host'], device['device_type'], result)
+        except Exception as e:
+            record['store_error'] = f"Lỗi ghi kho kết quả: {e}"
+    if delta is not None and record['results']:
+        try:
+            delta['tracker'].apply_to_result(device['host'], result, key_fields=delta.get('key_fields'),
+                                             ignore_fields=delta.get('ignore_fields') or ())
+        except Exception as e:
+            record['delta_error'] = f"Lỗi tính delta: {e}"
+
+
+def _run_device_transfer(device: Dict[str, Any], creds: Dict[str, Optional[str]], device_timeout: int,
+                         transfer: Dict[str, Any], record: Dict[str, Any], start: float) -> Dict[str, Any]:
+    """Tải file log của một thiết bị (giới hạn băng thông riêng xếp chồng lên giới hạn tổng)."""
+    remote_file_path = transfer['remote_file_path']
+    local_save_path = os.path.join(transfer['local_dir'], f"{device['name']}__{os.path.basename(remote_file_path)}")
+    rate_limiter = transfer.get('rate_limiter')
+    if transfer.get('device_rate'):
+        rate_limiter = RateLimiter(transfer['device_rate'], parent=rate_limiter)
+
+    result = execute_network_action(
+        device_type=device['device_type'],
+        host=device['host'],
+        username=creds['username'],
+        password=creds['password'],
+        secret=creds['secret'],
+        port=device['port'],
+        timeout=device_timeout,
+        action_type='tail_log_file' if transfer.get('tail') else 'get_log_file',
+        remote_file_path=remote_file_path,
+        local_save_path=local_save_path,
+        buffer_size=transfer.get('buffer_size', DEFAULT_BUFFER_SIZE),
+        compress=transfer.get('compress', False),
+        rate_limiter=rate_limiter,
+        state_db=transfer.get('state_db'),
+    )
+    record['results'][remote_file_path] = result
+    record['success'] = bool(result.get('success'))
+    record['error'] = result.get('error')
+    record['duration_s'] = round(time.monotonic() - start, 3)
+    return record
+
+
+def _emit(record: Dict[str, Any], lock: threading.Lock):
+    """In một dòng JSON cho mỗi thiết bị (NDJSON) để n8n đọc dạng stream."""
+    with lock:
+        sys.stdout.write(json.dumps(record, ensure_ascii=False) + "\n")
+        sys.stdout.flush()
+
+
+def _timeout_record(device: Dict[str, Any], message: str, duration: float) -> Dict[str, Any]:
+    return {
+        'name': device['name'],
+        'host': device['host'],
+        'device_type': device['device_type'],
+        'success': False,
+        'results': {},
+        'error': message,
+        'duration_s': round(duration, 3),
+    }
+
+
+# -----------------------------
+# 2. Điều phối toàn bộ fleet
+# -----------------------------
+
+def run_fleet(inventory: List[Dict[str, Any]], commands: List[str], use_textfsm: bool = False,
+              workers: int = 20, device_timeout: int = 60, deadline: Optional[float] = None,
+              transfer: Optional[Dict[str, Any]] = None, device_budget: Optional[float] = None,
+              result_store: Optional[ResultStore] = None, delta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Chạy bộ lệnh trên toàn bộ inventory với thread pool giới hạn.
+
+    Args:
+        inventory: Danh sách thiết bị (kết quả của load_inventory).
+        commands: Danh sách lệnh CLI.
+        use_textfsm: Parse output bằng TextFSM.
+        workers: Số thiết bị chạy đồng thời tối đa.
+        device_timeout: Timeout cho mỗi thiết bị (giây); thiết bị chạy quá
+                        device_timeout * (số lệnh + 1) sẽ bị đánh dấu timeout.
+        deadline: Thời hạn toàn cục (giây) cho cả fleet; None = không giới hạn.
+        transfer: Cấu hình tải file (xem run_device); None = chạy lệnh.
+        result_store: Kho lưu các dòng TextFSM đã parse (None = không lưu).
+        delta: Cấu hình chế độ delta (xem run_device); None = trả về cả bảng.
+        device_budget: Ghi đè thời gian tối đa cho mỗi thiết bị (giây). Ở chế độ tải file,
+                       None nghĩa là không giới hạn theo thiết bị (chỉ dùng deadline).
+
+    Returns:
+        dict: Tóm tắt (total, success, failed, timed_out, abandoned).
+    """
+    emit_lock = threading.Lock()
+    started_at: Dict[Any, float] = {}
+    # Cờ hủy theo thiết bị: đặt khi thiết bị bị báo timeout để thread còn chạy không ghi kết quả muộn
+    cancelled: Dict[Any, CancelToken] = {id(device): CancelToken() for device in inventory}
+    fleet_start = time.monotonic()
+    if device_budget is None and transfer is None:
+        # Mỗi lệnh có thể dùng tới device_timeout, cộng thêm một lần cho việc kết nối
+        device_budget = device_timeout * (len(commands) + 1)
+    summary = {'total': len(inventory), 'success': 0, 'failed': 0, 'timed_out': 0, 'abandoned': 0}
+
+    def task(device):
+        started_at[id(device)] = time.monotonic()
+        return run_device(device, commands, use_textfsm, device_timeout, transfer=transfer,
+                          result_store=result_store, delta=delta, cancelled=cancelled[id(device)])
+
+    executor = ThreadPoolExecutor(max_workers=max(1, workers))
+    futures = {executor.submit(task, device): device for device in inventory}
+    pending = set(futures)
+
+    while pending:
+        now = time.monotonic()
+        if deadline is not None and now - fleet_start >= deadline:
+            # Hết thời hạn toàn cục: hủy các thiết bị chưa bắt đầu, bỏ các thiết bị đang chạy
+            for future in pending:
+                device = futures[future]
+                cancelled[id(device)].set()
+                future.cancel()
+                _emit(_timeout_record(device, f"Vượt thời hạn toàn cục {deadline}s.", now - started_at.get(id(device), now)), emit_lock)
+                summary['timed_out'] += 1
+            summary['abandoned'] += sum(1 for f in pending if f.running())
+            pending = set()
+            break
+
+        wait_for = 1.0 if deadline is None else min(1.0, max(0.0, deadline - (now - fleet_start)))
+        done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+        for future in done:
+            device = futures[future]
+            try:
+                record = future.result()
+            except Exception as e:
+                record = _timeout_record(device, f"Đã xảy ra lỗi không mong muốn: {e}", 0.0)
+            _emit(record, emit_lock)
+            summary['success' if record['success'] else 'failed'] += 1
+
+        # Timeout theo từng thiết bị (tính từ lúc thiết bị bắt đầu chạy)
+        now = time.monotonic()
+        for future in list(pending):
+            device = futures[future]
+            started = started_at.get(id(device))
+            if device_budget is not None and started is not None and future.running() and now - started > device_budget:
+                cancelled[id(device)].set()
+                _emit(_timeout_record(device, f"Vượt timeout thiết bị {device_budget}s.", now - started), emit_lock)
+                summary['timed_out'] += 1
+                summary['abandoned'] += 1
+                pending.discard(future)
+
+    executor.shutdown(wait=False, cancel_futures=True)
+    summary['duration_s'] = round(time.monotonic() - fleet_start, 3)
+    return summary
+
+
+def run_fleet_asyncssh(inventory: List[Dict[str, Any]], commands: List[str], use_textfsm: bool = False,
+                       workers: int = 200, device_timeout: int = 60, deadline: Optional[float] = None,
+                       result_store: Optional[ResultStore] = None, delta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Như run_fleet nhưng dùng backend asyncssh: mọi thiết bị chạy trong một event loop
+    (hàng trăm phiên đồng thời), chỉ lệnh show trên juniper_junos / cisco_ios / nokia_sros.
+    Bản ghi NDJSON và tóm tắt có cùng định dạng với run_fleet.
+    """
+    from libs.asyncssh_backend import run_many
+
+    emit_lock = threading.Lock()
+    fleet_start = time.monotonic()
+    summary = {'total': len(inventory), 'success': 0, 'failed': 0, 'timed_out': 0, 'abandoned': 0}
+
+    jobs = []
+    for index, device in enumerate(inventory):
+        try:
+            creds = resolve_credentials(device['credentials'])
+        except ValueError as e:
+            record = dict(_device_record(device), error=f"Lỗi thông tin đăng nhập: {e}", duration_s=0.0)
+            _emit(record, emit_lock)
+            summary['failed'] += 1
+            continue
+        jobs.append((index, {
+            'device_type': device['device_type'],
+            'host': device['host'],
+            'username': creds['username'],
+            'password': creds['password'],
+            'secret': creds['secret'],
+            'port': device['port'],
+            'timeout': device_timeout,
+            'action_type': 'cli_commands',
+            'commands': commands,
+            'use_textfsm': use_textfsm,
+        }))
+
+    # Ghi kho / delta (SQLite, đồng bộ) chạy trên một thread ghi riêng để không chặn event loop
+    # đang giữ hàng trăm phiên SSH; một thread nên các lần ghi SQLite không tranh khóa nhau
+    writer = ThreadPoolExecutor(max_workers=1) if (result_store is not None or delta is not None) else None
+
+    def finish(device, result, start):
+        try:
+            record = _finish_command_record(_device_record(device), result, device, commands, start, result_store, delta)
+        except Exception as e:
+            record = _timeout_record(device, f"Đã xảy ra lỗi không mong muốn: {e}", time.monotonic() - start)
+        _emit(record, emit_lock)
+        summary['success' if record['success'] else 'failed'] += 1
+
+    def on_result(index, result, timeout_message, duration):
+        device = inventory[index]
+        if result is None:
+            _emit(_timeout_record(device, timeout_message, duration), emit_lock)
+            summary['timed_out'] += 1
+            return
+        if writer is None:
+            finish(device, result, time.monotonic() - duration)
+        else:
+            writer.submit(finish, device, result, time.monotonic() - duration)
+
+    try:
+        run_many(jobs, concurrency=workers, job_timeout=device_timeout * (len(commands) + 1),
+                 deadline=deadline, on_result=on_result)
+    finally:
+        if writer is not None:
+            # Chờ các bản ghi đã nhận được ghi + in xong trước khi in tóm tắt
+            writer.shutdown(wait=True)
+    summary['duration_s'] = round(time.monotonic() - fleet_start, 3)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chạy lệnh Netmiko trên nhiều thiết bị song song, in kết quả từng thiết bị dạng NDJSON.")
+    parser.add_argument('--inventory', type=str, default=DEFAULT_INVENTORY, help='File inventory CSV/JSON/YAML (mặc định: biến môi trường N8N_SCRIPTS_INVENTORY).')
+    parser.add_argument('--group', type=str, action='append', default=None, help='Chỉ chạy các thiết bị thuộc nhóm này (lặp lại được).')
+    parser.add_argument('--device', type=str, action='append', default=None, help='Chỉ chạy thiết bị có tên này (lặp lại được).')
+    parser.add_argument('--command', type=str, action='append', default=None, help='Lệnh CLI (lặp lại để chạy nhiều lệnh).')
+    parser.add_argument('--use-textfsm', action='store_true', help='Parse output bằng TextFSM/NTC-Templates.')
+    parser.add_argument('--workers', type=int, default=20, help='Số thiết bị chạy đồng thời tối đa (mặc định: 20).')
+    parser.add_argument('--device-timeout', type=int, default=60, help='Timeout kết nối/lệnh cho mỗi thiết bị (giây, mặc định: 60).')
+    parser.add_argument('--deadline', type=float, default=None, help='Thời hạn toàn cục cho cả fleet (giây).')
+    parser.add_argument('--backend', type=str, default='netmiko', choices=['netmiko', 'asyncssh'], help='Thư viện SSH: netmiko (thread pool) hoặc asyncssh (một event loop, chỉ lệnh show; --workers là số phiên đồng thời).')
+    parser.add_argument('--store', action='store_true', help='Lưu các dòng TextFSM đã parse vào kho kết quả (xem poll_history.py).')
+    parser.add_argument('--store-db', type=str, default=None, help='File SQLite của kho kết quả (mặc định: scripts/state/results.sqlite3).')
+    parser.add_argument('--delta', action='store_true', help='Chỉ trả về các dòng TextFSM thêm/mất/thay đổi so với lần poll trước.')
+    parser.add_argument('--delta-key', type=str, action='append', default=None, help='Trường định danh dòng cho --delta (lặp lại được; mặc định: tự chọn).')
+    parser.add_argument('--delta-ignore', type=str, action='append', default=[], help='Trường bỏ qua khi so sánh --delta (lặp lại được).')
+    parser.add_argument('--remote-file-path', type=str, default=None, help='Tải file này từ mọi thiết bị thay vì chạy lệnh.')
+    parser.add_argument('--local-dir', type=str, default='.', help='Thư mục lưu file tải về (mặc định: thư mục hiện tại).')
+    parser.add_argument('--compress', action='store_true', help='Nén gzip file tải về trong lúc ghi.')
+    parser.add_argument('--buffer-size', type=int, default=DEFAULT_BUFFER_SIZE, help=f'Kích thước khối đọc SFTP (bytes, mặc định: {DEFAULT_BUFFER_SIZE}).')
+    parser.add_argument('--bandwidth-limit', type=float, default=None, help='Giới hạn băng thông tổng cho cả fleet (KB/s).')
+    parser.add_argument('--device-bandwidth-limit', type=float, default=None, help='Giới hạn băng thông cho mỗi thiết bị (KB/s).')
+    parser.add_argument('--tail', action='store_true', help='Chỉ tải phần log mới kể từ lần chạy trước (offset lưu trong SQLite).')
+    parser.add_argument('--state-db', type=str, default=None, help='File SQLite trạng thái: offset log cho --tail, snapshot cho --delta.')
+    parser.add_argument('--transfer-timeout', type=float, default=None, help='Thời gian tối đa tải file cho mỗi thiết bị (giây, mặc định: không giới hạn).')
+    args = parser.parse_args()
+    if not args.command and not args.remote_file_path:
+        parser.error("Cần --command hoặc --remote-file-path.")
+    if not args.inventory:
+        parser.error("Cần --inventory (hoặc biến môi trường N8N_SCRIPTS_INVENTORY).")
+
+    try:
+        inventory = load_inventory(args.inventory, groups=args.group, names=args.device)
+    except (OSError, ValueError) as e:
+        print(json.dumps({"summary": {"status": "error", "message": f"Lỗi đọc inventory: {e}"}}, ensure_ascii=False))
+        sys.exit(1)
+
+    transfer = None
+    if args.remote_file_path:
+        transfer = {
+            'remote_file_path': args.remote_file_path,
+            'local_dir': args.local_dir,
+            'compress': args.compress,
+            'buffer_size': args.buffer_size,
+            'rate_limiter': RateLimiter(args.bandwidth_limit * 1024) if args.bandwidth_limit else None,
+            'device_rate': args.device_bandwidth_limit * 1024 if args.device_bandwidth_limit else None,
+            'tail': args.tail,
+            'state_db': args.state_db,
+        }
+
+    result_store = ResultStore(args.store_db) if args.store else None
+    delta = {'tracker': DeltaTracker(args.state_db), 'key_fields': args.delta_key,
+             'ignore_fields': args.delta_ignore} if args.delta else None
+
+    if args.backend == 'asyncssh':
+        if transfer is not None:
+            parser.error("--backend asyncssh chỉ hỗ trợ chạy lệnh show, không hỗ trợ tải file.")
+        summary = run_fleet_asyncssh(
+            inventory, args.command,
+            use_textfsm=args.use_textfsm,
+            workers=args.workers,
+            device_timeout=args.device_timeout,
+            deadline=args.deadline,
+            result_store=result_store,
+            delta=delta,
+        )
+    else:
+        summary = run_fleet(
+            inventory, args.command or [],
+            use_textfsm=args.use_textfsm,
+            workers=args.workers,
+            device_timeout=args.device_timeout,
+            deadline=args.deadline,
+            transfer=transfer,
+            device_budget=args.transfer_timeout if transfer else None,
+            result_store=result_store,
+            delta=delta,
+        )
+    summary['status'] = 'success' if summary['failed'] == 0 and summary['timed_out'] == 0 else 'error'
+    metrics.emit_run_summary("netmiko_fleet", summary)
+    print(json.dumps({"summary": summary}, ensure_ascii=False))
+    sys.stdout.flush()
+
+    exit_code = 0 if summary['status'] == 'success' else 1
+    if summary['abandoned']:
+        # Các thread Netmiko bị bỏ lại không thể dừng từ bên ngoài; thoát ngay thay vì chờ chúng
+        # (metric đã được emit ở trên, hard_exit ghi nốt profile nếu đang bật).
+        hard_exit(exit_code)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    run_main(main)
@@ -1,75 +1,84 @@
-import os
-import textfsm
-from netmiko import ConnectHandler
-from netmiko.exceptions import ReadTimeout
+import time
 import logging
+from libs.connection_pool import discard_on_release
+from libs.timing_profiles import tuned_connection
+from libs.textfsm_registry import get_registry
+from libs.cli_parsing import send_and_parse, PARSER_NTC, PARSER_CUSTOM
+# textfsm và netmiko được import trong hàm sử dụng (import trì hoãn)
 
 # Cấu hình logging thay vì dùng print
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 def get_custom_template(device_type, command):
-    """Tìm template tùy chỉnh dựa trên vị trí của file script này."""
-    # Normalize tên lệnh
-    command_norm = command.lower().strip().replace(" ", "_").replace("/", "_")
-    template_name = f"{device_type}_{command_norm}.textfsm"
-    
-    # Xây dựng đường dẫn tuyệt đối đến thư mục 'templates' cùng cấp với script này
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    template_dir = os.path.join(script_dir, "templates")
-    full_path = os.path.join(template_dir, template_name)
-    
-    logging.info(f"🔍 Tìm kiếm template tùy chỉnh: {full_path}")
-    return full_path if os.path.exists(full_path) else None
+    """Tìm template tùy chỉnh (templates/ hoặc index của textfsm_template/) qua registry đã quét sẵn."""
+    template_path = get_registry().find(device_type, command)
+    logging.info(f"🔍 Template tùy chỉnh cho '{command}' ({device_type}): {template_path or 'không có'}")
+    return template_path
 
 def parse_custom_template(output, template_path):
-    """Phân tích output với một template TextFSM cụ thể."""
-    with open(template_path) as template_file:
-        fsm = textfsm.TextFSM(template_file)
-        return fsm.ParseTextToDicts(output)
+    """Phân tích output với một template TextFSM cụ thể (FSM đã compile được cache, mỗi lần parse dùng bản sao)."""
+    return get_registry().parse_file(template_path, output)
 
-def smart_send_command(device, command, prefer_custom=False):
+def _send_on_connection(conn, device_type, command, prefer_custom=False, details=None):
+    """
+    Gửi một lệnh trên kết nối Netmiko đã mở và trả về kết quả theo thứ tự ưu tiên template.
+    Lệnh chỉ được gửi một lần; NTC / template tùy chỉnh / output thô được thử cục bộ trên cùng output.
+    Nếu truyền dict `details`, hàm ghi thêm 'parser' và 'timings' (giây) vào đó.
+    """
+    sent = send_and_parse(conn, device_type, command, use_textfsm=True, prefer_custom=prefer_custom, read_timeout=120)
+    if details is not None:
+        details["parser"] = sent["parser"]
+        details["timings"] = sent["timings"]
+
+    if sent["parser"] == PARSER_NTC:
+        logging.info("✅ Phân tích thành công bằng NTC-Templates.")
+    elif sent["parser"] == PARSER_CUSTOM:
+        logging.info(f"✅ Phân tích thành công bằng template tùy chỉnh: {get_registry().find(device_type, command)}")
+    else:
+        logging.warning("⚠️ Không tìm thấy template NTC hay template tùy chỉnh. Trả về output thô.")
+        return sent["raw_output"]
+    return sent["parsed_output"]
+
+def smart_send_command(device, command, prefer_custom=False, details=None):
     """
     Gửi lệnh tới thiết bị.
     - Nếu prefer_custom=True: Ưu tiên 1 là template tùy chỉnh, 2 là NTC, 3 là raw.
     - Nếu prefer_custom=False (mặc định): Ưu tiên 1 là NTC, 2 là tùy chỉnh, 3 là raw.
+    - details (dict, tùy chọn): nhận 'parser' và 'timings' (connect_s, send_s, parse_*_s).
     """
-    with ConnectHandler(**device) as conn:
-        # LUỒNG 1: Ưu tiên template tùy chỉnh
-        if prefer_custom:
-            template_path = get_custom_template(device['device_type'], command)
-            if template_path:
-                logging.info(f"✅ Ưu tiên dùng template tùy chỉnh: {template_path}")
-                raw_output = conn.send_command(command, use_textfsm=False)
-                return parse_custom_template(raw_output, template_path)
-            else:
-                logging.warning("⚠️ Không tìm thấy template tùy chỉnh, fallback về NTC-Templates.")
-                # Nếu không có template tùy chỉnh, chạy logic NTC như bình thường
-                # Netmiko sẽ trả về list nếu parse thành công, hoặc string nếu thất bại
-                return conn.send_command(command, use_textfsm=True, read_timeout=120)
+    start = time.perf_counter()
+    with tuned_connection(device) as conn:
+        connect_s = round(time.perf_counter() - start, 4)
+        result = _send_on_connection(conn, device['device_type'], command, prefer_custom=prefer_custom, details=details)
+    if details is not None:
+        details["timings"] = {"connect_s": connect_s, **details.get("timings", {})}
+    return result
 
-        # LUỒNG 2: Ưu tiên NTC-Templates (mặc định)
-        # 1. Thử dùng NTC-Templates trước
-        try:
-            # Tăng read_timeout để tránh lỗi khi parsing lâu
-            parsed_output = conn.send_command(command, use_textfsm=True, read_timeout=120)
-            # Netmiko trả về list nếu parse thành công, hoặc string nếu không có template
-            if isinstance(parsed_output, list) and parsed_output:
-                logging.info("✅ Phân tích thành công bằng NTC-Templates.")
-                return parsed_output
-            # Nếu trả về string, nó sẽ được xử lý ở dưới như là raw_output
-            raw_output = str(parsed_output)
-
-        except ReadTimeout:
-            # ReadTimeout thường xảy ra khi use_textfsm=True nhưng không có template
-            logging.warning("ReadTimeout khi dùng NTC, có thể do không có template. Lấy output thô.")
-            raw_output = conn.send_command(command, use_textfsm=False)
+def smart_send_commands(device, commands, prefer_custom=False):
+    """
+    Gửi nhiều lệnh tới thiết bị trên cùng một phiên SSH (login/tắt paging một lần).
+    Thứ tự ưu tiên template giống smart_send_command.
 
-        # 2. Nếu NTC không thành công, thử template tùy chỉnh
-        template_path = get_custom_template(device['device_type'], command)
-        if template_path:
-            logging.warning(f"⚠️ NTC template không có hoặc không khớp, dùng template tùy chỉnh: {template_path}")
-            return parse_custom_template(raw_output, template_path)
-        
-        # 3. Nếu cả hai đều không được, trả về output thô
-        logging.warning("⚠️ Không tìm thấy template NTC hay template tùy chỉnh. Trả về output thô.")
-        return raw_output
+    Returns:
+        dict: {command: {"result": list|str|None, "parser": str|None, "timings": dict, "error": str|None}}
+              theo thứ tự lệnh.
+              Sau lệnh lỗi (ví dụ ReadTimeout) kênh còn output dở dang: các lệnh còn lại bị bỏ qua
+              (error "Bỏ qua: ...") và phiên bị hủy khỏi pool; lỗi kết nối được ném ra ngoài.
+    """
+    results = {}
+    with tuned_connection(device) as conn:
+        usable = True
+        for command in commands:
+            details = {"parser": None, "timings": {}}
+            if not usable:
+                results[command] = {"result": None, "error": "Bỏ qua: phiên không còn đồng bộ sau lệnh bị lỗi.", **details}
+                continue
+            try:
+                result = _send_on_connection(conn, device['device_type'], command, prefer_custom=prefer_custom, details=details)
+                results[command] = {"result": result, "error": None, **details}
+            except Exception as e:
+                logging.warning(f"⚠️ Lệnh '{command}' thất bại: {e}")
+                results[command] = {"result": None, "error": str(e), **details}
+                usable = False
+                discard_on_release(conn)
+    return results
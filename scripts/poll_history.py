@@ -0,0 +1,110 @@
+"""
+Truy vấn lịch sử kết quả poll thiết bị đã lưu (libs/result_store.py) cho dashboard n8n,
+không cần poll lại thiết bị.
+
+Ví dụ:
+    # Công suất quang của một cổng trong 7 ngày qua
+    python poll_history.py --command "show interfaces diagnostics optics" --host 10.0.0.1 \\
+        --since 7d --where Interface=xe-0/0/1 --field Interface --field Rx_Power_dBm
+    # Snapshot alarm mới nhất của mọi thiết bị, xuất CSV
+    python poll_history.py --command "show system alarms" --latest --format csv
+    # Thống kê kho / thu gọn (xóa dữ liệu > 90 ngày, giữ 1 snapshot/giờ cho dữ liệu > 7 ngày)
+    python poll_history.py --stats
+    python poll_history.py --compact --retention-days 90 --downsample-after-days 7
+"""
+import sys
+import csv
+import json
+import time
+import argparse
+from datetime import datetime
+from typing import Optional
+
+from libs.result_store import ResultStore
+
+_UNIT_SECONDS = {"m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+
+
+def parse_time(value: Optional[str]) -> Optional[float]:
+    """Nhận '7d', '12h', '30m' (tương đối so với hiện tại), ngày ISO hoặc epoch giây."""
+    if not value:
+        return None
+    value = value.strip()
+    if value[-1:].lower() in _UNIT_SECONDS and value[:-1].replace(".", "", 1).isdigit():
+        return time.time() - float(value[:-1]) * _UNIT_SECONDS[value[-1].lower()]
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Truy vấn lịch sử kết quả poll thiết bị đã lưu (SQLite).")
+    parser.add_argument('--db', type=str, default=None, help='File SQLite kết quả (mặc định: scripts/state/results.sqlite3).')
+    parser.add_argument('--command', type=str, default=None, help='Lọc theo lệnh CLI.')
+    parser.add_argument('--host', type=str, default=None, help='Lọc theo host.')
+    parser.add_argument('--since', type=str, default=None, help="Từ thời điểm (ví dụ: 7d, 12h, 2024-05-01, epoch).")
+    parser.add_argument('--until', type=str, default=None, help='Đến thời điểm (cùng định dạng --since).')
+    parser.add_argument('--field', type=str, action='append', default=None, help='Chỉ lấy trường dữ liệu này (lặp lại được).')
+    parser.add_argument('--where', type=str, action='append', default=None, help='Lọc theo trường dữ liệu: TÊN=GIÁ_TRỊ (lặp lại được).')
+    parser.add_argument('--latest', action='store_true', help='Chỉ lấy snapshot mới nhất của mỗi (host, command).')
+    parser.add_argument('--limit', type=int, default=None, help='Số dòng tối đa.')
+    parser.add_argument('--include-empty', action='store_true', help='Thêm một dòng data=null cho mỗi lần poll có bảng rỗng (alarm đã hết...).')
+    parser.add_argument('--format', type=str, default='json', choices=['json', 'csv'], help='Định dạng đầu ra (mặc định: json).')
+    parser.add_argument('--stats', action='store_true', help='In thống kê kho thay vì truy vấn.')
+    parser.add_argument('--compact', action='store_true', help='Thu gọn kho (dùng với --retention-days / --downsample-after-days).')
+    parser.add_argument('--retention-days', type=float, default=None, help='Xóa dữ liệu cũ hơn số ngày này.')
+    parser.add_argument('--downsample-after-days', type=float, default=None, help='Dữ liệu cũ hơn số ngày này chỉ giữ 1 snapshot mỗi --bucket-hours.')
+    parser.add_argument('--bucket-hours', type=float, default=1.0, help='Độ rộng khoảng downsample (giờ, mặc định: 1).')
+    args = parser.parse_args()
+
+    try:
+        store = ResultStore(args.db)
+        if args.stats:
+            print(json.dumps({"status": "success", "stats": store.stats()}, indent=2, ensure_ascii=False))
+            return
+        if args.compact:
+            result = store.compact(retention_days=args.retention_days,
+                                   downsample_after_days=args.downsample_after_days,
+                                   bucket_s=args.bucket_hours * 3600)
+            print(json.dumps({"status": "success", **result}, indent=2, ensure_ascii=False))
+            return
+
+        where = {}
+        for item in args.where or []:
+            if "=" not in item:
+                raise ValueError(f"--where phải có dạng TÊN=GIÁ_TRỊ: {item}")
+            name, value = item.split("=", 1)
+            where[name.strip()] = value
+        rows = store.query(
+            command=args.command, host=args.host,
+            since=parse_time(args.since), until=parse_time(args.until),
+            fields=args.field, where=where, latest_only=args.latest, limit=args.limit,
+            include_empty=args.include_empty,
+        )
+    except ValueError as e:
+        print(json.dumps({"status": "error", "message": f"Tham số không hợp lệ: {e}"}, ensure_ascii=False))
+        sys.exit(1)
+
+    for row in rows:
+        row["time"] = datetime.fromtimestamp(row["ts"]).isoformat(timespec="seconds")
+
+    if args.format == "csv":
+        # Trường dữ liệu thành cột "data.<tên>" (không lẫn với cột metadata trùng tên)
+        flat_rows = []
+        for row in rows:
+            flat = {k: v for k, v in row.items() if k != "data"}
+            flat.update({f"data.{k}": v for k, v in (row["data"] or {}).items()})
+            flat_rows.append(flat)
+        fieldnames = []
+        for row in flat_rows:
+            fieldnames.extend(k for k in row if k not in fieldnames)
+        writer = csv.DictWriter(sys.stdout, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(flat_rows)
+    else:
+        print(json.dumps({"status": "success", "count": len(rows), "rows": rows}, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
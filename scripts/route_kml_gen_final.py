@@ -1,12 +1,18 @@
-import requests
-import simplekml
 import os
 import sys
 import json
 import time
 import argparse
-import openpyxl
 from collections import deque
+from libs.lazy_import import lazy_module
+
+from libs.result_sink import open_result_sink
+from libs import instrumentation as metrics
+from libs.cli_bootstrap import run_main
+
+# Thư viện nặng chỉ được import thật khi dùng tới (gọi API / tạo KML)
+requests = lazy_module("requests")
+simplekml = lazy_module("simplekml")
 
 # ------------------- Logger -------------------
 def setup_logger(log_file_path):
@@ -81,12 +87,15 @@ def get_osrm_route(osrm_base_url, start_coords, end_coords, profile="car", max_r
 
     for attempt in range(max_retries):
         try:
-            response = requests.get(url, timeout=20)
-            response.raise_for_status()
-            data = response.json()
+            metrics.inc("osrm_requests_total")
+            with metrics.timer("osrm_route_seconds"):
+                response = requests.get(url, timeout=20)
+                response.raise_for_status()
+                data = response.json()
 
             # Kiểm tra OSRM trả về OK
             if data.get("code") != "Ok":
+                metrics.inc("osrm_errors_total")
                 if logger:
                     logger.error(f"OSRM trả về lỗi: {data.get('code')}")
                 return None, None
@@ -120,11 +129,12 @@ def get_osrm_route(osrm_base_url, start_coords, end_coords, profile="car", max_r
             coords = [tuple(pt) for pt in coords_raw]
 
             if logger:
-                logger.info(f"OSRM OK: {start_coords} -> {end_coords} ({distance_km:.2f} km)")
+                logger.debug(f"OSRM OK: {start_coords} -> {end_coords} ({distance_km:.2f} km)")
 
             return coords, distance_km
 
         except requests.exceptions.RequestException as e:
+            metrics.inc("osrm_errors_total")
             if logger:
                 logger.error(f"Lỗi khi gọi OSRM: {e}. Attempt {attempt+1}/{max_retries}")
             time.sleep(1)
@@ -151,9 +161,11 @@ def get_ors_route(api_key, start_coords, end_coords, profile="driving-car", max_
             url = f"https://api.openrouteservice.org/v2/directions/{profile}/geojson"
             headers = {'Authorization': api_key, 'Content-Type': 'application/json'}
             body = {"coordinates": [list(start_coords), list(end_coords)]}
-            response = requests.post(url, json=body, headers=headers, timeout=30)
-            response.raise_for_status()
-            data = response.json()
+            metrics.inc("ors_requests_total")
+            with metrics.timer("ors_route_seconds"):
+                response = requests.post(url, json=body, headers=headers, timeout=30)
+                response.raise_for_status()
+                data = response.json()
 
             features = data.get('features')
             if not features or len(features) == 0:
@@ -180,10 +192,11 @@ def get_ors_route(api_key, start_coords, end_coords, profile="driving-car", max_
             coords = [tuple(pt) for pt in coords_raw]
             distance_km = distance / 1000.0
             if logger:
-                logger.info(f"API OK: {start_coords} -> {end_coords} ({distance_km:.2f} km)")
+                logger.debug(f"API OK: {start_coords} -> {end_coords} ({distance_km:.2f} km)")
             return coords, distance_km
 
         except requests.exceptions.HTTPError as e:
+            metrics.inc("ors_errors_total")
             status = None
             try:
                 status = e.response.status_code
@@ -200,10 +213,12 @@ def get_ors_route(api_key, start_coords, end_coords, profile="driving-car", max_
                     logger.error(f"HTTP Error {status}: {e}")
                 return None, None
         except requests.exceptions.Timeout:
+            metrics.inc("ors_errors_total")
             if logger:
                 logger.error("ORS API timeout.")
             return None, None
         except requests.exceptions.RequestException as e:
+            metrics.inc("ors_errors_total")
             if logger:
                 logger.error(f"Lỗi RequestException từ ORS: {e}")
             return None, None
@@ -251,27 +266,23 @@ def create_kml(all_routes_data, main_folder_name="Các Tuyến Đường", logge
         return None
 
 # ------------------- Excel -------------------
-def create_excel(original_data, processed_data, output_file, logger=None):
+def create_excel(original_data, processed_data, output_file, logger=None, parquet_file=None):
     try:
-        workbook = openpyxl.Workbook()
-        sheet = workbook.active
-        sheet.title = "Kết quả Tuyến Đường"
         headers = list(original_data[0].keys()) if original_data else ["LineName","Latitude1","Longitude1","Latitude2","Longitude2","FolderName"]
-        sheet.append(headers + ["Distance (km)", "Status"])
         # map processed by LineName (cẩn trọng nếu trùng tên - ở dataset lớn có thể cần key khác)
         processed_map = {item.get('LineName'): item for item in processed_data if item.get('LineName')}
-        for row in original_data:
-            line_name = row.get('LineName')
-            processed = processed_map.get(line_name, {})
-            excel_row = [row.get(h, '') for h in headers]
-            excel_row += [processed.get('Distance (km)', 'N/A'), processed.get('Status', 'Chưa xử lý')]
-            sheet.append(excel_row)
-        output_dir = os.path.dirname(output_file)
-        if output_dir:
-            os.makedirs(output_dir, exist_ok=True)
-        workbook.save(output_file)
+        # Ghi streaming (không dựng workbook trong bộ nhớ); sink tự tạo thư mục đầu ra.
+        # Bản Parquet (nếu có) giữ Distance (km) dạng float, 'N/A' thành null.
+        with open_result_sink(output_file, headers + ["Distance (km)", "Status"], sheet_name="Kết quả Tuyến Đường",
+                              columnar_path=parquet_file, types={"Distance (km)": "float"}) as sink:
+            for row in original_data:
+                line_name = row.get('LineName')
+                processed = processed_map.get(line_name, {})
+                excel_row = [row.get(h, '') for h in headers]
+                excel_row += [processed.get('Distance (km)', 'N/A'), processed.get('Status', 'Chưa xử lý')]
+                sink.write_row(excel_row)
         if logger:
-            logger.info(f"Excel lưu thành công: {output_file}")
+            logger.info(f"Excel lưu thành công: {output_file}" + (f" (Parquet: {parquet_file})" if parquet_file else ""))
         return True
     except Exception as e:
         if logger:
@@ -279,7 +290,7 @@ def create_excel(original_data, processed_data, output_file, logger=None):
         return False
 
 # ------------------- Main -------------------
-if __name__ == "__main__":
+def main():
     parser = argparse.ArgumentParser(description="Tạo KML + Excel từ dữ liệu tuyến đường Openrouteservice")
     parser.add_argument('--osrm-url', type=str, default='http://osrm.digithub.io.vn', help="URL server OSRM")
     parser.add_argument('--input-file', type=str, help="File JSON đầu vào")
@@ -288,6 +299,7 @@ if __name__ == "__main__":
     parser.add_argument('--rate-limit', type=int, default=40)
     parser.add_argument('--output-kml', type=str, default='routes_output.kml')
     parser.add_argument('--output-excel', type=str, default='routes_result.xlsx')
+    parser.add_argument('--parquet-out', type=str, default=None, help="Ghi thêm kết quả dạng Parquet (.parquet) hoặc Arrow IPC (.arrow/.feather) với cột có kiểu")
     parser.add_argument('--log-file', type=str, default='processing.log')
     parser.add_argument('--use-mock', action='store_true')
     args = parser.parse_args()
@@ -424,7 +436,8 @@ if __name__ == "__main__":
             continue
 
         # rate limit
-        wait_for_rate_limit(request_timestamps, args.rate_limit)
+        with metrics.timer("rate_limit_wait_seconds"):
+            wait_for_rate_limit(request_timestamps, args.rate_limit)
 
         start_coords = (lon1, lat1)
         end_coords = (lon2, lat2)
@@ -444,7 +457,8 @@ if __name__ == "__main__":
     kml_status = "error"
     kml_message = "Không có tuyến đường nào được xử lý thành công để tạo KML."
 
-    kml_content = create_kml(all_routes_data, logger=logger)
+    with metrics.timer("kml_build_seconds"):
+        kml_content = create_kml(all_routes_data, logger=logger)
     if kml_content:
         try:
             output_dir = os.path.dirname(args.output_kml)
@@ -465,12 +479,15 @@ if __name__ == "__main__":
 
     # --- Tạo Excel ---
     excel_file_path = None
+    parquet_file_path = None
     excel_status = "error"
     excel_message = "Không có dữ liệu đầu vào để tạo file Excel."
 
     if routes_to_process:
-        if create_excel(routes_to_process, processed_excel_data, args.output_excel, logger=logger):
+        if create_excel(routes_to_process, processed_excel_data, args.output_excel, logger=logger,
+                        parquet_file=args.parquet_out):
             excel_file_path = args.output_excel
+            parquet_file_path = args.parquet_out
             excel_status = "success"
             excel_message = f"Tạo file Excel đầu ra thành công tại: '{args.output_excel}'."
         else:
@@ -499,8 +516,10 @@ if __name__ == "__main__":
         "status": overall_status,
         "kml_file_path": kml_file_path,
         "excel_file_path": excel_file_path,
+        "parquet_file_path": parquet_file_path,
         "message": " ".join(overall_message)
     }
+    metrics.emit_run_summary("route_kml_gen_final", result)
 
     print(json.dumps(result, indent=2, ensure_ascii=False))
 
@@ -508,3 +527,7 @@ if __name__ == "__main__":
         sys.exit(1)
 
     logger.info("Chương trình kết thúc.")
+
+
+if __name__ == "__main__":
+    run_main(main)
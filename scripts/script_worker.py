@@ -0,0 +1,406 @@
+"""
+Worker thường trú cho n8n: chạy các script CLI trong cùng một tiến trình Python.
+
+Mỗi lần n8n gọi Execute Command, script phải khởi động lại trình thông dịch và
+import lại pandas/openpyxl/pykml/netmiko. Worker này giữ các thư viện (và cache
+KML, connection pool...) trong bộ nhớ, và phơi các entry point hiện có qua một
+API JSON cục bộ (HTTP trên TCP hoặc Unix socket).
+
+Cách gọi (giữ nguyên hợp đồng JSON của script):
+
+    POST /run/<tên_script>
+    {"args": ["--input-file", "/data/sites.json", "--output-file", "/data/out.kml"],
+     "cwd": "/data"}                       # cwd là tùy chọn
+
+Kết quả trả về:
+
+    {"script": ..., "exit_code": 0, "result": <JSON mà script in ra stdout>,
+     "stdout": "...", "stderr": "...", "duration_s": 0.12}
+
+Khởi động:
+    python script_worker.py --host 127.0.0.1 --port 8765
+    python script_worker.py --unix-socket /tmp/n8n_worker.sock
+
+Các script KML/routing chạy tuần tự trong tiến trình worker. Các script mạng (netmiko_exec/ssh/ssh2)
+có thể chạy vài phút nên được tách sang tiến trình con riêng ("network lane", --network-workers, mặc
+định 1): job SSH dài không chặn KML/routing. Mỗi tiến trình con giữ connection pool SSH riêng
+(libs/connection_pool.py): các lần gọi tới cùng (host, username, device_type, port, thông tin xác thực)
+dùng lại phiên đã login. Tắt pool bằng --pool-max-sessions 0; --network-workers 0 chạy script mạng
+ngay trong worker như trước (tuần tự với mọi script khác).
+"""
+import sys
+import os
+import io
+import json
+import time
+import runpy
+import logging
+import argparse
+import importlib
+import threading
+import socketserver
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict, Any, Optional
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+if SCRIPTS_DIR not in sys.path:
+    # Các script import 'libs.xxx' và 'netmiko_wrapper' tương đối với thư mục scripts
+    sys.path.insert(0, SCRIPTS_DIR)
+
+from libs.connection_pool import enable_default_pool, get_default_pool, disable_default_pool
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("script_worker")
+
+# Danh sách entry point được phép gọi qua worker (tên -> file script)
+ENTRY_POINTS: Dict[str, str] = {
+    "site_kml_gen": "site_kml_gen.py",
+    "line_kml_gen": "line_kml_gen.py",
+    "route_kml_gen_final": "route_kml_gen_final.py",
+    "batch_routing_plan_v3": "batch_routing_plan_v3.py",
+    "two_point_to_route_nearest_v5": "two_point_to_route_nearest_v5_sameroute_kml_color.py",
+    "kml_optimize": "kml_optimize.py",
+    "h04": "h04.py",
+    "netmiko_exec": "netmiko_exec.py",
+    "ssh": "ssh.py",
+    "ssh2": "ssh2.py",
+}
+
+# Entry point SSH tới thiết bị: chạy trong network lane (tiến trình con), không giữ _run_lock của worker
+NETWORK_ENTRY_POINTS = {"netmiko_exec", "ssh", "ssh2"}
+
+# Các module nặng được import sẵn khi worker khởi động (bỏ qua nếu chưa cài)
+DEFAULT_PRELOAD = [
+    "pandas", "openpyxl", "simplekml", "requests", "lxml.etree",
+    "pykml.parser", "shapely.geometry", "netmiko", "textfsm",
+    "libs.geospatial_tools", "libs.routing_solver", "netmiko_wrapper",
+]
+
+# Module import sẵn trong tiến trình con của network lane
+NETWORK_PRELOAD = ["netmiko", "textfsm", "netmiko_wrapper"]
+
+# Chuyển hướng stdout/stderr và os.chdir là trạng thái toàn cục của tiến trình,
+# nên các script được chạy tuần tự dưới một khóa (mỗi tiến trình của network lane có khóa riêng).
+_run_lock = threading.Lock()
+
+
+# -----------------------------
+# 1. Chạy script trong tiến trình
+# -----------------------------
+
+def preload_modules(module_names: List[str]) -> Dict[str, bool]:
+    """Import trước các module nặng để các request sau không phải trả phí import."""
+    status = {}
+    for name in module_names:
+        try:
+            importlib.import_module(name)
+            status[name] = True
+        except Exception as e:
+            logger.warning(f"Không thể preload module '{name}': {e}")
+            status[name] = False
+    return status
+
+
+def _parse_json_output(stdout_text: str) -> Optional[Any]:
+    """Thử đọc stdout của script thành JSON (hợp đồng đầu ra cho n8n)."""
+    text = stdout_text.strip()
+    if not text:
+        return None
+    try:
+        return json.loads(text)
+    except ValueError:
+        return None
+
+
+def run_entry_point(name: str, args: List[str], cwd: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Chạy một entry point như khi gọi từ dòng lệnh, nhưng trong tiến trình worker.
+
+    Args:
+        name: Tên entry point (key của ENTRY_POINTS).
+        args: Danh sách tham số dòng lệnh (không gồm tên script).
+        cwd: Thư mục làm việc khi chạy script (mặc định: thư mục hiện tại của worker).
+
+    Returns:
+        dict: exit_code, result (JSON stdout nếu parse được), stdout, stderr, duration_s.
+    """
+    if name not in ENTRY_POINTS:
+        raise KeyError(name)
+    script_path = os.path.join(SCRIPTS_DIR, ENTRY_POINTS[name])
+
+    stdout_buf = io.StringIO()
+    stderr_buf = io.StringIO()
+    exit_code = 0
+
+    with _run_lock:
+        old_argv = sys.argv
+        old_cwd = os.getcwd()
+        root_logger = logging.getLogger()
+        old_root_handlers = list(root_logger.handlers)
+        start = time.perf_counter()
+        try:
+            sys.argv = [script_path] + [str(a) for a in args]
+            if cwd:
+                os.chdir(cwd)
+            # Gỡ handler của worker để logging.basicConfig() trong script ghi vào stderr của request
+            root_logger.handlers = []
+            with contextlib.redirect_stdout(stdout_buf), contextlib.redirect_stderr(stderr_buf):
+                try:
+                    runpy.run_path(script_path, run_name="__main__")
+                except SystemExit as e:
+                    if e.code is None:
+                        exit_code = 0
+                    elif isinstance(e.code, int):
+                        exit_code = e.code
+                    else:
+                        print(e.code, file=sys.stderr)
+                        exit_code = 1
+                except Exception as e:
+                    logger.exception(f"Script '{name}' ném ra exception")
+                    print(f"Đã xảy ra lỗi không mong muốn: {e}", file=sys.stderr)
+                    exit_code = 1
+        finally:
+            duration = time.perf_counter() - start
+            for handler in root_logger.handlers:
+                if handler not in old_root_handlers:
+                    handler.close()
+            root_logger.handlers = old_root_handlers
+            sys.argv = old_argv
+            os.chdir(old_cwd)
+
+    stdout_text = stdout_buf.getvalue()
+    return {
+        "script": name,
+        "exit_code": exit_code,
+        "result": _parse_json_output(stdout_text),
+        "stdout": stdout_text,
+        "stderr": stderr_buf.getvalue(),
+        "duration_s": round(duration, 4),
+    }
+
+
+def _start_pool_reaper(interval_s: float):
+    """Thread nền định kỳ đóng các phiên SSH rảnh quá lâu trong pool."""
+    def reap():
+        while True:
+            time.sleep(interval_s)
+            pool = get_default_pool()
+            if pool is None:
+                return
+            closed = pool.reap_idle()
+            if closed:
+                logger.info(f"Đã đóng {closed} phiên SSH rảnh quá hạn.")
+
+    thread = threading.Thread(target=reap, name="pool-reaper", daemon=True)
+    thread.start()
+    return thread
+
+
+def _init_network_process(pool_settings: Optional[Dict[str, Any]], preload: List[str]):
+    """Khởi tạo tiến trình con của network lane: preload netmiko/textfsm và bật connection pool riêng."""
+    preload_modules(preload)
+    if pool_settings:
+        import atexit
+
+        enable_default_pool(**pool_settings)
+        _start_pool_reaper(max(5.0, min(60.0, pool_settings["max_idle_s"] / 2)))
+        atexit.register(disable_default_pool)
+
+
+def _network_pool_stats() -> Optional[Dict[str, Any]]:
+    pool = get_default_pool()
+    return pool.stats() if pool else None
+
+
+class NetworkLane:
+    """
+    Tiến trình con (spawn) chạy các entry point SSH. Mỗi tiến trình tự tuần tự hóa script của nó
+    bằng _run_lock riêng, nên job mạng dài không chặn KML/routing trong worker chính. Tiến trình
+    sống lâu để connection pool của nó dùng lại phiên giữa các request.
+    """
+
+    def __init__(self, workers: int, pool_settings: Optional[Dict[str, Any]], preload: List[str]):
+        self.workers = workers
+        self._initargs = (pool_settings, preload)
+        self._lock = threading.Lock()
+        self._executor = self._new_executor()
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # spawn: không fork tiến trình đang có các thread của HTTP server
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_network_process, initargs=self._initargs)
+
+    def run(self, name: str, args: List[str], cwd: Optional[str] = None) -> Dict[str, Any]:
+        with self._lock:
+            executor = self._executor
+        try:
+            return executor.submit(run_entry_point, name, args, cwd).result()
+        except BrokenProcessPool as e:
+            # Tiến trình con chết (crash, bị kill): tạo lại lane cho các request sau
+            logger.error(f"Network lane bị hỏng khi chạy '{name}': {e}. Khởi tạo lại.")
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = self._new_executor()
+            executor.shutdown(wait=False)
+            return {"script": name, "exit_code": 1, "result": None, "stdout": "",
+                    "stderr": f"Tiến trình network lane bị dừng bất thường: {e}", "duration_s": None}
+
+    def pool_stats(self, timeout_s: float = 2.0) -> Optional[Dict[str, Any]]:
+        """Thống kê pool của một tiến trình con (None nếu lane đang bận quá timeout_s)."""
+        with self._lock:
+            executor = self._executor
+        try:
+            return executor.submit(_network_pool_stats).result(timeout=timeout_s)
+        except (FutureTimeoutError, BrokenProcessPool):
+            return None
+
+    def shutdown(self):
+        with self._lock:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# -----------------------------
+# 2. HTTP API
+# -----------------------------
+
+class WorkerRequestHandler(BaseHTTPRequestHandler):
+    server_version = "n8nScriptWorker/1.0"
+
+    def _send_json(self, status: int, payload: Dict[str, Any]):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # client_address rỗng khi chạy trên Unix socket
+        logger.info("%s - %s", self.client_address or "unix", format % args)
+
+    def do_GET(self):
+        if self.path.rstrip("/") in ("", "/health"):
+            lane = self.server.network_lane
+            if lane is not None:
+                pool_stats = lane.pool_stats()
+            else:
+                pool = get_default_pool()
+                pool_stats = pool.stats() if pool else None
+            self._send_json(200, {
+                "status": "ok",
+                "pid": os.getpid(),
+                "entry_points": sorted(ENTRY_POINTS),
+                "preloaded": self.server.preload_status,
+                "network_workers": lane.workers if lane is not None else 0,
+                "connection_pool": pool_stats,
+            })
+        else:
+            self._send_json(404, {"status": "error", "message": f"Không có endpoint {self.path}"})
+
+    def do_POST(self):
+        parts = [p for p in self.path.split("/") if p]
+        if len(parts) != 2 or parts[0] != "run":
+            self._send_json(404, {"status": "error", "message": "Dùng POST /run/<tên_script>"})
+            return
+        name = parts[1]
+        if name not in ENTRY_POINTS:
+            self._send_json(404, {"status": "error", "message": f"Entry point '{name}' không được hỗ trợ."})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(payload, dict):
+                raise ValueError("body phải là một object JSON.")
+            args = payload.get("args", [])
+            if not isinstance(args, list):
+                raise ValueError("'args' phải là một mảng.")
+            cwd = payload.get("cwd")
+            if cwd is not None and not isinstance(cwd, str):
+                raise ValueError("'cwd' phải là chuỗi.")
+        except ValueError as e:
+            self._send_json(400, {"status": "error", "message": f"Body JSON không hợp lệ: {e}"})
+            return
+
+        lane = self.server.network_lane
+        if lane is not None and name in NETWORK_ENTRY_POINTS:
+            result = lane.run(name, args, cwd=cwd)
+        else:
+            result = run_entry_point(name, args, cwd=cwd)
+        self._send_json(200, result)
+
+
+class UnixThreadingHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ""
+
+
+def create_server(host: str, port: int, unix_socket: Optional[str] = None):
+    """Tạo HTTP server trên TCP (host:port) hoặc Unix socket."""
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        return UnixThreadingHTTPServer(unix_socket, WorkerRequestHandler)
+    return ThreadingHTTPServer((host, port), WorkerRequestHandler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker thường trú chạy các script CLI cho n8n qua API JSON cục bộ.")
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Địa chỉ lắng nghe (mặc định: 127.0.0.1).')
+    parser.add_argument('--port', type=int, default=8765, help='Cổng lắng nghe (mặc định: 8765).')
+    parser.add_argument('--unix-socket', type=str, default=None, help='Đường dẫn Unix socket (thay cho TCP).')
+    parser.add_argument('--preload', type=str, default=",".join(DEFAULT_PRELOAD),
+                        help='Danh sách module import sẵn, phân tách bằng dấu phẩy (rỗng để tắt).')
+    parser.add_argument('--pool-max-sessions', type=int, default=32, help='Số phiên SSH tối đa trong pool (0 để tắt pool, mặc định: 32).')
+    parser.add_argument('--pool-max-idle', type=float, default=300.0, help='Thời gian rảnh tối đa của một phiên SSH (giây, mặc định: 300).')
+    parser.add_argument('--pool-per-host', type=int, default=2, help='Số phiên SSH đồng thời tối đa trên mỗi host (mặc định: 2).')
+    parser.add_argument('--network-workers', type=int, default=1,
+                        help='Số tiến trình con chạy netmiko_exec/ssh/ssh2 song song với KML/routing '
+                             '(mỗi tiến trình có pool SSH riêng; 0 để chạy trong worker, mặc định: 1).')
+    args = parser.parse_args()
+
+    preload = [m.strip() for m in args.preload.split(",") if m.strip()]
+    pool_settings = None
+    if args.pool_max_sessions > 0:
+        pool_settings = dict(max_sessions=args.pool_max_sessions, max_idle_s=args.pool_max_idle,
+                             per_host_limit=args.pool_per_host)
+
+    network_lane = None
+    if args.network_workers > 0:
+        # Module mạng chỉ cần trong tiến trình con; worker chính giữ pandas/KML/routing
+        network_preload = [m for m in preload if m in NETWORK_PRELOAD]
+        preload = [m for m in preload if m not in NETWORK_PRELOAD]
+        network_lane = NetworkLane(args.network_workers, pool_settings, network_preload)
+    elif pool_settings:
+        enable_default_pool(**pool_settings)
+        _start_pool_reaper(max(5.0, min(60.0, args.pool_max_idle / 2)))
+    preload_status = preload_modules(preload)
+
+    server = create_server(args.host, args.port, args.unix_socket)
+    server.preload_status = preload_status
+    server.network_lane = network_lane
+    where = args.unix_socket or f"http://{args.host}:{args.port}"
+    logger.info(f"Worker sẵn sàng tại {where} ({sum(preload_status.values())}/{len(preload)} module đã preload)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Dừng worker.")
+    finally:
+        server.server_close()
+        if network_lane is not None:
+            network_lane.shutdown()
+        disable_default_pool()
+        if args.unix_socket and os.path.exists(args.unix_socket):
+            os.remove(args.unix_socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@ import sys
 import json
 import os
 import argparse
+from libs.cli_bootstrap import run_main
 
 # Hàm tạo một placemark cho điểm
 def create_point_placemark(site_name, lat, lon, description, icon_url, icon_scale):
@@ -149,7 +150,7 @@ def generate_kml_from_sites(items_to_process, doc_name="Dữ liệu điểm KML
 	return full_kml_content
 
 # Khối thực thi chính khi script được chạy trực tiếp
-if __name__ == "__main__":
+def main():
 	parser = argparse.ArgumentParser(
         description="Tạo KML chứa dữ liệu điểm từ một file JSON đầu vào.",
         formatter_class=argparse.RawTextHelpFormatter
@@ -376,4 +377,8 @@ def generate_kml_for_points(items_to_process, doc_name="Site/Point KML"):
   </Document>
 </kml>
 """
-    return full_kml_content
\ No newline at end of file
+    return full_kml_content
+
+
+if __name__ == "__main__":
+    run_main(main)
@@ -1,12 +1,59 @@
-from netmiko import ConnectHandler
-from netmiko.exceptions import NetmikoAuthenticationException, NetmikoTimeoutException
 import sys
 import json
+import time
 import argparse
-import textfsm
-from netmiko.utilities import get_structured_data
+from libs import instrumentation as metrics
+from libs.cli_bootstrap import run_main
+# netmiko/textfsm và các libs kết nối (connection pool, hồ sơ timing, registry template) được import
+# trong hàm (import trì hoãn) để --help không phải import chúng
 
-def ssh_to_router_with_netmiko(device_type, hostname, username, password, command, use_textfsm=False, textfsm_template=None, port=22, timeout=10):
+def _send_and_parse(net_connect, device_type, command, use_textfsm=False, textfsm_template=None):
+    """
+    Chạy một lệnh trên kết nối đã mở và (nếu yêu cầu) phân tích bằng TextFSM.
+
+    Returns:
+        tuple: (output, parsed_output, error_message)
+    """
+    from netmiko.utilities import get_structured_data
+    from libs.timing_profiles import command_read_timeout, record_command_result
+    from libs.textfsm_registry import get_registry
+
+    parsed_output = None
+    error_message = None
+
+    # 1. Luôn chạy lệnh để lấy output thô (read_timeout tối thiểu 120s, dài hơn nếu hồ sơ timing thấy lệnh chậm)
+    host = net_connect.host
+    start = time.perf_counter()
+    try:
+        output = net_connect.send_command(command, read_timeout=command_read_timeout(host, command, 120))
+    except Exception as e:
+        record_command_result(host, command, error=e)
+        raise
+    record_command_result(host, command, seconds=time.perf_counter() - start)
+
+    # 2. Nếu yêu cầu, phân tích output thô bằng TextFSM
+    if use_textfsm:
+        try:
+            if textfsm_template:
+                # Sử dụng template tùy chỉnh do người dùng cung cấp (compile một lần, cache trong registry)
+                parsed_output = get_registry().parse_file(textfsm_template, output)
+            else:
+                # Sử dụng thư viện ntc-templates tích hợp của Netmiko
+                parsed_output = get_structured_data(output, platform=device_type, command=command)
+
+            # Kiểm tra nếu parsing không trả về kết quả nào
+            if not parsed_output:
+                error_message = "Phân tích TextFSM không tìm thấy dữ liệu khớp. Output có thể không đúng định dạng hoặc template không phù hợp."
+
+        except FileNotFoundError:
+            error_message = f"Lỗi phân tích TextFSM: File template '{textfsm_template}' không tồn tại."
+        except Exception as e:
+            # Bắt các lỗi parsing khác (ví dụ: ntc-templates chưa cài, lỗi cú pháp template)
+            error_message = f"Lỗi trong quá trình phân tích TextFSM: {e}"
+
+    return output, parsed_output, error_message
+
+def ssh_to_router_with_netmiko(device_type, hostname, username, password, command=None, use_textfsm=False, textfsm_template=None, port=22, timeout=10, commands=None):
     """
     Kết nối SSH tới một thiết bị router bằng Netmiko và thực hiện một câu lệnh.
     Trả về cả output thô và output đã được phân tích (nếu có).
@@ -23,54 +70,67 @@ def ssh_to_router_with_netmiko(device_type, hostname, username, password, comman
                                            Nếu không cung cấp, sẽ sử dụng ntc-templates.
         port (int): Cổng SSH (mặc định là 22).
         timeout (int): Thời gian chờ kết nối (mặc định là 10 giây).
+        commands (list, optional): Danh sách lệnh chạy trên cùng một phiên SSH (thay cho command).
 
     Returns:
         dict: Một từ điển chứa kết quả (output, parsed_output), lỗi (error) và trạng thái.
+              Khi dùng commands, có thêm 'results': {command: {success, output, parsed_output, error}}.
     """
+    from netmiko.exceptions import NetmikoAuthenticationException, NetmikoTimeoutException
+    from libs.connection_pool import discard_on_release
+    from libs.timing_profiles import tuned_connection
+
     device_params = {
         'device_type': device_type,
         'host': hostname,
         'username': username,
         'password': password,
         'port': port,
-        'timeout': timeout,      
-        'global_delay_factor': 2 # Tăng độ trễ giữa các lệnh nếu thiết bị chậm phản hồi
+        'timeout': timeout,
+        # fast_cli / global_delay_factor do hồ sơ timing của host chọn (thiết bị chậm/lỗi: delay factor 2+)
     }
 
     output = None
     parsed_output = None
     error_message = None
     success = False
+    command_results = None
 
     try:
-        # Sử dụng 'with' để đảm bảo kết nối được đóng tự động
-        with ConnectHandler(**device_params) as net_connect:
-            
-            # 1. Luôn chạy lệnh để lấy output thô
-            output = net_connect.send_command(command, read_timeout=120)
-            success = True # Nếu lệnh thất bại, Netmiko sẽ ném ra exception
-
-            # 2. Nếu yêu cầu, phân tích output thô bằng TextFSM
-            if use_textfsm:
-                try:
-                    if textfsm_template:
-                        # Sử dụng template tùy chỉnh do người dùng cung cấp
-                        with open(textfsm_template) as template_file:
-                            fsm = textfsm.TextFSM(template_file)
-                            parsed_output = fsm.ParseTextToDicts(output)
+        # Sử dụng 'with' để đảm bảo kết nối được trả về pool / đóng tự động
+        with tuned_connection(device_params) as net_connect:
+            if commands:
+                # Nhiều lệnh trên cùng một phiên: chỉ login một lần
+                command_results = {}
+                usable = True
+                for cmd in commands:
+                    if not usable:
+                        cmd_output, cmd_parsed, cmd_error = None, None, "Bỏ qua: phiên không còn đồng bộ sau lệnh bị lỗi."
+                        cmd_success = False
                     else:
-                        # Sử dụng thư viện ntc-templates tích hợp của Netmiko
-                        parsed_output = get_structured_data(output, platform=device_type, command=command)
-
-                    # Kiểm tra nếu parsing không trả về kết quả nào
-                    if not parsed_output:
-                        error_message = "Phân tích TextFSM không tìm thấy dữ liệu khớp. Output có thể không đúng định dạng hoặc template không phù hợp."
-
-                except FileNotFoundError:
-                    error_message = f"Lỗi phân tích TextFSM: File template '{textfsm_template}' không tồn tại."
-                except Exception as e:
-                    # Bắt các lỗi parsing khác (ví dụ: ntc-templates chưa cài, lỗi cú pháp template)
-                    error_message = f"Lỗi trong quá trình phân tích TextFSM: {e}"
+                        try:
+                            cmd_output, cmd_parsed, cmd_error = _send_and_parse(net_connect, device_type, cmd, use_textfsm, textfsm_template)
+                            cmd_success = True
+                        except Exception as e:
+                            cmd_output, cmd_parsed, cmd_error = None, None, f"Lỗi khi chạy lệnh: {e}"
+                            cmd_success = False
+                            # Output dở dang (ví dụ ReadTimeout) còn trong kênh: dừng, không dùng lại phiên
+                            usable = False
+                            discard_on_release(net_connect)
+                    command_results[cmd] = {
+                        'success': cmd_success,
+                        'output': cmd_output.strip() if cmd_output else None,
+                        'parsed_output': cmd_parsed,
+                        'error': cmd_error,
+                    }
+                failed = [cmd for cmd, res in command_results.items() if not res['success']]
+                if failed:
+                    error_message = f"{len(failed)}/{len(commands)} lệnh thất bại: {', '.join(failed)}"
+                success = not failed
+            else:
+                # Nếu lệnh thất bại, Netmiko sẽ ném ra exception
+                output, parsed_output, error_message = _send_and_parse(net_connect, device_type, command, use_textfsm, textfsm_template)
+                success = True
 
     except NetmikoAuthenticationException:
         error_message = "Lỗi xác thực: Tên người dùng hoặc mật khẩu không đúng."
@@ -83,26 +143,32 @@ def ssh_to_router_with_netmiko(device_type, hostname, username, password, comman
         error_message = f"Đã xảy ra lỗi không mong muốn: {e}"
         success = False
 
-    return {
+    result = {
         'success': success,
         'output': output.strip() if output else None,
         'parsed_output': parsed_output,
         'error': error_message
     }
+    if commands:
+        result['results'] = command_results or {}
+    return result
 
-if __name__ == "__main__":
+def main():
     parser = argparse.ArgumentParser(description="Ứng dụng Python SSH dùng Netmiko để chạy lệnh trên thiết bị router.")
     parser.add_argument('--device_type', required=True, help='Kiểu thiết bị Netmiko (ví dụ: juniper, cisco_ios).')
     parser.add_argument('--ip', required=True, help='Địa chỉ IP hoặc hostname của router.')
     parser.add_argument('--user', required=True, help='Tên người dùng SSH.')
     parser.add_argument('--password', required=True, help='Mật khẩu SSH.')
-    parser.add_argument('--command', required=True, help='Câu lệnh CLI cần thực hiện trên router (đặt trong dấu ngoặc kép nếu có khoảng trắng).')
+    parser.add_argument('--command', default=None, help='Câu lệnh CLI cần thực hiện trên router (đặt trong dấu ngoặc kép nếu có khoảng trắng).')
+    parser.add_argument('--commands', nargs='+', default=None, help='Danh sách lệnh CLI chạy trên cùng một phiên SSH (thay cho --command).')
     parser.add_argument('--use-textfsm', action='store_true', help='Sử dụng TextFSM để phân tích output.')
     parser.add_argument('--textfsm-template', type=str, default=None, help='Đường dẫn đến file template TextFSM tùy chỉnh.')
     parser.add_argument('--port', type=int, default=22, help='Cổng SSH (mặc định: 22).')
     parser.add_argument('--timeout', type=int, default=10, help='Thời gian chờ kết nối SSH (mặc định: 10 giây).')
 
     args = parser.parse_args()
+    if not args.command and not args.commands:
+        parser.error("Cần --command hoặc --commands.")
 
     # Gọi hàm Netmiko chính
     result = ssh_to_router_with_netmiko(
@@ -111,15 +177,21 @@ if __name__ == "__main__":
         username=args.user,
         password=args.password,
         command=args.command,
+        commands=args.commands,
         use_textfsm=args.use_textfsm,
         textfsm_template=args.textfsm_template,
         port=args.port,
         timeout=args.timeout
     )
 
-    # In kết quả ra console dưới dạng JSON
+    # In kết quả ra console dưới dạng JSON (kèm tóm tắt metric của lần chạy)
+    metrics.emit_run_summary("ssh", result)
     print(json.dumps(result, indent=2))
 
     # Nếu có lỗi, thoát với mã lỗi khác 0
     # if not result.get('success'):
-    #     sys.exit(1)
\ No newline at end of file
+    #     sys.exit(1)
+
+
+if __name__ == "__main__":
+    run_main(main)
@@ -1,10 +1,19 @@
-from netmiko.exceptions import NetmikoAuthenticationException, NetmikoTimeoutException
 import sys
 import json
+import time
 import argparse
-from netmiko_wrapper import smart_send_command  # Wrapper bạn đã tạo để fallback
+from libs import instrumentation as metrics
+from libs.cli_bootstrap import run_main
+# netmiko_wrapper (wrapper fallback) và các libs kết nối/parse/lưu trữ được import trong hàm
+# (import trì hoãn) để --help không phải import chúng (xem check_startup_budget.py)
+
+def ssh_to_router_with_wrapper(device_type, hostname, username, password, command=None, use_textfsm=False, textfsm_template=None, prefer_custom=False, port=22, timeout=10, commands=None):
+    from netmiko.exceptions import NetmikoAuthenticationException, NetmikoTimeoutException
+    from libs.timing_profiles import tuned_connection
+    from libs.cli_parsing import send_and_parse
+    from libs.textfsm_registry import get_registry
+    from netmiko_wrapper import smart_send_command, smart_send_commands  # Wrapper bạn đã tạo để fallback
 
-def ssh_to_router_with_wrapper(device_type, hostname, username, password, command, use_textfsm=False, textfsm_template=None, prefer_custom=False, port=22, timeout=10):
     device_params = {
         'device_type': device_type,
         'host': hostname,
@@ -12,26 +21,53 @@ def ssh_to_router_with_wrapper(device_type, hostname, username, password, comman
         'password': password,
         'port': port,
         'timeout': timeout,
-        'global_delay_factor': 2
+        # fast_cli / global_delay_factor do hồ sơ timing của host chọn (libs/timing_profiles.py)
     }
 
     output = None
     parsed_output = None
     error_message = None
     success = False
+    command_results = None
+    parser_used = None
+    timings = {}
 
     try:
+        if commands:
+            # Nhiều lệnh trên cùng một phiên SSH, trả về kết quả theo từng lệnh
+            command_results = {}
+            for cmd, res in smart_send_commands(device_params, commands, prefer_custom=prefer_custom).items():
+                result = res['result']
+                command_results[cmd] = {
+                    'success': res['error'] is None,
+                    'output': result.strip() if isinstance(result, str) else (json.dumps(result, indent=2) if result is not None else None),
+                    'parsed_output': None if isinstance(result, str) else result,
+                    'parser': res['parser'],
+                    'error': res['error'],
+                    'timings': res['timings'],
+                }
+            failed = [cmd for cmd, res in command_results.items() if not res['success']]
+            if failed:
+                error_message = f"{len(failed)}/{len(commands)} lệnh thất bại: {', '.join(failed)}"
+            success = not failed
         # Nếu dùng template tùy chỉnh, ép luôn dùng textfsm
-        if use_textfsm and textfsm_template:
-            from textfsm import TextFSM
-            with open(textfsm_template) as tf:
-                fsm = TextFSM(tf)
-                raw_output = smart_send_command(device_params, command)
-                output = raw_output if isinstance(raw_output, str) else None
-                parsed_output = fsm.ParseTextToDicts(output)
+        elif use_textfsm and textfsm_template:
+            fsm = get_registry().get_fsm(textfsm_template)
+            # Lấy output thô một lần rồi parse bằng template chỉ định
+            with tuned_connection(device_params) as conn:
+                sent = send_and_parse(conn, device_type, command, use_textfsm=False, read_timeout=120)
+            output = sent['raw_output']
+            start = time.perf_counter()
+            parsed_output = fsm.ParseTextToDicts(output)
+            timings = dict(sent['timings'], parse_custom_s=round(time.perf_counter() - start, 4))
+            parser_used = 'custom'
+            success = True
         else:
             # print("Sử dụng Netmiko để gửi lệnh...")
-            result = smart_send_command(device_params, command, prefer_custom=prefer_custom)
+            details = {}
+            result = smart_send_command(device_params, command, prefer_custom=prefer_custom, details=details)
+            parser_used = details.get('parser')
+            timings = details.get('timings', {})
             # print("Kết quả từ Netmiko:", result)
             if isinstance(result, str):
                 output = result
@@ -40,7 +76,7 @@ def ssh_to_router_with_wrapper(device_type, hostname, username, password, comman
                 parsed_output = result
                 output = json.dumps(result, indent=2)
 
-        success = True
+            success = True
 
     except NetmikoAuthenticationException:
         error_message = "Lỗi xác thực: Tên người dùng hoặc mật khẩu không đúng."
@@ -51,27 +87,42 @@ def ssh_to_router_with_wrapper(device_type, hostname, username, password, comman
     except Exception as e:
         error_message = f"Đã xảy ra lỗi không mong muốn: {e}"
 
-    return {
+    response = {
         'success': success,
         'output': output.strip() if output else None,
         'parsed_output': parsed_output,
         'error': error_message
     }
+    if commands:
+        response['results'] = command_results or {}
+    else:
+        response['parser'] = parser_used
+        response['timings'] = timings
+    return response
 
-if __name__ == "__main__":
+def main():
     parser = argparse.ArgumentParser(description="Ứng dụng Python SSH dùng Netmiko Wrapper để fallback NTC + custom TextFSM.")
     parser.add_argument('--device_type', required=True)
     parser.add_argument('--ip', required=True)
     parser.add_argument('--user', required=True)
     parser.add_argument('--password', required=True)
-    parser.add_argument('--command', required=True)
+    parser.add_argument('--command', default=None)
+    parser.add_argument('--commands', nargs='+', default=None, help='Danh sách lệnh chạy trên cùng một phiên SSH.')
     parser.add_argument('--use-textfsm', action='store_true')
     parser.add_argument('--textfsm-template', type=str, default=None)
     parser.add_argument('--prefer-custom', action='store_true', help='Ưu tiên sử dụng template tùy chỉnh trước khi dùng NTC-Templates.')
     parser.add_argument('--port', type=int, default=22)
     parser.add_argument('--timeout', type=int, default=10)
+    parser.add_argument('--store', action='store_true', help='Lưu các dòng TextFSM đã parse vào kho kết quả (xem poll_history.py).')
+    parser.add_argument('--store-db', type=str, default=None, help='File SQLite của kho kết quả (mặc định: scripts/state/results.sqlite3).')
+    parser.add_argument('--delta', action='store_true', help='Chỉ trả về các dòng TextFSM thêm/mất/thay đổi so với lần poll trước (thay cho parsed_output).')
+    parser.add_argument('--delta-key', type=str, action='append', default=None, help='Trường định danh dòng cho --delta, ví dụ Interface (lặp lại được; mặc định: tự chọn).')
+    parser.add_argument('--delta-ignore', type=str, action='append', default=[], help='Trường bỏ qua khi so sánh --delta (lặp lại được).')
+    parser.add_argument('--state-db', type=str, default=None, help='File SQLite lưu snapshot cho --delta (mặc định: scripts/state/state.sqlite3).')
 
     args = parser.parse_args()
+    if not args.command and not args.commands:
+        parser.error("Cần --command hoặc --commands.")
 
     result = ssh_to_router_with_wrapper(
         device_type=args.device_type,
@@ -79,6 +130,7 @@ if __name__ == "__main__":
         username=args.user,
         password=args.password,
         command=args.command,
+        commands=args.commands,
         use_textfsm=args.use_textfsm,
         textfsm_template=args.textfsm_template,
         prefer_custom=args.prefer_custom,
@@ -86,7 +138,32 @@ if __name__ == "__main__":
         timeout=args.timeout
     )
 
+    if args.store:
+        # Lưu lịch sử để dashboard đọc lại mà không cần poll thiết bị
+        from libs.result_store import ResultStore
+        try:
+            result['stored_rows'] = ResultStore(args.store_db).append_action_result(
+                args.ip, args.device_type, result, command=args.command
+            )
+        except Exception as e:
+            result['store_error'] = f"Lỗi ghi kho kết quả: {e}"
+
+    if args.delta:
+        from libs.delta_tracker import DeltaTracker
+        try:
+            DeltaTracker(args.state_db).apply_to_result(
+                args.ip, result, command=args.command,
+                key_fields=args.delta_key, ignore_fields=args.delta_ignore,
+            )
+        except Exception as e:
+            result['delta_error'] = f"Lỗi tính delta: {e}"
+
+    metrics.emit_run_summary("ssh2", result)
     print(json.dumps(result, indent=2))
 
     if not result.get('success'):
         sys.exit(1)
+
+
+if __name__ == "__main__":
+    run_main(main)
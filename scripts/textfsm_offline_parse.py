@@ -0,0 +1,253 @@
+"""
+Parse offline các file output CLI đã thu thập (không cần login lại thiết bị).
+
+Mỗi file trong thư mục đầu vào chứa output thô của một lệnh, đặt tên theo quy ước:
+
+    <host>__<device_type>__<command>.txt
+    ví dụ: 10.0.0.1__juniper_junos__show_system_alarms.txt
+           PE01__nokia_sros__show_port_1%2F1%2F1_optical.txt
+
+Trong phần <command>, '_' thay cho khoảng trắng và '%2F' thay cho '/'.
+
+Các file được parse song song bằng process pool với registry template TextFSM
+(libs/textfsm_registry.py; fallback ntc-templates nếu đã cài). Kết quả được gom
+theo lệnh: mỗi lệnh một file Parquet (nếu có pyarrow) hoặc CSV, với cột host,
+device_type, source_file cùng các trường của template. Tóm tắt in ra stdout dạng JSON.
+
+Ví dụ:
+    python textfsm_offline_parse.py --input-dir captures/ --output-dir parsed/ --workers 8
+    python textfsm_offline_parse.py --input-dir captures/ --output-dir parsed/ --format csv
+"""
+import sys
+import os
+import csv
+import json
+import glob
+import time
+import argparse
+from urllib.parse import unquote
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+
+from libs.textfsm_registry import get_registry, normalize_command
+
+FILENAME_SEPARATOR = "__"
+MAX_ERRORS_IN_SUMMARY = 50
+
+
+# -----------------------------
+# 1. Đọc tên file & parse một file
+# -----------------------------
+
+def parse_capture_name(path: str) -> Optional[Tuple[str, str, str]]:
+    """Tách (host, device_type, command) từ tên file; None nếu sai quy ước."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    parts = stem.split(FILENAME_SEPARATOR)
+    if len(parts) != 3 or not all(parts):
+        return None
+    host, device_type, command_part = parts
+    command = unquote(command_part.replace("_", " "))
+    return host, device_type, command
+
+
+def _parse_with_ntc(device_type: str, command: str, output: str) -> Optional[List[Dict[str, Any]]]:
+    """Fallback ntc-templates (nếu đã cài); None nếu không có template phù hợp."""
+    try:
+        from ntc_templates.parse import parse_output
+    except ImportError:
+        return None
+    try:
+        return parse_output(platform=device_type, command=command, data=output)
+    except Exception:
+        return None
+
+
+def parse_capture_file(path: str) -> Dict[str, Any]:
+    """Parse một file capture. Chạy trong tiến trình con của process pool."""
+    record = {"file": path, "host": None, "device_type": None, "command": None,
+              "template": None, "rows": [], "error": None}
+    parsed_name = parse_capture_name(path)
+    if parsed_name is None:
+        record["error"] = f"Tên file không đúng quy ước <host>{FILENAME_SEPARATOR}<device_type>{FILENAME_SEPARATOR}<command>."
+        return record
+    record["host"], record["device_type"], record["command"] = parsed_name
+
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            output = f.read()
+    except OSError as e:
+        record["error"] = f"Không đọc được file: {e}"
+        return record
+
+    registry = get_registry()
+    try:
+        template_path = registry.find(record["device_type"], record["command"])
+        if template_path is not None:
+            record["template"] = os.path.basename(template_path)
+            record["rows"] = registry.parse_file(template_path, output)
+        else:
+            rows = _parse_with_ntc(record["device_type"], record["command"], output)
+            if rows is None:
+                record["error"] = "Không tìm thấy template phù hợp."
+            else:
+                record["template"] = "ntc-templates"
+                record["rows"] = rows
+    except Exception as e:
+        record["error"] = f"Lỗi phân tích TextFSM: {e}"
+    return record
+
+
+def _warm_registry():
+    """Initializer của process con: quét template một lần cho mỗi tiến trình."""
+    get_registry().load()
+
+
+# -----------------------------
+# 2. Ghi kết quả theo lệnh
+# -----------------------------
+
+def _flatten_value(value: Any) -> Any:
+    # Value List của TextFSM trả về list; CSV cần một chuỗi
+    if isinstance(value, list):
+        return ";".join(str(v) for v in value)
+    return value
+
+
+def _parquet_column(values: List[Any]) -> List[Any]:
+    # Một cột có thể vừa có list (Value List) vừa có chuỗi (template khác vendor): Arrow không suy
+    # được kiểu chung, nên cột có list được đưa về list<string> (giá trị đơn -> list một phần tử)
+    if any(isinstance(v, list) for v in values):
+        return [None if v is None else [str(x) for x in v] if isinstance(v, list) else [str(v)] for v in values]
+    return [None if v is None else str(v) for v in values]
+
+
+def _fieldnames(rows: List[Dict[str, Any]]) -> List[str]:
+    names = []
+    for row in rows:
+        for key in row:
+            if key not in names:
+                names.append(key)
+    return names
+
+
+def write_command_table(rows: List[Dict[str, Any]], output_dir: str, command: str, fmt: str) -> str:
+    """Ghi toàn bộ dòng của một lệnh ra Parquet hoặc CSV. Trả về đường dẫn file."""
+    base = os.path.join(output_dir, normalize_command(command))
+    if fmt == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        path = base + ".parquet"
+        # Các thiết bị khác vendor có thể trả về cột khác nhau: lấy hợp các cột
+        columns = {name: _parquet_column([row.get(name) for row in rows]) for name in _fieldnames(rows)}
+        pq.write_table(pa.Table.from_pydict(columns), path)
+        return path
+
+    path = base + ".csv"
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.DictWriter(f, fieldnames=_fieldnames(rows))
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({k: _flatten_value(v) for k, v in row.items()})
+    return path
+
+
+def resolve_format(fmt: str) -> str:
+    """'auto' -> parquet nếu có pyarrow, ngược lại csv."""
+    if fmt != "auto":
+        return fmt
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+        return "parquet"
+    except ImportError:
+        return "csv"
+
+
+# -----------------------------
+# 3. Điều phối
+# -----------------------------
+
+def run_offline_parse(files: List[str], output_dir: str, fmt: str = "auto", workers: Optional[int] = None) -> Dict[str, Any]:
+    start = time.monotonic()
+    fmt = resolve_format(fmt)
+    os.makedirs(output_dir, exist_ok=True)
+
+    tables: Dict[str, List[Dict[str, Any]]] = {}
+    errors = []
+    parsed_files = 0
+
+    chunksize = max(1, len(files) // ((workers or os.cpu_count() or 1) * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_warm_registry) as executor:
+        for record in executor.map(parse_capture_file, files, chunksize=chunksize):
+            if record["error"]:
+                errors.append({"file": record["file"], "error": record["error"]})
+                continue
+            parsed_files += 1
+            table = tables.setdefault(record["command"], [])
+            for row in record["rows"]:
+                table.append({"host": record["host"], "device_type": record["device_type"],
+                              "source_file": os.path.basename(record["file"]), **row})
+
+    outputs = []
+    write_errors = []
+    for command, rows in sorted(tables.items()):
+        if not rows:
+            continue
+        try:
+            path = write_command_table(rows, output_dir, command, fmt)
+        except ImportError:
+            raise
+        except Exception as e:
+            # Lỗi ghi một lệnh không làm mất bảng của các lệnh khác
+            write_errors.append({"command": command, "error": f"Lỗi ghi kết quả: {e}"})
+            continue
+        outputs.append({"command": command, "path": path, "rows": len(rows)})
+
+    return {
+        "status": ("success" if not errors and not write_errors
+                   else "partial" if parsed_files and (outputs or not write_errors) else "error"),
+        "format": fmt,
+        "files": len(files),
+        "parsed_files": parsed_files,
+        "failed_files": len(errors),
+        "failed_commands": len(write_errors),
+        "outputs": outputs,
+        "errors": (write_errors + errors)[:MAX_ERRORS_IN_SUMMARY],
+        "duration_s": round(time.monotonic() - start, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse offline các file output CLI đã thu thập bằng TextFSM, ghi Parquet/CSV theo từng lệnh.")
+    parser.add_argument('--input-dir', type=str, required=True, help='Thư mục chứa file <host>__<device_type>__<command>.txt.')
+    parser.add_argument('--output-dir', type=str, required=True, help='Thư mục ghi kết quả (mỗi lệnh một file).')
+    parser.add_argument('--pattern', type=str, default='*.txt', help="Mẫu tên file cần parse (mặc định: '*.txt').")
+    parser.add_argument('--recursive', action='store_true', help='Tìm file trong cả thư mục con.')
+    parser.add_argument('--format', type=str, default='auto', choices=['auto', 'parquet', 'csv'], help='Định dạng đầu ra (auto: Parquet nếu có pyarrow).')
+    parser.add_argument('--workers', type=int, default=None, help='Số tiến trình parse song song (mặc định: số CPU).')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.input_dir):
+        print(json.dumps({"status": "error", "message": f"Thư mục đầu vào không tồn tại: {args.input_dir}"}, ensure_ascii=False))
+        sys.exit(1)
+
+    pattern = os.path.join(args.input_dir, "**", args.pattern) if args.recursive else os.path.join(args.input_dir, args.pattern)
+    files = sorted(glob.glob(pattern, recursive=args.recursive))
+    if not files:
+        print(json.dumps({"status": "error", "message": f"Không tìm thấy file nào khớp {pattern}"}, ensure_ascii=False))
+        sys.exit(1)
+
+    try:
+        summary = run_offline_parse(files, args.output_dir, fmt=args.format, workers=args.workers)
+    except ImportError as e:
+        print(json.dumps({"status": "error", "message": f"Thiếu thư viện cho định dạng '{args.format}': {e}"}, ensure_ascii=False))
+        sys.exit(1)
+
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    if summary["status"] == "error":
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,25 @@
 import argparse
 import math
-import csv
-import openpyxl
 from typing import List, Tuple, Dict, Any, Optional
+from libs.lazy_import import lazy_module
 
 # Import necessary libraries (pykml and lxml are required for KML output)
-# Cần cài đặt: pip install pykml lxml openpyxl
-from pykml import parser as kmlparser
-from pykml.factory import KML_ElementMaker as KML # Sử dụng KML factory để xây dựng cấu trúc
-from lxml import etree # Để tuần tự hóa (serialization) KML
+# Cần cài đặt: pip install pykml lxml pandas xlsxwriter (hoặc openpyxl)
+# Các thư viện nặng được import trì hoãn: chỉ load khi đọc KML / ghi KML.
+from libs.result_sink import ColumnarSink, ExcelSink
+from libs.csv_loaders import load_typed_csv
+from libs.planning_model import PairTable
+from libs import instrumentation as metrics
+from libs.cli_bootstrap import run_main
+kmlparser = lazy_module("pykml.parser")
+etree = lazy_module("lxml.etree") # Để tuần tự hóa (serialization) KML
 
 # Type aliases for clarity
 RouteCoords = List[Tuple[float, float]] # List of (lon, lat)
 
 # New structure for a single row after loading/validation
-ProcessedPointRow = Dict[str, Any] 
-# New PointData structure: (List of ProcessedPointRow, List of original field names)
-PointData = Tuple[List[ProcessedPointRow], List[str]] 
+# Cặp điểm (P1-P2) được giữ dạng cột: PairTable (tọa độ NumPy, mask hợp lệ, thông báo lỗi theo dòng),
+# đọc từng dòng qua PairRow (__slots__) — xem libs/planning_model.py
 
 # Bán kính Trái Đất (mét)
 EARTH_RADIUS_METERS = 6371000 
@@ -40,76 +43,53 @@ def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
 # Common Utility Functions 
 # -----------------------------
 
-def load_points_from_csv(csv_path: str) -> Optional[PointData]:
+def load_points_from_csv(csv_path: str) -> Optional[PairTable]:
     """Tải dữ liệu cặp điểm từ file CSV, giữ lại các hàng lỗi để báo cáo."""
-    processed_rows = []
     required_fields = ['lat1', 'lon1', 'lat2', 'lon2']
-    original_fieldnames: List[str] = []
     
     try:
-        with open(csv_path, 'r', encoding='utf-8-sig') as file:
-            reader = csv.DictReader(file)
-            
-            original_fieldnames = list(reader.fieldnames)
-            
-            # Kiểm tra xem các trường bắt buộc có tồn tại không
-            missing_fields_in_header = [field for field in required_fields if field not in original_fieldnames]
-            if missing_fields_in_header:
-                print(f"❌ Cảnh báo: File CSV thiếu các cột tọa độ bắt buộc: {', '.join(missing_fields_in_header)}. Các hàng sẽ được đánh dấu lỗi nếu không thể truy cập các cột này.")
-            
-            for i, row in enumerate(reader):
-                # Lưu dữ liệu gốc và khởi tạo trạng thái
-                row_entry: ProcessedPointRow = {
-                    'original_data': row.copy(), 
-                    'status': 'OK', 
-                    'error_msg': None, 
-                    'coordinates': {}
-                }
-                error_found = False
-                error_message = []
-                
-                # Cố gắng chuyển đổi tọa độ
-                for field in required_fields:
-                    value = row.get(field)
-                    
-                    if value is None or str(value).strip() == "":
-                        error_found = True
-                        error_message.append(f"Cột '{field}' bị thiếu hoặc rỗng.")
-                        continue
-
-                    try:
-                        # Chuyển đổi tọa độ sang float và lưu vào 'coordinates'
-                        row_entry['coordinates'][field] = float(value)
-                    except ValueError:
-                        error_found = True
-                        error_message.append(f"Cột '{field}' ('{value}') không phải là số hợp lệ.")
-                    except TypeError:
-                        error_found = True
-                        error_message.append(f"Cột '{field}' có giá trị không hợp lệ.")
-
-                # Cập nhật trạng thái và tin nhắn lỗi nếu có lỗi
-                if error_found:
-                    row_entry['status'] = 'ERROR'
-                    row_entry['error_msg'] = "Lỗi Tọa độ: " + " | ".join(error_message)
-                    
-                processed_rows.append(row_entry)
-                
+        # Đọc và kiểm tra tọa độ hàng loạt (vector hóa); chỉ dựng thông báo lỗi cho các hàng lỗi
+        table = load_typed_csv(csv_path, {field: 'float' for field in required_fields})
     except FileNotFoundError:
         print(f"❌ Lỗi: File CSV '{csv_path}' không tồn tại.")
         return None
     except Exception as e:
         print(f"❌ Lỗi khi đọc file CSV: {e}")
         return None
+
+    original_fieldnames: List[str] = table.fieldnames
+    
+    # Kiểm tra xem các trường bắt buộc có tồn tại không
+    if table.missing_columns:
+        print(f"❌ Cảnh báo: File CSV thiếu các cột tọa độ bắt buộc: {', '.join(table.missing_columns)}. Các hàng sẽ được đánh dấu lỗi nếu không thể truy cập các cột này.")
+
+    error_messages = {}
+    for index in table.error_rows:
+        error_message = []
+        for error in table.field_errors(index):
+            if error['reason'] == 'empty':
+                error_message.append(f"Cột '{error['field']}' bị thiếu hoặc rỗng.")
+            elif error['reason'] == 'extra_fields':
+                error_message.append(f"Dòng có {len(error['value'])} trường thừa so với header: {error['value']}.")
+            else:
+                error_message.append(f"Cột '{error['field']}' ('{error['value']}') không phải là số hợp lệ.")
+        error_messages[int(index)] = "Lỗi Tọa độ: " + " | ".join(error_message)
+
+    pairs = PairTable(
+        original_fieldnames,
+        [table.raw[name].tolist() for name in original_fieldnames],
+        table.columns, table.valid, error_messages,
+    )
         
-    print(f"Đã tải và xử lý {len(processed_rows)} hàng dữ liệu từ CSV.")
-    return (processed_rows, original_fieldnames)
+    print(f"Đã tải và xử lý {len(pairs)} hàng dữ liệu từ CSV.")
+    return pairs
 
 
 def extract_routes_from_kml(kml_path: str) -> List[Tuple[str, RouteCoords]]:
     """Tải và phân tích cú pháp KML để trích xuất các tuyến đường."""
     print(f"📥 Đang load file KML: {kml_path}")
     try:
-        with open(kml_path, "rb") as f:
+        with metrics.timer("kml_parse_seconds"), open(kml_path, "rb") as f:
             root = kmlparser.parse(f).getroot()
     except Exception as e:
         print(f"❌ Lỗi khi đọc file KML: {e}")
@@ -272,6 +252,8 @@ def generate_kml_description(row_data: Dict[str, Any], match_data: Dict[str, Any
 
 def build_optimization_kml(results: List[Dict[str, Any]], original_fields: List[str], output_kml: str):
     """Tạo file KML hiển thị trực quan hóa các kết quả tối ưu hóa."""
+    from pykml.factory import KML_ElementMaker as KML # Sử dụng KML factory để xây dựng cấu trúc
+
     print(f"\n🏗️ Bắt đầu xây dựng KML trực quan hóa: {output_kml}")
     
     # Màu đỏ (ff0000ff - AABBGGRR) và độ rộng (width) 4.0
@@ -453,7 +435,7 @@ def build_optimization_kml(results: List[Dict[str, Any]], original_fields: List[
 # -----------------------------
 # Main Process (Modified for Optimization and CSV Name Extraction)
 # -----------------------------
-def process_kml_optimizer(kml_path: str, csv_path: str, output_excel: str, output_kml: str):
+def process_kml_optimizer(kml_path: str, csv_path: str, output_excel: str, output_kml: str, output_parquet: Optional[str] = None):
     """Quá trình chính: Tải tuyến, tải cặp điểm và tính toán tuyến tối ưu cho mỗi cặp, sau đó tạo Excel và KML."""
     
     routes = extract_routes_from_kml(kml_path)
@@ -462,18 +444,18 @@ def process_kml_optimizer(kml_path: str, csv_path: str, output_excel: str, outpu
         # Vẫn tiếp tục để ghi file Excel với trạng thái lỗi cho tất cả các hàng
         # Điều này sẽ được xử lý khi check `if best_match:` bên dưới.
 
-    point_data = load_points_from_csv(csv_path)
-    if not point_data:
+    with metrics.timer("csv_load_seconds"):
+        pairs = load_points_from_csv(csv_path)
+    if pairs is None:
         print("Không tìm thấy hàng dữ liệu nào trong CSV. Kết thúc.")
         return
 
-    point_rows, original_fieldnames = point_data
+    original_fieldnames = list(pairs.fieldnames)
     if not original_fieldnames:
         original_fieldnames = ['lat1', 'lon1', 'lat2', 'lon2']
 
     print("\n🔍 Bắt đầu tính toán tuyến cáp tối ưu cho từng cặp điểm (P1-P2)...")
     
-    excel_rows: List[List[Any]] = []
     kml_visualization_results: List[Dict[str, Any]] = [] # Thu thập kết quả cho KML
     
     # Định nghĩa Header kết quả mới
@@ -490,31 +472,51 @@ def process_kml_optimizer(kml_path: str, csv_path: str, output_excel: str, outpu
         "Nearest Lon P2",
         "Full Route Name", 
     ]
+
+    # Excel được ghi từng dòng ngay khi có kết quả (không giữ workbook trong bộ nhớ)
+    final_header = original_fieldnames + result_header
+    try:
+        excel_sink = ExcelSink(output_excel, final_header, sheet_name="OptimizedNearestRoute_DualPoint")
+    except Exception as e:
+        print(f"❌ Lỗi khi tạo file Excel: {e}")
+        excel_sink = None
+
+    # Bản Parquet/Arrow (tùy chọn) giữ khoảng cách / tọa độ dạng float thay vì chuỗi đã format
+    parquet_sink = None
+    if output_parquet:
+        float_columns = [name for name in result_header if name.startswith(("Tổng Dist", "Dist", "Nearest"))]
+        float_columns += [name for name in ('lat1', 'lon1', 'lat2', 'lon2') if name in original_fieldnames]
+        try:
+            parquet_sink = ColumnarSink(output_parquet, final_header, types={name: "float" for name in float_columns})
+        except Exception as e:
+            print(f"❌ Lỗi khi tạo file Parquet: {e}")
     
-    for i, processed_row in enumerate(point_rows):
+    for i, pair in enumerate(pairs):
         # Lấy dữ liệu gốc và trạng thái
-        row_data_original = processed_row['original_data']
-        status = processed_row['status']
-        error_msg = processed_row['error_msg']
+        row_data_original = pair.original
+        status = pair.status
+        error_msg = pair.error_msg
         
         # Lấy các giá trị cột gốc (theo thứ tự header)
-        original_values = [row_data_original.get(name) for name in original_fieldnames]
+        original_values = pairs.original_values(i)
         
         # Khởi tạo các cột kết quả là rỗng/lỗi
         empty_result_slots = [""] * (len(result_header) - 2)
         result_values = [status, error_msg] + empty_result_slots
+        raw_result_values = [status, error_msg] + [None] * (len(result_header) - 2)
         best_match = None
 
         if status == 'OK':
             # Chỉ xử lý các hàng hợp lệ
-            coords = processed_row['coordinates']
-            lat1, lon1 = coords['lat1'], coords['lon1']
-            lat2, lon2 = coords['lat2'], coords['lon2']
+            coords = pair.coordinates
+            lat1, lon1 = pair.lat1, pair.lon1
+            lat2, lon2 = pair.lat2, pair.lon2
             
             print(f"\n--- Xử lý Cặp Điểm #{i+1} (Dòng {i+2}) ---")
             
             # ÁP DỤNG LOGIC TỐI ƯU HÓA
-            best_match = find_best_route_for_pair(lat1, lon1, lat2, lon2, routes)
+            with metrics.timer("pair_match_seconds"):
+                best_match = find_best_route_for_pair(lat1, lon1, lat2, lon2, routes)
             
             # XÁC ĐỊNH TÊN THƯ MỤC TỪ CSV (Sử dụng dữ liệu gốc)
             descriptive_name = ""
@@ -550,9 +552,17 @@ def process_kml_optimizer(kml_path: str, csv_path: str, output_excel: str, outpu
                     f"{best_match['nearest_lon2']:.6f}",
                     best_match['full_name'],
                 ]
+                raw_result_values = [
+                    status, "", best_match['short_name'],
+                    best_match['total_distance'], best_match['dist1'],
+                    best_match['nearest_lat1'], best_match['nearest_lon1'],
+                    best_match['dist2'], best_match['nearest_lat2'], best_match['nearest_lon2'],
+                    best_match['full_name'],
+                ]
                 
                 # Chuẩn bị dữ liệu KML (chèn tọa độ float vào dữ liệu gốc để KML dùng)
-                kml_row_data = row_data_original.copy()
+                # (pair.original là dict riêng của dòng này, không cần copy)
+                kml_row_data = row_data_original
                 kml_row_data.update(coords) 
                 
                 kml_visualization_results.append({
@@ -565,6 +575,7 @@ def process_kml_optimizer(kml_path: str, csv_path: str, output_excel: str, outpu
                 # Không tìm thấy tuyến cáp nào hợp lệ (mặc dù tọa độ OK)
                 result_values[1] = "ROUTE_ERROR: Không tìm thấy tuyến cáp KML hợp lệ nào để kết nối (Routes is empty or no point on routes)."
                 result_values[0] = "ROUTE_ERROR"
+                raw_result_values[:2] = result_values[:2]
                 print("  ❌ Không tìm thấy tuyến cáp nào hợp lệ để kết nối.")
 
         elif status == 'ERROR':
@@ -572,32 +583,39 @@ def process_kml_optimizer(kml_path: str, csv_path: str, output_excel: str, outpu
             # result_values đã được khởi tạo: [status, error_msg, "","","","","","","","",""]
             
         # Thêm vào Excel bất kể thành công hay thất bại (đảm bảo thứ tự)
-        excel_rows.append(original_values + result_values)
+        if excel_sink:
+            # Đảm bảo tất cả các giá trị trong hàng là string/số có thể ghi vào Excel
+            excel_sink.write_row([str(item) if item is not None else "" for item in original_values + result_values])
+        if parquet_sink:
+            # Cột tọa độ gốc ghi bằng giá trị đã parse (null ở dòng lỗi) để giá trị nhập sai như 'abc'
+            # không làm ColumnarSink báo lỗi kiểu cột float
+            coords_parsed = pair.coordinates
+            parquet_values = [
+                (coords_parsed[name] if math.isfinite(coords_parsed[name]) else None) if name in coords_parsed else value
+                for name, value in zip(original_fieldnames, original_values)
+            ]
+            parquet_sink.write_row(parquet_values + raw_result_values)
 
     # 3. Write KML visualization file (Chỉ ghi các hàng thành công)
     if kml_visualization_results and output_kml:
-        build_optimization_kml(kml_visualization_results, original_fieldnames, output_kml)
+        with metrics.timer("kml_build_seconds"):
+            build_optimization_kml(kml_visualization_results, original_fieldnames, output_kml)
     elif output_kml:
         print("Không có kết quả tối ưu hóa nào thành công để trực quan hóa trong KML.")
         
-    # 4. Write Excel
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "OptimizedNearestRoute_DualPoint"
-    
-    final_header = original_fieldnames + result_header
-    ws.append(final_header)
-
-    for row in excel_rows:
-        # Đảm bảo tất cả các giá trị trong hàng là string/số có thể ghi vào Excel
-        processed_row_for_excel = [str(item) if item is not None else "" for item in row]
-        ws.append(processed_row_for_excel)
-
-    try:
-        wb.save(output_excel)
-        print(f"\n✅ File Excel đã lưu: {output_excel}")
-    except Exception as e:
-        print(f"❌ Lỗi khi lưu file Excel: {e}")
+    # 4. Hoàn tất file Excel
+    if excel_sink:
+        try:
+            excel_sink.close()
+            print(f"\n✅ File Excel đã lưu: {output_excel}")
+        except Exception as e:
+            print(f"❌ Lỗi khi lưu file Excel: {e}")
+    if parquet_sink:
+        try:
+            parquet_sink.close()
+            print(f"✅ File Parquet đã lưu: {output_parquet}")
+        except Exception as e:
+            print(f"❌ Lỗi khi lưu file Parquet: {e}")
 
 
 # -----------------------------
@@ -609,10 +627,12 @@ def main():
     argp.add_argument("--csv", required=True, help="Đường dẫn đến file CSV chứa các cặp tọa độ (lat1, lon1, lat2, lon2) và các cột bổ sung.")
     argp.add_argument("--out", required=True, help="Đường dẫn file Excel (.xlsx) đầu ra.")
     argp.add_argument("--kml_out", required=True, help="Đường dẫn file KML (.kml) trực quan hóa kết quả đầu ra.")
+    argp.add_argument("--parquet-out", default=None, help="(Tùy chọn) Ghi thêm kết quả dạng Parquet (.parquet) hoặc Arrow IPC (.arrow/.feather), khoảng cách/tọa độ là số thực.")
 
     args = argp.parse_args()
-    process_kml_optimizer(args.kml, args.csv, args.out, args.kml_out)
+    process_kml_optimizer(args.kml, args.csv, args.out, args.kml_out, args.parquet_out)
+    metrics.emit_run_summary("two_point_to_route_nearest_v5_sameroute_kml_color")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    run_main(main)
\ No newline at end of file